@@ -12,8 +12,9 @@ from aqt.utils import showInfo, qconnect
 from .gui.input_window import show_input_dialog
 from .gui.settings_window import SettingsDialog
 from .gui.language_window import show_language_window
+from .gui.dialogs.generation_jobs_dialog import show_generation_jobs, resume_unfinished_jobs
 from .utils import ensure_note_types, setup_text_capture
-from aqt.gui_hooks import profile_did_open
+from aqt.gui_hooks import profile_did_open, profile_will_close
 from .lang.messages import get_message, DEFAULT_LANG
 
 def load_config():
@@ -83,19 +84,42 @@ def init_feynman():
     # 添加菜单动作
     start_action = QAction(get_message('menu_create', current_lang), mw)
     language_action = QAction("语言学习练习", mw)
+    jobs_action = QAction("生成任务", mw)
     settings_action = QAction(get_message('menu_settings', current_lang), mw)
     about_action = QAction('About', mw)
 
     feynman_menu.addAction(start_action)
     feynman_menu.addAction(language_action)
+    feynman_menu.addAction(jobs_action)
     feynman_menu.addAction(settings_action)
     feynman_menu.addAction(about_action)
 
     # 连接信号
     qconnect(start_action.triggered, show_input_dialog)
     qconnect(language_action.triggered, show_language_window)
+    qconnect(jobs_action.triggered, show_generation_jobs)
     qconnect(settings_action.triggered, show_settings)
     qconnect(about_action.triggered, lambda: showInfo("Anki 费曼学习法插件 v0.1.0"))
 
+    # 继续上次运行时被中断的生成任务
+    resume_unfinished_jobs()
+
+def cleanup_feynman():
+    """配置文件关闭时释放插件持有的长期资源"""
+    from .utils.http_transport import close_all_transports
+    from .utils.async_engine import shutdown_async_engine
+    from .utils.adaptive_concurrency import save_concurrency_limits
+    from .utils.executor_service import shutdown_executor_service
+    from .utils.job_store import close_job_store
+    # 先停止正在运行的生成任务（保持运行中状态，下次打开时继续），再关闭线程池
+    close_job_store()
+    shutdown_executor_service()
+    shutdown_async_engine()
+    # 连接池的会话忽略外部的close()，只在这里释放
+    close_all_transports()
+    save_concurrency_limits()
+
 # 在配置文件加载后初始化插件
 profile_did_open.append(init_feynman)
+# 在配置文件关闭前释放资源
+profile_will_close.append(cleanup_feynman)
@@ -0,0 +1,229 @@
+"""
+文本分块性能对比
+
+对比旧版 TextChunker 的断点查找（每类边界复制一次窗口切片、收集全部匹配后取最接近的）
+与新实现（在原文上按窗口范围匹配、越过理想位置即停止）在1/10/50 MB（百万字符）文本上的
+耗时，并校验两者的分块结果完全一致。
+
+用法：
+    python benchmarks/bench_chunker.py [大小MB ...]
+"""
+
+import os
+import random
+import re
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from text_chunker import TextChunker  # noqa: E402
+
+
+class LegacyTextChunker(TextChunker):
+    """旧版智能分块的断点查找（仅用于对比）"""
+
+    def _smart_chunk(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        智能分块：在自然边界处分块（段落、句子）
+        
+        Args:
+            text: 要分块的文本
+            
+        Returns:
+            分块列表
+        """
+        chunks = []
+        start = 0
+        text_len = len(text)
+        
+        while start < text_len:
+            # 计算理想的结束位置
+            ideal_end = min(start + self.chunk_size, text_len)
+            
+            if ideal_end >= text_len:
+                # 已到文本末尾
+                chunks.append((text[start:text_len], start, text_len))
+                break
+            
+            # 寻找自然断点
+            actual_end = self._find_natural_break(text, start, ideal_end, text_len)
+            chunk = text[start:actual_end]
+            chunks.append((chunk, start, actual_end))
+            
+            # 计算下一块的起始位置（考虑重叠）
+            if actual_end < text_len:
+                # 向前查找重叠区域的起始点
+                overlap_start = max(start, actual_end - self.overlap)
+                # 尝试在重叠区域找到段落或句子边界
+                next_start = self._find_overlap_start(text, overlap_start, actual_end)
+                start = next_start
+            else:
+                start = text_len
+                
+        return chunks
+    
+    def _find_natural_break(self, text: str, start: int, ideal_end: int, text_len: int) -> int:
+        """
+        寻找自然断点
+        
+        Args:
+            text: 文本
+            start: 起始位置
+            ideal_end: 理想结束位置
+            text_len: 文本总长度
+            
+        Returns:
+            实际结束位置
+        """
+        # 如果理想结束位置就是文本末尾，直接返回
+        if ideal_end >= text_len:
+            return text_len
+        
+        # 定义搜索窗口（在理想位置前后各搜索一定范围）
+        search_window = min(200, self.chunk_size // 4)
+        search_start = max(start, ideal_end - search_window)
+        search_end = min(text_len, ideal_end + search_window)
+        search_text = text[search_start:search_end]
+        
+        # 1. 优先查找段落边界（双换行符）
+        paragraph_breaks = [m.end() for m in re.finditer(r'\n\s*\n', search_text)]
+        if paragraph_breaks:
+            # 找到最接近理想位置的段落边界
+            closest = min(paragraph_breaks, 
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 2. 查找单换行符
+        newline_breaks = [m.end() for m in re.finditer(r'\n', search_text)]
+        if newline_breaks:
+            closest = min(newline_breaks,
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 3. 查找句子边界（句号、问号、感叹号后跟空格或换行）
+        sentence_breaks = [m.end() for m in re.finditer(r'[。！？.!?]\s+', search_text)]
+        if sentence_breaks:
+            closest = min(sentence_breaks,
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 4. 查找中文句号
+        chinese_sentence_breaks = [m.end() for m in re.finditer(r'[。！？]', search_text)]
+        if chinese_sentence_breaks:
+            closest = min(chinese_sentence_breaks,
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 5. 查找逗号、分号等标点
+        punctuation_breaks = [m.end() for m in re.finditer(r'[，,;；]\s*', search_text)]
+        if punctuation_breaks:
+            closest = min(punctuation_breaks,
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 6. 查找空格
+        space_breaks = [m.end() for m in re.finditer(r'\s+', search_text)]
+        if space_breaks:
+            closest = min(space_breaks,
+                         key=lambda x: abs((search_start + x) - ideal_end))
+            return search_start + closest
+        
+        # 7. 如果都找不到，直接在理想位置分割
+        return ideal_end
+    
+    def _find_overlap_start(self, text: str, overlap_start: int, chunk_end: int) -> int:
+        """
+        寻找重叠区域的起始点，尽量在自然边界处
+        
+        Args:
+            text: 文本
+            overlap_start: 重叠区域的理想起始位置
+            chunk_end: 上一块的结束位置
+            
+        Returns:
+            重叠区域的实际起始位置
+        """
+        search_text = text[overlap_start:chunk_end]
+        
+        # 1. 查找段落开始
+        paragraph_starts = [m.start() for m in re.finditer(r'\n\s*\n\s*', search_text)]
+        if paragraph_starts:
+            # 使用最后一个段落开始
+            return overlap_start + paragraph_starts[-1] + len(re.search(r'\n\s*\n\s*', search_text[paragraph_starts[-1]:]).group())
+        
+        # 2. 查找换行符
+        newline_starts = [m.start() for m in re.finditer(r'\n', search_text)]
+        if newline_starts:
+            return overlap_start + newline_starts[-1] + 1
+        
+        # 3. 查找句子开始（标点后的位置）
+        sentence_starts = [m.end() for m in re.finditer(r'[。！？.!?]\s+', search_text)]
+        if sentence_starts:
+            return overlap_start + sentence_starts[-1]
+        
+        # 4. 如果都找不到，使用理想起始位置
+        return overlap_start
+
+
+SENTENCES = [
+    "机器学习是人工智能的一个分支，它使计算机能够从数据中学习。",
+    "费曼学习法强调用简单的语言解释复杂的概念！",
+    "The mitochondria is the powerhouse of the cell. ",
+    "Spaced repetition improves long-term retention, according to many studies; ",
+    "为什么天空是蓝色的？",
+    "Rayleigh scattering explains the color of the sky! ",
+]
+
+
+def make_pdf_text(size: int) -> str:
+    """模拟PDF提取的文本：按行折断，段落之间有空行"""
+    random.seed(size)
+    parts = []
+    length = 0
+    line = []
+    while length < size:
+        sentence = random.choice(SENTENCES)
+        line.append(sentence)
+        length += len(sentence)
+        if sum(len(s) for s in line) > 60:
+            parts.append("".join(line))
+            parts.append("\n\n" if random.random() < 0.1 else "\n")
+            line = []
+    return "".join(parts)[:size]
+
+
+def make_single_line_text(size: int) -> str:
+    """没有换行的长文本（如从网页复制的段落），断点落在句子或空格上"""
+    random.seed(size)
+    parts = []
+    length = 0
+    while length < size:
+        sentence = random.choice(SENTENCES)
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)[:size]
+
+
+def measure(chunker: TextChunker, text: str):
+    """返回 (耗时秒, 分块结果)"""
+    start = time.perf_counter()
+    chunks = chunker.chunk_text(text)
+    return time.perf_counter() - start, chunks
+
+
+def main():
+    sizes = [float(arg) for arg in sys.argv[1:]] or [1, 10, 50]
+    print(f"{'文本':<14}{'大小(MB)':>10}{'分块数':>10}{'旧实现(s)':>12}{'新实现(s)':>12}{'加速':>8}{'结果一致':>10}")
+    for name, make in (("pdf", make_pdf_text), ("single_line", make_single_line_text)):
+        for size in sizes:
+            text = make(int(size * 1_000_000))
+            legacy_time, legacy_chunks = measure(LegacyTextChunker(2000, 200, "smart"), text)
+            index_time, index_chunks = measure(TextChunker(2000, 200, "smart"), text)
+            speedup = legacy_time / index_time if index_time else float("inf")
+            print(f"{name:<14}{size:>10g}{len(index_chunks):>10}{legacy_time:>12.3f}{index_time:>12.3f}"
+                  f"{speedup:>7.1f}x{str(legacy_chunks == index_chunks):>10}")
+
+
+if __name__ == "__main__":
+    main()
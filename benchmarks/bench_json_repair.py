@@ -0,0 +1,410 @@
+"""
+JSON修复性能对比
+
+对比旧的正则修复流程（try_multiple_fixes + parse_and_validate 中的额外修复）与
+utils/lenient_json.py 中单次扫描的宽松解析器，在20道选择题规模的响应上的耗时和成功率。
+
+用法：
+    python benchmarks/bench_json_repair.py [重复次数]
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+from lenient_json import lenient_loads  # noqa: E402
+
+
+class LegacyResponseHandler:
+    """旧版ResponseHandler中的JSON修复流程（仅用于对比）"""
+
+    @staticmethod
+    def clean_response(response: str) -> str:
+        """清理AI响应文本，移除代码块标记等"""
+        cleaned = response.strip()
+        
+        # 移除代码块标记
+        if cleaned.startswith("```"):
+            cleaned = cleaned.split("\n", 1)[1]
+        if cleaned.endswith("```"):
+            cleaned = cleaned.rsplit("\n", 1)[0]
+            
+        # 移除语言标识
+        cleaned = cleaned.replace("```json", "").replace("```", "").strip()
+        
+        return cleaned
+    
+    @staticmethod
+    def fix_incomplete_json(json_str: str) -> str:
+        """修复不完整的JSON字符串"""
+        # 处理末尾不完整的情况
+        if not json_str.endswith("}"):
+            # 尝试找到最后一个完整的对象
+            last_complete = json_str.rfind('        }')
+            if last_complete != -1:
+                json_str = json_str[:last_complete + 9] + "\n    ]\n}"
+        return json_str
+    
+    @staticmethod
+    def advanced_json_fix(json_str: str) -> str:
+        """高级JSON修复，处理各种常见的JSON格式错误"""
+        # 1. 尝试修复缺少逗号的问题
+        # 查找可能缺少逗号的位置 - 通常是在对象或数组项之后
+        pattern = r'(["}\]])\s*\n\s*(["{\[])'
+        json_str = re.sub(pattern, r'\1,\n\2', json_str)
+        
+        # 特别处理题目列表中可能缺少的逗号
+        # 例如："question": "问题内容"\n    "options": 之间缺少逗号
+        pattern_question = r'("question":\s*"[^"]*")\s*\n\s*(")'
+        json_str = re.sub(pattern_question, r'\1,\n    \2', json_str)
+        
+        # 处理选项之间缺少的逗号
+        pattern_options = r'("options":\s*\[\s*(?:"[^"]*",\s*)*"[^"]*")\s*\n\s*(")'
+        json_str = re.sub(pattern_options, r'\1,\n    \2', json_str)
+        
+        # 处理correct_answer后缺少的逗号
+        pattern_correct = r'("correct_answer":\s*"[^"]*")\s*\n\s*(")'
+        json_str = re.sub(pattern_correct, r'\1,\n    \2', json_str)
+        
+        # 处理explanation后缺少的逗号
+        pattern_explanation = r'("explanation":\s*"[^"]*")\s*\n\s*(")'
+        json_str = re.sub(pattern_explanation, r'\1,\n    \2', json_str)
+        
+        # 处理key_points后缺少的逗号
+        pattern_key_points = r'("key_points":\s*\[[^\]]*\])\s*\n\s*(")'
+        json_str = re.sub(pattern_key_points, r'\1,\n    \2', json_str)
+        
+        # 处理reference_answer后缺少的逗号
+        pattern_reference = r'("reference_answer":\s*"[^"]*")\s*\n\s*(")'
+        json_str = re.sub(pattern_reference, r'\1,\n    \2', json_str)
+        
+        # 2. 修复多余的逗号
+        # 数组末尾多余的逗号
+        json_str = re.sub(r',\s*\]', r']', json_str)
+        # 对象末尾多余的逗号
+        json_str = re.sub(r',\s*\}', r'}', json_str)
+        
+        # 3. 修复未闭合的引号
+        # 这是一个简化的处理，实际上引号不匹配的问题很复杂
+        # 计算引号数量，如果是奇数，尝试找到可能缺少引号的位置
+        if json_str.count('"') % 2 != 0:
+            lines = json_str.split('\n')
+            for i, line in enumerate(lines):
+                # 如果一行中有奇数个引号，可能是这行缺少引号
+                if line.count('"') % 2 != 0:
+                    # 检查是否是值的结尾缺少引号
+                    if ':' in line and line.rstrip()[-1] not in ['"', '}', ']', ',']:
+                        lines[i] = line + '"'
+            json_str = '\n'.join(lines)
+        
+        # 4. 确保JSON对象和数组的完整性
+        # 检查大括号是否匹配
+        if json_str.count('{') > json_str.count('}'):
+            json_str += '}'
+        # 检查方括号是否匹配
+        if json_str.count('[') > json_str.count(']'):
+            json_str += ']'
+        
+        # 5. 处理特定位置的格式问题
+        # 检查第13行附近是否缺少逗号（根据错误信息）
+        lines = json_str.split('\n')
+        if len(lines) >= 13:
+            line12 = lines[12] if len(lines) > 12 else ""
+            line13 = lines[13] if len(lines) > 13 else ""
+            
+            # 如果第12行结束没有逗号，且第13行开始是一个新的键
+            if line12 and line13 and not line12.rstrip().endswith(',') and re.match(r'\s*"[^"]+"\s*:', line13):
+                lines[12] = line12.rstrip() + ','
+                json_str = '\n'.join(lines)
+        
+        return json_str
+    
+    @staticmethod
+    def deep_json_fix(json_str: str) -> str:
+        """深度JSON修复，处理更复杂的格式问题
+        
+        这个方法尝试通过更激进的方式修复JSON，适用于常规修复方法失败的情况
+        """
+        # 首先尝试识别JSON的基本结构
+        # 大多数情况下，我们期望的是一个包含questions数组的对象
+        
+        # 1. 确保最外层是一个对象
+        json_str = json_str.strip()
+        if not json_str.startswith('{'):
+            json_str = '{' + json_str
+        if not json_str.endswith('}'):
+            json_str = json_str + '}'
+            
+        # 2. 尝试识别和修复questions数组
+        questions_match = re.search(r'"questions"\s*:\s*\[', json_str)
+        if questions_match:
+            # 找到questions数组的开始位置
+            start_pos = questions_match.end()
+            # 尝试找到数组的结束位置
+            bracket_count = 1  # 已经遇到了一个[
+            end_pos = len(json_str)
+            
+            for i in range(start_pos, len(json_str)):
+                if json_str[i] == '[':
+                    bracket_count += 1
+                elif json_str[i] == ']':
+                    bracket_count -= 1
+                    if bracket_count == 0:
+                        end_pos = i + 1
+                        break
+            
+            # 提取questions数组内容
+            questions_content = json_str[start_pos:end_pos-1]  # 不包括最后的]
+            
+            # 分割成单独的问题对象
+            question_objects = []
+            object_start = 0
+            bracket_count = 0
+            in_string = False
+            escape_next = False
+            
+            for i, char in enumerate(questions_content):
+                if escape_next:
+                    escape_next = False
+                    continue
+                    
+                if char == '\\':
+                    escape_next = True
+                elif char == '"' and not escape_next:
+                    in_string = not in_string
+                elif not in_string:
+                    if char == '{':
+                        if bracket_count == 0:
+                            object_start = i
+                        bracket_count += 1
+                    elif char == '}':
+                        bracket_count -= 1
+                        if bracket_count == 0:
+                            # 找到一个完整的问题对象
+                            question_obj = questions_content[object_start:i+1]
+                            # 尝试修复这个对象
+                            fixed_obj = LegacyResponseHandler.fix_question_object(question_obj)
+                            question_objects.append(fixed_obj)
+            
+            # 重建questions数组
+            fixed_questions = ',\n'.join(question_objects)
+            fixed_json = json_str[:start_pos] + fixed_questions + json_str[end_pos-1:]
+            
+            return fixed_json
+        
+        return json_str
+    
+    @staticmethod
+    def fix_question_object(question_obj: str) -> str:
+        """修复单个问题对象的JSON格式"""
+        # 确保对象的开始和结束
+        question_obj = question_obj.strip()
+        if not question_obj.startswith('{'):
+            question_obj = '{' + question_obj
+        if not question_obj.endswith('}'):
+            question_obj = question_obj + '}'
+            
+        # 使用正则表达式找出所有键值对
+        pairs = re.findall(r'"([^"]+)"\s*:\s*("(?:\\.|[^"\\])*"|[\[\{].*?[\]\}]|\d+|true|false|null)', question_obj, re.DOTALL)
+        
+        # 重建对象，确保键值对之间有逗号
+        if pairs:
+            fixed_obj = '{\n'
+            for i, (key, value) in enumerate(pairs):
+                fixed_obj += f'    "{key}": {value}'
+                if i < len(pairs) - 1:
+                    fixed_obj += ',\n'
+                else:
+                    fixed_obj += '\n'
+            fixed_obj += '}'
+            return fixed_obj
+            
+        return question_obj
+        
+    @staticmethod
+    def try_multiple_fixes(response: str) -> str:
+        """尝试多种方法修复JSON"""
+        # 首先进行基本清理
+        cleaned = LegacyResponseHandler.clean_response(response)
+        
+        # 尝试直接解析
+        try:
+            json.loads(cleaned)
+            return cleaned
+        except json.JSONDecodeError:
+            pass
+        
+        # 尝试基本的不完整JSON修复
+        fixed = LegacyResponseHandler.fix_incomplete_json(cleaned)
+        try:
+            json.loads(fixed)
+            return fixed
+        except json.JSONDecodeError:
+            pass
+        
+        # 尝试高级修复
+        advanced_fixed = LegacyResponseHandler.advanced_json_fix(cleaned)
+        try:
+            json.loads(advanced_fixed)
+            return advanced_fixed
+        except json.JSONDecodeError:
+            pass
+            
+        # 尝试深度修复
+        deep_fixed = LegacyResponseHandler.deep_json_fix(cleaned)
+        try:
+            json.loads(deep_fixed)
+            return deep_fixed
+        except json.JSONDecodeError:
+            pass
+        
+        # 如果所有修复都失败，返回原始清理后的文本
+        # 让json.loads抛出具体的错误信息
+        return cleaned
+
+    def parse(self, response: str, schema_type: str):
+        """旧版parse_and_validate的预处理与解析部分（不含校验）"""
+        debug_info = f"尝试解析{schema_type}类型的JSON..."
+        
+        if True:
+            # 尝试从文本中提取JSON部分（删除前导和尾随文本）
+            json_text = response
+            
+            # 查找JSON的开始位置
+            json_start = response.find('{')
+            if json_start > 0:
+                # 如果JSON不是从开头开始，则可能有前导文本
+                debug_info += f"\n发现前导文本，JSON从位置{json_start}开始。"
+                json_text = response[json_start:]
+            
+            # 查找JSON的结束位置（找到最后一个闭合的大括号）
+            json_end = len(json_text)
+            stack = []
+            for i, char in enumerate(json_text):
+                if char == '{':
+                    stack.append(i)
+                elif char == '}':
+                    if stack:
+                        stack.pop()
+                        if not stack:  # 如果栈为空，意味着我们找到了最后匹配的闭合括号
+                            json_end = i + 1
+                            break
+            
+            if json_end < len(json_text):
+                # 如果找到了闭合括号且不在文本末尾，可能有尾随文本
+                debug_info += f"\n发现尾随文本，JSON在位置{json_end}结束。"
+                json_text = json_text[:json_end]
+            
+            # 尝试多种方法修复JSON
+            fixed = self.try_multiple_fixes(json_text)
+            debug_info += "\n尝试修复JSON格式..."
+            
+            # 解析JSON
+            try:
+                data = json.loads(fixed)
+                debug_info += "\nJSON解析成功!"
+            except json.JSONDecodeError as e:
+                debug_info += f"\nJSON解析失败: {str(e)}，尝试额外的修复方法..."
+                
+                # 尝试修复引号问题
+                fixed = fixed.replace("'", '"')  # 将单引号替换为双引号
+                
+                # 尝试修复常见的问题，如尾部逗号
+                fixed = re.sub(r',\s*}', '}', fixed)  # 删除对象结尾的逗号
+                fixed = re.sub(r',\s*]', ']', fixed)  # 删除数组结尾的逗号
+                
+                # 如果是选择题，尝试修复options数组格式
+                if schema_type == "choice_question":
+                    # 查找并修复options数组中可能的格式问题
+                    options_pattern = r'"options"\s*:\s*\[(.*?)\]'
+                    for match in re.finditer(options_pattern, fixed, re.DOTALL):
+                        options_content = match.group(1)
+                        if ',' not in options_content:
+                            # 可能缺少逗号，尝试添加
+                            fixed_options = re.sub(r'("[^"]*")\s*("[^"]*")', r'\1, \2', options_content)
+                            fixed = fixed.replace(options_content, fixed_options)
+                
+                data = json.loads(fixed)
+                debug_info += "\n额外修复后JSON解析成功!"
+        return data
+
+
+def make_question(index: int) -> dict:
+    """生成一道内容较长的选择题"""
+    text = "这是一段用于测试的题目内容，包含中文标点、English words 和数字 42。" * 3
+    return {
+        "question": f"第{index}题：{text}",
+        "options": [f"{letter}. 选项{letter}：{text[:40]}" for letter in "ABCD"],
+        "correct_answer": "ABCD"[index % 4],
+        "explanation": f"解析：{text}",
+        "source_content": text * 2,
+    }
+
+
+def make_responses(count: int):
+    """生成各种常见错误的20题响应"""
+    questions = {"questions": [make_question(i) for i in range(20)]}
+    valid = json.dumps(questions, ensure_ascii=False, indent=4)
+    lines = valid.split("\n")
+
+    def drop_commas(probability):
+        result = []
+        for line in lines:
+            if line.endswith(",") and random.random() < probability:
+                line = line[:-1]
+            result.append(line)
+        return "\n".join(result)
+
+    cases = {
+        "valid": valid,
+        "code_fence_and_prose": "以下是生成的题目：\n```json\n" + valid + "\n```\n希望对你有帮助！",
+        "trailing_commas": valid.replace("\n        }", ",\n        }").replace("\n    ]", ",\n    ]"),
+        "missing_commas": drop_commas(0.2),
+        "single_quotes": valid.replace('"', "'"),
+        "truncated": valid[:int(len(valid) * 0.8)],
+    }
+    return {name: [text] * count for name, text in cases.items()}
+
+
+REQUIRED_KEYS = ("question", "options", "correct_answer", "explanation", "source_content")
+
+
+def count_valid(data) -> int:
+    """统计解析结果中字段完整的题目数"""
+    if not isinstance(data, dict) or not isinstance(data.get("questions"), list):
+        return 0
+    return sum(1 for q in data["questions"] if isinstance(q, dict) and all(k in q for k in REQUIRED_KEYS))
+
+
+def run(parse, texts):
+    """返回 (总耗时秒, 平均每次得到的完整题目数)"""
+    recovered = 0
+    start = time.perf_counter()
+    for text in texts:
+        try:
+            data = parse(text)
+        except Exception:
+            continue
+        recovered += count_valid(data)
+    return time.perf_counter() - start, recovered / len(texts)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    random.seed(0)
+    legacy = LegacyResponseHandler()
+    print(f"{'用例':<22}{'旧流程(ms/次)':>14}{'新解析器(ms/次)':>16}{'加速':>8}{'旧题数':>8}{'新题数':>8}")
+    for name, texts in make_responses(repeat).items():
+        legacy_time, legacy_count = run(lambda t: legacy.parse(t, "choice_question"), texts)
+        lenient_time, lenient_count = run(lambda t: lenient_loads(t)[0], texts)
+        speedup = legacy_time / lenient_time if lenient_time else float("inf")
+        print(f"{name:<22}{legacy_time * 1000 / repeat:>14.3f}{lenient_time * 1000 / repeat:>16.3f}"
+              f"{speedup:>7.1f}x{legacy_count:>8.1f}{lenient_count:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
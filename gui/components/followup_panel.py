@@ -11,7 +11,10 @@ from ..styles.anki_style import apply_anki_style
 from ..dialogs.cloze_dialog import ClozeDialog
 from ...utils import create_feynman_note
 from ...lang.messages import get_message, get_default_lang
+from ...utils.executor_service import LANE_FOLLOWUP
+from ..workers import start_worker
 from ..workers.followup_worker import FollowUpQuestionWorker
+from .stream_render_throttle import StreamRenderThrottle
 
 # 导入markdown处理
 MARKDOWN_AVAILABLE = False
@@ -152,11 +155,15 @@ class FollowUpPanel(QWidget):
         self.lang = get_default_lang()
         self.follow_up_history = []
         self.current_follow_up_question = ""
-        self.thread = None
+        self.future = None
         self.worker = None
+        # 流式回答中正在追加内容的历史条目
+        self._streaming_item = None
         
         self.setup_ui()
         self.setup_connections()
+        # 限制流式回答的重绘频率，避免每个token都重新渲染Markdown
+        self._stream_render = StreamRenderThrottle(self, self.update_history_display)
         self.setup_context_menu()
     
     def setup_ui(self):
@@ -189,8 +196,12 @@ class FollowUpPanel(QWidget):
         self.followUpEdit.setPlaceholderText(get_message("follow_up_input_placeholder", self.lang))
         self.askButton = QPushButton(get_message("ask_question", self.lang))
         self.askButton.setEnabled(False)
+        # 停止按钮，只在等待回答时显示
+        self.stopButton = QPushButton(get_message("stop_request", self.lang))
+        self.stopButton.hide()
         inputLayout.addWidget(self.followUpEdit)
         inputLayout.addWidget(self.askButton)
+        inputLayout.addWidget(self.stopButton)
         followUpLayout.addLayout(inputLayout)
         
         self.followUpGroupBox.setLayout(followUpLayout)
@@ -207,6 +218,7 @@ class FollowUpPanel(QWidget):
     def setup_connections(self):
         """设置信号连接"""
         self.askButton.clicked.connect(self.on_ask_clicked)
+        self.stopButton.clicked.connect(self.cancel_request)
         self.followUpEdit.returnPressed.connect(self.on_ask_clicked)  # 支持回车提交
         self.followUpEdit.textChanged.connect(self.on_follow_up_changed)
     
@@ -245,28 +257,26 @@ class FollowUpPanel(QWidget):
             # 获取当前问题的相关信息
             context = self._get_context_info(question)
 
-            # 创建新线程处理提问
-            self.thread = QThread()
+            # 创建追问任务
             self.worker = FollowUpQuestionWorker(
                 self.ai_handler,
                 context,
                 self.followup_model
             )
-            self.worker.moveToThread(self.thread)
 
             # 连接信号
-            self.thread.started.connect(self.worker.run)
-            self.worker.finished.connect(self.thread.quit)
-            self.worker.finished.connect(self.worker.deleteLater)
-            self.thread.finished.connect(self.thread.deleteLater)
+            self.worker.delta_received.connect(self.on_delta_received)
             self.worker.response_ready.connect(self.on_response_received)
             self.worker.error_occurred.connect(self.on_ask_error)
+            self.worker.cancelled.connect(self.on_ask_cancelled)
+            self.stopButton.show()
 
             # 保存当前问题以供后续使用
             self.current_follow_up_question = question
+            self._streaming_item = None
 
-            # 启动线程
-            self.thread.start()
+            # 在共享线程池中运行
+            self.future = start_worker(self.worker, LANE_FOLLOWUP)
 
         except Exception as e:
             self.on_ask_error(str(e))
@@ -313,33 +323,71 @@ class FollowUpPanel(QWidget):
             "history": self.follow_up_history
         }
     
+    def on_delta_received(self, delta):
+        """处理流式回答的增量文本"""
+        if self._streaming_item is None:
+            self._streaming_item = {
+                "question": self.current_follow_up_question,
+                "answer": ""
+            }
+            self.follow_up_history.append(self._streaming_item)
+        self._streaming_item["answer"] += delta
+        self._stream_render.request()
+    
     def on_response_received(self, response):
         """处理AI回答"""
         try:
-            # 添加到对话历史
-            self.follow_up_history.append({
-                "question": self.current_follow_up_question,
-                "answer": response
-            })
+            if self._streaming_item is not None:
+                # 流式回答已在历史中，用完整内容替换
+                self._streaming_item["answer"] = response
+                self._streaming_item = None
+            else:
+                # 添加到对话历史
+                self.follow_up_history.append({
+                    "question": self.current_follow_up_question,
+                    "answer": response
+                })
             
-            # 更新显示
-            self.update_history_display()
+            # 更新显示（取消等待中的流式重绘）
+            self._stream_render.flush()
             
             # 清空输入框
             self.followUpEdit.clear()
             
         finally:
             # 恢复界面状态
-            self.progressBar.hide()
-            self.askButton.setEnabled(True)
-            self.followUpEdit.setEnabled(True)
+            self._restore_input()
     
-    def on_ask_error(self, error_message):
-        """处理提问错误"""
-        showWarning(f"{get_message('follow_up_error', self.lang)}{error_message}")
+    def _restore_input(self):
+        """回答结束后恢复输入区域"""
         self.progressBar.hide()
+        self.stopButton.hide()
         self.askButton.setEnabled(True)
         self.followUpEdit.setEnabled(True)
+        self.worker = None
+    
+    def cancel_request(self):
+        """停止正在进行的追问，立即中止请求（关闭窗口时也会调用）"""
+        if self.worker is not None:
+            self.worker.cancel()
+    
+    def on_ask_cancelled(self):
+        """追问被停止，保留已收到的部分回答"""
+        if self._streaming_item is not None:
+            self._streaming_item = None
+            self._stream_render.flush()
+        self._restore_input()
+    
+    def on_ask_error(self, error_message):
+        """处理提问错误"""
+        # 移除未完成的流式回答
+        if self._streaming_item is not None:
+            if self._streaming_item in self.follow_up_history:
+                self.follow_up_history.remove(self._streaming_item)
+            self._streaming_item = None
+            self._stream_render.flush()
+        showWarning(f"{get_message('follow_up_error', self.lang)}{error_message}")
+        self._restore_input()
     
     def update_history_display(self):
         """更新对话历史显示"""
@@ -389,6 +437,7 @@ class FollowUpPanel(QWidget):
         self.follow_up_history = []
         self.askButton.setEnabled(False)
         self.current_follow_up_question = ""
+        self._streaming_item = None
     
     def show_context_menu(self, position):
         """显示右键菜单"""
@@ -39,6 +39,7 @@ class InputDialogUI:
         self.followUpModelLabel = None
         self.followUpModelComboBox = None
         self.generateButton = None
+        self.cancelGenerationButton = None
         self.progressBar = None
         self.questionSetsButton = None
         
@@ -190,9 +191,15 @@ class InputDialogUI:
         buttonLayout.addStretch()
         
         self.generateButton = QPushButton(get_message("generate_button", self.lang))
+        self.generateButton.setToolTip(get_message("generate_button_tooltip", self.lang))
         self.generateButton.setMinimumWidth(120)
         buttonLayout.addWidget(self.generateButton)
         
+        # 停止生成按钮，只在生成过程中显示
+        self.cancelGenerationButton = QPushButton(get_message("cancel_generation_button", self.lang))
+        self.cancelGenerationButton.hide()
+        buttonLayout.addWidget(self.cancelGenerationButton)
+        
         buttonLayout.addStretch()
         
         layout.addLayout(buttonLayout)
@@ -408,4 +415,5 @@ class InputDialogUI:
         self.modelLabel.setText(get_message("select_model", self.lang))
         self.followUpModelLabel.setText(get_message("select_followup_model", self.lang))
         self.generateButton.setText(get_message("generate_button", self.lang))
+        self.cancelGenerationButton.setText(get_message("cancel_generation_button", self.lang))
         self.questionSetsButton.setText("题集") 
\ No newline at end of file
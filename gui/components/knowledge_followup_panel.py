@@ -4,13 +4,16 @@
 """
 from aqt.qt import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox, 
                      QTextEdit, QLineEdit, QPushButton, QProgressBar,
-                     QMenu, QThread, pyqtSignal)
+                     QMenu, pyqtSignal)
 from PyQt6.QtCore import Qt
 from aqt import mw
 from aqt.utils import showInfo, showWarning
 
 from ...lang.messages import get_message, get_default_lang
+from ...utils.executor_service import LANE_FOLLOWUP
+from ..workers import start_worker
 from ..workers.knowledge_followup_worker import FollowUpQuestionWorker
+from .stream_render_throttle import StreamRenderThrottle
 
 
 class KnowledgeFollowUpPanel(QWidget):
@@ -34,7 +37,12 @@ class KnowledgeFollowUpPanel(QWidget):
         self.ai_handler = None
         self.followup_model = None
         self.current_followup_question = ""
+        # 流式回答中正在追加内容的历史条目
+        self._streaming_item = None
+        self.worker = None
         self._setup_ui()
+        # 限制流式回答的重绘频率，避免每个token都重新渲染历史
+        self._stream_render = StreamRenderThrottle(self, self._render_streaming_answer)
         
     def _setup_ui(self):
         """设置UI界面"""
@@ -59,8 +67,13 @@ class KnowledgeFollowUpPanel(QWidget):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         
+        # 停止按钮，只在等待回答时显示
+        self.stop_button = QPushButton(get_message("stop_request", self.lang))
+        self.stop_button.setVisible(False)
+        
         input_layout.addWidget(self.followup_input)
         input_layout.addWidget(self.send_button)
+        input_layout.addWidget(self.stop_button)
         followup_layout.addLayout(input_layout)
         followup_layout.addWidget(self.progress_bar)
         
@@ -70,6 +83,7 @@ class KnowledgeFollowUpPanel(QWidget):
         # 连接信号
         self.send_button.clicked.connect(self._handle_followup_question)
         self.followup_input.returnPressed.connect(self._handle_followup_question)
+        self.stop_button.clicked.connect(self.cancel_request)
         
         # 设置历史区域的右键菜单
         self.history_text.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
@@ -133,52 +147,97 @@ class KnowledgeFollowUpPanel(QWidget):
             context: 上下文信息字典
         """
         # 创建工作线程
-        self.thread = QThread()
         self.worker = FollowUpQuestionWorker(
             self.ai_handler,
             context,
             self.followup_model
         )
+        self._streaming_item = None
 
         # 连接信号
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
+        self.worker.delta_received.connect(self._handle_ai_delta)
         self.worker.response_ready.connect(self._handle_ai_response)
         self.worker.error_occurred.connect(self._handle_ai_error)
+        self.worker.cancelled.connect(self._handle_ai_cancelled)
+        self.stop_button.setVisible(True)
+
+        # 在共享线程池中运行
+        self.future = start_worker(self.worker, LANE_FOLLOWUP)
 
-        # 启动线程
-        self.thread.start()
+    def _handle_ai_delta(self, delta):
+        """处理流式回答的增量文本"""
+        if self._streaming_item is None:
+            self._streaming_item = {
+                "question": self.current_followup_question,
+                "answer": ""
+            }
+            self.follow_up_history.append(self._streaming_item)
+        self._streaming_item["answer"] += delta
+        self._stream_render.request()
+
+    def _render_streaming_answer(self):
+        """重绘流式回答并保持滚动到底部"""
+        self._update_history_display()
+        scroll_bar = self.history_text.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
 
     def _handle_ai_response(self, response):
         """处理AI响应"""
-        # 添加到历史记录
-        self.follow_up_history.append({
-            "question": self.current_followup_question,
-            "answer": response
-        })
+        if self._streaming_item is not None:
+            # 流式回答已在历史中，用完整内容替换
+            self._streaming_item["answer"] = response
+            self._streaming_item = None
+        else:
+            # 添加到历史记录
+            self.follow_up_history.append({
+                "question": self.current_followup_question,
+                "answer": response
+            })
 
-        # 更新显示
-        self._update_history_display()
+        # 更新显示（取消等待中的流式重绘）
+        self._stream_render.flush()
 
         # 清空输入框并恢复界面
         self.followup_input.clear()
+        self._restore_input()
+
+        # 发出历史更新信号
+        self.history_updated.emit(self.follow_up_history)
+
+    def _restore_input(self):
+        """回答结束后恢复输入区域"""
         self.followup_input.setEnabled(True)
         self.send_button.setEnabled(True)
+        self.stop_button.setVisible(False)
         self.progress_bar.setVisible(False)
+        self.worker = None
 
-        # 发出历史更新信号
-        self.history_updated.emit(self.follow_up_history)
+    def cancel_request(self):
+        """停止正在进行的追问，立即中止请求（关闭窗口时也会调用）"""
+        if self.worker is not None:
+            self.worker.cancel()
+
+    def _handle_ai_cancelled(self):
+        """追问被停止，保留已收到的部分回答"""
+        if self._streaming_item is not None:
+            self._streaming_item = None
+            self._stream_render.flush()
+            self.history_updated.emit(self.follow_up_history)
+        self._restore_input()
 
     def _handle_ai_error(self, error_msg):
         """处理AI错误"""
+        # 移除未完成的流式回答
+        if self._streaming_item is not None:
+            if self._streaming_item in self.follow_up_history:
+                self.follow_up_history.remove(self._streaming_item)
+            self._streaming_item = None
+            self._stream_render.flush()
+
         showWarning(error_msg)
 
         # 恢复界面
-        self.followup_input.setEnabled(True)
-        self.send_button.setEnabled(True)
-        self.progress_bar.setVisible(False)
+        self._restore_input()
 
     def _update_history_display(self):
         """更新历史记录显示"""
@@ -213,6 +272,7 @@ class KnowledgeFollowUpPanel(QWidget):
         """清空历史记录"""
         self.follow_up_history = []
         self.history_text.clear()
+        self._streaming_item = None
 
     def get_history(self):
         """
@@ -0,0 +1,47 @@
+"""
+流式输出重绘限流组件
+流式回答每收到一段内容都会触发重绘，重新渲染整个对话历史的开销随内容增长，
+这里把重绘限制为每 interval 秒最多一次，并保证最后一段内容也会显示出来
+"""
+import time
+
+from aqt.qt import QTimer
+
+
+class StreamRenderThrottle:
+    """限制流式输出时的重绘频率"""
+
+    def __init__(self, parent, render, interval=0.1):
+        """
+        初始化重绘限流
+
+        Args:
+            parent: 拥有计时器的控件（控件销毁时计时器随之停止）
+            render: 重绘函数
+            interval: 两次重绘之间的最小间隔（秒）
+        """
+        self._render = render
+        self._interval = interval
+        self._last_render = 0.0
+        self._timer = QTimer(parent)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    def request(self):
+        """收到新内容时调用：距上次重绘超过间隔时立即重绘，否则在间隔结束时重绘一次"""
+        if self._timer.isActive():
+            return
+        remaining = self._interval - (time.monotonic() - self._last_render)
+        if remaining <= 0:
+            self._fire()
+        else:
+            self._timer.start(max(1, int(remaining * 1000)))
+
+    def flush(self):
+        """流式输出结束（完成、停止或出错）时调用：取消等待中的重绘并立即重绘"""
+        self._timer.stop()
+        self._fire()
+
+    def _fire(self):
+        self._last_render = time.monotonic()
+        self._render()
@@ -1,10 +1,12 @@
 """
 输入事件处理控制器模块
 """
-from aqt.qt import QThread
+from aqt.qt import QApplication, Qt
 from aqt.utils import showWarning, showInfo
 from ...lang.messages import get_message
 from ...utils.ai_handler import AIHandler
+from ...utils.executor_service import LANE_GENERATION, LANE_PDF_IO
+from ..workers import start_worker
 from ..workers.generate_questions_worker import GenerateQuestionsWorker
 from ..workers.document_extract_worker import DocumentExtractWorker
 from ..dialogs.pdf_import_dialog import PDFImportDialog
@@ -24,9 +26,9 @@ class InputEventsController:
         self.dialog = dialog
         self.question_controller = question_controller
         self.ai_handler = None
-        self.thread = None
+        self.future = None
         self.worker = None
-        self.extract_thread = None
+        self.extract_future = None
         self.extract_worker = None
         
     def setup_connections(self):
@@ -35,6 +37,8 @@ class InputEventsController:
             return
 
         self.dialog.ui.generateButton.clicked.connect(self.on_generate_clicked)
+        if hasattr(self.dialog.ui, 'cancelGenerationButton'):
+            self.dialog.ui.cancelGenerationButton.clicked.connect(self.on_cancel_generation_clicked)
         self.dialog.ui.contentEdit.textChanged.connect(self.on_content_changed)
 
         # 添加问题类型变更事件
@@ -96,6 +100,9 @@ class InputEventsController:
             actual_type = "qa"
         num_questions = self.dialog.ui.numQuestionsSpinBox.value()
         
+        # 按住Shift点击时跳过响应缓存，强制重新生成
+        use_cache = not (QApplication.keyboardModifiers() & Qt.KeyboardModifier.ShiftModifier)
+        
         # 获取选择的模型
         selected_model = self.dialog.ui.modelComboBox.currentData()
         # 获取选择的追加提问模型
@@ -137,8 +144,7 @@ class InputEventsController:
             if not self.ai_handler:
                 self.ai_handler = AIHandler()
 
-            # 创建新线程
-            self.thread = QThread()
+            # 创建生成任务
             self.worker = GenerateQuestionsWorker(
                 self.ai_handler,
                 content,
@@ -147,20 +153,21 @@ class InputEventsController:
                 selected_model,  # 传递选择的模型
                 template_id,  # 传递模板ID
                 selected_followup_model,  # 传递追加提问模型
-                selected_language  # 传递选择的语言
+                selected_language,  # 传递选择的语言
+                use_cache=use_cache
             )
-            self.worker.moveToThread(self.thread)
 
             # 连接信号
-            self.thread.started.connect(self.worker.run)
-            self.worker.finished.connect(self.thread.quit)
-            self.worker.finished.connect(self.worker.deleteLater)
-            self.thread.finished.connect(self.thread.deleteLater)
             self.worker.questions_ready.connect(self.question_controller.on_questions_generated)
+            self.worker.questions_streamed.connect(self.question_controller.on_questions_streamed)
             self.worker.error_occurred.connect(self.question_controller.on_generation_error)
+            self.worker.generation_cancelled.connect(self.question_controller.on_generation_cancelled)
+
+            # 生成过程中显示停止按钮
+            self._show_cancel_button()
 
-            # 启动线程
-            self.thread.start()
+            # 在共享线程池中运行
+            self.future = start_worker(self.worker, LANE_GENERATION)
 
         except Exception as e:
             # �ض���AIδ�������쳣��ʾ���ʾ
@@ -174,6 +181,18 @@ class InputEventsController:
             else:
                 self.question_controller.on_generation_error(msg)
             
+    def _show_cancel_button(self):
+        """显示停止生成按钮"""
+        if hasattr(self.dialog.ui, 'cancelGenerationButton'):
+            self.dialog.ui.cancelGenerationButton.setEnabled(True)
+            self.dialog.ui.cancelGenerationButton.show()
+
+    def on_cancel_generation_clicked(self):
+        """停止生成：中止正在进行的请求，已完成的分块结果仍会显示"""
+        if self.worker is not None:
+            self.dialog.ui.cancelGenerationButton.setEnabled(False)
+            self.worker.cancel()
+            
     def on_content_changed(self):
         """内容变化事件"""
         has_content = bool(self.dialog.ui.contentEdit.toPlainText().strip())
@@ -225,16 +244,10 @@ class InputEventsController:
     def on_pdf_selected(self, pdf_path, start_page, end_page):
         """PDF选择回调，开始提取文本并生成题目"""
         try:
-            # 创建文档提取线程
-            self.extract_thread = QThread()
+            # 创建文档提取任务
             self.extract_worker = DocumentExtractWorker(pdf_path, start_page, end_page)
-            self.extract_worker.moveToThread(self.extract_thread)
 
             # 连接信号
-            self.extract_thread.started.connect(self.extract_worker.run)
-            self.extract_worker.finished.connect(self.extract_thread.quit)
-            self.extract_worker.finished.connect(self.extract_worker.deleteLater)
-            self.extract_thread.finished.connect(self.extract_thread.deleteLater)
             self.extract_worker.text_extracted.connect(self.on_pdf_text_extracted)
             self.extract_worker.error_occurred.connect(self.on_pdf_extraction_error)
             self.extract_worker.progress_updated.connect(self.on_pdf_extraction_progress)
@@ -247,8 +260,8 @@ class InputEventsController:
             # 禁用生成按钮
             self.dialog.ui.generateButton.setEnabled(False)
 
-            # 启动线程
-            self.extract_thread.start()
+            # 在共享线程池中运行
+            self.extract_future = start_worker(self.extract_worker, LANE_PDF_IO)
 
         except Exception as e:
             showWarning(f"{get_message('pdf_extraction_failed', self.dialog.lang)}: {str(e)}")
@@ -344,8 +357,7 @@ class InputEventsController:
             if not self.ai_handler:
                 self.ai_handler = AIHandler()
 
-            # 创建新线程
-            self.thread = QThread()
+            # 创建生成任务
             self.worker = GenerateQuestionsWorker(
                 self.ai_handler,
                 content,
@@ -356,19 +368,19 @@ class InputEventsController:
                 selected_followup_model,  # 传递追加提问模型
                 selected_language  # 传递选择的语言
             )
-            self.worker.moveToThread(self.thread)
 
             # 连接信号
-            self.thread.started.connect(self.worker.run)
-            self.worker.finished.connect(self.thread.quit)
-            self.worker.finished.connect(self.worker.deleteLater)
-            self.thread.finished.connect(self.thread.deleteLater)
             self.worker.questions_ready.connect(self.question_controller.on_questions_generated)
+            self.worker.questions_streamed.connect(self.question_controller.on_questions_streamed)
             self.worker.error_occurred.connect(self.question_controller.on_generation_error)
+            self.worker.generation_cancelled.connect(self.question_controller.on_generation_cancelled)
             self.worker.progress_updated.connect(self.on_generation_progress)
 
-            # 启动线程
-            self.thread.start()
+            # 生成过程中显示停止按钮
+            self._show_cancel_button()
+
+            # 在共享线程池中运行
+            self.future = start_worker(self.worker, LANE_GENERATION)
 
         except Exception as e:
             # �ض���AIδ�������쳣��ʾ���ʾ
@@ -1,7 +1,8 @@
 from aqt.qt import *
 from aqt.utils import showInfo, showWarning, tooltip
-from PyQt6.QtCore import QThread
 from ...utils.ai_handler import AIHandler
+from ...utils.executor_service import LANE_GENERATION
+from ..workers import start_worker
 from ..workers.language_pattern_worker import LanguagePatternWorker
 from ...config.language_levels import LANGUAGE_LEVELS
 
@@ -12,7 +13,7 @@ class LanguageController:
         self.window = window
         self.ai_handler = None
         self.pattern_examples = []
-        self.thread = None
+        self.future = None
         self.worker = None
         self.selected_model = None  # 存储当前选择的模型
         self.setup_connections()
@@ -110,20 +111,14 @@ class LanguageController:
             language_level, 
             examples_count
         )
-        self.thread = QThread()
-        self.worker.moveToThread(self.thread)
         
         # 连接信号
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        
         self.worker.response_ready.connect(self.on_pattern_generated)
         self.worker.error_occurred.connect(self.on_generation_error)
+        self.worker.cancelled.connect(self.on_generation_cancelled)
         
-        # 启动线程
-        self.thread.start()
+        # 在共享线程池中运行
+        self.future = start_worker(self.worker, LANE_GENERATION)
         
     def on_pattern_generated(self, response):
         """处理生成的语言模式练习内容"""
@@ -158,6 +153,17 @@ class LanguageController:
         self.window.input_panel.generate_button.setEnabled(True)
         showWarning(f"生成失败: {error_message}")
         
+    def cancel_generation(self):
+        """取消正在进行的生成，立即中止请求（关闭窗口时调用）"""
+        if self.worker is not None:
+            self.worker.cancel()
+        
+    def on_generation_cancelled(self):
+        """生成被取消，恢复界面状态"""
+        self.window.status_label.setText("")
+        self.window.input_panel.generate_button.setEnabled(True)
+        self.window.result_panel.enable_add_button(True)
+        
     def add_more_replacements(self, new_part):
         """处理添加更多替换部分"""
         if not new_part:
@@ -201,21 +207,14 @@ class LanguageController:
             language_level, 
             examples_count
         )
-        self.thread = QThread()
-        self.worker.moveToThread(self.thread)
-        
-        # 连接信号
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
         
         # 设置响应处理
         self.worker.response_ready.connect(self.on_additional_examples_generated)
         self.worker.error_occurred.connect(self.on_additional_generation_error)
+        self.worker.cancelled.connect(self.on_generation_cancelled)
         
-        # 启动线程
-        self.thread.start()
+        # 在共享线程池中运行
+        self.future = start_worker(self.worker, LANE_GENERATION)
         
     def on_additional_examples_generated(self, response):
         """处理生成的追加替换例句"""
@@ -2,7 +2,7 @@
 问题处理控制器模块
 """
 from aqt.qt import QPoint
-from aqt.utils import showInfo, showWarning
+from aqt.utils import showInfo, showWarning, tooltip
 from ...lang.messages import get_message
 from ..dialogs.review_dialog import ReviewDialog
 from ..knowledge_window import KnowledgeCardWindow
@@ -23,10 +23,31 @@ class QuestionController:
         self.current_question_index = 0
         self.review_dialog = None
         self.knowledge_dialog = None
+        # 本次生成中已通过流式输出显示的题目/卡片数
+        self.streamed_count = 0
         # ��ʼ��ʱ����ʱ������AI������ʵ�����Ա��ڳ�ʼ�������޷����д���
         # �ڼ�������ʱ���ٽ���ʼ��AI������
         self.ai_handler = None
         
+    def on_questions_streamed(self, partial):
+        """
+        流式生成时收到新解析出的题目或卡片的回调
+
+        第一批到达时就打开答题/知识卡窗口，之后到达的追加到窗口中，不必等待全部生成完成。
+
+        参数:
+        partial -- 新到达的条目，如 {"questions": [...]} 或 {"cards": [...]}
+        """
+        field = 'cards' if 'cards' in partial else 'questions'
+        items = partial.get(field) or []
+        if not items:
+            return
+        if self.streamed_count == 0:
+            self._show_generated({field: list(items)}, pending=True)
+        else:
+            self._append_generated(field, items)
+        self.streamed_count += len(items)
+
     def on_questions_generated(self, questions):
         """
         问题生成完成的回调
@@ -34,6 +55,55 @@ class QuestionController:
         参数:
         questions -- 生成的问题数据
         """
+        if self.streamed_count:
+            # 流式输出显示的是各请求/分块先到达的条目，最终结果经过去重、补充和排序，
+            # 用最终结果替换尚未看到的条目
+            field = 'cards' if isinstance(questions, dict) and 'cards' in questions else 'questions'
+            self._replace_generated(field, questions.get(field, []))
+            self._finish_streaming()
+        else:
+            self._show_generated(questions)
+
+        # 恢复界面状态
+        self._restore_generation_ui()
+
+    def _restore_generation_ui(self):
+        """生成结束后恢复输入窗口的按钮和进度条"""
+        self.dialog.ui.progressBar.hide()
+        self.dialog.ui.generateButton.setEnabled(True)
+        if hasattr(self.dialog.ui, 'cancelGenerationButton'):
+            self.dialog.ui.cancelGenerationButton.hide()
+
+    def _append_generated(self, field, items):
+        """向已打开的窗口追加流式生成的题目或卡片"""
+        if field == 'cards':
+            if self.knowledge_dialog is not None:
+                self.knowledge_dialog.append_cards(items)
+        elif self.review_dialog is not None:
+            self.review_dialog.append_questions(items)
+
+    def _replace_generated(self, field, items):
+        """用最终结果替换已打开窗口中流式显示的题目或卡片"""
+        if field == 'cards':
+            if self.knowledge_dialog is not None:
+                self.knowledge_dialog.replace_cards(items)
+        elif self.review_dialog is not None:
+            self.review_dialog.replace_questions(items)
+
+    def _finish_streaming(self):
+        """流式生成结束，通知答题窗口不再有新题目"""
+        if self.streamed_count and self.review_dialog is not None:
+            self.review_dialog.set_generation_pending(False)
+        self.streamed_count = 0
+
+    def _show_generated(self, questions, pending=False):
+        """
+        打开或更新答题/知识卡窗口
+
+        参数:
+        questions -- 生成的问题数据
+        pending -- 是否还有题目正在流式生成
+        """
         self.current_questions = questions
         self.current_question_index = 0
 
@@ -72,6 +142,7 @@ class QuestionController:
             else:
                 # 更新现有窗口的内容
                 self.review_dialog.update_questions(self.current_questions)
+            self.review_dialog.set_generation_pending(pending)
 
             # 显示窗口
             self.review_dialog.show()
@@ -81,10 +152,6 @@ class QuestionController:
             input_size = self.dialog.size()
             review_pos = QPoint(input_pos.x() + input_size.width() + 10, input_pos.y())
             self.review_dialog.move(review_pos)
-
-        # 恢复界面状态
-        self.dialog.ui.progressBar.hide()
-        self.dialog.ui.generateButton.setEnabled(True)
         
     def on_generation_error(self, error_message):
         """
@@ -93,9 +160,18 @@ class QuestionController:
         参数:
         error_message -- 错误信息
         """
+        self._finish_streaming()
         showWarning(f"{get_message('generation_error', self.dialog.lang)}{error_message}")
-        self.dialog.ui.progressBar.hide()
-        self.dialog.ui.generateButton.setEnabled(True)
+        self._restore_generation_ui()
+        
+    def on_generation_cancelled(self):
+        """
+        生成被取消且没有已完成的分块结果
+        （有已完成的结果时通过on_questions_generated显示部分结果）
+        """
+        self._finish_streaming()
+        tooltip(get_message('generation_cancelled', self.dialog.lang), parent=self.dialog)
+        self._restore_generation_ui()
         
     def show_current_question(self):
         """显示当前问题 - 已由ReviewDialog内部处理，此方法保留但不再需要实现具体逻辑"""
@@ -4,11 +4,13 @@
 """
 from aqt import mw
 from aqt.utils import showInfo, showWarning
-from aqt.qt import QObject, pyqtSignal, QThread, QDialog
+from aqt.qt import QObject, pyqtSignal, QDialog
 
 from ...utils import create_feynman_note, create_feynman_cloze_type
 from ...utils.question_sets import update_question_set
 from ...lang.messages import get_message, get_default_lang
+from ...utils.executor_service import LANE_EVALUATION
+from ..workers import start_worker
 from ..dialogs.cloze_dialog import ClozeDialog
 
 
@@ -18,6 +20,7 @@ class ReviewController(QObject):
     # 自定义信号
     feedback_ready = pyqtSignal(str)     # 反馈准备好的信号
     question_ready = pyqtSignal(dict)    # 问题准备好的信号
+    question_count_changed = pyqtSignal(int, int)  # 流式生成追加题目后的 (当前序号, 题目总数)
     
     def __init__(self, parent=None, ai_handler=None):
         """
@@ -47,8 +50,11 @@ class ReviewController(QObject):
         # 题目集ID，用于更新进度
         self.question_set_id = None
         
-        # 工作线程
-        self.thread = None
+        # 是否还有题目正在流式生成
+        self.generation_pending = False
+        
+        # 后台任务
+        self.future = None
         self.worker = None
     
     def update_questions(self, questions):
@@ -72,6 +78,64 @@ class ReviewController(QObject):
         
         self.show_current_question()
     
+    def append_questions(self, questions):
+        """
+        追加流式生成的题目，不重置答题状态
+        
+        Args:
+            questions (list): 新到达的题目列表
+        """
+        if not self.current_questions or 'questions' not in self.current_questions:
+            self.update_questions({'questions': list(questions)})
+            return
+        
+        question_list = self.current_questions['questions']
+        previous_total = len(question_list)
+        question_list.extend(questions)
+        
+        if self.current_question_index >= previous_total:
+            # 用户已答完之前到达的题目，正在等待新题目
+            self.show_current_question()
+        else:
+            self.question_count_changed.emit(self.current_question_index + 1, len(question_list))
+    
+    def replace_questions(self, questions):
+        """
+        流式生成结束后用最终结果替换尚未看到的题目，不重置答题状态
+        
+        已经看到的题目（当前题目、之前的题目和已作答的题目）保持原位置，之后的题目换成
+        最终结果中其余的题目（最终结果经过去重、补充和排序，与流式到达的题目可能不同）。
+        
+        Args:
+            questions (list): 最终生成的题目列表
+        """
+        if not self.current_questions or 'questions' not in self.current_questions:
+            self.update_questions({'questions': list(questions)})
+            return
+        
+        question_list = self.current_questions['questions']
+        seen = min(max([self.current_question_index] + list(self.question_history)) + 1, len(question_list))
+        seen_keys = {str(question.get('question', '')) for question in question_list[:seen]}
+        question_list[seen:] = [question for question in questions
+                                if str(question.get('question', '')) not in seen_keys]
+        
+        if self.current_question_index >= len(question_list):
+            self.show_current_question()
+        else:
+            self.question_count_changed.emit(self.current_question_index + 1, len(question_list))
+    
+    def set_generation_pending(self, pending):
+        """
+        设置是否还有题目正在流式生成
+        
+        Args:
+            pending (bool): 为True时答完已到达的题目后等待新题目，而不是提示全部完成
+        """
+        self.generation_pending = pending
+        if not pending and self.current_questions and 'questions' in self.current_questions:
+            if self.current_question_index >= len(self.current_questions['questions']):
+                self.show_current_question()
+    
     def show_current_question(self):
         """显示当前问题"""
         if not self.current_questions or 'questions' not in self.current_questions:
@@ -80,6 +144,10 @@ class ReviewController(QObject):
         
         questions = self.current_questions['questions']
         if self.current_question_index >= len(questions):
+            if self.generation_pending:
+                # 后面的题目还在生成，到达后会自动显示
+                print("等待后续题目生成...")
+                return
             showInfo(get_message("all_questions_done", self.lang))
             return
         
@@ -171,24 +239,19 @@ class ReviewController(QObject):
         from ..workers.evaluate_answer_worker import EvaluateAnswerWorker
         
         # 创建工作线程
-        self.thread = QThread()
         self.worker = EvaluateAnswerWorker(
             self.ai_handler, 
             question, 
             answer
         )
-        self.worker.moveToThread(self.thread)
         
         # 连接信号
-        self.thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
         self.worker.feedback_ready.connect(self.on_feedback_received)
         self.worker.error_occurred.connect(self.on_evaluate_error)
+        self.worker.cancelled.connect(self.on_evaluate_cancelled)
         
-        # 启动线程
-        self.thread.start()
+        # 在共享线程池中运行
+        self.future = start_worker(self.worker, LANE_EVALUATION)
     
     def on_feedback_received(self, feedback):
         """
@@ -240,6 +303,16 @@ class ReviewController(QObject):
         showWarning(f"{get_message('answer_eval_error', self.lang)}{error_message}")
         self.feedback_ready.emit(get_message("feedback_error", self.lang))
     
+    def cancel_evaluation(self):
+        """取消正在进行的答案评估，立即中止请求（关闭答题窗口时调用）"""
+        if self.worker is not None:
+            self.worker.cancel()
+    
+    def on_evaluate_cancelled(self):
+        """答案评估被取消"""
+        print("答案评估已取消")
+        self.worker = None
+    
     def next_question(self):
         """处理进入下一题"""
         # 保存当前问题的followup面板内容
@@ -0,0 +1,251 @@
+"""
+生成任务管理对话框模块
+显示保存的生成任务，支持暂停、继续、取消和查看结果；
+打开配置文件时在后台继续上次中断的任务
+"""
+import time
+
+from aqt.qt import *
+from aqt import mw
+from aqt.utils import showWarning, askUser, tooltip
+
+from ..styles.anki_style import apply_anki_style
+from ..workers import start_worker
+from ..workers.generate_questions_worker import GenerateQuestionsWorker
+from ...utils.ai_handler import AIHandler
+from ...utils.executor_service import LANE_GENERATION
+from ...utils.job_store import (
+    JOB_CANCELLED, JOB_COMPLETED, JOB_PAUSED, JOB_RUNNING, JOB_STATUS_NAMES, RESUMABLE_STATUSES,
+    get_job_store
+)
+
+# 问题类型的显示名称
+QUESTION_TYPE_NAMES = {
+    "multiple_choice": "选择题",
+    "qa": "问答题",
+    "knowledge_card": "知识卡",
+    "language_learning": "语言学习",
+    "custom": "自定义模板",
+}
+
+# 在后台运行的任务 {任务ID: 工作对象}，保持引用直到任务结束
+_background_workers = {}
+
+
+def run_job_in_background(job_id):
+    """
+    在后台继续生成任务，完成后可以在生成任务窗口中查看结果
+
+    Args:
+        job_id: 任务ID
+
+    Returns:
+        bool: 是否已开始运行
+    """
+    store = get_job_store()
+    job = store.get_job(job_id)
+    if job is None or store.is_active(job_id) or job_id in _background_workers:
+        return False
+    try:
+        worker = GenerateQuestionsWorker.from_job(AIHandler(), job)
+    except Exception as e:
+        print(f"继续生成任务失败: {str(e)}")
+        store.set_status(job_id, job["status"], error=str(e))
+        return False
+
+    title = job["title"]
+    worker.questions_ready.connect(lambda _: tooltip(f"生成任务已完成：{title}", parent=mw))
+    worker.error_occurred.connect(lambda message: tooltip(f"生成任务未完成：{message}", parent=mw))
+    worker.generation_cancelled.connect(lambda: tooltip(f"生成任务已取消：{title}", parent=mw))
+    worker.finished.connect(lambda: _background_workers.pop(job_id, None))
+    _background_workers[job_id] = worker
+    start_worker(worker, LANE_GENERATION)
+    return True
+
+
+def resume_unfinished_jobs():
+    """继续上次运行时被中断的生成任务（在打开配置文件时调用），已完成的分块不会重新请求"""
+    try:
+        jobs = get_job_store().list_jobs([JOB_RUNNING])
+    except Exception as e:
+        print(f"读取生成任务失败: {str(e)}")
+        return
+    resumed = sum(1 for job in jobs if run_job_in_background(job["id"]))
+    if resumed:
+        print(f"继续 {resumed} 个未完成的生成任务")
+        tooltip(f"正在后台继续 {resumed} 个未完成的生成任务", parent=mw)
+
+
+class GenerationJobsDialog(QDialog):
+    """生成任务管理对话框"""
+
+    def __init__(self, parent=None):
+        """
+        初始化生成任务管理对话框
+
+        Args:
+            parent: 父窗口
+        """
+        super().__init__(parent)
+        self.jobs = []
+
+        self.setup_ui()
+        self.setup_connections()
+        self.load_jobs()
+
+        # 定时刷新任务进度
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.load_jobs)
+        self.refresh_timer.start(2000)
+
+    def setup_ui(self):
+        """设置UI界面"""
+        self.setWindowTitle("生成任务")
+        self.resize(760, 420)
+
+        layout = QVBoxLayout(self)
+
+        self.jobs_table = QTableWidget()
+        self.jobs_table.setColumnCount(5)
+        self.jobs_table.setHorizontalHeaderLabels(["内容", "类型", "状态", "分块进度", "更新时间"])
+        self.jobs_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, 5):
+            self.jobs_table.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.jobs_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.jobs_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.jobs_table)
+
+        # 按钮区域
+        buttons_layout = QHBoxLayout()
+
+        self.resume_button = QPushButton("继续")
+        buttons_layout.addWidget(self.resume_button)
+
+        self.pause_button = QPushButton("暂停")
+        buttons_layout.addWidget(self.pause_button)
+
+        self.cancel_button = QPushButton("取消任务")
+        buttons_layout.addWidget(self.cancel_button)
+
+        self.open_button = QPushButton("查看结果")
+        buttons_layout.addWidget(self.open_button)
+
+        self.delete_button = QPushButton("删除")
+        buttons_layout.addWidget(self.delete_button)
+
+        buttons_layout.addStretch()
+
+        self.close_button = QPushButton("关闭")
+        buttons_layout.addWidget(self.close_button)
+
+        layout.addLayout(buttons_layout)
+
+        # 应用样式
+        apply_anki_style(self)
+        self.update_buttons()
+
+    def setup_connections(self):
+        """设置信号连接"""
+        self.jobs_table.itemSelectionChanged.connect(self.update_buttons)
+        self.jobs_table.cellDoubleClicked.connect(lambda row, column: self.on_open_clicked())
+        self.resume_button.clicked.connect(self.on_resume_clicked)
+        self.pause_button.clicked.connect(lambda: self.stop_selected(JOB_PAUSED))
+        self.cancel_button.clicked.connect(self.on_cancel_clicked)
+        self.open_button.clicked.connect(self.on_open_clicked)
+        self.delete_button.clicked.connect(self.on_delete_clicked)
+        self.close_button.clicked.connect(self.close)
+
+    def load_jobs(self):
+        """加载任务列表，保持当前选中的任务"""
+        selected = self.selected_job()
+        selected_id = selected["id"] if selected else None
+        store = get_job_store()
+        self.jobs = store.list_jobs()
+
+        self.jobs_table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            status = job["status"]
+            status_text = JOB_STATUS_NAMES.get(status, status)
+            if status == JOB_RUNNING and not store.is_active(job["id"]):
+                status_text = "已中断"
+            progress = f"{job['done']}/{job['total']}" if job["total"] else "-"
+            values = [
+                job["title"] or "（空）",
+                QUESTION_TYPE_NAMES.get(job["question_type"], job["question_type"]),
+                status_text,
+                progress,
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(job["updated"])),
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 2 and job["error"]:
+                    item.setToolTip(job["error"])
+                self.jobs_table.setItem(row, column, item)
+            if job["id"] == selected_id:
+                self.jobs_table.selectRow(row)
+        self.update_buttons()
+
+    def selected_job(self):
+        """获取选中的任务"""
+        rows = self.jobs_table.selectionModel().selectedRows() if self.jobs_table.selectionModel() else []
+        if not rows or rows[0].row() >= len(self.jobs):
+            return None
+        return self.jobs[rows[0].row()]
+
+    def update_buttons(self):
+        """根据选中任务的状态更新按钮"""
+        job = self.selected_job()
+        active = job is not None and (get_job_store().is_active(job["id"]) or job["id"] in _background_workers)
+        status = job["status"] if job else None
+        self.resume_button.setEnabled(job is not None and not active and status in RESUMABLE_STATUSES)
+        self.pause_button.setEnabled(active)
+        self.cancel_button.setEnabled(job is not None and status not in (JOB_COMPLETED, JOB_CANCELLED))
+        self.open_button.setEnabled(status == JOB_COMPLETED)
+        self.delete_button.setEnabled(job is not None and not active)
+
+    def on_resume_clicked(self):
+        """在后台继续选中的任务"""
+        job = self.selected_job()
+        if job and not run_job_in_background(job["id"]):
+            showWarning("无法继续该生成任务", parent=self)
+        self.load_jobs()
+
+    def stop_selected(self, status):
+        """暂停或取消选中的任务"""
+        job = self.selected_job()
+        if job:
+            get_job_store().request_stop(job["id"], status)
+        self.load_jobs()
+
+    def on_cancel_clicked(self):
+        """取消选中的任务"""
+        if askUser("确定要取消该生成任务吗？已完成的分块结果将不再使用。", parent=self):
+            self.stop_selected(JOB_CANCELLED)
+
+    def on_open_clicked(self):
+        """在答题/知识卡窗口中打开已完成任务的结果"""
+        job = self.selected_job()
+        if not job or job["status"] != JOB_COMPLETED:
+            return
+        result = get_job_store().get_job(job["id"])["result"]
+        if not result:
+            showWarning("该任务没有保存结果", parent=self)
+            return
+        from ..input_window import show_input_dialog
+        input_dialog = show_input_dialog()
+        input_dialog.question_controller.on_questions_generated(result)
+
+    def on_delete_clicked(self):
+        """删除选中的任务"""
+        job = self.selected_job()
+        if job and askUser("确定要删除该生成任务吗？", parent=self):
+            get_job_store().delete_job(job["id"])
+            self.load_jobs()
+
+
+def show_generation_jobs():
+    """显示生成任务管理对话框（非模态）"""
+    dialog = GenerationJobsDialog(mw)
+    dialog.show()
+    return dialog
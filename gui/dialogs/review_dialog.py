@@ -126,6 +126,7 @@ class ReviewDialog(QDialog):
         """设置信号连接"""
         # 连接控制器信号
         self.controller.question_ready.connect(self.on_question_ready)
+        self.controller.question_count_changed.connect(self.on_question_count_changed)
         self.controller.feedback_ready.connect(self.on_feedback_ready)
         
         # 连接UI信号
@@ -205,6 +206,17 @@ class ReviewDialog(QDialog):
         if hasattr(self.controller, 'question_set_id') and self.controller.question_set_id:
             update_question_set(self.controller.question_set_id, self.controller.current_question_index)
     
+    def on_question_count_changed(self, index, total):
+        """
+        流式生成追加题目后更新题号中的总数，不影响当前的作答状态
+        
+        Args:
+            index (int): 当前题目序号（从1开始）
+            total (int): 题目总数
+        """
+        if self.controller.current_question:
+            self.questionView.set_question(self.controller.current_question, index, total)
+    
     def on_answer_submitted(self, answer):
         """
         处理答案提交信号
@@ -304,6 +316,33 @@ class ReviewDialog(QDialog):
             questions (dict): 问题数据，包含questions列表
         """
         self.controller.update_questions(questions)
+    
+    def append_questions(self, questions):
+        """
+        追加流式生成的题目
+        
+        Args:
+            questions (list): 新到达的题目列表
+        """
+        self.controller.append_questions(questions)
+    
+    def replace_questions(self, questions):
+        """
+        流式生成结束后用最终结果替换尚未看到的题目
+        
+        Args:
+            questions (list): 最终生成的题目列表
+        """
+        self.controller.replace_questions(questions)
+    
+    def set_generation_pending(self, pending):
+        """
+        设置是否还有题目正在流式生成
+        
+        Args:
+            pending (bool): 是否还有题目正在生成
+        """
+        self.controller.set_generation_pending(pending)
         
     def save_question_set(self, title=None):
         """
@@ -340,6 +379,10 @@ class ReviewDialog(QDialog):
         Args:
             event: 关闭事件
         """
+        # 中止正在进行的评估和追问请求
+        self.controller.cancel_evaluation()
+        self.followupPanel.cancel_request()
+        
         # 检查是否有题目
         if (hasattr(self.controller, 'current_questions') and 
             self.controller.current_questions and 
@@ -463,6 +463,30 @@ class KnowledgeCardWindow(QDialog):
         # 显示新的卡片
         self._show_current_card()
 
+    def append_cards(self, cards):
+        """追加流式生成的卡片，不改变当前显示的卡片"""
+        if not self.cards or not self.cards.get('cards'):
+            self.update_cards({'cards': list(cards)})
+            return
+        self.cards['cards'].extend(cards)
+        self.navigation.update_navigation(self.current_index, len(self.cards['cards']))
+
+    def replace_cards(self, cards):
+        """流式生成结束后用最终结果替换当前卡片之后的卡片，不改变当前显示的卡片"""
+        if not self.cards or not self.cards.get('cards'):
+            self.update_cards({'cards': list(cards)})
+            return
+        card_list = self.cards['cards']
+        seen = min(self.current_index + 1, len(card_list))
+        seen_keys = {str(card.get('question', '')) for card in card_list[:seen]}
+        card_list[seen:] = [card for card in cards if str(card.get('question', '')) not in seen_keys]
+        self.navigation.update_navigation(self.current_index, len(card_list))
+
+    def closeEvent(self, event):
+        """关闭窗口时中止正在进行的追问请求"""
+        self.followup_panel.cancel_request()
+        super().closeEvent(event)
+
     # 保留旧的apply_anki_style方法以防其他地方调用（已废弃）
     def apply_anki_style(self):
         """应用Anki样式（已废弃，使用样式模块）"""
@@ -111,6 +111,11 @@ class LanguageWindow(QDialog):
         # 重新加载模型列表
         self.settings_panel.load_models()
 
+    def closeEvent(self, event):
+        """关闭窗口时中止正在进行的生成请求"""
+        self.controller.cancel_generation()
+        super().closeEvent(event)
+
 def show_language_window(sentence=None):
     """
     显示语言模式练习窗口
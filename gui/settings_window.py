@@ -636,18 +636,18 @@ class SettingsDialog(QDialog):
                 model['request_timeout'] = 300
         
         # 保存额外设置
-        # 先获取现有的model_specific_settings（如果有的话）
-        existing_model_specific = self.config.get('advanced_settings', {}).get('model_specific_settings', {})
-        
-        config['advanced_settings'] = {
+        # 保留界面上未提供的设置项（如model_specific_settings、缓存设置等）
+        advanced_settings = dict(self.config.get('advanced_settings', {}))
+        advanced_settings.setdefault('model_specific_settings', {})
+        advanced_settings.update({
             'enable_concurrent_processing': self.enableConcurrentCheck.isChecked(),
             'max_concurrent_requests': self.maxConcurrentSpinBox.value(),
             'enable_text_chunking': self.enableChunkingCheck.isChecked(),
             'chunk_size': self.chunkSizeSpinBox.value(),
             'chunk_overlap': self.chunkOverlapSpinBox.value(),
-            'chunk_strategy': self.chunkStrategyCombo.currentData(),
-            'model_specific_settings': existing_model_specific
-        }
+            'chunk_strategy': self.chunkStrategyCombo.currentData()
+        })
+        config['advanced_settings'] = advanced_settings
         
         # 验证配置
         if config['advanced_settings']['chunk_overlap'] >= config['advanced_settings']['chunk_size']:
@@ -845,7 +845,10 @@ class SettingsDialog(QDialog):
         models = self.config.get('models', [])
         
         if self.current_edit_index >= 0 and self.current_edit_index < len(models):
-            # 更新现有模型
+            # 更新现有模型（保留界面上未提供的速率限制设置）
+            for key in ('rpm_limit', 'tpm_limit'):
+                if key in models[self.current_edit_index]:
+                    model_config[key] = models[self.current_edit_index][key]
             models[self.current_edit_index] = model_config
         else:
             # 添加新模型
@@ -1,4 +1,23 @@
 # 工作线程目录初始化文件
 """
 工作线程相关代码目录，用于存放处理后台任务的线程类
-""" 
\ No newline at end of file
+"""
+from ...utils.executor_service import get_executor_service
+
+
+def start_worker(worker, lane):
+    """
+    在共享线程池的指定通道中运行工作对象
+
+    工作对象不再各自创建QThread，而是由run方法在线程池线程中执行；信号会排队
+    传递到界面线程。工作对象在发出finished信号后自动释放。
+
+    Args:
+        worker: 带有run方法和finished信号的工作对象
+        lane: 线程池通道名称（见utils.executor_service）
+
+    Returns:
+        concurrent.futures.Future
+    """
+    worker.finished.connect(worker.deleteLater)
+    return get_executor_service().submit(lane, worker.run)
@@ -4,6 +4,7 @@
 """
 from aqt.qt import QObject, pyqtSignal
 from ...lang.messages import get_message, get_default_lang
+from ...utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
 
 
 class EvaluateAnswerWorker(QObject):
@@ -11,6 +12,7 @@ class EvaluateAnswerWorker(QObject):
     finished = pyqtSignal()
     feedback_ready = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
     def __init__(self, ai_handler, question, answer):
         """
@@ -26,9 +28,18 @@ class EvaluateAnswerWorker(QObject):
         self.question = question
         self.answer = answer
         self.lang = get_default_lang()
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        """取消评估，立即中止正在进行的请求"""
+        self.cancel_token.cancel()
 
     def run(self):
         """运行工作线程，处理答案评估请求"""
+        with cancellation_scope(self.cancel_token):
+            self._run()
+
+    def _run(self):
         try:
             # 验证数据
             if not self.ai_handler:
@@ -52,6 +63,8 @@ class EvaluateAnswerWorker(QObject):
             # 发送评估结果
             self.feedback_ready.emit(formatted_feedback)
             
+        except OperationCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
@@ -3,13 +3,16 @@
 负责处理追加提问请求并获取AI回答
 """
 from aqt.qt import QObject, pyqtSignal
+from ...utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
 
 
 class FollowUpQuestionWorker(QObject):
     """追加问题处理工作线程类"""
     finished = pyqtSignal()
     response_ready = pyqtSignal(str)
+    delta_received = pyqtSignal(str)  # 流式回答的增量文本
     error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()  # 被取消，已收到的流式文本保留在界面上
 
     def __init__(self, ai_handler, context, followup_model=None):
         """
@@ -24,9 +27,18 @@ class FollowUpQuestionWorker(QObject):
         self.ai_handler = ai_handler
         self.context = context
         self.followup_model = followup_model
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        """取消追问，立即中止正在进行的请求"""
+        self.cancel_token.cancel()
 
     def run(self):
         """运行工作线程，处理追加问题请求"""
+        with cancellation_scope(self.cancel_token):
+            self._run()
+
+    def _run(self):
         try:
             # 确保上下文中的关键字段存在，如果不存在则给默认值
             required_fields = ["original_question", "source_content", "user_answer", 
@@ -64,7 +76,10 @@ class FollowUpQuestionWorker(QObject):
                 
             try:
                 # 调用AI处理器
-                response = self.ai_handler.handle_follow_up_question(normalized_context)
+                response = self.ai_handler.handle_follow_up_question(
+                    normalized_context,
+                    stream_callback=self.delta_received.emit
+                )
                 if not response:
                     raise ValueError("AI返回的响应为空")
                     
@@ -73,7 +88,8 @@ class FollowUpQuestionWorker(QObject):
                 # 如果之前切换了模型，恢复原始模型设置
                 if self.followup_model and original_model:
                     self.ai_handler.current_model_info = original_model
-                
+        except OperationCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
@@ -2,15 +2,19 @@
 问题生成工作线程
 """
 from aqt.qt import QObject, pyqtSignal
+from ...utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
+from ...utils.job_store import JOB_CANCELLED, JobInterrupted, get_job_store
 
 class GenerateQuestionsWorker(QObject):
     """生成问题的工作线程类"""
     finished = pyqtSignal()
     questions_ready = pyqtSignal(dict)
+    questions_streamed = pyqtSignal(dict)  # 流式生成时逐条发送，如 {"questions": [题目]}
     error_occurred = pyqtSignal(str)
     progress_updated = pyqtSignal(int, int, str)  # current, total, message
+    generation_cancelled = pyqtSignal()  # 被取消且没有已完成的条目（有条目时通过questions_ready发送部分结果）
 
-    def __init__(self, ai_handler, content, question_type, num_questions, model_name=None, template_id=None, followup_model=None, language="中文"):
+    def __init__(self, ai_handler, content, question_type, num_questions, model_name=None, template_id=None, followup_model=None, language="中文", use_cache=True, job_id=None):
         """
         初始化问题生成工作线程
         
@@ -23,6 +27,8 @@ class GenerateQuestionsWorker(QObject):
         template_id -- 模板ID（可选，自定义类型需要）
         followup_model -- 追加提问模型（可选）
         language -- 生成内容使用的语言（可选）
+        use_cache -- 是否使用响应缓存（可选，False时强制重新生成）
+        job_id -- 要继续的生成任务ID（可选，为空时创建新任务）
         """
         super().__init__()
         self.ai_handler = ai_handler
@@ -33,19 +39,100 @@ class GenerateQuestionsWorker(QObject):
         self.template_id = template_id
         self.followup_model = followup_model
         self.language = language
+        self.use_cache = use_cache
+        self.job_id = job_id
+        self.cancel_token = CancellationToken()
+        self.job = None
+
+    @classmethod
+    def from_job(cls, ai_handler, job):
+        """
+        根据保存的生成任务创建工作对象，用于继续中断的任务
+
+        参数:
+        ai_handler -- AI处理器实例
+        job -- JobStore.get_job返回的任务信息
+        """
+        params = job["params"]
+        return cls(
+            ai_handler,
+            job["content"],
+            job["question_type"],
+            params.get("num_questions", 5),
+            params.get("model_name"),
+            params.get("template_id"),
+            params.get("followup_model"),
+            params.get("language", "中文"),
+            use_cache=params.get("use_cache", True),
+            job_id=job["id"]
+        )
+
+    def _start_job(self):
+        """
+        创建（或继续）持久化的生成任务
+
+        只有分块生成才保存任务（单次请求没有可以继续的中间结果），
+        未启用任务存储或不分块时返回None
+        """
+        if not getattr(self.ai_handler, 'enable_job_store', False):
+            return None
+        if self.job_id is None and not self.ai_handler.will_chunk(
+                self.content, self.question_type, self.num_questions, self.language):
+            return None
+        store = get_job_store()
+        if self.job_id is None:
+            self.job_id = store.create_job(self.question_type, self.content, {
+                "num_questions": self.num_questions,
+                "model_name": self.model_name,
+                "template_id": self.template_id,
+                "followup_model": self.followup_model,
+                "language": self.language,
+                "use_cache": self.use_cache,
+            })
+        return store.attach(self.job_id)
+
+    def cancel(self):
+        """
+        取消生成：立即中止正在进行的请求，不再发送排队中的分块，
+        已完成的分块结果作为部分结果发送；有生成任务时任务标记为已取消
+        """
+        job = self.job
+        if job is not None:
+            job.request_stop(JOB_CANCELLED)
+        self.cancel_token.cancel()
 
     def run(self):
         """运行工作线程，生成问题"""
+        with cancellation_scope(self.cancel_token):
+            self._run()
+
+    def _run(self):
+        job = None
         try:
-            # 如果设置了模型名称，先设置模型
+            # 如果设置了模型名称，先设置模型（是否分块取决于模型的上下文窗口）
             if self.model_name:
                 self.ai_handler.set_model(self.model_name)
-            
+
+            job = self._start_job()
+            if job is not None:
+                # 在生成任务窗口中暂停或取消任务时同样中止正在进行的请求
+                job.on_stop(self.cancel_token.cancel)
+                self.job = job
+                if self.cancel_token.cancelled:
+                    job.request_stop(JOB_CANCELLED)
+            self.ai_handler.generation_job = job
+
             # 设置进度回调
             def progress_callback(current, total, message):
                 self.progress_updated.emit(current, total, message)
             
             self.ai_handler.progress_callback = progress_callback
+            
+            # 设置条目回调，流式生成时每解析出一个题目/卡片就发送出去
+            def item_callback(field, item):
+                self.questions_streamed.emit({field: [item]})
+            
+            self.ai_handler.item_callback = item_callback
                 
             # 生成问题
             if self.question_type == "custom" and self.template_id:
@@ -53,14 +140,16 @@ class GenerateQuestionsWorker(QObject):
                     self.content, 
                     self.template_id, 
                     self.num_questions,
-                    self.language
+                    self.language,
+                    use_cache=self.use_cache
                 )
             else:
                 questions = self.ai_handler.generate_questions(
                     self.content, 
                     self.question_type, 
                     self.num_questions,
-                    self.language
+                    self.language,
+                    use_cache=self.use_cache
                 )
                 
             # 将追加提问模型信息添加到结果中
@@ -68,10 +157,32 @@ class GenerateQuestionsWorker(QObject):
                 if isinstance(questions, dict):
                     questions['followup_model'] = self.followup_model
                 
+            if job is not None and job.stopping:
+                # 被暂停或取消时返回的是已完成分块的部分结果，任务不算完成
+                job.interrupted(job.stop_status)
+                if job.stop_status != JOB_CANCELLED:
+                    # 暂停或中断的任务稍后继续，不发送部分结果
+                    self.error_occurred.emit(str(JobInterrupted(job.stop_status)))
+                    return
+            elif job is not None:
+                job.finish(questions)
             self.questions_ready.emit(questions)
+        except (JobInterrupted, OperationCancelled):
+            status = job.stop_status if job is not None else None
+            if status is not None:
+                job.interrupted(status)
+            if status in (None, JOB_CANCELLED):
+                self.generation_cancelled.emit()
+            else:
+                self.error_occurred.emit(str(JobInterrupted(status)))
         except Exception as e:
+            if job is not None:
+                job.fail(str(e))
             self.error_occurred.emit(str(e))
         finally:
-            # 清除进度回调
+            # 清除进度回调、条目回调和生成任务
             self.ai_handler.progress_callback = None
+            self.ai_handler.item_callback = None
+            self.ai_handler.generation_job = None
+            self.job = None
             self.finished.emit() 
\ No newline at end of file
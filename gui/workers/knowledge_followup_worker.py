@@ -3,13 +3,16 @@
 处理知识卡片的AI追问请求
 """
 from aqt.qt import QObject, pyqtSignal
+from ...utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
 
 
 class FollowUpQuestionWorker(QObject):
     """处理追问请求的工作线程"""
     finished = pyqtSignal()
     response_ready = pyqtSignal(str)
+    delta_received = pyqtSignal(str)  # 流式回答的增量文本
     error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()  # 被取消，已收到的流式文本保留在界面上
     
     def __init__(self, ai_handler, context, followup_model=None):
         """
@@ -24,9 +27,18 @@ class FollowUpQuestionWorker(QObject):
         self.ai_handler = ai_handler
         self.context = context
         self.followup_model = followup_model
+        self.cancel_token = CancellationToken()
         
+    def cancel(self):
+        """取消追问，立即中止正在进行的请求"""
+        self.cancel_token.cancel()
+
     def run(self):
         """运行AI请求"""
+        with cancellation_scope(self.cancel_token):
+            self._run()
+
+    def _run(self):
         try:
             # 如果指定了追加提问模型，临时设置AI处理器使用该模型
             original_model = None
@@ -38,7 +50,10 @@ class FollowUpQuestionWorker(QObject):
                 
             try:
                 # 调用AI处理器
-                response = self.ai_handler.handle_follow_up_question(self.context)
+                response = self.ai_handler.handle_follow_up_question(
+                    self.context,
+                    stream_callback=self.delta_received.emit
+                )
                 if not response:
                     raise ValueError("AI返回的响应为空")
                     
@@ -47,6 +62,8 @@ class FollowUpQuestionWorker(QObject):
                 # 如果之前切换了模型，恢复原始模型设置
                 if self.followup_model and original_model:
                     self.ai_handler.current_model_info = original_model
+        except OperationCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
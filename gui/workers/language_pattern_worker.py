@@ -1,10 +1,12 @@
 from PyQt6.QtCore import QObject, pyqtSignal
+from ...utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
 
 class LanguagePatternWorker(QObject):
     """处理语言模式练习请求的工作线程"""
     finished = pyqtSignal()
     response_ready = pyqtSignal(dict)
     error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()
     
     def __init__(self, ai_handler, sentence, target_language, specified_parts=None, language_level=None, examples_count=3):
         super().__init__()
@@ -14,8 +16,17 @@ class LanguagePatternWorker(QObject):
         self.specified_parts = specified_parts
         self.language_level = language_level
         self.examples_count = examples_count
+        self.cancel_token = CancellationToken()
+        
+    def cancel(self):
+        """取消生成，立即中止正在进行的请求"""
+        self.cancel_token.cancel()
         
     def run(self):
+        with cancellation_scope(self.cancel_token):
+            self._run()
+        
+    def _run(self):
         try:
             # 调用AI处理器生成语言练习内容
             print(f"使用目标语言: {self.target_language} ({self.language_level})")  # 添加调试信息
@@ -27,6 +38,8 @@ class LanguagePatternWorker(QObject):
                 self.examples_count
             )
             self.response_ready.emit(response)
+        except OperationCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
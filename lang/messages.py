@@ -118,6 +118,10 @@ translations: Dict[str, Dict[str, str]] = {
         "select_template": "选择模板：",
         "manage_templates": "管理模板",
         "generate_button": "生成问题",
+        "generate_button_tooltip": "按住Shift点击可跳过缓存，重新生成",
+        "cancel_generation_button": "停止生成",
+        "generation_cancelled": "已停止生成",
+        "stop_request": "停止",
         "input_content_warning": "请输入要学习的内容",
         "generation_error": "生成问题时出错：",
         "no_questions": "没有可用的问题",
@@ -415,6 +419,10 @@ translations: Dict[str, Dict[str, str]] = {
         "select_template": "Select Template:",
         "manage_templates": "Manage Templates",
         "generate_button": "Generate Questions",
+        "generate_button_tooltip": "Shift+click to bypass the cache and regenerate",
+        "cancel_generation_button": "Stop",
+        "generation_cancelled": "Generation stopped",
+        "stop_request": "Stop",
         "input_content_warning": "Please enter content to learn",
         "generation_error": "Error generating questions: ",
         "no_questions": "No questions available",
@@ -0,0 +1,77 @@
+"""
+摘要提示模板模块，包含分层生成（先概括分块、再合并提纲）所需的提示模板。
+"""
+
+from .common import ROLE_FEYNMAN_ASSISTANT, format_with_language
+
+# 分块摘要提示模板
+CHUNK_SUMMARY_PROMPT = """{role_description}下面是一本较长学习材料中的第{index}个片段，请概括其中的知识要点。
+要求：
+1. 只保留值得出题考查的概念、定义、原理、结论和关键数据，省略举例细节和过渡性文字
+2. 每个要点单独一行，以"- "开头
+3. 总长度不超过{max_chars}字
+4. 片段中没有实质性知识内容（如目录、版权页、参考文献）时，只输出"（无）"
+5. 直接输出要点，不要添加标题或其他说明
+
+片段内容：
+{content}
+"""
+
+# 提纲合并提示模板
+OUTLINE_PROMPT = """{role_description}下面是一本较长学习材料各片段的要点摘要，每段摘要前的[编号]表示它来自原文的哪个片段。
+请把这些摘要合并成一份结构清晰的提纲。
+要求：
+1. 按主题组织层次，合并重复的要点，保留重要的概念、定义、原理和结论
+2. 每个要点末尾保留其来源片段的编号，如"[3]"；来自多个片段时写成"[3][7]"
+3. 总长度不超过{max_chars}字
+4. 直接输出提纲，不要添加其他说明
+
+各片段摘要：
+{content}
+"""
+
+
+def get_chunk_summary_prompt(content: str, index: int, max_chars: int = 300, language: str = "中文") -> str:
+    """
+    格式化分块摘要提示模板
+
+    Args:
+        content: 分块文本
+        index: 片段编号（从1开始）
+        max_chars: 摘要的最大字数
+        language: 生成内容使用的语言
+
+    Returns:
+        格式化后的提示文本
+    """
+    return format_with_language(
+        CHUNK_SUMMARY_PROMPT,
+        language,
+        "要点",
+        role_description=ROLE_FEYNMAN_ASSISTANT + "。",
+        index=index,
+        max_chars=max_chars,
+        content=content
+    )
+
+
+def get_outline_prompt(summaries: str, max_chars: int = 4000, language: str = "中文") -> str:
+    """
+    格式化提纲合并提示模板
+
+    Args:
+        summaries: 带[编号]标记的各片段摘要
+        max_chars: 提纲的最大字数
+        language: 生成内容使用的语言
+
+    Returns:
+        格式化后的提示文本
+    """
+    return format_with_language(
+        OUTLINE_PROMPT,
+        language,
+        "提纲内容",
+        role_description=ROLE_FEYNMAN_ASSISTANT + "。",
+        max_chars=max_chars,
+        content=summaries
+    )
@@ -0,0 +1,31 @@
+"""
+测试配置
+
+插件目录的__init__.py和utils/__init__.py会导入aqt，只能在Anki中运行。这里把插件目录
+注册为feynman包、utils注册为feynman.utils子包，但不执行它们的__init__.py，这样不依赖
+Anki的模块（使用相对导入）可以直接在pytest中导入：
+
+    from feynman.utils.lenient_json import lenient_loads
+
+插件目录本身也有__init__.py，pytest收集测试时会以目录名导入它，因此同样预先注册。
+"""
+
+import os
+import sys
+import types
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _register_package(name: str, path: str):
+    """注册只有搜索路径、不执行__init__.py的包"""
+    if name in sys.modules:
+        return
+    package = types.ModuleType(name)
+    package.__path__ = [path]
+    sys.modules[name] = package
+
+
+_register_package("feynman", ADDON_DIR)
+_register_package(os.path.basename(ADDON_DIR), ADDON_DIR)
+_register_package("feynman.utils", os.path.join(ADDON_DIR, "utils"))
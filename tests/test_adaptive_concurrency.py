@@ -0,0 +1,267 @@
+"""自适应并发：AIMD调整并发上限、按优先级排队"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from feynman.utils import adaptive_concurrency, retry_policy
+from feynman.utils.adaptive_concurrency import AdaptiveLimiter, is_overload_error
+from feynman.utils.request_priority import PRIORITY_BULK, PRIORITY_INTERACTIVE
+from feynman.utils.retry_policy import CircuitBreaker, RetryPolicy, call_with_retry
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(adaptive_concurrency.time, "time", lambda: now[0])
+    return now
+
+
+def saturated_success(limiter, latency=0.1):
+    """占满并发名额后完成一个请求"""
+    while limiter.try_acquire():
+        pass
+    limiter.release(latency=latency)
+
+
+@pytest.mark.parametrize("error, overload", [
+    (HTTPError(429), True),
+    (HTTPError(503), True),
+    (HTTPError(400), False),
+    (TimeoutError(), True),
+    (ValueError("坏响应"), False),
+])
+def test_is_overload_error(error, overload):
+    assert is_overload_error(error) == overload
+
+
+def test_try_acquire_respects_limit():
+    limiter = AdaptiveLimiter("test", initial_limit=2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release(latency=0.1)
+    assert limiter.try_acquire()
+
+
+def test_overload_halves_limit(clock):
+    limiter = AdaptiveLimiter("test", initial_limit=8)
+    limiter.acquire()
+    limiter.release(error=HTTPError(429))
+    assert limiter.current_limit == 4
+
+    # 同一时间窗口内的多次失败只减一次
+    limiter.acquire()
+    limiter.release(error=HTTPError(503))
+    assert limiter.current_limit == 4
+
+    clock[0] += 2
+    limiter.acquire()
+    limiter.release(error=HTTPError(503))
+    assert limiter.current_limit == 2
+    assert limiter.get_stats()["decreases"] == 2
+
+
+def test_limit_never_drops_below_minimum(clock):
+    limiter = AdaptiveLimiter("test", initial_limit=2, min_limit=1)
+    for _ in range(5):
+        clock[0] += 10
+        limiter.acquire()
+        limiter.release(error=HTTPError(429))
+    assert limiter.current_limit == 1
+
+
+def test_other_errors_keep_limit():
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    limiter.acquire()
+    limiter.release(error=HTTPError(400))
+    assert limiter.current_limit == 4
+
+
+def test_additive_increase_when_saturated():
+    limiter = AdaptiveLimiter("test", initial_limit=2, max_limit=4)
+    limits = []
+    for _ in range(12):
+        saturated_success(limiter)
+        limits.append(limiter.limit)
+    # 每完成约一个窗口（limit个请求）增加1，不超过max_limit
+    assert limits[:2] == [2.5, 2.9]
+    assert limits == sorted(limits)
+    assert limiter.current_limit == 4
+    assert limiter.limit == 4.0
+
+
+def test_no_increase_when_not_saturated():
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.limit == 4.0
+
+
+def test_no_increase_when_latency_rises():
+    limiter = AdaptiveLimiter("test", initial_limit=2, latency_tolerance=2.0)
+    saturated_success(limiter, latency=0.1)
+    limit = limiter.limit
+    for _ in range(10):
+        saturated_success(limiter, latency=5.0)
+    assert limiter.limit < limit + 0.5
+
+
+def test_on_change_called_when_integer_limit_changes(clock):
+    changes = []
+    limiter = AdaptiveLimiter("test", initial_limit=4, on_change=lambda l: changes.append(l.current_limit))
+    limiter.acquire()
+    limiter.release(error=HTTPError(429))
+    assert changes == [2]
+
+
+def test_track_releases_with_error(clock):
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    with pytest.raises(HTTPError):
+        with limiter.track():
+            raise HTTPError(429)
+    assert limiter.current_limit == 2
+    assert limiter.get_stats()["in_flight"] == 0
+
+
+def test_reserved_slots_only_for_interactive():
+    limiter = AdaptiveLimiter("test", initial_limit=2, reserved_slots=1)
+    assert limiter.try_acquire(PRIORITY_BULK)
+    assert limiter.try_acquire(PRIORITY_BULK)
+    assert not limiter.try_acquire(PRIORITY_BULK)
+    assert limiter.try_acquire(PRIORITY_INTERACTIVE)
+    assert not limiter.try_acquire(PRIORITY_INTERACTIVE)
+
+
+def test_waiting_interactive_request_goes_first():
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    limiter.acquire(PRIORITY_BULK)
+    acquired = threading.Event()
+
+    def interactive():
+        limiter.acquire(PRIORITY_INTERACTIVE)
+        acquired.set()
+
+    thread = threading.Thread(target=interactive)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while not limiter.get_stats()["waiting"]["interactive"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    limiter.release(latency=0.1)
+    # 名额释放后不会被批量请求抢先占用
+    assert not limiter.try_acquire(PRIORITY_BULK)
+    assert acquired.wait(2)
+    thread.join()
+    assert limiter.get_stats()["in_flight"] == 1
+
+
+def test_hold_retried_overload_halves_limit(clock, monkeypatch):
+    limiter = AdaptiveLimiter("test", initial_limit=8)
+    in_flight_while_waiting = []
+    monkeypatch.setattr(
+        retry_policy, "cancellable_sleep",
+        lambda seconds: in_flight_while_waiting.append(limiter.get_stats()["in_flight"]),
+    )
+    attempts = [0]
+
+    def open_stream():
+        attempts[0] += 1
+        if attempts[0] == 1:
+            raise HTTPError(429)
+        return "stream"
+
+    held = call_with_retry("test", lambda: limiter.hold(open_stream), RetryPolicy(), CircuitBreaker("test"))
+    # 被重试吸收的429同样计入AIMD，重试等待期间不占用名额
+    assert limiter.current_limit == 4
+    assert in_flight_while_waiting == [0]
+    with held as stream:
+        assert stream == "stream"
+        assert limiter.get_stats()["in_flight"] == 1
+    assert limiter.get_stats()["in_flight"] == 0
+
+
+def test_async_waiter_woken_by_release_from_other_thread():
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    limiter.acquire()
+
+    async def wait_for_slot():
+        threading.Timer(0.1, limiter.release, kwargs={"latency": 0.1}).start()
+        await asyncio.wait_for(limiter.acquire_async(PRIORITY_BULK), 2)
+
+    asyncio.run(wait_for_slot())
+    stats = limiter.get_stats()
+    assert stats["in_flight"] == 1
+    assert stats["waiting"]["bulk"] == 0
+
+
+def test_async_interactive_waiter_goes_first():
+    limiter = AdaptiveLimiter("test", initial_limit=1, max_limit=1)
+    limiter.acquire()
+    order = []
+
+    async def waiter(priority, name):
+        await limiter.acquire_async(priority)
+        order.append(name)
+
+    async def main():
+        bulk = asyncio.ensure_future(waiter(PRIORITY_BULK, "bulk"))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.ensure_future(waiter(PRIORITY_INTERACTIVE, "interactive"))
+        await asyncio.sleep(0.01)
+        limiter.release(latency=0.1)
+        await asyncio.wait_for(interactive, 2)
+        assert not bulk.done()
+        limiter.release(latency=0.1)
+        await asyncio.wait_for(bulk, 2)
+
+    asyncio.run(main())
+    assert order == ["interactive", "bulk"]
+
+
+def test_cancelled_async_waiter_stops_waiting():
+    limiter = AdaptiveLimiter("test", initial_limit=1)
+    limiter.acquire()
+
+    async def main():
+        task = asyncio.ensure_future(limiter.acquire_async(PRIORITY_BULK))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert limiter.get_stats()["waiting"]["bulk"] == 0
+    limiter.release(latency=0.1)
+    assert limiter.get_stats()["in_flight"] == 0
+
+
+def test_limit_changes_saved_in_background(monkeypatch):
+    monkeypatch.setattr(adaptive_concurrency, "_saved_limits", {})
+    monkeypatch.setattr(adaptive_concurrency, "_last_save", 0.0)
+    monkeypatch.setattr(adaptive_concurrency, "_save_timer", None)
+    saved = threading.Event()
+    writers = []
+
+    def save():
+        writers.append(threading.get_ident())
+        saved.set()
+
+    monkeypatch.setattr(adaptive_concurrency, "save_concurrency_limits", save)
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    adaptive_concurrency._on_limit_changed(limiter)
+    # 同一写入间隔内的多次变化合并为一次写入
+    adaptive_concurrency._on_limit_changed(limiter)
+    assert saved.wait(2)
+    time.sleep(0.05)
+    assert len(writers) == 1
+    assert writers[0] != threading.get_ident()
+    assert adaptive_concurrency._saved_limits["test"] == 4.0
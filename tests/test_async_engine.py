@@ -0,0 +1,135 @@
+"""异步引擎：结果顺序、并发上限、取消、推测执行和硬截止时间"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from feynman.utils.async_engine import AsyncEngine
+from feynman.utils.cancellation import CancellationToken, OperationCancelled, cancellation_scope
+from feynman.utils.task_deadlines import (
+    MIN_LATENCY_SAMPLES, BatchDeadlineExceeded, DeadlinePolicy, LatencyTracker,
+)
+
+
+@pytest.fixture
+def engine():
+    engine = AsyncEngine()
+    yield engine
+    engine.shutdown()
+
+
+def sleeper(delays):
+    """返回按delays[index]秒后完成的协程工厂列表"""
+    def factory(index):
+        async def run():
+            await asyncio.sleep(delays[index])
+            return index
+        return run
+    return [factory(index) for index in range(len(delays))]
+
+
+def test_results_in_task_order(engine):
+    finished = []
+    threads = set()
+
+    def on_outcome(index, ok, result, elapsed):
+        finished.append(index)
+        threads.add(threading.get_ident())
+
+    results = engine.run_batch(sleeper([0.15, 0.1, 0.05, 0.0]), limit=4, outcome_callback=on_outcome)
+    assert results == [(True, 0), (True, 1), (True, 2), (True, 3)]
+    assert finished == [3, 2, 1, 0]
+    # 回调在调用方线程中执行
+    assert threads == {threading.get_ident()}
+
+
+def test_failures_keep_their_index(engine):
+    async def fail():
+        raise ValueError("坏响应")
+
+    async def succeed():
+        return "ok"
+
+    results = engine.run_batch([fail, succeed], limit=2)
+    assert results[1] == (True, "ok")
+    assert results[0][0] is False
+    assert isinstance(results[0][1], ValueError)
+
+
+def test_limit_bounds_concurrency(engine):
+    running = [0, 0]
+
+    def factory():
+        async def run():
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+            await asyncio.sleep(0.02)
+            running[0] -= 1
+        return run()
+
+    progress = []
+    engine.run_batch([factory] * 10, limit=3, progress_callback=lambda done, total: progress.append((done, total)))
+    assert running[1] == 3
+    assert progress[-1] == (10, 10)
+
+
+def test_cancellation_token_stops_batch(engine):
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+    start = time.monotonic()
+    with cancellation_scope(token):
+        results = engine.run_batch(sleeper([0.0, 5.0, 5.0, 5.0, 0.0]), limit=3)
+    assert time.monotonic() - start < 2.0
+    assert results[0] == (True, 0)
+    for ok, error in results[1:]:
+        assert not ok
+        assert isinstance(error, OperationCancelled)
+
+
+def test_speculation_waits_for_peer_samples(engine):
+    # 样本还差一个：同一批中第一个完成的任务记录样本后，落后的任务随即推测执行
+    tracker = LatencyTracker()
+    for _ in range(MIN_LATENCY_SAMPLES - 1):
+        tracker.record("model", 0.05)
+    policy = DeadlinePolicy("model", multiplier=1.0, min_soft_deadline=0.1, tracker=tracker)
+    calls = [0]
+
+    async def slow_then_fast():
+        calls[0] += 1
+        await asyncio.sleep(5.0 if calls[0] == 1 else 0.01)
+        return "straggler"
+
+    async def fast():
+        await asyncio.sleep(0.05)
+        return "fast"
+
+    start = time.monotonic()
+    results = engine.run_batch([slow_then_fast, fast], limit=2, deadline_policy=policy)
+    assert time.monotonic() - start < 2.0
+    assert results == [(True, "straggler"), (True, "fast")]
+    assert calls[0] == 2
+
+
+def test_no_speculation_without_samples(engine):
+    policy = DeadlinePolicy("model", min_soft_deadline=0.0, tracker=LatencyTracker())
+    calls = [0]
+
+    async def task():
+        calls[0] += 1
+        await asyncio.sleep(0.1)
+        return calls[0]
+
+    assert engine.run_batch([task], limit=1, deadline_policy=policy) == [(True, 1)]
+    assert calls[0] == 1
+
+
+def test_hard_deadline(engine):
+    policy = DeadlinePolicy("model", max_speculative=0, batch_deadline=0.3, tracker=LatencyTracker())
+    start = time.monotonic()
+    results = engine.run_batch(sleeper([0.0, 5.0, 0.05]), limit=3, deadline_policy=policy)
+    assert time.monotonic() - start < 2.0
+    assert results[0] == (True, 0) and results[2] == (True, 2)
+    assert not results[1][0]
+    assert isinstance(results[1][1], BatchDeadlineExceeded)
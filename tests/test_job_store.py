@@ -0,0 +1,126 @@
+"""生成任务存储：分块结果的保存与恢复、过期任务清理"""
+
+import time
+
+import pytest
+
+from feynman.utils import job_store
+from feynman.utils.job_store import (
+    JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED, JOB_PAUSED, JOB_RUNNING, STAGE_GENERATE,
+    JobInterrupted, JobStore,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def tasks(*texts):
+    return [(text, index, 3, "中文") for index, text in enumerate(texts)]
+
+
+def test_resume_returns_completed_chunks(store):
+    job_id = store.create_job("multiple_choice", "原文", {"num_questions": 6})
+    job = store.attach(job_id)
+    assert job.begin_stage(STAGE_GENERATE, tasks("一", "二", "三")) == {}
+    job.record_chunk(STAGE_GENERATE, 0, {"questions": [{"question": "题一"}]})
+    job.record_chunk(STAGE_GENERATE, 2, {"questions": []})
+    job.interrupted(JOB_PAUSED)
+
+    assert store.get_job(job_id)["status"] == JOB_PAUSED
+    listed = store.list_jobs([JOB_PAUSED])
+    assert [(item["id"], item["done"], item["total"]) for item in listed] == [(job_id, 2, 3)]
+
+    resumed = store.attach(job_id)
+    completed = resumed.begin_stage(STAGE_GENERATE, tasks("一", "二", "三"))
+    assert completed == {0: {"questions": [{"question": "题一"}]}, 2: {"questions": []}}
+
+
+def test_changed_chunks_are_not_reused(store):
+    job_id = store.create_job("essay", "原文", {})
+    job = store.attach(job_id)
+    job.begin_stage(STAGE_GENERATE, tasks("一", "二", "三"))
+    for index in range(3):
+        job.record_chunk(STAGE_GENERATE, index, {"questions": [index]})
+    job.fail("网络错误")
+
+    assert store.get_job(job_id)["error"] == "网络错误"
+    job = store.attach(job_id)
+    # 第二个分块内容变化，第三个分块不再存在
+    assert job.begin_stage(STAGE_GENERATE, tasks("一", "改")) == {0: {"questions": [0]}}
+    assert store.list_jobs()[0]["total"] == 2
+
+
+def test_finish_saves_result(store):
+    job_id = store.create_job("essay", "原文", {})
+    job = store.attach(job_id)
+    job.finish({"questions": ["完成"]})
+    info = store.get_job(job_id)
+    assert info["status"] == JOB_COMPLETED
+    assert info["result"] == {"questions": ["完成"]}
+    assert not store.is_active(job_id)
+
+
+def test_attach_twice_fails(store):
+    job_id = store.create_job("essay", "原文", {})
+    store.attach(job_id)
+    with pytest.raises(RuntimeError):
+        store.attach(job_id)
+
+
+def test_request_stop_interrupts_running_job(store):
+    job_id = store.create_job("essay", "原文", {})
+    job = store.attach(job_id)
+    stopped = []
+    job.on_stop(lambda: stopped.append(True))
+    store.request_stop(job_id, JOB_CANCELLED)
+    assert stopped == [True]
+    with pytest.raises(JobInterrupted) as info:
+        job.check()
+    assert info.value.status == JOB_CANCELLED
+
+
+def test_request_stop_on_idle_job_updates_status(store):
+    job_id = store.create_job("essay", "原文", {})
+    store.request_stop(job_id, JOB_CANCELLED)
+    assert store.get_job(job_id)["status"] == JOB_CANCELLED
+
+
+def test_close_keeps_running_jobs_resumable(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    job_id = store.create_job("essay", "原文", {})
+    job = store.attach(job_id)
+    store.close()
+    assert job.stop_status == JOB_RUNNING
+
+    reopened = JobStore(path)
+    try:
+        assert reopened.get_job(job_id)["status"] == JOB_RUNNING
+    finally:
+        reopened.close()
+
+
+def test_prune_removes_old_finished_and_failed_jobs(store, monkeypatch):
+    statuses = [JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED, JOB_PAUSED, JOB_RUNNING]
+    now = time.time()
+    monkeypatch.setattr(job_store.time, "time", lambda: now - 30 * 86400)
+    old = {}
+    for status in statuses:
+        job_id = store.create_job("essay", "原文", {})
+        store.begin_stage(job_id, STAGE_GENERATE, tasks("一"))
+        store.set_status(job_id, status)
+        old[status] = job_id
+    monkeypatch.setattr(job_store.time, "time", lambda: now)
+    recent = store.create_job("essay", "原文", {})
+    store.set_status(recent, JOB_FAILED)
+
+    store.prune()
+
+    remaining = {item["id"] for item in store.list_jobs()}
+    assert remaining == {old[JOB_PAUSED], old[JOB_RUNNING], recent}
+    rows = store._execute("SELECT job_id FROM job_chunks")
+    assert {row["job_id"] for row in rows} == {old[JOB_PAUSED], old[JOB_RUNNING]}
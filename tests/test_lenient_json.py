@@ -0,0 +1,98 @@
+"""宽松JSON解析和截断响应的条目提取"""
+
+import json
+
+import pytest
+
+from feynman.utils.lenient_json import (
+    MAX_DEPTH,
+    REPAIR_CODE_FENCE, REPAIR_EXTRA_COMMA, REPAIR_LEADING_TEXT, REPAIR_MISSING_COMMA,
+    REPAIR_PYTHON_LITERAL, REPAIR_SINGLE_QUOTE, REPAIR_TRAILING_TEXT, REPAIR_TRUNCATED,
+    REPAIR_UNCLOSED_STRING, REPAIR_UNESCAPED_QUOTE, REPAIR_UNQUOTED_KEY,
+    LenientJSONError, lenient_loads, salvage_array,
+)
+
+
+def test_valid_json_needs_no_repairs():
+    text = json.dumps({"questions": [{"question": "什么是动量？", "options": ["A", "B"]}]}, ensure_ascii=False)
+    assert lenient_loads(text) == (json.loads(text), [])
+
+
+@pytest.mark.parametrize("text, expected, repair", [
+    ('```json\n{"a": 1}\n```', {"a": 1}, REPAIR_CODE_FENCE),
+    ('以下是生成的题目：{"a": 1}', {"a": 1}, REPAIR_LEADING_TEXT),
+    ('{"a": 1} 希望对你有帮助', {"a": 1}, REPAIR_TRAILING_TEXT),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}, REPAIR_MISSING_COMMA),
+    ('{"a": [1, 2,], }', {"a": [1, 2]}, REPAIR_EXTRA_COMMA),
+    ("{'a': 'x'}", {"a": "x"}, REPAIR_SINGLE_QUOTE),
+    ('{a: 1}', {"a": 1}, REPAIR_UNQUOTED_KEY),
+    ('{"a": True, "b": None}', {"a": True, "b": None}, REPAIR_PYTHON_LITERAL),
+    ('{"a": "他说"你好"然后走了"}', {"a": '他说"你好"然后走了'}, REPAIR_UNESCAPED_QUOTE),
+])
+def test_repairs(text, expected, repair):
+    value, repairs = lenient_loads(text)
+    assert value == expected
+    assert repair in repairs
+
+
+def test_truncated_response_is_closed():
+    value, repairs = lenient_loads('{"questions": [{"question": "未完成的题')
+    assert value == {"questions": [{"question": "未完成的题"}]}
+    assert REPAIR_UNCLOSED_STRING in repairs
+    assert REPAIR_TRUNCATED in repairs
+
+
+def test_no_json_raises():
+    with pytest.raises(LenientJSONError):
+        lenient_loads("抱歉，我无法生成题目。")
+
+
+def test_error_is_value_error():
+    # 调用方按ValueError处理解析失败
+    assert issubclass(LenientJSONError, ValueError)
+
+
+def test_depth_limit_on_damaged_input():
+    # 非法JSON走宽松解析器，超过嵌套上限时报错而不是递归溢出
+    text = "[" * (MAX_DEPTH + 1) + "1,,"
+    with pytest.raises(LenientJSONError, match="嵌套层数"):
+        lenient_loads(text)
+
+
+def test_deeply_nested_input_does_not_overflow():
+    text = "[" * 100000
+    with pytest.raises(LenientJSONError):
+        lenient_loads(text)
+
+
+def test_nesting_within_limit():
+    depth = MAX_DEPTH - 1
+    value, _ = lenient_loads("[" * depth + "1" + "]" * depth + " trailing")
+    for _ in range(depth):
+        value = value[0]
+    assert value == 1
+
+
+def test_salvage_keeps_complete_items():
+    text = '{"questions": [{"question": "一"}, {"question": "二"}, {"question": "三'
+    items, incomplete = salvage_array(text, "questions")
+    assert items == [{"question": "一"}, {"question": "二"}]
+    assert incomplete
+
+
+def test_salvage_complete_response():
+    items, incomplete = salvage_array('{"cards": [{"question": "一"}]}', "cards")
+    assert items == [{"question": "一"}]
+    assert not incomplete
+
+
+def test_salvage_stops_at_damage():
+    text = '{"questions": [{"question": "一"}, {"question": "二"}, {"question": : ]}'
+    with pytest.raises(LenientJSONError):
+        lenient_loads(text)
+    assert salvage_array(text, "questions") == ([{"question": "一"}, {"question": "二"}], True)
+
+
+@pytest.mark.parametrize("text", ["", "没有JSON", '{"other": 1}', '{"questions": "不是数组"}'])
+def test_salvage_without_items(text):
+    assert salvage_array(text, "questions") == ([], True)
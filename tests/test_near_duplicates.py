@@ -0,0 +1,85 @@
+"""基于MinHash/LSH的近似重复条目检测"""
+
+import random
+
+from feynman.utils.near_duplicates import (
+    ChunkDeduplicator, NearDuplicateIndex, deduplicate, item_text, jaccard, shingles,
+)
+
+
+def choice(question, options=("A. 甲", "B. 乙", "C. 丙", "D. 丁")):
+    return {"question": question, "options": list(options), "correct_answer": "A"}
+
+
+def test_shingles_ignore_case_whitespace_and_punctuation():
+    assert shingles("Newton's First Law!") == shingles("newtons  first law")
+    assert shingles("牛顿第一定律。") == shingles("牛顿 第一 定律")
+
+
+def test_short_and_empty_text():
+    assert len(shingles("ab")) == 1
+    assert shingles("，。 ") == set()
+    assert jaccard(set(), {1}) == 0.0
+
+
+def test_item_text_uses_options_or_answer():
+    assert "B. 乙" in item_text(choice("题干"))
+    assert item_text({"question": "问", "answer": "答"}) == "问 答"
+    assert item_text("纯文本") == "纯文本"
+
+
+def test_index_detects_near_duplicate():
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add("牛顿第一定律指出物体在不受外力作用时保持静止或匀速直线运动状态") is None
+    assert index.add("牛顿第一定律指出，物体在不受外力作用时保持静止或匀速直线运动状态。") == 0
+    assert index.add("能量守恒定律说明能量既不会凭空产生也不会凭空消失") is None
+    assert len(index) == 2
+
+
+def test_index_matches_exact_jaccard():
+    # LSH只用于筛选候选，是否重复由精确的Jaccard相似度决定
+    rng = random.Random(7)
+    words = ["力", "质量", "加速度", "动量", "能量", "速度", "位移", "时间", "功率", "电流"]
+    texts = ["".join(rng.choice(words) for _ in range(12)) for _ in range(80)]
+    index = NearDuplicateIndex(threshold=0.5)
+    kept = []
+    for text in texts:
+        duplicate_of = index.add(text)
+        if duplicate_of is None:
+            kept.append(text)
+        else:
+            assert jaccard(shingles(text), shingles(kept[duplicate_of])) >= 0.5
+
+
+def test_deduplicate_keeps_first_occurrence():
+    items = [
+        choice("下列关于动量守恒条件的说法，正确的是？"),
+        choice("关于能量守恒，下列说法正确的是？"),
+        choice("下列关于动量守恒条件的说法中，正确的是："),
+    ]
+    kept, removed = deduplicate(items)
+    assert kept == items[:2]
+    assert removed == [(2, 0)]
+
+
+def test_different_options_are_not_duplicates():
+    items = [
+        choice("下列哪个是矢量？", ["A. 速度", "B. 质量", "C. 时间", "D. 温度"]),
+        choice("下列哪个是标量？", ["A. 力", "B. 位移", "C. 功", "D. 加速度"]),
+    ]
+    kept, removed = deduplicate(items)
+    assert kept == items
+    assert removed == []
+
+
+def test_chunk_deduplicator_records_duplicates_per_chunk():
+    deduplicator = ChunkDeduplicator()
+    first = choice("下列关于动量守恒条件的说法，正确的是？")
+    assert deduplicator.filter(0, [first]) == [first]
+    again = choice("下列关于动量守恒条件的说法，正确的是？")
+    other = choice("关于热力学第二定律，下列说法正确的是？")
+    assert deduplicator.filter(1, [again, other]) == [other]
+    assert deduplicator.duplicates_of == {1: [first]}
+    assert deduplicator.removed == 1
+    assert not deduplicator.accept(choice("下列关于动量守恒条件的说法正确的是"))
+    assert deduplicator.accept(choice("电磁感应现象是由谁发现的？"))
@@ -0,0 +1,99 @@
+"""速率预算：RPM/TPM令牌桶、按实际用量修正、按优先级排队"""
+
+import pytest
+
+from feynman.utils import rate_limiter
+from feynman.utils.rate_limiter import (
+    UNLIMITED_BUDGET, RateBudget, TokenBucket,
+    estimate_request_tokens, extract_usage_tokens, get_rate_budget,
+)
+from feynman.utils.request_priority import PRIORITY_BULK, PRIORITY_EVALUATION, PRIORITY_INTERACTIVE
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_refills_per_minute(clock):
+    bucket = TokenBucket(60)
+    bucket.tokens = 0
+    bucket.refill(clock[0])
+    clock[0] += 10
+    bucket.refill(clock[0])
+    assert bucket.tokens == pytest.approx(10)
+    assert bucket.wait_time(15) == pytest.approx(5)
+    clock[0] += 600
+    bucket.refill(clock[0])
+    assert bucket.tokens == 60
+
+
+def test_rpm_budget(clock):
+    budget = RateBudget("model", rpm=2)
+    assert budget.try_reserve(0, PRIORITY_BULK) == 0
+    assert budget.try_reserve(0, PRIORITY_BULK) == 0
+    # 每分钟2个请求：再攒一个需要30秒
+    assert budget.try_reserve(0, PRIORITY_BULK) == pytest.approx(30)
+    clock[0] += 30
+    assert budget.try_reserve(0, PRIORITY_BULK) == 0
+    assert budget.get_stats()["admitted"] == 3
+
+
+def test_tpm_budget_and_reconcile(clock):
+    budget = RateBudget("model", tpm=1000)
+    assert budget.try_reserve(800, PRIORITY_BULK) == 0
+    assert budget.try_reserve(800, PRIORITY_BULK) > 0
+    # 实际只用了300个token，多扣的退回桶中
+    budget.reconcile(800, 300)
+    assert budget.try_reserve(600, PRIORITY_BULK) == 0
+    assert budget.get_stats()["actual_tokens"] == 300
+
+
+def test_request_larger_than_bucket_is_admitted_when_full(clock):
+    budget = RateBudget("model", tpm=100)
+    assert budget.try_reserve(500, PRIORITY_BULK) == 0
+
+
+def test_lower_priority_yields_to_waiting_requests(clock):
+    budget = RateBudget("model", rpm=60)
+    budget._set_waiting(PRIORITY_INTERACTIVE, 1)
+    # 预算充足，但有交互请求在等待，批量请求让出
+    assert budget.try_reserve(0, PRIORITY_BULK) == rate_limiter.PRIORITY_YIELD_INTERVAL
+    assert budget.try_reserve(0, PRIORITY_EVALUATION) == rate_limiter.PRIORITY_YIELD_INTERVAL
+    assert budget.try_reserve(0, PRIORITY_INTERACTIVE) == 0
+    budget._set_waiting(PRIORITY_INTERACTIVE, -1)
+    assert budget.try_reserve(0, PRIORITY_BULK) == 0
+
+
+def test_interactive_reserve(clock):
+    budget = RateBudget("model", rpm=10, reserve=0.2)
+    admitted = 0
+    while budget.try_reserve(0, PRIORITY_BULK) == 0:
+        admitted += 1
+    # 保留的两个请求只有交互请求可以使用
+    assert admitted == 8
+    assert budget.try_reserve(0, PRIORITY_INTERACTIVE) == 0
+    assert budget.try_reserve(0, PRIORITY_INTERACTIVE) == 0
+    assert budget.try_reserve(0, PRIORITY_INTERACTIVE) > 0
+
+
+def test_unlimited_budget():
+    assert get_rate_budget("model", 0, 0) is UNLIMITED_BUDGET
+
+
+def test_estimate_request_tokens():
+    messages = [{"role": "user", "content": "hello world"}]
+    assert estimate_request_tokens(messages, 100) > 100
+    assert estimate_request_tokens([], 50) == 50
+
+
+@pytest.mark.parametrize("response, tokens", [
+    ({"usage": {"total_tokens": 42}}, 42),
+    ({"usage": {"prompt_tokens": 10, "completion_tokens": 5}}, 15),
+    ({"choices": []}, None),
+    ({"usage": {"total_tokens": "many"}}, None),
+])
+def test_extract_usage_tokens(response, tokens):
+    assert extract_usage_tokens(response) == tokens
@@ -0,0 +1,77 @@
+"""响应解析：按JSON_SCHEMAS校验解析结果"""
+
+import json
+
+import pytest
+
+from feynman.utils.response_handler import JSON_SCHEMAS, ResponseHandler
+
+
+def choice(**changes):
+    item = {"question": "问", "options": ["A. 甲", "B. 乙", "C. 丙", "D. 丁"], "correct_answer": "A",
+            "explanation": "解析", "source_content": "原文"}
+    item.update(changes)
+    return item
+
+
+@pytest.fixture
+def handler():
+    return ResponseHandler()
+
+
+def test_valid_choice_question(handler):
+    handler.validate({"questions": [choice()]}, "choice_question")
+
+
+@pytest.mark.parametrize("data, message", [
+    ({}, "缺少questions字段"),
+    ({"questions": {}}, "必须是数组"),
+    ({"questions": [choice(correct_answer="E")]}, "必须是A、B、C、D之一"),
+    ({"questions": [choice(options=["A. 甲"])]}, "至少需要4项"),
+    ({"questions": [choice(options=["A", "B", "C", "D", "E"])]}, "最多只能有4项"),
+    ({"questions": [{"question": "问"}]}, "缺少options"),
+    ({"questions": [choice(question=1)]}, "必须是字符串"),
+])
+def test_invalid_choice_question(handler, data, message):
+    with pytest.raises(ValueError, match=message):
+        handler.validate(data, "choice_question")
+
+
+def test_essay_evaluation_score_must_be_number(handler):
+    evaluation = {"score": 80, "feedback": "好", "covered_points": ["一"], "missing_points": [], "suggestions": ["无"]}
+    handler.validate(evaluation, "essay_evaluation")
+    for score in ("80", True):
+        with pytest.raises(ValueError, match="必须是数字"):
+            handler.validate(dict(evaluation, score=score), "essay_evaluation")
+
+
+def test_essay_question_needs_key_points(handler):
+    question = {"question": "问", "reference_answer": "答", "key_points": ["一", "二"], "source_content": "原文"}
+    with pytest.raises(ValueError, match="至少需要3项"):
+        handler.validate({"questions": [question]}, "essay_question")
+
+
+def test_unknown_schema_type(handler):
+    with pytest.raises(ValueError):
+        handler.validate({}, "unknown")
+
+
+def test_validate_item(handler):
+    assert handler.validate_item(choice(), "choice_question")
+    assert not handler.validate_item(choice(correct_answer="E"), "choice_question")
+    assert not handler.validate_item("不是对象", "choice_question")
+
+
+def test_parse_structured(handler):
+    data = {"questions": [choice()]}
+    response = "```json\n" + json.dumps(data, ensure_ascii=False) + "\n```"
+    assert handler.parse_structured(response, "choice_question") == (data, False)
+    # 尾随逗号需要修复
+    assert handler.parse_structured(response.replace("}]}", "},]}"), "choice_question") == (data, True)
+    with pytest.raises(ValueError):
+        handler.parse_structured(json.dumps({"questions": [{"question": "问"}]}), "choice_question")
+
+
+def test_schemas_cover_all_types(handler):
+    for schema_type in JSON_SCHEMAS:
+        assert handler.get_json_schema(schema_type)["type"] == "object"
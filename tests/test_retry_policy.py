@@ -0,0 +1,224 @@
+"""重试策略：错误分类、Retry-After解析、熔断器状态变化"""
+
+import asyncio
+import email.utils
+import time
+
+import pytest
+
+from feynman.utils import retry_policy
+from feynman.utils.retry_policy import (
+    FATAL, RATE_LIMITED, SERVER_ERROR, TRANSIENT,
+    APIRequestError, CircuitBreaker, CircuitOpenError, RetryPolicy,
+    call_with_retry, classify_error, parse_retry_after,
+)
+
+
+class HTTPError(Exception):
+    """带状态码和响应头的请求异常"""
+
+    def __init__(self, status=None, headers=None, code=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers
+        self.code = code
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class RequestsHTTPError(Exception):
+    """requests风格的异常：状态码和响应头在response上"""
+
+    def __init__(self, response):
+        super().__init__("request failed")
+        self.response = response
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+class ClientConnectionError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [
+    (HTTPError(429), RATE_LIMITED),
+    (HTTPError(429, code="insufficient_quota"), FATAL),
+    (HTTPError(408), SERVER_ERROR),
+    (HTTPError(500), SERVER_ERROR),
+    (HTTPError(503), SERVER_ERROR),
+    (HTTPError(400), FATAL),
+    (HTTPError(401), FATAL),
+    (RequestsHTTPError(Response(502)), SERVER_ERROR),
+    (ConnectionError("reset"), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (asyncio.TimeoutError(), TRANSIENT),
+    (ReadTimeout(), TRANSIENT),
+    (ClientConnectionError(), TRANSIENT),
+    (ValueError("bad json"), FATAL),
+    (APIRequestError("already handled", status=503), FATAL),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_retry_after_seconds():
+    assert parse_retry_after(HTTPError(429, {"Retry-After": "7"})) == 7.0
+
+
+def test_retry_after_is_case_insensitive():
+    assert parse_retry_after(HTTPError(429, {"retry-after": "2.5"})) == 2.5
+
+
+def test_retry_after_ms_takes_precedence():
+    error = HTTPError(429, {"retry-after-ms": "1500", "Retry-After": "9"})
+    assert parse_retry_after(error) == 1.5
+
+
+def test_retry_after_http_date():
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    delay = parse_retry_after(HTTPError(429, {"Retry-After": date}))
+    assert 25 <= delay <= 30
+
+
+def test_retry_after_from_response_headers():
+    error = RequestsHTTPError(Response(429, {"Retry-After": "3"}))
+    assert parse_retry_after(error) == 3.0
+
+
+@pytest.mark.parametrize("headers", [None, {}, {"Retry-After": "soon"}, {"Retry-After": ""}])
+def test_retry_after_missing_or_invalid(headers):
+    assert parse_retry_after(HTTPError(429, headers)) is None
+
+
+def test_retry_after_in_the_past_is_zero():
+    assert parse_retry_after(HTTPError(429, {"Retry-After": "-5"})) == 0.0
+
+
+def test_compute_delay_follows_retry_after():
+    policy = RetryPolicy(base_delay=0.5, max_delay=1.0)
+    delay = policy.compute_delay(HTTPError(429, {"Retry-After": "10"}), 0.0)
+    # Retry-After不受max_delay限制，只加少量抖动
+    assert 10.0 <= delay <= 10.5
+
+
+def test_compute_delay_backoff_is_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    delay = 0.0
+    for _ in range(20):
+        delay = policy.compute_delay(HTTPError(503), delay)
+        assert 1.0 <= delay <= 4.0
+
+
+def test_should_retry():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(SERVER_ERROR, 1)
+    assert policy.should_retry(RATE_LIMITED, 2)
+    assert not policy.should_retry(TRANSIENT, 3)
+    assert not policy.should_retry(FATAL, 1)
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("http://test", failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    stats = breaker.get_stats()
+    assert stats["trips"] == 1
+    assert stats["fast_failures"] == 1
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker("http://test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_allows_one_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy.time, "time", lambda: now[0])
+    breaker = CircuitBreaker("http://test", failure_threshold=1, cooldown=30)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] += 31
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 探测请求进行中，其他请求快速失败
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_breaker_failed_probe_reopens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy.time, "time", lambda: now[0])
+    breaker = CircuitBreaker("http://test", failure_threshold=5, cooldown=30)
+    for _ in range(5):
+        breaker.record_failure()
+    now[0] += 31
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_neutral_releases_probe(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retry_policy.time, "time", lambda: now[0])
+    breaker = CircuitBreaker("http://test", failure_threshold=1, cooldown=30)
+    breaker.record_failure()
+    now[0] += 31
+    breaker.before_call()
+    breaker.record_neutral()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+
+
+def test_call_with_retry_retries_server_errors(monkeypatch):
+    monkeypatch.setattr(retry_policy, "cancellable_sleep", lambda seconds: None)
+    breaker = CircuitBreaker("http://test", failure_threshold=10)
+    calls = []
+
+    def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise HTTPError(503)
+        return "ok"
+
+    assert call_with_retry("http://test", request, RetryPolicy(max_attempts=3), breaker) == "ok"
+    assert len(calls) == 3
+    assert breaker.get_stats()["consecutive_failures"] == 0
+
+
+def test_call_with_retry_does_not_retry_fatal_errors(monkeypatch):
+    monkeypatch.setattr(retry_policy, "cancellable_sleep", lambda seconds: None)
+    breaker = CircuitBreaker("http://test", failure_threshold=1)
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise HTTPError(400)
+
+    with pytest.raises(HTTPError):
+        call_with_retry("http://test", request, RetryPolicy(max_attempts=3), breaker)
+    assert len(calls) == 1
+    # 参数错误不反映端点可用性，不触发熔断
+    assert breaker.state == CircuitBreaker.CLOSED
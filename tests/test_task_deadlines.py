@@ -0,0 +1,92 @@
+"""任务截止时间：耗时百分位、软截止时间，以及分块批次的推测执行和硬截止时间"""
+
+import threading
+import time
+
+from feynman.utils.cancellation import cancellable_sleep
+from feynman.utils.concurrent_processor import ConcurrentProcessor
+from feynman.utils.task_deadlines import (
+    MIN_LATENCY_SAMPLES, BatchDeadlineExceeded, DeadlinePolicy, LatencyTracker,
+)
+
+
+def policy_with_samples(latency, **kwargs):
+    tracker = LatencyTracker()
+    for _ in range(MIN_LATENCY_SAMPLES):
+        tracker.record("model", latency)
+    return DeadlinePolicy("model", tracker=tracker, **kwargs)
+
+
+def test_percentile_needs_enough_samples():
+    tracker = LatencyTracker()
+    for seconds in range(1, MIN_LATENCY_SAMPLES):
+        tracker.record("model", seconds)
+    assert tracker.percentile("model", 90) is None
+    tracker.record("model", MIN_LATENCY_SAMPLES)
+    assert tracker.percentile("model", 50) == 3
+    assert tracker.percentile("model", 90) == 5
+    assert tracker.percentile("other", 50) is None
+
+
+def test_tracker_keeps_recent_samples():
+    tracker = LatencyTracker(max_samples=MIN_LATENCY_SAMPLES)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        tracker.record("model", 100.0)
+    for _ in range(MIN_LATENCY_SAMPLES):
+        tracker.record("model", 1.0)
+    assert tracker.percentile("model", 90) == 1.0
+    assert tracker.get_stats()["model"]["samples"] == MIN_LATENCY_SAMPLES
+
+
+def test_soft_deadline():
+    policy = policy_with_samples(4.0, multiplier=1.5, min_soft_deadline=1.0)
+    assert policy.soft_deadline() == 6.0
+    assert policy_with_samples(1.0, min_soft_deadline=10.0).soft_deadline() == 10.0
+    assert policy_with_samples(4.0, max_speculative=0).soft_deadline() is None
+    assert DeadlinePolicy("model", tracker=LatencyTracker()).soft_deadline() is None
+
+
+def test_speculative_request_wins():
+    policy = policy_with_samples(0.05, multiplier=1.0, min_soft_deadline=0.05)
+    calls = {}
+    lock = threading.Lock()
+
+    def task(index):
+        with lock:
+            calls[index] = calls.get(index, 0) + 1
+            attempt = calls[index]
+        # 任务0的第一次请求卡住，推测请求很快返回
+        cancellable_sleep(5.0 if index == 0 and attempt == 1 else 0.01)
+        return index, attempt
+
+    start = time.monotonic()
+    outcomes = ConcurrentProcessor(max_workers=4).process_outcomes([(i,) for i in range(4)], task,
+                                                                   deadline_policy=policy)
+    assert time.monotonic() - start < 2.0
+    assert [outcome.result for outcome in outcomes] == [(0, 2), (1, 1), (2, 1), (3, 1)]
+    assert calls[0] == 2
+
+
+def test_no_speculation_without_samples():
+    policy = DeadlinePolicy("model", tracker=LatencyTracker(), min_soft_deadline=0.0)
+    calls = []
+    outcomes = ConcurrentProcessor(max_workers=2).process_outcomes(
+        [(i,) for i in range(3)], lambda index: calls.append(index) or index, deadline_policy=policy)
+    assert [outcome.result for outcome in outcomes] == [0, 1, 2]
+    assert sorted(calls) == [0, 1, 2]
+
+
+def test_batch_deadline_returns_finished_tasks():
+    policy = DeadlinePolicy("model", tracker=LatencyTracker(), max_speculative=0, batch_deadline=0.3)
+
+    def task(index):
+        cancellable_sleep(5.0 if index == 1 else 0.01)
+        return index
+
+    start = time.monotonic()
+    outcomes = ConcurrentProcessor(max_workers=3).process_outcomes([(i,) for i in range(3)], task,
+                                                                   deadline_policy=policy)
+    assert time.monotonic() - start < 2.0
+    assert [outcome.index for outcome in outcomes] == [0, 1, 2]
+    assert outcomes[0].result == 0 and outcomes[2].result == 2
+    assert isinstance(outcomes[1].error, BatchDeadlineExceeded)
@@ -0,0 +1,54 @@
+"""文本分块：按字符数分块时与优化前的分块器（baseline_text_chunker）结果一致"""
+
+import os
+import random
+import sys
+
+import pytest
+
+from feynman.utils.text_chunker import TextChunker
+
+sys.path.insert(0, os.path.dirname(__file__))
+import baseline_text_chunker  # noqa: E402
+
+PIECES = [
+    "牛顿第一定律是经典力学的基础。", "动量守恒吗？", "能量不会凭空产生！", "逗号，分号；",
+    "The first law states that an object stays at rest. ", "Really? ", "Yes! ", "word ",
+    "\n", "\n\n", "\n  \n", "。", ". ", "  ", "无标点的一长串中文内容" * 3,
+]
+
+SETTINGS = [(100, 0), (200, 20), (500, 100), (1000, 200), (300, 299)]
+
+
+def random_texts(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 400)))
+
+
+@pytest.mark.parametrize("strategy", ["smart", "simple"])
+@pytest.mark.parametrize("chunk_size, overlap", SETTINGS)
+def test_chunks_match_baseline(strategy, chunk_size, overlap):
+    new = TextChunker(chunk_size, overlap, strategy)
+    old = baseline_text_chunker.TextChunker(chunk_size, overlap, strategy)
+    for text in random_texts(60, seed=chunk_size * 31 + overlap):
+        assert new.chunk_text(text) == old.chunk_text(text)
+        assert new.get_chunk_count(text) == old.get_chunk_count(text)
+        assert new.should_chunk(text) == old.should_chunk(text)
+
+
+@pytest.mark.parametrize("text", ["", "短文本", "a" * 5000, "第一段。\n\n" * 400, "句子。" * 1000])
+def test_edge_cases_match_baseline(text):
+    for strategy in ("smart", "simple"):
+        new = TextChunker(1000, 200, strategy)
+        old = baseline_text_chunker.TextChunker(1000, 200, strategy)
+        assert new.chunk_text(text) == old.chunk_text(text)
+
+
+def test_chunks_cover_text():
+    text = next(random_texts(1, seed=3)) * 5
+    chunks = TextChunker(300, 50).chunk_text(text)
+    assert chunks[0][1] == 0
+    assert chunks[-1][2] == len(text)
+    for (_, _, end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert start <= end
@@ -0,0 +1,519 @@
+"""
+自适应并发控制模块
+
+使用AIMD（加性增、乘性减）算法为每个（服务商, 端点, 模型）组合动态调整
+并发请求数：请求延迟和错误率正常时逐步提高并发上限，遇到429、5xx或超时
+时将上限减半。学习到的上限保存在 data/concurrency_limits.json 中，
+下次打开配置文件时继续使用。等待名额的请求按优先级类别排队（见request_priority），
+交互请求还可以使用上限之外保留的名额。
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .cancellation import current_token
+from .request_priority import PRIORITY_INTERACTIVE, PRIORITY_NAMES, current_priority, record_priority_wait
+
+
+# 视为过载（需要降低并发）的HTTP状态码
+OVERLOAD_STATUS_CODES = {408, 429, 500, 502, 503, 504, 529}
+
+
+def limits_file_path() -> str:
+    """获取并发上限持久化文件路径"""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    return os.path.join(data_dir, "concurrency_limits.json")
+
+
+def get_error_status(error: BaseException) -> Optional[int]:
+    """
+    从各类请求异常中提取HTTP状态码
+
+    兼容 requests.HTTPError（response.status_code）、openai 0.28 的异常
+    （http_status）以及异步引擎的 AsyncHTTPError（status）。
+    """
+    status = getattr(error, "status", None) or getattr(error, "http_status", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """
+    判断异常是否表示服务端过载（限流、服务端错误或超时）
+
+    Args:
+        error: 请求过程中抛出的异常
+
+    Returns:
+        是否应当降低并发
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status = get_error_status(error)
+    if status is not None:
+        return status in OVERLOAD_STATUS_CODES
+    # requests.Timeout、openai.error.Timeout、RateLimitError、ServiceUnavailableError等
+    name = type(error).__name__
+    return "Timeout" in name or name in ("RateLimitError", "ServiceUnavailableError")
+
+
+class AdaptiveLimiter:
+    """AIMD自适应并发限制器"""
+
+    def __init__(self, key: str, initial_limit: float = 3, min_limit: int = 1, max_limit: int = 16,
+                 latency_tolerance: float = 2.0, on_change=None, reserved_slots: int = 0):
+        """
+        初始化限制器
+
+        Args:
+            key: 限制器标识（服务商|端点|模型）
+            initial_limit: 初始并发上限
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+            latency_tolerance: 平均延迟超过基线延迟的倍数时停止增加并发
+            on_change: 并发上限（整数部分）变化时的回调
+            reserved_slots: 在并发上限之外为交互请求保留的名额数
+        """
+        self.key = key
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.reserved_slots = max(0, reserved_slots)
+        self._on_change = on_change
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        # 各优先级类别正在等待名额的请求数
+        self._waiting = [0] * len(PRIORITY_NAMES)
+        # 在事件循环中等待名额的请求：(事件循环, future)，名额变化时由_notify唤醒
+        self._async_waiters = []
+        # 延迟的指数移动平均及基线（观测到的最低平均延迟，缓慢上浮以适应变化）
+        self._avg_latency = None
+        self._baseline_latency = None
+        self._last_decrease = 0.0
+        self._successes = 0
+        self._overloads = 0
+        self._increases = 0
+        self._decreases = 0
+
+    @property
+    def current_limit(self) -> int:
+        """当前允许的并发数"""
+        return max(self.min_limit, int(self.limit))
+
+    def set_max_limit(self, max_limit: int):
+        """调整并发上限的上限（配置变化时调用）"""
+        with self._cond:
+            self.max_limit = max(self.min_limit, max_limit)
+            if self.limit > self.max_limit:
+                self.limit = float(self.max_limit)
+            self._notify()
+
+    def set_reserved_slots(self, reserved_slots: int):
+        """调整为交互请求保留的名额数（配置变化时调用）"""
+        with self._cond:
+            self.reserved_slots = max(0, reserved_slots)
+            self._notify()
+
+    def _can_admit(self, priority: int) -> bool:
+        """有更高优先级的请求在等待时不放行；交互请求可以额外使用保留名额（调用前需持有锁）"""
+        if any(self._waiting[:priority]):
+            return False
+        limit = self.current_limit
+        if priority == PRIORITY_INTERACTIVE:
+            limit += self.reserved_slots
+        return self._in_flight < limit
+
+    def try_acquire(self, priority: Optional[int] = None) -> bool:
+        """尝试占用一个并发名额，不阻塞"""
+        if priority is None:
+            priority = current_priority()
+        with self._cond:
+            if self._can_admit(priority):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self, priority: Optional[int] = None):
+        """
+        占用一个并发名额（名额不足时按优先级排队等待）
+
+        Raises:
+            OperationCancelled: 等待期间当前操作被取消
+        """
+        if priority is None:
+            priority = current_priority()
+        token = current_token()
+        start = time.monotonic()
+        waited = 0.0
+        with self._cond:
+            if not self._can_admit(priority):
+                self._waiting[priority] += 1
+                unregister = token.on_cancel(self._wake_waiters)
+                try:
+                    while not self._can_admit(priority):
+                        token.check()
+                        self._cond.wait()
+                finally:
+                    unregister()
+                    self._waiting[priority] -= 1
+                    # 其他类别的请求可能因为本请求在等待而被挡住
+                    self._notify()
+                waited = time.monotonic() - start
+            self._in_flight += 1
+        record_priority_wait(priority, "slot", waited)
+
+    def _wake_waiters(self):
+        """唤醒所有等待名额的请求（取消时让被取消的请求结束等待）"""
+        with self._cond:
+            self._notify()
+
+    def _notify(self):
+        """唤醒所有等待名额的线程和协程，让它们重新检查能否放行（调用前需持有锁）"""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake_future, future)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    async def acquire_async(self, priority: Optional[int] = None):
+        """
+        在事件循环中占用一个并发名额（名额不足时按优先级异步等待）
+
+        等待时不轮询：每次检查失败后登记一个future，名额释放或上限变化时由
+        释放名额的线程通过call_soon_threadsafe唤醒。
+        """
+        if priority is None:
+            priority = current_priority()
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        waited = 0.0
+        if not self.try_acquire(priority):
+            with self._cond:
+                self._waiting[priority] += 1
+            try:
+                while True:
+                    with self._cond:
+                        if self._can_admit(priority):
+                            self._in_flight += 1
+                            break
+                        # 每个等待者使用各自的future，一个任务被取消不影响其他等待者
+                        waiter = (loop, loop.create_future())
+                        self._async_waiters.append(waiter)
+                    try:
+                        await waiter[1]
+                    finally:
+                        with self._cond:
+                            if waiter in self._async_waiters:
+                                self._async_waiters.remove(waiter)
+            finally:
+                with self._cond:
+                    self._waiting[priority] -= 1
+                    self._notify()
+            waited = time.monotonic() - start
+        record_priority_wait(priority, "slot", waited)
+
+    def release(self, latency: Optional[float] = None, error: Optional[BaseException] = None):
+        """
+        释放并发名额并根据请求结果调整上限
+
+        Args:
+            latency: 请求耗时（秒），请求成功时提供
+            error: 请求失败时的异常
+        """
+        with self._cond:
+            saturated = self._in_flight >= self.current_limit
+            self._in_flight -= 1
+            old_limit = self.current_limit
+
+            if error is not None:
+                if is_overload_error(error):
+                    self._on_overload()
+            elif latency is not None:
+                self._on_success(latency, saturated)
+
+            new_limit = self.current_limit
+            self._notify()
+
+        if new_limit != old_limit:
+            print(f"自适应并发 [{self.key}]: {old_limit} -> {new_limit}")
+            if self._on_change:
+                self._on_change(self)
+
+    def _on_success(self, latency: float, saturated: bool):
+        """请求成功：延迟正常且并发已用满时加性增加上限"""
+        self._successes += 1
+        if self._avg_latency is None:
+            self._avg_latency = latency
+        else:
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+        if self._baseline_latency is None or self._avg_latency < self._baseline_latency:
+            self._baseline_latency = self._avg_latency
+        else:
+            self._baseline_latency *= 1.01
+
+        # 并发未用满时没有证据表明可以承受更高并发，不增加
+        if not saturated:
+            return
+        if self._avg_latency > self._baseline_latency * self.latency_tolerance:
+            return
+        if self.limit < self.max_limit:
+            # 每完成约一个窗口（limit个请求）增加1
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._increases += 1
+
+    def _on_overload(self):
+        """请求过载：上限减半（同一时间窗口内的多次失败只减一次）"""
+        self._overloads += 1
+        now = time.time()
+        cooldown = max(1.0, self._avg_latency or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        self._decreases += 1
+
+    @contextlib.contextmanager
+    def track(self):
+        """
+        同步请求的上下文管理器：占用名额、计时并根据结果调整上限
+
+        用法：
+            with limiter.track():
+                response = session.post(...)
+                response.raise_for_status()
+        """
+        self.acquire()
+        start = time.time()
+        try:
+            yield self
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.time() - start)
+
+    @contextlib.asynccontextmanager
+    async def track_async(self):
+        """异步请求的上下文管理器，用法同track"""
+        await self.acquire_async()
+        start = time.time()
+        try:
+            yield self
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.time() - start)
+
+    def hold(self, open_func: Callable[[], Any]):
+        """
+        占用名额执行一次open_func（如建立流式连接），成功后继续占用名额，直到返回的
+        上下文管理器退出
+
+        与track不同，open_func失败时立即释放名额并按异常调整上限，适合作为重试的单次尝试：
+        重试等待期间不占用名额，被重试吸收的429、5xx也会计入AIMD。
+
+        用法：
+            held = call_with_retry(endpoint, lambda: limiter.hold(open_stream))
+            with held as stream:
+                for chunk in stream:
+                    ...
+
+        Args:
+            open_func: 建立连接的函数
+
+        Returns:
+            上下文管理器，进入时得到open_func的返回值，退出时释放名额（读取过程中的异常
+            同样计入）；调用方必须进入该上下文管理器，否则名额不会释放
+        """
+        self.acquire()
+        start = time.time()
+        try:
+            value = open_func()
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        return self._held(value, start)
+
+    @contextlib.contextmanager
+    def _held(self, value: Any, start: float):
+        try:
+            yield value
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.time() - start)
+
+    def get_stats(self) -> dict:
+        """获取限制器统计信息"""
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "reserved_slots": self.reserved_slots,
+                "in_flight": self._in_flight,
+                "waiting": {PRIORITY_NAMES[priority]: count for priority, count in enumerate(self._waiting)},
+                "avg_latency": round(self._avg_latency, 3) if self._avg_latency is not None else None,
+                "successes": self._successes,
+                "overloads": self._overloads,
+                "increases": self._increases,
+                "decreases": self._decreases,
+            }
+
+
+def _wake_future(future: asyncio.Future):
+    """在future所属的事件循环中唤醒等待者"""
+    if not future.done():
+        future.set_result(None)
+
+
+class _NullLimiter:
+    """未启用自适应并发时使用的空限制器"""
+
+    @contextlib.contextmanager
+    def track(self):
+        yield self
+
+    @contextlib.asynccontextmanager
+    async def track_async(self):
+        yield self
+
+    def hold(self, open_func):
+        return contextlib.nullcontext(open_func())
+
+
+NULL_LIMITER = _NullLimiter()
+
+
+# 全局限制器注册表：key -> AdaptiveLimiter
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_registry_lock = threading.Lock()
+# 持久化的上限：key -> limit（首次使用时从文件加载）
+_saved_limits = None
+_last_save = 0.0
+# 等待写入文件的后台定时器
+_save_timer: Optional[threading.Timer] = None
+# 两次写入文件之间的最小间隔（秒）
+SAVE_INTERVAL = 5.0
+
+
+def _load_saved_limits() -> Dict[str, float]:
+    """从文件加载已学习的并发上限"""
+    global _saved_limits
+    if _saved_limits is None:
+        _saved_limits = {}
+        try:
+            path = limits_file_path()
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for key, entry in data.items():
+                    if isinstance(entry, dict) and "limit" in entry:
+                        _saved_limits[key] = float(entry["limit"])
+        except Exception as e:
+            print(f"加载并发上限失败: {e}")
+    return _saved_limits
+
+
+def make_limiter_key(provider: str, endpoint: str, model: str) -> str:
+    """生成限制器标识"""
+    return f"{provider}|{endpoint or ''}|{model or ''}"
+
+
+def get_concurrency_limiter(key: str, initial_limit: float = 3, max_limit: int = 16,
+                            reserved_slots: int = 0) -> AdaptiveLimiter:
+    """
+    获取（或创建）指定标识的自适应并发限制器
+
+    Args:
+        key: 限制器标识，见make_limiter_key
+        initial_limit: 没有已学习上限时使用的初始并发数
+        max_limit: 并发上限的上限
+        reserved_slots: 在并发上限之外为交互请求保留的名额数
+
+    Returns:
+        AdaptiveLimiter实例
+    """
+    with _registry_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            saved = _load_saved_limits().get(key)
+            limiter = AdaptiveLimiter(
+                key,
+                initial_limit=saved if saved is not None else initial_limit,
+                max_limit=max_limit,
+                on_change=_on_limit_changed,
+                reserved_slots=reserved_slots
+            )
+            _limiters[key] = limiter
+            return limiter
+    if limiter.max_limit != max_limit:
+        limiter.set_max_limit(max_limit)
+    if limiter.reserved_slots != reserved_slots:
+        limiter.set_reserved_slots(reserved_slots)
+    return limiter
+
+
+def _on_limit_changed(limiter: AdaptiveLimiter):
+    """
+    并发上限变化时记录，并在后台线程中（限频）写入文件
+
+    回调可能在事件循环中执行（异步请求释放名额时），因此不在这里同步写文件；
+    两次写入间隔内的多次变化合并为一次写入。
+    """
+    global _save_timer
+    with _registry_lock:
+        _load_saved_limits()[limiter.key] = limiter.limit
+        if _save_timer is not None:
+            return
+        delay = max(0.0, _last_save + SAVE_INTERVAL - time.time())
+        _save_timer = threading.Timer(delay, _flush_limits)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _flush_limits():
+    """后台定时器：写入并发上限"""
+    global _save_timer, _last_save
+    with _registry_lock:
+        _save_timer = None
+        _last_save = time.time()
+    save_concurrency_limits()
+
+
+def save_concurrency_limits():
+    """将所有限制器的当前上限写入文件"""
+    with _registry_lock:
+        limits = dict(_load_saved_limits())
+        for key, limiter in _limiters.items():
+            limits[key] = limiter.limit
+
+    data = {key: {"limit": round(limit, 3), "updated_at": time.time()} for key, limit in limits.items()}
+    try:
+        path = limits_file_path()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"保存并发上限失败: {e}")
+
+
+def get_all_limiter_stats() -> Dict[str, dict]:
+    """获取所有限制器的统计信息"""
+    with _registry_lock:
+        items = list(_limiters.items())
+    return {key: limiter.get_stats() for key, limiter in items}
@@ -1,5 +1,8 @@
+import asyncio
+import contextvars
 import json
 import requests
+import threading
 import time
 try:
     import openai
@@ -19,9 +22,63 @@ from ..prompts.essay_prompts import get_essay_prompt
 from ..prompts.evaluation_prompts import get_essay_evaluation_prompt, get_choice_evaluation_messages
 from ..prompts.followup_prompts import get_followup_messages
 from ..prompts.language_prompts import format_language_pattern_messages  # 导入语言模式练习提示
-from .response_handler import ResponseHandler
+from ..prompts.summary_prompts import get_chunk_summary_prompt, get_outline_prompt
+from .response_handler import ITEM_FIELDS, ResponseHandler
+from .streaming_json import StreamingArrayParser
 from .text_chunker import TextChunker
+from .token_estimator import get_token_estimator
+from .job_store import STAGE_GENERATE, STAGE_SUMMARY, JobInterrupted
+from .near_duplicates import ChunkDeduplicator, NearDuplicateIndex, get_dedup_stats, item_text
+from .chunk_scoring import allocate, score_chunks
+from .source_locator import SourceLocator, chunk_markers
 from .concurrent_processor import ConcurrentProcessor
+from .task_deadlines import BatchDeadlineExceeded, DeadlinePolicy, get_deadline_stats
+from .executor_service import get_executor_service
+from .http_transport import abort_on_cancel, get_transport, get_all_transport_stats
+from .cancellation import OperationCancelled, check_cancelled, current_token
+from .async_engine import AsyncEngine, AsyncHTTPError, get_async_engine
+from .response_cache import get_response_cache, make_cache_key
+from .adaptive_concurrency import (
+    NULL_LIMITER, get_all_limiter_stats, get_concurrency_limiter, make_limiter_key
+)
+from .rate_limiter import (
+    estimate_request_tokens, extract_usage_tokens, get_all_budget_stats, get_rate_budget
+)
+from .adaptive_concurrency import get_error_status
+from .request_priority import (
+    PRIORITY_BULK, PRIORITY_EVALUATION, PRIORITY_INTERACTIVE, get_priority_stats, request_priority
+)
+from .retry_policy import (
+    APIRequestError, RetryPolicy, acall_with_retry, call_with_retry, get_circuit_breaker, get_retry_stats
+)
+from .model_router import get_model_router
+from .structured_output import (
+    MODE_NONE, UNSUPPORTED_STATUS_CODES, build_response_format, get_structured_output_registry,
+    make_capability_key, next_mode
+)
+
+# 各生成类型对应的 (结果字段, 校验schema类型, 合并日志中的单位)
+GENERATION_KINDS = {
+    "choice": ("questions", "choice_question", "个问题"),
+    "essay": ("questions", "essay_question", "个问题"),
+    "knowledge_card": ("cards", "knowledge_card", "张卡片"),
+    "language_learning": ("cards", "knowledge_card", "张语言学习卡片"),
+}
+
+# 按token分块时每块的最小token预算
+MIN_CHUNK_TOKENS = 256
+
+# 分层生成中摘要和提纲在响应缓存中使用的类型
+SUMMARY_CACHE_TYPE = "chunk_summary"
+OUTLINE_CACHE_TYPE = "outline"
+# 为去重后的分块补充生成的条目，与分块本身的响应分开缓存
+BACKFILL_CACHE_TYPE = "dedup_backfill"
+
+# 本次生成中已通过item_callback发送的条目题干。每次生成单独记录，不放在共享的
+# AIHandler实例上；分块线程和异步引擎复制调用方的上下文，共用同一个集合
+_streamed_stems = contextvars.ContextVar("streamed_stems", default=None)
+# 分层生成合并提纲的最多轮数
+MAX_OUTLINE_LEVELS = 5
 
 class AIHandler:
     def __init__(self, config=None):
@@ -38,12 +95,83 @@ class AIHandler:
         self.enable_concurrent = advanced_config.get('enable_concurrent_processing', False)
         self.max_concurrent = advanced_config.get('max_concurrent_requests', 3)
         self.enable_chunking = advanced_config.get('enable_text_chunking', False)
+        self.enable_streaming = advanced_config.get('enable_streaming', True)
+        self.use_async_engine = advanced_config.get('use_async_engine', True)
+        self.async_concurrency_limit = advanced_config.get('async_concurrency_limit', 16)
+        self.enable_response_cache = advanced_config.get('enable_response_cache', True)
+        self.response_cache_max_mb = advanced_config.get('response_cache_max_mb', 50)
+        self.response_cache_ttl_hours = advanced_config.get('response_cache_ttl_hours', 0)
+        self.enable_adaptive_concurrency = advanced_config.get('enable_adaptive_concurrency', True)
+        self.adaptive_concurrency_max = advanced_config.get('adaptive_concurrency_max', 16)
+        # 默认的每分钟请求数/token数上限（0表示不限制，可在config['models']中按模型覆盖）
+        self.default_rpm_limit = advanced_config.get('rpm_limit', 0)
+        self.default_tpm_limit = advanced_config.get('tpm_limit', 0)
+        # 为交互请求（追问等）保留的并发名额数和速率预算比例，批量生成不会占用这一部分
+        self.interactive_reserved_slots = advanced_config.get('interactive_reserved_slots', 1)
+        self.interactive_rate_reserve = advanced_config.get('interactive_rate_reserve', 0.1)
+        # 统一的请求重试策略和熔断设置
+        self.retry_policy = RetryPolicy(
+            max_attempts=advanced_config.get('retry_max_attempts', 3),
+            base_delay=advanced_config.get('retry_base_delay', 1.0),
+            max_delay=advanced_config.get('retry_max_delay', 60.0)
+        )
+        self.circuit_breaker_threshold = advanced_config.get('circuit_breaker_threshold', 5)
+        self.circuit_breaker_cooldown = advanced_config.get('circuit_breaker_cooldown', 30)
+        # 多模型路由（对冲请求、故障转移、按权重分配分块任务）
+        self.enable_model_routing = advanced_config.get('enable_model_routing', False)
+        self.routing_models = advanced_config.get('routing_models', [])
+        self.model_weights = advanced_config.get('model_weights', {})
+        self.hedge_latency_percentile = advanced_config.get('hedge_latency_percentile', 90)
+        self.hedge_min_delay = advanced_config.get('hedge_min_delay', 5)
+        self.hedge_default_delay = advanced_config.get('hedge_default_delay', 30)
+        # 结构化输出（response_format），端点不支持时自动降级，修复流程仅作兜底
+        self.enable_structured_output = advanced_config.get('enable_structured_output', True)
+        self.structured_output_mode = advanced_config.get('structured_output_mode', 'json_schema')
+        # 响应被截断或损坏时保留其中完整的题目/卡片，而不是整次重新请求
+        self.enable_partial_salvage = advanced_config.get('enable_partial_salvage', True)
+        # 生成数量不足时只补充请求缺少的条目（最多补充的轮数）
+        self.enable_shortfall_top_up = advanced_config.get('enable_shortfall_top_up', True)
+        self.top_up_max_rounds = advanced_config.get('top_up_max_rounds', 2)
+        # 分块结果合并后去除近似重复的题目/卡片（题干和选项的相似度达到阈值即视为重复）
+        self.enable_dedup = advanced_config.get('enable_dedup', True)
+        self.dedup_threshold = advanced_config.get('dedup_threshold', 0.8)
+        # 按各分块的信息密度分配题目数，得分低于中位数一定比例的分块（目录、参考文献等）不分配
+        self.enable_density_allocation = advanced_config.get('enable_density_allocation', True)
+        self.density_skip_ratio = advanced_config.get('density_skip_ratio', 0.2)
+        # 分层生成：分块数达到阈值时先概括各分块、合并成提纲，再根据提纲生成
+        self.enable_hierarchical_generation = advanced_config.get('enable_hierarchical_generation', False)
+        self.hierarchical_min_chunks = advanced_config.get('hierarchical_min_chunks', 8)
+        self.summary_max_chars = advanced_config.get('summary_max_chars', 300)
+        self.outline_max_chars = advanced_config.get('outline_max_chars', 4000)
+        # 把生成任务和已完成分块的结果保存到 data/generation_jobs.db，中断后可以继续
+        self.enable_job_store = advanced_config.get('enable_job_store', True)
+        # 分块批次的截止时间：超过该模型最近耗时百分位 * 倍数的分块再发送一份相同请求，
+        # 取先返回的有效结果；整批超过batch_deadline秒时返回已完成的分块（0表示不限制）
+        self.enable_straggler_redispatch = advanced_config.get('enable_straggler_redispatch', True)
+        self.straggler_latency_percentile = advanced_config.get('straggler_latency_percentile', 75)
+        self.straggler_deadline_multiplier = advanced_config.get('straggler_deadline_multiplier', 1.5)
+        self.straggler_min_deadline = advanced_config.get('straggler_min_deadline', 10)
+        self.max_speculative_requests = advanced_config.get('max_speculative_requests', 1)
+        self.batch_deadline = advanced_config.get('batch_deadline', 900)
+        # 本次调用是否跳过缓存读取（由generate_questions的use_cache参数控制）
+        self.bypass_cache = False
         
         # 保存默认设置（作为备份）
         self.default_max_concurrent = self.max_concurrent
+        self.default_async_concurrency_limit = self.async_concurrency_limit
         self.default_chunk_size = advanced_config.get('chunk_size', 2000)
         self.default_chunk_overlap = advanced_config.get('chunk_overlap', 200)
         self.default_chunk_strategy = advanced_config.get('chunk_strategy', 'smart')
+        # 分块单位：chars按字符数分块，tokens按模型上下文窗口计算每块的token预算
+        self.chunk_unit = advanced_config.get('chunk_unit', 'chars')
+        self.default_context_window = advanced_config.get('context_window', 8192)
+        self.context_window = self.default_context_window
+        # 为模型输出预留的token数，0表示使用max_tokens
+        self.completion_reserve = advanced_config.get('completion_reserve', 0)
+        self.chunk_overlap_tokens = advanced_config.get('chunk_overlap_tokens', 100)
+        self.token_estimator = get_token_estimator(advanced_config.get('token_estimator', 'heuristic'))
+        # 按内容锚定分块边界，修改部分内容后重新生成时未变化的分块可以直接复用缓存结果
+        self.chunk_anchoring = advanced_config.get('chunk_anchoring', True)
         
         # 保存模型特定设置配置
         self.model_specific_settings = advanced_config.get('model_specific_settings', {})
@@ -52,14 +180,23 @@ class AIHandler:
         self.text_chunker = TextChunker(
             chunk_size=self.default_chunk_size,
             overlap=self.default_chunk_overlap,
-            strategy=self.default_chunk_strategy
+            strategy=self.default_chunk_strategy,
+            token_estimator=self.token_estimator,
+            anchored=self.chunk_anchoring
         )
         
-        # 初始化并发处理器
-        self.concurrent_processor = ConcurrentProcessor(max_workers=self.max_concurrent)
+        # 初始化并发处理器（启用自适应并发时线程数按上限分配，实际并发由限制器控制）
+        self.concurrent_processor = ConcurrentProcessor(max_workers=self._get_worker_count())
         
         # 进度回调（可由外部设置）
         self.progress_callback = None
+        # 条目回调 (field, item)：流式生成时每解析出一个题目/卡片调用一次（可由外部设置）
+        self.item_callback = None
+        # 是否正在分块生成（分块完成时整体发送条目，不逐条流式发送）
+        self._deliver_by_chunk = False
+        # 当前的持久化生成任务（job_store.ActiveJob，可由外部设置）：分块完成时保存结果，
+        # 每次请求前检查暂停/取消
+        self.generation_job = None
         
         if self.provider == 'openai':
             self._setup_openai()
@@ -92,26 +229,348 @@ class AIHandler:
         self.temperature = custom_config.get('temperature', 0.7)
         self.request_timeout = custom_config.get('request_timeout', 180)
 
-    def _call_ai_api(self, messages):
-        """调用AI API"""
+    def _call_ai_api(self, messages, schema_type=None):
+        """
+        调用AI API
+        
+        请求层面的重试（限流、5xx、连接错误）由重试策略统一处理，
+        失败时抛出APIRequestError，调用方不需要再次重试。
+        
+        Args:
+            messages: 消息列表
+            schema_type: 期望的响应schema类型，设置后使用结构化输出模式请求
+        """
         try:
-            if self.provider == 'openai':
-                return self._call_openai(messages)
+            if self._use_model_routing():
+                return self._call_with_failover(messages, schema_type)
             else:
-                return self._call_custom_api(messages)
+                return self._call_structured(messages, schema_type)
         except Exception as e:
+            # 操作被取消导致的连接错误不包装成请求失败
+            check_cancelled()
             # 添加更详细的错误信息
             error_msg = f"API调用失败：{str(e)}"
             if hasattr(e, 'response') and e.response is not None:
                 error_msg += f"\n响应状态码：{e.response.status_code}"
                 error_msg += f"\n响应内容：{e.response.text}"
-            raise Exception(error_msg)
+            raise APIRequestError(error_msg, get_error_status(e))
+    
+    def _use_model_routing(self):
+        """是否启用多模型路由（仅自定义API，且至少有两个候选模型）"""
+        return (self.enable_model_routing and self.provider != 'openai'
+                and len(self._get_routing_candidates()) > 1)
+    
+    def _get_routing_candidates(self, primary=None):
+        """
+        获取参与路由的模型列表
+        
+        Args:
+            primary: 主模型配置，默认为当前选择的模型
+            
+        Returns:
+            模型配置列表，第一个为主模型；未选择模型时用 {"name": 默认模型} 表示默认端点
+        """
+        if primary is None:
+            primary = self.current_model_info or {"name": self.model}
+        models = self.config.get('models', [])
+        names = self.routing_models or [model.get('name') for model in models]
+        candidates = [primary]
+        for model in models:
+            if model.get('name') in names and model.get('name') != primary.get('name'):
+                candidates.append(model)
+        return candidates
+    
+    def _order_routing_candidates(self, primary=None):
+        """按健康状况和权重排列候选模型（主模型健康时排在最前）"""
+        candidates = {model.get('name'): model for model in self._get_routing_candidates(primary)}
+        ordered = get_model_router().order_candidates(list(candidates.keys()), self.model_weights)
+        return [candidates[name] for name in ordered]
+    
+    def _call_with_failover(self, messages, schema_type=None):
+        """
+        依次尝试各个候选模型，主模型失败时转移到下一个模型
+        
+        Args:
+            messages: 消息列表
+            schema_type: 期望的响应schema类型
+            
+        Returns:
+            第一个成功的模型返回的文本
+        """
+        router = get_model_router()
+        last_error = None
+        for model_info in self._order_routing_candidates():
+            name = model_info.get('name')
+            start = time.monotonic()
+            try:
+                result = self._call_structured(messages, schema_type, model_info)
+            except Exception as e:
+                router.record_failure(name)
+                router.record_failover(name)
+                last_error = e
+                print(f"模型 {name} 请求失败，尝试下一个模型：{str(e)[:200]}")
+                continue
+            router.record_success(name, time.monotonic() - start)
+            return result
+        raise last_error
+    
+    def _get_structured_target(self, model_info=None):
+        """
+        获取结构化输出能力的记录键和模型名称
+        
+        Returns:
+            (能力键, 模型名称) 元组
+        """
+        if self.provider == 'openai':
+            return make_capability_key(openai.api_base, self.model), self.model
+        api_url, _, model_name = self._resolve_custom_endpoint(model_info)
+        return make_capability_key(api_url, model_name), model_name
+    
+    def _call_structured(self, messages, schema_type=None, model_info=None, on_delta=None):
+        """
+        以结构化输出模式请求一个模型
+        
+        按 json_schema -> json_object -> none 的顺序使用端点支持的方式；
+        端点以400/422拒绝response_format时降级并立即重发，成功后记录该端点可用的方式。
+        
+        Args:
+            messages: 消息列表
+            schema_type: 期望的响应schema类型，为None时不设置response_format
+            model_info: 模型配置（仅自定义API），默认为当前选择的模型
+            on_delta: 设置时以流式方式请求，每收到一段内容调用一次
+        """
+        if on_delta is not None:
+            send = lambda response_format: self._call_ai_api_stream(messages, on_delta, response_format, model_info)
+        elif self.provider == 'openai':
+            send = lambda response_format: self._call_openai(messages, response_format)
+        else:
+            send = lambda response_format: self._call_custom_api(messages, model_info, response_format)
+        if not schema_type or not self.enable_structured_output:
+            return send(None)
+        
+        registry = get_structured_output_registry()
+        key, model_name = self._get_structured_target(model_info)
+        mode = registry.get_mode(key, self.structured_output_mode)
+        while True:
+            try:
+                result = send(build_response_format(mode, schema_type))
+            except APIRequestError as e:
+                if mode == MODE_NONE or e.status not in UNSUPPORTED_STATUS_CODES:
+                    raise
+                mode = next_mode(mode)
+                registry.record_downgrade(model_name, mode)
+                continue
+            registry.confirm_mode(key, mode)
+            return result
+    
+    def _request_generation(self, messages, schema_type):
+        """
+        发送生成请求
+        
+        设置了item_callback且启用流式输出时以流式方式请求，每解析出一个通过校验的
+        题目/卡片就立即回调，调用方仍然得到完整的响应文本。
+        
+        Args:
+            messages: 消息列表
+            schema_type: 校验类型（choice_question、essay_question、knowledge_card）
+        """
+        if not (self.item_callback and self.enable_streaming) or self._use_model_routing() or self._deliver_by_chunk:
+            return self._call_ai_api(messages, schema_type)
+        
+        field = ITEM_FIELDS[schema_type]
+        parser = StreamingArrayParser((field,))
+        
+        def on_delta(delta):
+            # 解析失败重新请求时，已经发送过的条目按题干跳过
+            self._stream_items(field, [item for item in parser.feed(delta)
+                                       if self.response_handler.validate_item(item, schema_type)])
+        
+        return self._call_structured(messages, schema_type, on_delta=on_delta)
+    
+    def _parse_generation(self, response, schema_type, model_name=None, expected_count=None):
+        """
+        解析并校验生成结果，同时按模型记录直接解析/修复/部分保留/失败次数
+        
+        响应被截断或损坏时，保留其中每个完整且通过校验的题目/卡片，返回的条目数
+        可能少于expected_count。
+        
+        Args:
+            response: AI响应文本
+            schema_type: 校验类型
+            model_name: 返回响应的模型名称，默认为当前选择的模型
+            expected_count: 请求生成的数量
+            
+        Raises:
+            ValueError: 修复后仍无法通过校验，且没有可以保留的条目
+        """
+        registry = get_structured_output_registry()
+        model_name = model_name or self._get_current_model_name()
+        try:
+            result, repaired = self.response_handler.parse_structured(response, schema_type)
+        except ValueError:
+            if not (self.enable_partial_salvage and schema_type in ITEM_FIELDS):
+                registry.record_parse(model_name, "failed")
+                raise
+            try:
+                result, missing_count = self.response_handler.salvage(response, schema_type, expected_count)
+            except ValueError:
+                registry.record_parse(model_name, "failed")
+                raise
+            registry.record_parse(model_name, "salvaged", missing_count)
+            print(f"响应不完整，保留了{len(result[ITEM_FIELDS[schema_type]])}个完整条目，缺少{missing_count}个")
+            return result
+        registry.record_parse(model_name, "repaired" if repaired else "direct")
+        return result
+    
+    @staticmethod
+    def _item_stem(item):
+        """题目/卡片的题干，用于去重"""
+        return " ".join(str(item.get("question", "")).split()).lower()
+    
+    def _get_shortfall(self, result, schema_type, expected_count):
+        """结果中缺少的条目数；未启用补充请求或无法计算时返回0"""
+        field = ITEM_FIELDS.get(schema_type)
+        if not (self.enable_shortfall_top_up and field and expected_count) or not isinstance(result, dict):
+            return 0
+        return max(0, expected_count - len(result.get(field, [])))
+    
+    def _build_top_up_messages(self, messages, schema_type, items, missing_count):
+        """
+        构建补充请求的消息：沿用原请求，在最后一条用户消息末尾要求只生成缺少的条目，
+        并列出已生成的题干以避免重复
+        """
+        measure, noun = ("张", "卡片") if ITEM_FIELDS[schema_type] == "cards" else ("道", "题目")
+        stems = "\n".join(f"- {str(item.get('question', ''))[:100]}" for item in items)
+        note = (f"\n\n注意：以下{len(items)}{measure}{noun}已经生成，请不要重复，"
+                f"只需再生成{missing_count}{measure}新的{noun}，仍按上面要求的JSON格式返回：\n{stems}")
+        top_up_messages = [dict(message) for message in messages]
+        for message in reversed(top_up_messages):
+            if message.get("role") == "user":
+                message["content"] = f"{message['content']}{note}"
+                break
+        return top_up_messages
+    
+    def _merge_top_up(self, result, schema_type, extra, missing_count):
+        """
+        把补充请求的条目合并到结果中，跳过与已有题干重复的条目
+        
+        Returns:
+            新增的条目数
+        """
+        field = ITEM_FIELDS[schema_type]
+        seen = {self._item_stem(item) for item in result[field]}
+        index = self._build_dedup_index(result[field])
+        added = 0
+        for item in extra.get(field, []):
+            if added >= missing_count:
+                break
+            stem = self._item_stem(item)
+            if stem in seen or (index is not None and index.add(item_text(item)) is not None):
+                continue
+            seen.add(stem)
+            result[field].append(item)
+            added += 1
+        print(f"补充请求新增{added}个条目，共{len(result[field])}个")
+        return added
+    
+    def _build_dedup_index(self, items):
+        """用已有条目建立近似重复索引；未启用去重时返回None"""
+        if not self.enable_dedup:
+            return None
+        index = NearDuplicateIndex(self.dedup_threshold)
+        for item in items:
+            index.add(item_text(item))
+        return index
+    
+    def _top_up(self, messages, schema_type, result, expected_count, raise_errors=False):
+        """
+        生成数量不足时，只请求缺少的条目并合并到结果中
+        
+        补充请求失败时保留已有结果，不影响本次生成。
+        
+        Args:
+            messages: 原生成请求的消息列表
+            schema_type: 校验类型
+            result: 已解析的结果
+            expected_count: 请求生成的数量
+            raise_errors: 补充请求失败时是否抛出异常（默认保留已有结果并停止补充）
+            
+        Returns:
+            合并后的结果
+        """
+        for _ in range(self.top_up_max_rounds):
+            missing_count = self._get_shortfall(result, schema_type, expected_count)
+            if missing_count == 0:
+                break
+            print(f"缺少{missing_count}个条目，发送补充请求")
+            top_up_messages = self._build_top_up_messages(
+                messages, schema_type, result[ITEM_FIELDS[schema_type]], missing_count)
+            try:
+                response = self._call_ai_api(top_up_messages, schema_type)
+                extra = self._parse_generation(response, schema_type, expected_count=missing_count)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                print(f"补充请求失败：{str(e)}")
+                break
+            if self._merge_top_up(result, schema_type, extra, missing_count) == 0:
+                break
+        return result
+    
+    async def _atop_up(self, messages, schema_type, result, expected_count, model_info=None):
+        """异步版本的_top_up，在异步引擎的事件循环中运行"""
+        for _ in range(self.top_up_max_rounds):
+            missing_count = self._get_shortfall(result, schema_type, expected_count)
+            if missing_count == 0:
+                break
+            print(f"缺少{missing_count}个条目，发送补充请求")
+            top_up_messages = self._build_top_up_messages(
+                messages, schema_type, result[ITEM_FIELDS[schema_type]], missing_count)
+            try:
+                extra = await self._agenerate_attempt(top_up_messages, schema_type, model_info, missing_count)
+            except Exception as e:
+                print(f"补充请求失败：{str(e)}")
+                break
+            if self._merge_top_up(result, schema_type, extra, missing_count) == 0:
+                break
+        return result
+    
+    def _with_retry(self, endpoint, func):
+        """
+        按统一的重试策略执行一次请求
+        
+        Args:
+            endpoint: 端点地址（熔断器按端点区分）
+            func: 执行一次请求的函数
+        """
+        breaker = get_circuit_breaker(endpoint, self.circuit_breaker_threshold, self.circuit_breaker_cooldown)
+        return call_with_retry(endpoint, func, self.retry_policy, breaker)
+    
+    async def _awith_retry(self, endpoint, func):
+        """异步版本的_with_retry，func返回协程"""
+        breaker = get_circuit_breaker(endpoint, self.circuit_breaker_threshold, self.circuit_breaker_cooldown)
+        return await acall_with_retry(endpoint, func, self.retry_policy, breaker)
 
-    def _call_openai(self, messages):
-        """调用OpenAI API"""
+    def _call_openai(self, messages, response_format=None):
+        """
+        调用OpenAI API
+        
+        Args:
+            messages: 消息列表
+            response_format: 结构化输出参数，为None时不设置
+        """
         if not openai.api_key:
             raise ValueError("OpenAI API Key未设置，请在设置中配置API密钥")
             
+        # 旧版SDK通过全局requestssession复用连接池
+        openai.requestssession = get_transport(
+            openai.api_base, openai.api_key, self._get_pool_size()
+        ).session
+        limiter = self._get_limiter(openai.api_base, self.model)
+        budget = self._get_rate_budget(openai.api_base, self.model)
+        estimated_tokens = estimate_request_tokens(messages, self.max_tokens)
+        extra_params = {"response_format": response_format} if response_format else {}
+
         try:
             try:
                 # 尝试使用新版API
@@ -119,53 +578,83 @@ class AIHandler:
                     api_key=openai.api_key,
                     timeout=self.request_timeout
                 )
-                response = client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens
-                )
+                def send_once():
+                    budget.acquire(estimated_tokens)
+                    with limiter.track(), abort_on_cancel():
+                        return client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=self.temperature,
+                            max_tokens=self.max_tokens,
+                            **extra_params
+                        )
+                response = self._with_retry(openai.api_base, send_once)
+                budget.reconcile(estimated_tokens, extract_usage_tokens(response))
                 return response.choices[0].message.content
             except (AttributeError, ImportError):
                 # 如果新版API不可用，使用旧版API
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=self.temperature,
-                    max_tokens=self.max_tokens,
-                    request_timeout=self.request_timeout
-                )
+                def send_once():
+                    budget.acquire(estimated_tokens)
+                    with limiter.track(), abort_on_cancel():
+                        return openai.ChatCompletion.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=self.temperature,
+                            max_tokens=self.max_tokens,
+                            request_timeout=self.request_timeout,
+                            **extra_params
+                        )
+                response = self._with_retry(openai.api_base, send_once)
+                budget.reconcile(estimated_tokens, extract_usage_tokens(response))
                 return response.choices[0].message.content
         except Exception as e:
             error_msg = str(e)
             if hasattr(e, 'response') and e.response is not None:
                 error_msg = f"OpenAI API错误：{error_msg}\n状态码：{e.response.status_code}"
-            raise Exception(error_msg)
+            raise APIRequestError(error_msg, get_error_status(e))
 
-    def _call_custom_api(self, messages):
-        """调用自定义AI API"""
-        # 确定API URL和API Key
+    def _resolve_custom_endpoint(self, model_info=None):
+        """
+        确定自定义API的地址、密钥和模型名称
+        
+        Args:
+            model_info: 模型配置，默认为当前选择的模型
+        
+        Returns:
+            (api_url, api_key, model_name) 元组
+        """
+        if model_info is None:
+            model_info = self.current_model_info
         api_url = self.api_url
         api_key = self.api_key
         
         # 如果设置了当前模型并且模型有自定义API设置，则使用模型的API设置
-        if self.current_model_info and 'api_url' in self.current_model_info and 'api_key' in self.current_model_info:
-            api_url = self.current_model_info['api_url']
-            api_key = self.current_model_info['api_key']
+        if model_info and 'api_url' in model_info and 'api_key' in model_info:
+            api_url = model_info['api_url']
+            api_key = model_info['api_key']
         
         if not api_url or not api_key:
             raise ValueError("自定义API的URL或密钥未设置")
-            
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
         
         # 确定要使用的模型名称
         model_name = self.model
-        if self.current_model_info:
-            model_name = self.current_model_info.get('name', self.model)
+        if model_info:
+            model_name = model_info.get('name', self.model)
+        
+        return api_url, api_key, model_name
+
+    def _build_custom_payload(self, messages, model_name, response_format=None):
+        """
+        构建自定义API的请求体
         
+        Args:
+            messages: 消息列表
+            model_name: 模型名称
+            response_format: 结构化输出参数，为None时不设置
+            
+        Returns:
+            请求体字典
+        """
         data = {
             "messages": messages,
             "model": model_name,
@@ -174,70 +663,328 @@ class AIHandler:
         }
         
         # 针对不同模型调整请求格式和参数
-        is_claude_model = "claude" in model_name.lower()
-        if is_claude_model:
+        if "claude" in model_name.lower():
             # 为Claude模型调整请求，可能需要减小max_tokens和添加超时重试机制
             data["max_tokens"] = min(self.max_tokens, 4000)  # Claude对长请求可能更敏感
         
-        # 添加重试机制，特别是针对连接重置错误
-        max_retries = 3
-        retry_count = 0
-        retry_delay = 2  # 初始重试延迟（秒）
+        if response_format:
+            data["response_format"] = response_format
         
-        while retry_count < max_retries:
-            try:
-                response = requests.post(
+        return data
+
+    def _call_custom_api(self, messages, model_info=None, response_format=None):
+        """
+        调用自定义AI API
+        
+        Args:
+            messages: 消息列表
+            model_info: 模型配置，默认为当前选择的模型
+            response_format: 结构化输出参数，为None时不设置
+        """
+        api_url, api_key, model_name = self._resolve_custom_endpoint(model_info)
+            
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        data = self._build_custom_payload(messages, model_name, response_format)
+        is_claude_model = "claude" in model_name.lower()
+        
+        # 使用长连接池，避免每次请求重新握手
+        transport = get_transport(api_url, api_key, self._get_pool_size())
+        limiter = self._get_limiter(api_url, model_name)
+        budget = self._get_rate_budget(api_url, model_name)
+        estimated_tokens = estimate_request_tokens(messages, data["max_tokens"])
+        
+        def send_once():
+            # 每次尝试（包括重试）都计入RPM/TPM预算
+            budget.acquire(estimated_tokens)
+            with limiter.track():
+                response = transport.post(
                     api_url,
                     headers=headers,
                     json=data,
                     timeout=self.request_timeout
                 )
                 response.raise_for_status()  # 检查HTTP错误
-                result = response.json()
-                
-                if not isinstance(result, dict) or 'choices' not in result:
-                    raise ValueError(f"API返回格式错误：{response.text}")
-                    
-                return result['choices'][0]['message']['content']
-                
-            except (requests.exceptions.ConnectionError, ConnectionResetError) as e:
-                # 特别处理连接错误和连接重置错误
-                retry_count += 1
-                if retry_count >= max_retries:
-                    error_msg = f"API连接错误（已重试{max_retries}次）：{str(e)}"
-                    if is_claude_model:
-                        error_msg += "\n使用Claude模型时可能需要更长的超时时间或减小max_tokens值"
-                    raise Exception(error_msg)
-                
-                print(f"连接错误，正在进行第{retry_count}次重试，等待{retry_delay}秒...")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # 指数退避，增加重试间隔
-                continue
-                
-            except requests.exceptions.RequestException as e:
-                error_msg = f"API请求失败：{str(e)}"
-                if hasattr(e, 'response') and e.response is not None:
-                    error_msg += f"\n状态码：{e.response.status_code}"
-                    error_msg += f"\n响应内容：{e.response.text}"
-                raise Exception(error_msg)
+            return response
+        
+        try:
+            # 限流、5xx和连接错误由重试策略统一重试
+            response = self._with_retry(api_url, send_once)
+            result = response.json()
+            budget.reconcile(estimated_tokens, extract_usage_tokens(result))
+            
+            if not isinstance(result, dict) or 'choices' not in result:
+                raise ValueError(f"API返回格式错误：{response.text}")
                 
-            except (KeyError, IndexError, ValueError) as e:
-                raise Exception(f"API响应解析失败：{str(e)}")
+            return result['choices'][0]['message']['content']
+            
+        except APIRequestError:
+            raise
+            
+        except (requests.exceptions.ConnectionError, ConnectionResetError) as e:
+            error_msg = f"API连接错误（已重试{self.retry_policy.max_attempts}次）：{str(e)}"
+            if is_claude_model:
+                error_msg += "\n使用Claude模型时可能需要更长的超时时间或减小max_tokens值"
+            raise APIRequestError(error_msg)
+            
+        except requests.exceptions.RequestException as e:
+            error_msg = f"API请求失败：{str(e)}"
+            status = None
+            if hasattr(e, 'response') and e.response is not None:
+                status = e.response.status_code
+                error_msg += f"\n状态码：{e.response.status_code}"
+                error_msg += f"\n响应内容：{e.response.text}"
+            raise APIRequestError(error_msg, status)
+            
+        except (KeyError, IndexError, ValueError) as e:
+            raise APIRequestError(f"API响应解析失败：{str(e)}")
+
+    def _call_ai_api_stream(self, messages, on_delta, response_format=None, model_info=None):
+        """
+        以流式（SSE）方式调用AI API
+        
+        Args:
+            messages: 消息列表
+            on_delta: 增量文本回调，每收到一段内容调用一次
+            response_format: 结构化输出参数，为None时不设置
+            model_info: 模型配置（仅自定义API），默认为当前选择的模型
+            
+        Returns:
+            完整的响应文本
+        """
+        try:
+            if self.provider == 'openai':
+                return self._call_openai_stream(messages, on_delta, response_format)
+            else:
+                return self._call_custom_api_stream(messages, on_delta, model_info, response_format)
+        except Exception as e:
+            # 读取流的过程中被取消时连接已被关闭，不包装成请求失败
+            check_cancelled()
+            error_msg = f"API调用失败：{str(e)}"
+            if hasattr(e, 'response') and e.response is not None:
+                error_msg += f"\n响应状态码：{e.response.status_code}"
+            raise APIRequestError(error_msg, get_error_status(e))
+
+    def _call_openai_stream(self, messages, on_delta, response_format=None):
+        """流式调用OpenAI API"""
+        if not openai.api_key:
+            raise ValueError("OpenAI API Key未设置，请在设置中配置API密钥")
+
+        openai.requestssession = get_transport(
+            openai.api_base, openai.api_key, self._get_pool_size()
+        ).session
+        limiter = self._get_limiter(openai.api_base, self.model)
+        # 流式响应通常不带usage，只按估算值扣减预算
+        budget = self._get_rate_budget(openai.api_base, self.model)
+        estimated_tokens = estimate_request_tokens(messages, self.max_tokens)
+        extra_params = {"response_format": response_format} if response_format else {}
+
+        parts = []
+        try:
+            # 尝试使用新版API
+            client = openai.OpenAI(
+                api_key=openai.api_key,
+                timeout=self.request_timeout
+            )
+            # 只重试建立流之前的失败，已输出的内容不会重复
+            def open_stream():
+                budget.acquire(estimated_tokens)
+                return client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    **extra_params
+                )
+            # 每次尝试单独占用并发名额，建立成功后读取整个流期间一直占用
+            with abort_on_cancel():
+                with self._with_retry(openai.api_base, lambda: limiter.hold(open_stream)) as stream:
+                    for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content or ""
+                        if delta:
+                            parts.append(delta)
+                            on_delta(delta)
+        except (AttributeError, ImportError):
+            # 如果新版API不可用，使用旧版API
+            def open_stream():
+                budget.acquire(estimated_tokens)
+                return openai.ChatCompletion.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    request_timeout=self.request_timeout,
+                    stream=True,
+                    **extra_params
+                )
+            with abort_on_cancel():
+                with self._with_retry(openai.api_base, lambda: limiter.hold(open_stream)) as stream:
+                    for chunk in stream:
+                        choices = chunk.get("choices") or []
+                        if not choices:
+                            continue
+                        delta = choices[0].get("delta", {}).get("content") or ""
+                        if delta:
+                            parts.append(delta)
+                            on_delta(delta)
+        return "".join(parts)
+
+    def _call_custom_api_stream(self, messages, on_delta, model_info=None, response_format=None):
+        """
+        流式调用自定义AI API（OpenAI兼容的SSE格式）
+        
+        与非流式请求共用自适应并发名额，读取整个流期间一直占用名额。
+        
+        Args:
+            messages: 消息列表
+            on_delta: 增量文本回调
+            model_info: 模型配置，默认为当前选择的模型
+            response_format: 结构化输出参数，为None时不设置
+        """
+        api_url, api_key, model_name = self._resolve_custom_endpoint(model_info)
+
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        data = self._build_custom_payload(messages, model_name, response_format)
+        data["stream"] = True
+
+        transport = get_transport(api_url, api_key, self._get_pool_size())
+        limiter = self._get_limiter(api_url, model_name)
+        # 流式响应通常不带usage，只按估算值扣减预算
+        budget = self._get_rate_budget(api_url, model_name)
+        estimated_tokens = estimate_request_tokens(messages, data["max_tokens"])
+
+        # 只重试建立流之前的失败，已输出的内容不会重复
+        def open_stream():
+            budget.acquire(estimated_tokens)
+            response = transport.post(
+                api_url,
+                headers=headers,
+                json=data,
+                timeout=self.request_timeout,
+                stream=True
+            )
+            try:
+                response.raise_for_status()
+            except Exception:
+                response.close()
+                raise
+            return response
+
+        # 每次尝试单独占用并发名额，建立成功后读取整个流期间一直占用
+        with self._with_retry(api_url, lambda: limiter.hold(open_stream)) as response:
+            try:
+                # 部分服务商会忽略stream参数，直接返回完整JSON
+                content_type = response.headers.get("Content-Type", "")
+                if "text/event-stream" not in content_type:
+                    result = response.json()
+                    if not isinstance(result, dict) or 'choices' not in result:
+                        raise ValueError(f"API返回格式错误：{response.text}")
+                    content = result['choices'][0]['message']['content']
+                    if content:
+                        on_delta(content)
+                    return content
+
+                response.encoding = "utf-8"
+                parts = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(payload)
+                    except json.JSONDecodeError:
+                        continue
+                    choices = event.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = (choices[0].get("delta") or {}).get("content") or ""
+                    if delta:
+                        parts.append(delta)
+                        on_delta(delta)
+                return "".join(parts)
+            finally:
+                response.close()
+
+    def get_stats(self) -> dict:
+        """
+        获取运行统计信息
+        
+        Returns:
+            包含HTTP连接复用、异步引擎、共享线程池、响应缓存、自适应并发、速率预算、请求优先级排队、重试/熔断、多模型路由、结构化输出、去重和分块截止时间状态的字典
+        """
+        return {
+            "transport": get_all_transport_stats(),
+            "async_engine": get_async_engine().get_stats(),
+            "executor": get_executor_service().get_stats(),
+            "response_cache": self._get_response_cache().get_stats(),
+            "adaptive_concurrency": get_all_limiter_stats(),
+            "rate_limits": get_all_budget_stats(),
+            "priority": get_priority_stats(),
+            "retry": get_retry_stats(),
+            "routing": get_model_router().get_stats(),
+            "structured_output": get_structured_output_registry().get_stats(),
+            "dedup": get_dedup_stats(),
+            "deadlines": get_deadline_stats()
+        }
 
-    def _should_chunk_text(self, content: str) -> bool:
+    def _should_chunk_text(self, content: str, kind=None, num_items=3, language="中文") -> bool:
         """
         判断文本是否需要分块
         
         Args:
             content: 文本内容
+            kind: 生成类型，按token分块时用于计算提示词本身占用的token数
+            num_items: 生成数量
+            language: 生成内容使用的语言
             
         Returns:
             是否需要分块
         """
         if not self.enable_chunking:
             return False
+        self._configure_token_budget(kind, num_items, language)
         return self.text_chunker.should_chunk(content)
     
+    def _configure_token_budget(self, kind=None, num_items=3, language="中文"):
+        """
+        按当前模型的上下文窗口设置分块器的token预算
+        
+        每块预算 = 上下文窗口 - 为输出预留的token数 - 不含学习内容的提示词token数。
+        chunk_unit 不为 tokens 时恢复按字符数分块。
+        
+        Args:
+            kind: 生成类型，为None时不扣除提示词占用
+            num_items: 生成数量
+            language: 生成内容使用的语言
+        """
+        if self.chunk_unit != 'tokens':
+            self.text_chunker.set_token_budget(None)
+            return
+        reserve = self.completion_reserve or self.max_tokens or 0
+        prompt_tokens = 0
+        if kind in GENERATION_KINDS:
+            # 每条消息约有4个token的格式开销
+            prompt_tokens = 4 + self.token_estimator(self._build_generation_prompt(kind, "", num_items, language))
+        budget = self.context_window - reserve - prompt_tokens
+        if budget < MIN_CHUNK_TOKENS:
+            print(f"上下文窗口 {self.context_window} 扣除输出预留 {reserve} 和提示词 {prompt_tokens} 后"
+                  f"只剩 {budget} token，每块按 {MIN_CHUNK_TOKENS} token 分块")
+            budget = MIN_CHUNK_TOKENS
+        overlap = min(self.chunk_overlap_tokens, budget // 4)
+        self.text_chunker.set_token_budget(budget, overlap, self.token_estimator)
+    
     def _distribute_questions_across_chunks(self, num_chunks: int, total_questions: int) -> list:
         """
         将问题数量分配到各个分块
@@ -266,6 +1013,42 @@ class AIHandler:
         
         return distribution
     
+    def _allocate_items_to_chunks(self, chunk_texts: list, total_items: int) -> list:
+        """
+        按信息密度把题目/卡片数量分配到各个分块
+        
+        未启用按密度分配或所有分块都没有有效内容时退回平均分配。
+        
+        Args:
+            chunk_texts: 各分块的文本
+            total_items: 总数量
+            
+        Returns:
+            每个分块应生成的数量列表（为0的分块不会发送请求）
+        """
+        if not self.enable_density_allocation:
+            return self._distribute_questions_across_chunks(len(chunk_texts), total_items)
+        scores = score_chunks(chunk_texts)
+        positive = sorted(score for score in scores if score > 0)
+        if not positive:
+            return self._distribute_questions_across_chunks(len(chunk_texts), total_items)
+        cutoff = positive[len(positive) // 2] * self.density_skip_ratio
+        weights = [score if score >= cutoff else 0.0 for score in scores]
+        skipped = sum(1 for weight in weights if weight <= 0)
+        if skipped:
+            print(f"跳过 {skipped} 个信息量很低的分块（目录、参考文献、空白页等）")
+        return allocate(total_items, weights)
+    
+    def _check_job(self):
+        """
+        检查当前生成任务是否已被暂停或取消
+        
+        Raises:
+            JobInterrupted: 任务已被请求停止
+        """
+        if self.generation_job is not None:
+            self.generation_job.check()
+    
     def _report_progress(self, current: int, total: int, message: str = ""):
         """
         报告进度
@@ -281,163 +1064,257 @@ class AIHandler:
             except Exception as e:
                 print(f"Progress callback error: {e}")
 
-    def generate_questions(self, content, question_type, num_questions=3, language="中文"):
-        """生成问题
+    def _get_deadline_policy(self, speculative=True, hard_deadline=True):
+        """
+        获取分块批次的截止时间设置（耗时样本按当前模型分组）
         
         Args:
-            content: 学习内容
-            question_type: 问题类型
-            num_questions: 问题数量
-            language: 生成内容使用的语言
+            speculative: 是否对超过软截止时间的分块推测执行
+            hard_deadline: 是否使用批次的硬截止时间（结果需要与任务一一对应时不能使用）
+            
+        Returns:
+            DeadlinePolicy；既不推测执行也不限制批次用时时返回None
         """
-        if question_type == "multiple_choice":
-            return self._generate_choice_questions(content, num_questions, language)
-        elif question_type == "knowledge_card":
-            return self._generate_knowledge_cards(content, num_questions, language)
-        elif question_type == "language_learning":
-            return self._generate_language_learning_cards(content, num_questions, language)
-        elif question_type == "custom":
-            return self._generate_custom_questions(content, num_questions, language)
-        else:
-            return self._generate_essay_questions(content, num_questions, language)
+        max_speculative = self.max_speculative_requests if speculative and self.enable_straggler_redispatch else 0
+        batch_deadline = self.batch_deadline if hard_deadline else 0
+        if not max_speculative and not batch_deadline:
+            return None
+        return DeadlinePolicy(
+            f"{self.provider}:{self._get_current_model_name()}",
+            percentile=self.straggler_latency_percentile,
+            multiplier=self.straggler_deadline_multiplier,
+            min_soft_deadline=self.straggler_min_deadline,
+            max_speculative=max_speculative,
+            batch_deadline=batch_deadline
+        )
+    
+    def _get_current_model_name(self):
+        """获取当前实际使用的模型名称"""
+        if self.current_model_info:
+            return self.current_model_info.get('name', self.model) or ""
+        return self.model or ""
 
-    def _generate_choice_questions(self, content, num_questions, language="中文"):
-        """生成选择题"""
+    def _build_generation_prompt(self, kind, content, num_items, language="中文"):
+        """
+        构建生成请求的提示词
+        
+        Args:
+            kind: 生成类型（choice, essay, knowledge_card, language_learning）
+            content: 学习内容
+            num_items: 生成数量
+            language: 生成内容使用的语言
+            
+        Returns:
+            提示词文本
+        """
+        large_batch_hint = "\n\n特别注意：你正在生成较多数量的题目，请特别注意JSON格式的正确性，确保每个问题对象之间有逗号分隔，所有属性名和字符串值都用双引号包围，每个属性后面都有逗号（除了最后一个）。"
+
+        if kind == "choice":
+            prompt = get_choice_prompt(content, num_items, language)
+            # 为Claude模型或大量题目添加额外提醒
+            if "claude" in self._get_current_model_name().lower():
+                prompt += """
+
+注意：当前使用 Claude 模型。
+1. 直接返回一个有效的 JSON 对象，不要在前后添加说明文字
+2. 不要使用任何 Markdown 代码块（例如 ```json）
+3. 所有字符串必须使用双引号，保证 JSON 可以被严格解析
+"""
+            elif num_items > 5:
+                prompt += large_batch_hint
+            return prompt
+        elif kind == "essay":
+            prompt = get_essay_prompt(content, num_items, language)
+            # 如果题目数量较多，添加额外提醒
+            if num_items > 5:
+                prompt += large_batch_hint
+            return prompt
+        elif kind == "knowledge_card":
+            return format_prompt("basic", content, num_items, language)
+        elif kind == "language_learning":
+            return format_prompt("language_learning", content, num_items, language)
+        else:
+            raise ValueError(f"不支持的生成类型: {kind}")
+
+    def _build_generation_messages(self, kind, content, num_items, language="中文"):
+        """构建生成请求的消息列表（也用作响应缓存键的一部分）"""
+        return [{
+            "role": "user",
+            "content": self._build_generation_prompt(kind, content, num_items, language)
+        }]
+    
+    def _generate_single(self, kind, content, num_items, language="中文", cache=True):
+        """
+        按类型执行单次生成
+        
+        Args:
+            kind: 生成类型（choice, essay, knowledge_card, language_learning）
+            content: 学习内容
+            num_items: 生成数量
+            language: 生成内容使用的语言
+            cache: 是否读写响应缓存。分块生成时为False：分块请求可能被推测执行而重复调用，
+                缓存的读写由调用方在派发前和分块完成时各做一次
+        """
+        single_generators = {
+            "choice": self._generate_choice_questions_single,
+            "essay": self._generate_essay_questions_single,
+            "knowledge_card": self._generate_knowledge_cards_single,
+            "language_learning": self._generate_language_learning_cards_single,
+        }
+        self._check_job()
+        _, schema_type, _ = GENERATION_KINDS[kind]
+        messages = self._build_generation_messages(kind, content, num_items, language)
+        return self._generate_cached(
+            messages, schema_type, num_items,
+            lambda: single_generators[kind](content, num_items, language), cache)
+    
+    def _generate_cached(self, messages, schema_type, num_items, generate, cache=True):
+        """
+        读取响应缓存，未命中时生成、补足缺少的条目并写入缓存
+        
+        Args:
+            messages: 生成请求的消息列表（响应缓存键的一部分）
+            schema_type: 校验类型
+            num_items: 生成数量
+            generate: 执行一次生成并返回解析结果的函数
+            cache: 是否读写响应缓存
+        """
+        cached = self._get_cached_result(messages, schema_type) if cache else None
+        if cached is not None:
+            return cached
+        
+        result = generate()
+        result = self._top_up(messages, schema_type, result, num_items)
+        if cache:
+            self._store_cached_result(messages, schema_type, result)
+        return result
+
+    def _get_response_cache(self):
+        """获取响应缓存实例"""
+        return get_response_cache(self.response_cache_max_mb, self.response_cache_ttl_hours)
+
+    def _response_cache_key(self, messages, schema_type):
+        """计算当前服务商、模型和参数下请求的响应缓存键"""
+        return make_cache_key(self.provider, self._get_current_model_name(), self.temperature,
+                              self.max_tokens, messages, schema_type)
+    
+    def _get_cached_result(self, messages, schema_type):
+        """
+        读取已缓存的解析结果
+        
+        Args:
+            messages: 请求消息列表
+            schema_type: 校验类型
+            
+        Returns:
+            缓存的结果；未启用缓存、本次要求重新生成或未命中时返回None
+        """
+        if not self.enable_response_cache or self.bypass_cache:
+            return None
+        key = self._response_cache_key(messages, schema_type)
+        result = self._get_response_cache().get(key)
+        if result is not None:
+            print(f"命中响应缓存（{schema_type}）")
+        return result
+
+    def _store_cached_result(self, messages, schema_type, result):
+        """
+        将已校验的解析结果写入缓存
+        
+        Args:
+            messages: 请求消息列表
+            schema_type: 校验类型
+            result: 解析结果
+        """
+        if not self.enable_response_cache or result is None:
+            return
+        key = self._response_cache_key(messages, schema_type)
+        self._get_response_cache().put(key, result)
+
+    def generate_questions(self, content, question_type, num_questions=3, language="中文", use_cache=True):
+        """生成问题
+        
+        Args:
+            content: 学习内容
+            question_type: 问题类型
+            num_questions: 问题数量
+            language: 生成内容使用的语言
+            use_cache: 是否使用响应缓存，为False时强制重新生成（结果仍会写入缓存）
+        """
+        self.bypass_cache = not use_cache
+        streamed = _streamed_stems.set(set())
+        try:
+            if question_type == "multiple_choice":
+                return self._generate_choice_questions(content, num_questions, language)
+            elif question_type == "knowledge_card":
+                return self._generate_knowledge_cards(content, num_questions, language)
+            elif question_type == "language_learning":
+                return self._generate_language_learning_cards(content, num_questions, language)
+            elif question_type == "custom":
+                return self._generate_custom_questions(content, num_questions, language)
+            else:
+                return self._generate_essay_questions(content, num_questions, language)
+        finally:
+            _streamed_stems.reset(streamed)
+            self.bypass_cache = False
+
+    def will_chunk(self, content, question_type, num_questions=3, language="中文") -> bool:
+        """
+        generate_questions是否会对该内容分块生成（自定义模板不分块）
+        
+        Args:
+            content: 学习内容
+            question_type: 问题类型
+            num_questions: 问题数量
+            language: 生成内容使用的语言
+        """
+        kind = {
+            "multiple_choice": "choice",
+            "knowledge_card": "knowledge_card",
+            "language_learning": "language_learning",
+            "custom": None,
+        }.get(question_type, "essay")
+        return kind is not None and self._should_chunk_text(content, kind, num_questions, language)
+
+    def _generate_choice_questions(self, content, num_questions, language="中文"):
+        """生成选择题"""
         # 检查是否需要分块处理
-        if self._should_chunk_text(content):
+        if self._should_chunk_text(content, "choice", num_questions, language):
             print(f"文本长度 {len(content)}，启用分块处理")
             return self._generate_choice_questions_with_chunking(content, num_questions, language)
         
         # 原有的单次生成逻辑
-        return self._generate_choice_questions_single(content, num_questions, language)
+        return self._generate_single("choice", content, num_questions, language)
     
     def _generate_choice_questions_single(self, content, num_questions, language="中文"):
         """生成选择题（单次请求）"""
-        prompt = get_choice_prompt(content, num_questions, language)
+        prompt = self._build_generation_prompt("choice", content, num_questions, language)
         max_retries = 3
         current_retry = 0
 
-        # 检查当前使用的模型是否为Claude
-        model_name = self.model
-        if self.current_model_info:
-            model_name = self.current_model_info.get('name', self.model)
-        is_claude_model = "claude" in model_name.lower()
-
-        # 为Claude模型或大量题目添加额外提醒
-        if is_claude_model:
-            prompt += """
-
-注意：当前使用 Claude 模型。
-1. 直接返回一个有效的 JSON 对象，不要在前后添加说明文字
-2. 不要使用任何 Markdown 代码块（例如 ```json）
-3. 所有字符串必须使用双引号，保证 JSON 可以被严格解析
-"""
-        elif num_questions > 5:
-            prompt += "\n\n特别注意：你正在生成较多数量的题目，请特别注意JSON格式的正确性，确保每个问题对象之间有逗号分隔，所有属性名和字符串值都用双引号包围，每个属性后面都有逗号（除了最后一个）。"
-
         while current_retry < max_retries:
             try:
                 # 打印当前重试次数，便于调试
                 print(f"正在生成选择题，第{current_retry + 1}次尝试...")
 
-                response = self._call_ai_api([{
+                response = self._request_generation([{
                     "role": "user",
                     "content": prompt
-                }])
+                }], "choice_question")
                 
                 # 输出原始响应前50个字符，便于调试
                 print(f"获得原始响应（前50个字符）：{response[:50]}...")
                 
                 try:
-                    result = self.response_handler.parse_and_validate(response, "choice_question")
-                    
-                    # 验证问题数量
-                    if len(result["questions"]) < num_questions:
-                        print(f"警告：请求生成{num_questions}个问题，但只生成了{len(result['questions'])}个")
-                    
-                    return result
+                    return self._parse_generation(response, "choice_question", expected_count=num_questions)
                 except ValueError as e:
-                    # 如果是JSON解析错误，记录详细信息并重试
-                    error_msg = str(e)
-                    print(f"JSON解析错误：{error_msg}")
-                    
-                    # 对于Claude模型，尝试更激进的清理和修复
-                    if is_claude_model:
-                        try:
-                            # 记录原始响应到日志（前200个字符）
-                            print(f"Claude响应片段: {response[:200]}...")
-                            
-                            # 尝试找到JSON的开始位置（可能有前导文本）
-                            json_start = response.find('{')
-                            if json_start >= 0:
-                                # 尝试清理并解析JSON部分
-                                cleaned_json = response[json_start:]
-                                
-                                # 尝试找到JSON的结束位置（可能有尾随文本）
-                                brace_count = 0
-                                for i, char in enumerate(cleaned_json):
-                                    if char == '{':
-                                        brace_count += 1
-                                    elif char == '}':
-                                        brace_count -= 1
-                                        if brace_count == 0:
-                                            cleaned_json = cleaned_json[:i+1]
-                                            break
-                                
-                                # 应用深度修复
-                                cleaned_response = self.response_handler.clean_response(cleaned_json)
-                                fixed_json = self.response_handler.deep_json_fix(cleaned_response)
-                                result = json.loads(fixed_json)
-                                
-                                # 验证数据结构
-                                if not isinstance(result, dict) or "questions" not in result:
-                                    raise ValueError("返回的JSON格式不正确：缺少questions字段")
-                                
-                                # 验证每个问题的格式
-                                for q in result["questions"]:
-                                    if not all(key in q for key in ["question", "options", "correct_answer", "explanation", "source_content"]):
-                                        raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-                                    if not isinstance(q["options"], list) or len(q["options"]) != 4:
-                                        raise ValueError("返回的JSON格式不正确：选项数量不正确")
-                                    if q["correct_answer"] not in ["A", "B", "C", "D"]:
-                                        raise ValueError("返回的JSON格式不正确：正确答案必须是A、B、C、D之一")
-                                
-                                return result
-                            else:
-                                raise ValueError("Claude响应中未找到有效的JSON数据")
-                        except Exception as claude_error:
-                            print(f"Claude模型响应修复失败：{str(claude_error)}")
-                            current_retry += 1
-                            continue
-                    elif "JSON解析失败" in error_msg:
-                        # 尝试使用深度修复
-                        try:
-                            cleaned_response = self.response_handler.clean_response(response)
-                            fixed_json = self.response_handler.deep_json_fix(cleaned_response)
-                            result = json.loads(fixed_json)
-                            
-                            # 验证数据结构
-                            if not isinstance(result, dict) or "questions" not in result:
-                                raise ValueError("返回的JSON格式不正确：缺少questions字段")
-                            
-                            # 验证每个问题的格式
-                            for q in result["questions"]:
-                                if not all(key in q for key in ["question", "options", "correct_answer", "explanation", "source_content"]):
-                                    raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-                                if not isinstance(q["options"], list) or len(q["options"]) != 4:
-                                    raise ValueError("返回的JSON格式不正确：选项数量不正确")
-                                if q["correct_answer"] not in ["A", "B", "C", "D"]:
-                                    raise ValueError("返回的JSON格式不正确：正确答案必须是A、B、C、D之一")
-                            
-                            return result
-                        except Exception as inner_e:
-                            print(f"深度修复失败：{str(inner_e)}")
-                            current_retry += 1
-                            continue
-                    else:
-                        current_retry += 1
-                        continue
-                
+                    print(f"JSON解析错误：{str(e)}")
+                    current_retry += 1
+                    continue
+
+            except APIRequestError:
+                # 请求失败已由重试策略处理，不再重复请求
+                raise
             except Exception as e:
                 print(f"API调用错误：{str(e)}")
                 current_retry += 1
@@ -445,90 +1322,45 @@ class AIHandler:
                     raise Exception(f"生成选择题失败：{str(e)}")
                 continue
         
-        # 如果尝试次数用完，保存最后一次响应内容到临时文件以便调试
-        try:
-            with open("last_claude_response.txt", "w", encoding="utf-8") as f:
-                f.write(f"模型: {model_name}\n\n")
-                f.write(f"系统提示:\n{system_prompt}\n\n")
-                f.write(f"用户提示:\n{prompt}\n\n")
-                f.write(f"响应:\n{response}")
-            print("已将最后一次响应保存到last_claude_response.txt")
-        except:
-            pass
-            
         raise Exception("生成选择题失败：超过最大重试次数")
 
     def _generate_essay_questions(self, content, num_questions, language="中文"):
         """生成问答题"""
         # 检查是否需要分块处理
-        if self._should_chunk_text(content):
+        if self._should_chunk_text(content, "essay", num_questions, language):
             print(f"文本长度 {len(content)}，启用分块处理")
             return self._generate_essay_questions_with_chunking(content, num_questions, language)
         
         # 原有的单次生成逻辑
-        return self._generate_essay_questions_single(content, num_questions, language)
+        return self._generate_single("essay", content, num_questions, language)
     
     def _generate_essay_questions_single(self, content, num_questions, language="中文"):
         """生成问答题（单次请求）"""
-        prompt = get_essay_prompt(content, num_questions, language)
+        prompt = self._build_generation_prompt("essay", content, num_questions, language)
         max_retries = 3
         current_retry = 0
 
-        # 如果题目数量较多，添加额外提醒
-        if num_questions > 5:
-            prompt += "\n\n特别注意：你正在生成较多数量的题目，请特别注意JSON格式的正确性，确保每个问题对象之间有逗号分隔，所有属性名和字符串值都用双引号包围，每个属性后面都有逗号（除了最后一个）。"
-
         while current_retry < max_retries:
             try:
-                response = self._call_ai_api([{
+                response = self._request_generation([{
                     "role": "user",
                     "content": prompt
-                }])
+                }], "essay_question")
                 
                 # 记录原始响应（可以在调试时使用）
                 # print(f"原始响应：{response}")
                 
                 # 使用ResponseHandler处理和验证JSON
                 try:
-                    result = self.response_handler.parse_and_validate(response, "essay_question")
-                    
-                    # 验证问题数量
-                    if len(result["questions"]) < num_questions:
-                        print(f"警告：请求生成{num_questions}个问题，但只生成了{len(result['questions'])}个")
-                    
-                    return result
+                    return self._parse_generation(response, "essay_question", expected_count=num_questions)
                 except ValueError as e:
-                    # 如果是JSON解析错误，尝试手动解析和修复
-                    error_msg = str(e)
-                    print(f"JSON解析错误：{error_msg}")
-                    
-                    if "JSON解析失败" in error_msg:
-                        # 尝试使用深度修复
-                        try:
-                            cleaned_response = self.response_handler.clean_response(response)
-                            fixed_json = self.response_handler.deep_json_fix(cleaned_response)
-                            result = json.loads(fixed_json)
-                            
-                            # 验证数据结构
-                            if not isinstance(result, dict) or "questions" not in result:
-                                raise ValueError("返回的JSON格式不正确：缺少questions字段")
-                            
-                            for q in result["questions"]:
-                                if not all(key in q for key in ["question", "reference_answer", "key_points", "source_content"]):
-                                    raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-                                if not isinstance(q["key_points"], list) or len(q["key_points"]) < 3:
-                                    raise ValueError("返回的JSON格式不正确：关键点数量不足")
-                            
-                            return result
-                        except Exception as inner_e:
-                            print(f"深度修复失败：{str(inner_e)}")
-                            current_retry += 1
-                            continue
-                    else:
-                        # 如果是其他验证错误，继续重试
-                        current_retry += 1
-                        continue
-                        
+                    print(f"JSON解析错误：{str(e)}")
+                    current_retry += 1
+                    continue
+
+            except APIRequestError:
+                # 请求失败已由重试策略处理，不再重复请求
+                raise
             except Exception as e:
                 print(f"API调用错误：{str(e)}")
                 current_retry += 1
@@ -541,28 +1373,31 @@ class AIHandler:
     def _generate_knowledge_cards(self, content, num_cards=3, language="中文"):
         """生成知识卡片"""
         # 检查是否需要分块处理
-        if self._should_chunk_text(content):
+        if self._should_chunk_text(content, "knowledge_card", num_cards, language):
             print(f"文本长度 {len(content)}，启用分块处理")
             return self._generate_knowledge_cards_with_chunking(content, num_cards, language)
         
         # 原有的单次生成逻辑
-        return self._generate_knowledge_cards_single(content, num_cards, language)
+        return self._generate_single("knowledge_card", content, num_cards, language)
     
     def _generate_knowledge_cards_single(self, content, num_cards=3, language="中文"):
         """生成知识卡片（单次请求）"""
-        prompt = format_prompt("basic", content, num_cards, language)
+        prompt = self._build_generation_prompt("knowledge_card", content, num_cards, language)
         max_retries = 3
         current_retry = 0
 
         while current_retry < max_retries:
             try:
-                response = self._call_ai_api([{
+                response = self._request_generation([{
                     "role": "user",
                     "content": prompt
-                }])
+                }], "knowledge_card")
                 
-                return self.response_handler.parse_and_validate(response, "knowledge_card")
+                return self._parse_generation(response, "knowledge_card", expected_count=num_cards)
                 
+            except APIRequestError:
+                # 请求失败已由重试策略处理，不再重复请求
+                raise
             except Exception as e:
                 current_retry += 1
                 if current_retry >= max_retries:
@@ -583,12 +1418,12 @@ class AIHandler:
             包含cards数组的字典
         """
         # 检查是否需要分块处理
-        if self._should_chunk_text(content):
+        if self._should_chunk_text(content, "language_learning", num_cards, language):
             print(f"文本长度 {len(content)}，启用分块处理")
             return self._generate_language_learning_cards_with_chunking(content, num_cards, language)
         
         # 原有的单次生成逻辑
-        return self._generate_language_learning_cards_single(content, num_cards, language)
+        return self._generate_single("language_learning", content, num_cards, language)
     
     def _generate_language_learning_cards_single(self, content, num_cards=5, language="中文"):
         """生成语言学习知识卡片（单次请求）
@@ -601,20 +1436,23 @@ class AIHandler:
         Returns:
             包含cards数组的字典
         """
-        prompt = format_prompt("language_learning", content, num_cards, language)
+        prompt = self._build_generation_prompt("language_learning", content, num_cards, language)
         max_retries = 3
         current_retry = 0
 
         while current_retry < max_retries:
             try:
-                response = self._call_ai_api([{
+                response = self._request_generation([{
                     "role": "user",
                     "content": prompt
-                }])
+                }], "knowledge_card")
                 
                 # 使用knowledge_card schema验证，因为格式相同
-                return self.response_handler.parse_and_validate(response, "knowledge_card")
+                return self._parse_generation(response, "knowledge_card", expected_count=num_cards)
                 
+            except APIRequestError:
+                # 请求失败已由重试策略处理，不再重复请求
+                raise
             except Exception as e:
                 current_retry += 1
                 if current_retry >= max_retries:
@@ -631,13 +1469,14 @@ class AIHandler:
             response = self._call_ai_api([{
                 "role": "user",
                 "content": prompt
-            }])
+            }], "cloze_card")
             
-            return self.response_handler.parse_and_validate(response, "cloze_card")
+            return self._parse_generation(response, "cloze_card")
             
         except Exception as e:
             raise Exception(f"转换为填空卡失败：{str(e)}")
 
+    @request_priority(PRIORITY_EVALUATION)
     def evaluate_answer(self, question_data, user_answer, language="中文"):
         """评估用户答案
         
@@ -686,24 +1525,29 @@ class AIHandler:
             response = self._call_ai_api([{
                 "role": "user",
                 "content": prompt
-            }])
+            }], "essay_evaluation")
             
-            return self.response_handler.parse_and_validate(response, "essay_evaluation")
+            return self._parse_generation(response, "essay_evaluation")
                 
         except Exception as e:
             raise Exception(f"评估答案时出错：{str(e)}")
 
-    def handle_follow_up_question(self, context, language="中文"):
+    @request_priority(PRIORITY_INTERACTIVE)
+    def handle_follow_up_question(self, context, language="中文", stream_callback=None):
         """处理追问
         
         Args:
             context: 上下文信息
             language: 回答使用的语言
+            stream_callback: 流式增量回调（可选），设置后逐段返回回答内容
         """
         messages = get_followup_messages(context, language)
+        if stream_callback and self.enable_streaming:
+            return self._call_ai_api_stream(messages, stream_callback)
         response = self._call_ai_api(messages)
         return response
 
+    @request_priority(PRIORITY_INTERACTIVE)
     def generate_language_pattern(self, sentence, target_language, specified_parts=None, language_level=None, examples_count=3):
         """生成语言模式练习内容
         
@@ -842,14 +1686,21 @@ class AIHandler:
             # 应用并发设置
             if 'max_concurrent_requests' in settings:
                 self.max_concurrent = settings['max_concurrent_requests']
-                self.concurrent_processor.set_max_workers(self.max_concurrent)
+                self.concurrent_processor.set_max_workers(self._get_worker_count())
                 print(f"为模型 {model_name} 应用特定并发设置: {self.max_concurrent}")
             
+            # 应用异步引擎并发上限
+            if 'async_concurrency_limit' in settings:
+                self.async_concurrency_limit = settings['async_concurrency_limit']
+            
             # 应用分块设置
             if 'chunk_size' in settings:
                 chunk_size = settings['chunk_size']
                 self.text_chunker.chunk_size = chunk_size
                 print(f"为模型 {model_name} 应用特定分块大小: {chunk_size}")
+            
+            # 应用上下文窗口（按token分块时决定每块的token预算）
+            self.context_window = settings.get('context_window', self.default_context_window)
         else:
             # 没有特定设置，使用默认值
             self._reset_to_default_settings()
@@ -857,8 +1708,10 @@ class AIHandler:
     def _reset_to_default_settings(self):
         """重置为默认设置"""
         self.max_concurrent = self.default_max_concurrent
-        self.concurrent_processor.set_max_workers(self.max_concurrent)
+        self.concurrent_processor.set_max_workers(self._get_worker_count())
+        self.async_concurrency_limit = self.default_async_concurrency_limit
         self.text_chunker.chunk_size = self.default_chunk_size
+        self.context_window = self.default_context_window
 
     def _generate_custom_questions(self, content, template_id, num_questions, language="中文"):
         """使用自定义模板生成卡片"""
@@ -883,6 +1736,40 @@ class AIHandler:
         else:
             raise ValueError(f"不支持的卡片类型: {card_type}")
 
+    def _generate_from_messages(self, messages, schema_type, num_items, failure_message):
+        """
+        发送自定义模板的生成请求并解析结果，解析失败时重新请求
+        
+        Args:
+            messages: 消息列表
+            schema_type: 校验类型
+            num_items: 生成数量
+            failure_message: 多次尝试仍失败时的错误信息
+        """
+        max_retries = 3
+        current_retry = 0
+
+        while current_retry < max_retries:
+            try:
+                response = self._request_generation(messages, schema_type)
+
+                try:
+                    return self._parse_generation(response, schema_type, expected_count=num_items)
+                except ValueError as e:
+                    print(f"JSON解析错误：{str(e)}")
+                    current_retry += 1
+                    continue
+
+            except APIRequestError:
+                # 请求失败已由重试策略处理，不再重复请求
+                raise
+            except Exception as e:
+                print(f"API调用错误：{str(e)}")
+                current_retry += 1
+                continue
+
+        raise Exception(failure_message)
+
     def _generate_custom_choice(self, content, template, num_questions, language="中文"):
         """使用自定义模板生成选择题"""
         # 构建提示词，只替换content变量
@@ -924,64 +1811,13 @@ JSON格式要求：
 9. 检查生成的JSON是否完整，特别是在生成大量题目时
 10. 确保每个问题对象的所有字段都正确闭合"""
 
-        max_retries = 3
-        current_retry = 0
-
-        while current_retry < max_retries:
-            try:
-                response = self._call_ai_api([{
-                    "role": "user",
-                    "content": prompt
-                }])
-                
-                try:
-                    result = self.response_handler.parse_and_validate(response, "choice_question")
-                    
-                    # 验证问题数量
-                    if len(result["questions"]) < num_questions:
-                        print(f"警告：请求生成{num_questions}个问题，但只生成了{len(result['questions'])}个")
-                    
-                    return result
-                except ValueError as e:
-                    # 如果是JSON解析错误，记录详细信息并重试
-                    error_msg = str(e)
-                    print(f"JSON解析错误：{error_msg}")
-                    
-                    if "JSON解析失败" in error_msg:
-                        # 尝试使用深度修复
-                        try:
-                            cleaned_response = self.response_handler.clean_response(response)
-                            fixed_json = self.response_handler.deep_json_fix(cleaned_response)
-                            result = json.loads(fixed_json)
-                            
-                            # 验证数据结构
-                            if not isinstance(result, dict) or "questions" not in result:
-                                raise ValueError("返回的JSON格式不正确：缺少questions字段")
-                            
-                            # 验证每个问题的格式
-                            for q in result["questions"]:
-                                if not all(key in q for key in ["question", "options", "correct_answer", "explanation", "source_content"]):
-                                    raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-                                if not isinstance(q["options"], list) or len(q["options"]) != 4:
-                                    raise ValueError("返回的JSON格式不正确：选项数量不正确")
-                                if q["correct_answer"] not in ["A", "B", "C", "D"]:
-                                    raise ValueError("返回的JSON格式不正确：正确答案必须是A、B、C、D之一")
-                            
-                            return result
-                        except Exception as inner_e:
-                            print(f"深度修复失败：{str(inner_e)}")
-                            current_retry += 1
-                            continue
-                    else:
-                        current_retry += 1
-                        continue
-                
-            except Exception as e:
-                print(f"API调用错误：{str(e)}")
-                current_retry += 1
-                continue
-                
-        raise Exception("生成选择题失败，请检查提示词模板是否正确")
+        messages = [{
+            "role": "user",
+            "content": prompt
+        }]
+        return self._generate_cached(
+            messages, "choice_question", num_questions,
+            lambda: self._generate_from_messages(messages, "choice_question", num_questions, "生成选择题失败，请检查提示词模板是否正确"))
 
     def _generate_custom_knowledge_card(self, content, template, num_questions, language="中文"):
         """使用自定义模板生成知识卡"""
@@ -1011,35 +1847,13 @@ JSON格式要求：
 3. 特别注意JSON格式中的逗号、引号等标点符号的正确使用
 4. 确保每个JSON对象和数组的开始和结束都有正确的括号"""
 
-        max_retries = 3
-        current_retry = 0
-
-        while current_retry < max_retries:
-            try:
-                response = self._call_ai_api([{
-                    "role": "user",
-                    "content": prompt
-                }])
-
-                try:
-                    result = self.response_handler.parse_and_validate(response, "knowledge_card")
-
-                    # 验证卡片数量
-                    if len(result["cards"]) < num_questions:
-                        print(f"警告：请求生成{num_questions}张卡片，但只生成了{len(result['cards'])}张")
-
-                    return result
-                except ValueError as e:
-                    print(f"JSON解析错误：{str(e)}")
-                    current_retry += 1
-                    continue
-
-            except Exception as e:
-                print(f"API调用错误：{str(e)}")
-                current_retry += 1
-                continue
-
-        raise Exception("生成知识卡失败，请检查提示词模板是否正确")
+        messages = [{
+            "role": "user",
+            "content": prompt
+        }]
+        return self._generate_cached(
+            messages, "knowledge_card", num_questions,
+            lambda: self._generate_from_messages(messages, "knowledge_card", num_questions, "生成知识卡失败，请检查提示词模板是否正确"))
 
     def _generate_custom_essay(self, content, template, num_questions, language="中文"):
         """使用自定义模板生成问答题"""
@@ -1071,261 +1885,892 @@ JSON格式要求：
 4. 特别注意JSON格式中的逗号、引号等标点符号的正确使用
 5. 确保每个JSON对象和数组的开始和结束都有正确的括号"""
 
-        max_retries = 3
-        current_retry = 0
-
-        while current_retry < max_retries:
-            try:
-                response = self._call_ai_api([{
-                    "role": "user",
-                    "content": prompt
-                }])
-
-                try:
-                    result = self.response_handler.parse_and_validate(response, "essay_question")
-
-                    # 验证问题数量
-                    if len(result["questions"]) < num_questions:
-                        print(f"警告：请求生成{num_questions}道问题，但只生成了{len(result['questions'])}道")
-
-                    return result
-                except ValueError as e:
-                    print(f"JSON解析错误：{str(e)}")
-                    current_retry += 1
-                    continue
+        messages = [{
+            "role": "user",
+            "content": prompt
+        }]
+        return self._generate_cached(
+            messages, "essay_question", num_questions,
+            lambda: self._generate_from_messages(messages, "essay_question", num_questions, "生成问答题失败，请检查提示词模板是否正确"))
 
-            except Exception as e:
-                print(f"API调用错误：{str(e)}")
-                current_retry += 1
-                continue
-
-        raise Exception("生成问答题失败，请检查提示词模板是否正确")
-
-    def generate_custom_questions(self, content, template_id, num_questions=3, language="中文"):
+    def generate_custom_questions(self, content, template_id, num_questions=3, language="中文", use_cache=True):
         """生成自定义问题的公共方法"""
-        return self._generate_custom_questions(content, template_id, num_questions, language)
+        self.bypass_cache = not use_cache
+        streamed = _streamed_stems.set(set())
+        try:
+            return self._generate_custom_questions(content, template_id, num_questions, language)
+        finally:
+            _streamed_stems.reset(streamed)
+            self.bypass_cache = False
     
     def _generate_choice_questions_with_chunking(self, content, num_questions, language="中文"):
+        """使用分块处理生成选择题"""
+        return self._generate_with_chunking("choice", content, num_questions, language)
+    
+    def _generate_essay_questions_with_chunking(self, content, num_questions, language="中文"):
+        """使用分块处理生成问答题"""
+        return self._generate_with_chunking("essay", content, num_questions, language)
+    
+    def _generate_knowledge_cards_with_chunking(self, content, num_cards, language="中文"):
+        """使用分块处理生成知识卡"""
+        return self._generate_with_chunking("knowledge_card", content, num_cards, language)
+    
+    def _generate_language_learning_cards_with_chunking(self, content, num_cards, language="中文"):
+        """使用分块处理生成语言学习知识卡"""
+        return self._generate_with_chunking("language_learning", content, num_cards, language)
+    
+    @request_priority(PRIORITY_BULK)
+    def _generate_with_chunking(self, kind, content, num_items, language="中文"):
         """
-        使用分块处理生成选择题
+        使用分块处理生成问题或卡片
         
         Args:
+            kind: 生成类型（choice, essay, knowledge_card, language_learning）
             content: 文本内容
-            num_questions: 总问题数
+            num_items: 总问题数/卡片数
             language: 生成内容使用的语言
             
         Returns:
-            合并后的问题结果
+            合并后的结果
         """
+        result_key, _, unit = GENERATION_KINDS[kind]
+        # 已完成的分块结果 {分块序号: 结果}，取消时返回其中的内容
+        delivered = {}
+        # 分块生成时按分块整体发送条目，不在单个分块的请求中逐条流式发送
+        self._deliver_by_chunk = True
         try:
             # 分块
+            self._configure_token_budget(kind, num_items, language)
             chunks = self.text_chunker.chunk_text(content)
             num_chunks = len(chunks)
             print(f"文本已分为 {num_chunks} 块")
             
-            # 分配问题数
-            question_distribution = self._distribute_questions_across_chunks(num_chunks, num_questions)
+            if self.enable_hierarchical_generation and num_chunks >= self.hierarchical_min_chunks:
+                return self._generate_hierarchical(kind, [chunk[0] for chunk in chunks], num_items, language)
+            
+            # 分配数量
+            distribution = self._allocate_items_to_chunks([chunk[0] for chunk in chunks], num_items)
             
             # 准备任务列表
-            tasks = []
+            all_tasks = []
             for i, (chunk_text, start, end) in enumerate(chunks):
-                num_q = question_distribution[i]
-                if num_q > 0:  # 只处理需要生成问题的分块
-                    tasks.append((chunk_text, num_q))
+                num_per_chunk = distribution[i]
+                if num_per_chunk > 0:  # 只处理需要生成内容的分块
+                    all_tasks.append((chunk_text, num_per_chunk))
+            
+            # 各分块完成时立即去重并发送给界面，最终按分块顺序合并
+            deduplicator = ChunkDeduplicator(self.dedup_threshold) if self.enable_dedup else None
+            deliver_lock = threading.Lock()
+            job = self.generation_job
+            
+            def deliver(index, result, record=True, store=True):
+                # 在调用方线程中每个分块只执行一次（推测执行的重复请求不会重复保存）
+                if job is not None and record:
+                    job.record_chunk(STAGE_GENERATE, index, result)
+                if store:
+                    chunk_text, num_per_chunk = all_tasks[index]
+                    self._store_cached_result(
+                        self._build_generation_messages(kind, chunk_text, num_per_chunk, language),
+                        GENERATION_KINDS[kind][1], result)
+                with deliver_lock:
+                    delivered[index] = self._deliver_chunk_result(result_key, deduplicator, index, result)
+            
+            # 继续中断的任务时，已完成的分块直接使用保存的结果
+            resumed = job.begin_stage(STAGE_GENERATE, all_tasks) if job is not None else {}
+            if resumed:
+                print(f"继续生成任务：{len(resumed)}/{len(all_tasks)} 个分块已完成")
+            # 内容未变化的分块直接复用缓存结果，只发送有变化的分块
+            reused = self._get_cached_chunk_results(kind, all_tasks, language, skip=resumed)
+            for index in sorted(resumed):
+                deliver(index, resumed[index], record=False, store=False)
+            for index in sorted(reused):
+                deliver(index, reused[index], store=False)
+            # 需要生成的分块在all_tasks中的序号
+            pending = [index for index in range(len(all_tasks)) if index not in reused and index not in resumed]
+            tasks = [all_tasks[index] for index in pending]
+            if reused:
+                print(f"复用 {len(reused)}/{len(all_tasks)} 个未变化分块的缓存结果")
+            
+            def progress_callback(completed, total):
+                self._report_progress(completed, total, f"正在处理分块 {completed}/{total}")
+            
+            def on_chunk_done(task_index, result, elapsed):
+                print(f"分块 {pending[task_index] + 1} 完成，用时 {elapsed:.1f} 秒")
+                deliver(pending[task_index], result)
+            
+            # 并发处理中失败的分块序号，以及到达批次硬截止时间时仍未完成的分块序号
+            failed_indices = []
+            expired_indices = []
             
             # 检查是否启用并发
             if self.enable_concurrent and len(tasks) > 1:
-                print(f"使用并发处理，最大并发数: {self.max_concurrent}")
-                
-                # 并发处理
-                def progress_callback(completed, total):
-                    self._report_progress(completed, total, f"正在处理分块 {completed}/{total}")
-                
-                results = self.concurrent_processor.process_batch(
-                    tasks,
-                    lambda chunk_text, num_q: self._generate_choice_questions_single(chunk_text, num_q, language),
-                    progress_callback=progress_callback
-                )
+                if self._use_async_engine():
+                    limit = self._get_async_concurrency_limit()
+                    print(f"使用异步引擎并发处理，并发上限: {limit}")
+                    self._process_chunks_async(kind, tasks, language, limit, progress_callback,
+                                               failed_indices, on_chunk_done, expired_indices)
+                    self._check_job()
+                else:
+                    if self.enable_adaptive_concurrency:
+                        print(f"使用并发处理，自适应并发（上限: {self.adaptive_concurrency_max}）")
+                    else:
+                        print(f"使用并发处理，最大并发数: {self.max_concurrent}")
+                    
+                    def on_outcome(outcome):
+                        if outcome.ok:
+                            on_chunk_done(outcome.index, outcome.result, outcome.elapsed)
+                        elif isinstance(outcome.error, BatchDeadlineExceeded):
+                            expired_indices.append(outcome.index)
+                        else:
+                            failed_indices.append(outcome.index)
+                    
+                    self.concurrent_processor.process_outcomes(
+                        tasks,
+                        lambda chunk_text, num_per_chunk: self._generate_single(
+                            kind, chunk_text, num_per_chunk, language, cache=False),
+                        outcome_callback=on_outcome,
+                        progress_callback=progress_callback,
+                        deadline_policy=self._get_deadline_policy()
+                    )
+                    # 任务被暂停或取消时，未发送的分块都以失败结束，不再补充请求
+                    self._check_job()
+                    if len(failed_indices) == len(tasks):
+                        raise Exception("所有分块都生成失败")
+                if expired_indices:
+                    # 已到达批次的截止时间，返回已完成的分块，不再补充请求
+                    print(f"分块批次超过截止时间，跳过 {len(expired_indices)} 个未完成的分块")
+                    if not delivered:
+                        raise BatchDeadlineExceeded(self.batch_deadline)
+                else:
+                    for task_index, result in self._top_up_failed_chunks(kind, tasks, failed_indices, language).items():
+                        deliver(pending[task_index], result)
             else:
                 # 顺序处理
                 print("顺序处理各个分块")
-                results = []
-                for i, (chunk_text, num_q) in enumerate(tasks):
+                for i, (chunk_text, num_per_chunk) in enumerate(tasks):
                     print(f"处理分块 {i+1}/{len(tasks)}")
                     self._report_progress(i+1, len(tasks), f"正在处理分块 {i+1}/{len(tasks)}")
-                    result = self._generate_choice_questions_single(chunk_text, num_q, language)
-                    results.append(result)
+                    deliver(pending[i], self._generate_single(kind, chunk_text, num_per_chunk, language, cache=False))
+            
+            results = [delivered[index] for index in sorted(delivered)]
+            if deduplicator is not None and not expired_indices:
+                results = self._backfill_duplicates(kind, all_tasks, results, deduplicator, language)
             
             # 合并结果
-            merged = self.text_chunker.merge_results(results, "questions")
-            print(f"已合并 {len(merged.get('questions', []))} 个问题")
+            merged = self.text_chunker.merge_results(results, result_key)
+            print(f"已合并 {len(merged.get(result_key, []))} {unit}")
             
             return merged
             
+        except JobInterrupted:
+            raise
+        except OperationCancelled:
+            return self._merge_partial_results(delivered, result_key, unit)
+        except BatchDeadlineExceeded:
+            # 超过截止时间时不再回退到单次处理，只返回继续任务时已有的分块结果
+            if not delivered:
+                raise
+            return self.text_chunker.merge_results([delivered[index] for index in sorted(delivered)], result_key)
         except Exception as e:
+            # 任务被暂停或取消时不回退
+            self._check_job()
+            if current_token().cancelled:
+                return self._merge_partial_results(delivered, result_key, unit)
             print(f"分块处理失败: {str(e)}，回退到单次处理")
             # 回退到单次处理
-            return self._generate_choice_questions_single(content, num_questions)
+            self._deliver_by_chunk = False
+            return self._generate_single(kind, content, num_items, language)
+        finally:
+            self._deliver_by_chunk = False
     
-    def _generate_essay_questions_with_chunking(self, content, num_questions, language="中文"):
+    def _merge_partial_results(self, delivered, result_key, unit):
         """
-        使用分块处理生成问答题
+        用户取消分块生成时，合并已经完成的分块结果（不再补充请求）
         
         Args:
-            content: 文本内容
-            num_questions: 总问题数
+            delivered: 已完成的分块结果 {分块序号: 结果}
+            result_key: 结果中条目列表的字段名
+            unit: 条目的单位名称（用于日志）
+            
+        Raises:
+            OperationCancelled: 没有已完成的条目
+        """
+        results = [delivered[index] for index in sorted(delivered)]
+        merged = self.text_chunker.merge_results(results, result_key)
+        if not merged.get(result_key):
+            raise OperationCancelled()
+        print(f"生成已取消，返回已完成的 {len(delivered)} 个分块中的 {len(merged[result_key])} {unit}")
+        return merged
+    
+    def _generate_hierarchical(self, kind, chunk_texts, num_items, language="中文"):
+        """
+        分层生成：先并发概括各分块（map），再合并成提纲（reduce），最后根据提纲生成，
+        并为每个条目找回原文所在的分块作为原文依据
+        
+        Args:
+            kind: 生成类型
+            chunk_texts: 各分块的文本
+            num_items: 总数量
             language: 生成内容使用的语言
             
         Returns:
-            合并后的问题结果
+            生成结果，条目的原文字段（source_content或context）为原文摘录，
+            source_chunk为原文片段编号（从1开始）
         """
-        try:
-            chunks = self.text_chunker.chunk_text(content)
-            num_chunks = len(chunks)
-            print(f"文本已分为 {num_chunks} 块")
-            
-            question_distribution = self._distribute_questions_across_chunks(num_chunks, num_questions)
-            
-            tasks = []
-            for i, (chunk_text, start, end) in enumerate(chunks):
-                num_q = question_distribution[i]
-                if num_q > 0:
-                    tasks.append((chunk_text, num_q))
-            
-            if self.enable_concurrent and len(tasks) > 1:
-                print(f"使用并发处理，最大并发数: {self.max_concurrent}")
-                
-                def progress_callback(completed, total):
-                    self._report_progress(completed, total, f"正在处理分块 {completed}/{total}")
-                
-                results = self.concurrent_processor.process_batch(
-                    tasks,
-                    lambda chunk_text, num_q: self._generate_essay_questions_single(chunk_text, num_q, language),
-                    progress_callback=progress_callback
-                )
-            else:
-                print("顺序处理各个分块")
-                results = []
-                for i, (chunk_text, num_q) in enumerate(tasks):
-                    print(f"处理分块 {i+1}/{len(tasks)}")
-                    self._report_progress(i+1, len(tasks), f"正在处理分块 {i+1}/{len(tasks)}")
-                    result = self._generate_essay_questions_single(chunk_text, num_q, language)
-                    results.append(result)
-            
-            merged = self.text_chunker.merge_results(results, "questions")
-            print(f"已合并 {len(merged.get('questions', []))} 个问题")
-            
-            return merged
+        print(f"使用分层生成：概括 {len(chunk_texts)} 个分块后根据提纲生成")
+        summaries = self._summarize_chunks(chunk_texts, language)
+        outline = self._build_outline(summaries, language)
+        print(f"提纲长度 {len(outline)}")
+        
+        self._report_progress(0, 1, "第3步：根据提纲生成")
+        result = self._generate_single(kind, outline, num_items, language)
+        self._report_progress(1, 1, "第3步：根据提纲生成")
+        self._attach_sources(kind, result, chunk_texts)
+        return result
+    
+    def _run_stage(self, tasks, task_func, message, fallback):
+        """
+        执行分层生成的一个阶段，启用并发时使用并发处理器
+        
+        失败或被取消的任务使用fallback的结果，保证结果与tasks一一对应。
+        
+        Args:
+            tasks: 参数元组列表
+            task_func: 处理单个任务的函数
+            message: 进度消息前缀
+            fallback: 根据任务参数返回兜底结果的函数
             
+        Returns:
+            与tasks一一对应的结果列表
+        """
+        def progress_callback(completed, total):
+            self._report_progress(completed, total, f"{message} {completed}/{total}")
+        
+        if self.enable_concurrent and len(tasks) > 1:
+            # 只推测执行落后的任务，不使用批次的硬截止时间
+            outcomes = self.concurrent_processor.process_outcomes(
+                tasks, task_func, progress_callback=progress_callback,
+                deadline_policy=self._get_deadline_policy(hard_deadline=False))
+            # 被取消时outcomes只包含已完成的任务，不再用兜底结果继续下一阶段
+            check_cancelled()
+            self._check_job()
+            results = [fallback(*task_args) for task_args in tasks]
+            for outcome in outcomes:
+                if outcome.ok:
+                    results[outcome.index] = outcome.result
+            return results
+        results = []
+        for task_args in tasks:
+            results.append(task_func(*task_args))
+            progress_callback(len(results), len(tasks))
+        return results
+    
+    def _cached_text_request(self, prompt, cache_type, fallback):
+        """
+        发送返回纯文本的请求（摘要、提纲），结果写入响应缓存
+        
+        Args:
+            prompt: 提示词
+            cache_type: 缓存类型
+            fallback: 请求失败时使用的文本
+        """
+        self._check_job()
+        messages = [{"role": "user", "content": prompt}]
+        cached = self._get_cached_result(messages, cache_type)
+        if cached is not None:
+            return cached
+        try:
+            text = str(self._call_ai_api(messages) or "").strip()
         except Exception as e:
-            print(f"分块处理失败: {str(e)}，回退到单次处理")
-            return self._generate_essay_questions_single(content, num_questions)
+            print(f"请求失败（{cache_type}）：{str(e)}，使用原文代替")
+            return fallback
+        if not text:
+            return fallback
+        self._store_cached_result(messages, cache_type, text)
+        return text
     
-    def _generate_knowledge_cards_with_chunking(self, content, num_cards, language="中文"):
+    def _summarize_chunks(self, chunk_texts, language="中文"):
+        """
+        概括各分块（map阶段），内容未变化的分块直接复用缓存的摘要
+        
+        Returns:
+            与chunk_texts一一对应的摘要；请求失败的分块使用原文开头代替
         """
-        使用分块处理生成知识卡
+        tasks = [(chunk_text, index) for index, chunk_text in enumerate(chunk_texts, 1)]
+        job = self.generation_job
+        # 继续中断的任务时，已完成的摘要直接使用保存的结果
+        resumed = job.begin_stage(STAGE_SUMMARY, tasks) if job is not None else {}
+        
+        def summarize(chunk_text, index):
+            if index - 1 in resumed:
+                return resumed[index - 1]
+            fallback = chunk_text.strip()[:self.summary_max_chars]
+            prompt = get_chunk_summary_prompt(chunk_text, index, self.summary_max_chars, language)
+            summary = self._cached_text_request(prompt, SUMMARY_CACHE_TYPE, fallback)
+            if job is not None and summary != fallback:
+                job.record_chunk(STAGE_SUMMARY, index - 1, summary)
+            return summary
+        
+        summaries = self._run_stage(tasks, summarize, "第1步：概括分块",
+                                    lambda chunk_text, index: chunk_text.strip()[:self.summary_max_chars])
+        self._check_job()
+        return summaries
+    
+    def _build_outline(self, summaries, language="中文"):
+        """
+        把各分块摘要合并成提纲（reduce阶段）
+        
+        摘要总长度超过outline_max_chars时分组合并，逐轮合并直到只剩一组。
+        每条摘要以[片段编号]开头，提纲中保留这些编号用于找回原文。
+        
+        Returns:
+            提纲文本
+        """
+        entries = [f"[{index}] {summary.strip()}" for index, summary in enumerate(summaries, 1)
+                   if summary and summary.strip() not in ("（无）", "(无)")]
+        if not entries:
+            raise ValueError("所有分块都没有可概括的内容")
+        
+        previous_groups = None
+        for level in range(1, MAX_OUTLINE_LEVELS + 1):
+            groups = self._pack_outline_entries(entries, self.outline_max_chars)
+            if previous_groups is not None and len(groups) >= previous_groups:
+                # 上一轮合并没有缩短内容，不再继续
+                break
+            previous_groups = len(groups)
+            final = len(groups) == 1
+            # 中间轮次的提纲控制在一半长度，保证下一轮至少两组可以合并到一起
+            limit = self.outline_max_chars if final else max(200, self.outline_max_chars // 2)
+            merge = lambda group_text: self._cached_text_request(
+                get_outline_prompt(group_text, limit, language), OUTLINE_CACHE_TYPE, group_text)
+            outlines = self._run_stage([("\n".join(group),) for group in groups], merge,
+                                       f"第2步：合并提纲（第{level}轮）", lambda group_text: group_text)
+            if final:
+                return outlines[0]
+            entries = outlines
+        # 无法合并成一组时直接拼接各组提纲
+        return "\n".join(entries)
+    
+    @staticmethod
+    def _pack_outline_entries(entries, max_chars):
+        """把条目按顺序分组，每组总长度不超过max_chars（单个条目超长时单独成组）"""
+        groups = [[]]
+        length = 0
+        for entry in entries:
+            if groups[-1] and length + len(entry) > max_chars:
+                groups.append([])
+                length = 0
+            groups[-1].append(entry)
+            length += len(entry) + 1
+        return groups
+    
+    def _attach_sources(self, kind, result, chunk_texts):
+        """
+        为根据提纲生成的条目找回原文：按提纲中的[片段编号]和题目内容定位原文分块，
+        用其中最相关的几句话替换条目的原文字段，并记录片段编号
+        """
+        field = GENERATION_KINDS[kind][0]
+        source_field = "context" if field == "cards" else "source_content"
+        if not isinstance(result, dict):
+            return
+        locator = SourceLocator(chunk_texts)
+        for item in result.get(field, []):
+            quoted = str(item.get(source_field, ""))
+            query = " ".join(str(item.get(key, "")) for key in
+                             ("question", "answer", "reference_answer", "explanation")) + " " + quoted
+            found = locator.locate(query, chunk_markers(quoted))
+            if found is not None:
+                item["source_chunk"], item[source_field] = found
+    
+    def _get_cached_chunk_results(self, kind, tasks, language="中文", skip=()):
+        """
+        查找内容未变化、已有缓存结果的分块
+        
+        缓存键由分块文本、生成数量、语言、提示词模板、模型和校验类型共同决定，
+        与单次生成使用同一个响应缓存。
         
         Args:
-            content: 文本内容
-            num_cards: 总卡片数
+            kind: 生成类型
+            tasks: (chunk_text, num_items) 任务列表
             language: 生成内容使用的语言
+            skip: 不需要查找的分块序号（如生成任务中已完成的分块）
             
         Returns:
-            合并后的卡片结果
+            {分块序号: 缓存结果}
         """
-        try:
-            chunks = self.text_chunker.chunk_text(content)
-            num_chunks = len(chunks)
-            print(f"文本已分为 {num_chunks} 块")
-            
-            card_distribution = self._distribute_questions_across_chunks(num_chunks, num_cards)
-            
-            tasks = []
-            for i, (chunk_text, start, end) in enumerate(chunks):
-                num_c = card_distribution[i]
-                if num_c > 0:
-                    tasks.append((chunk_text, num_c))
-            
-            if self.enable_concurrent and len(tasks) > 1:
-                print(f"使用并发处理，最大并发数: {self.max_concurrent}")
-                
-                def progress_callback(completed, total):
-                    self._report_progress(completed, total, f"正在处理分块 {completed}/{total}")
-                
-                results = self.concurrent_processor.process_batch(
-                    tasks,
-                    lambda chunk_text, num_c: self._generate_knowledge_cards_single(chunk_text, num_c, language),
-                    progress_callback=progress_callback
-                )
-            else:
-                print("顺序处理各个分块")
-                results = []
-                for i, (chunk_text, num_c) in enumerate(tasks):
-                    print(f"处理分块 {i+1}/{len(tasks)}")
-                    self._report_progress(i+1, len(tasks), f"正在处理分块 {i+1}/{len(tasks)}")
-                    result = self._generate_knowledge_cards_single(chunk_text, num_c, language)
-                    results.append(result)
-            
-            merged = self.text_chunker.merge_results(results, "cards")
-            print(f"已合并 {len(merged.get('cards', []))} 张卡片")
+        if not self.enable_response_cache or self.bypass_cache:
+            return {}
+        _, schema_type, _ = GENERATION_KINDS[kind]
+        cache = self._get_response_cache()
+        reused = {}
+        for index, (chunk_text, num_items) in enumerate(tasks):
+            if index in skip:
+                continue
+            messages = self._build_generation_messages(kind, chunk_text, num_items, language)
+            result = cache.get(self._response_cache_key(messages, schema_type))
+            if result is not None:
+                reused[index] = result
+        return reused
+    
+    def _deliver_chunk_result(self, field, deduplicator, index, result):
+        """
+        处理一个完成的分块结果：与先完成的分块去重，并把保留的条目立即发送给界面
+        
+        Args:
+            field: 结果字段（questions或cards）
+            deduplicator: 跨分块去重器，未启用去重时为None
+            index: 分块序号
+            result: 分块结果
             
-            return merged
+        Returns:
+            去重后的分块结果
+        """
+        if not isinstance(result, dict):
+            return result
+        if deduplicator is not None:
+            result = dict(result, **{field: deduplicator.filter(index, result.get(field, []))})
+        self._stream_items(field, result.get(field, []))
+        return result
+    
+    def _stream_items(self, field, items):
+        """启用流式输出时把本次生成中尚未发送过的条目逐个发送给界面（按题干识别）"""
+        if not (self.item_callback and self.enable_streaming):
+            return
+        streamed = _streamed_stems.get()
+        for item in items:
+            if streamed is not None:
+                stem = self._item_stem(item)
+                if stem in streamed:
+                    continue
+                streamed.add(stem)
+            try:
+                self.item_callback(field, item)
+            except Exception as e:
+                print(f"Item callback error: {e}")
+    
+    def _backfill_duplicates(self, kind, tasks, results, deduplicator, language="中文"):
+        """
+        为去重时被去除条目的分块补充生成同样数量的新条目
+        
+        相邻分块的重叠内容和重复讲解同一知识点的文本常常生成几乎相同的题目。去重后
+        通过补充请求让对应分块再生成同样数量的新条目，尽量保持请求的总数，补充的条目
+        立即发送给界面。分块的响应缓存中保留原始结果（复用时重新去重），补充的条目
+        单独缓存，下次去重结果相同时不必再次请求。
+        
+        Args:
+            kind: 生成类型
+            tasks: (chunk_text, num_items) 任务列表
+            results: 去重后的各分块结果（与tasks一一对应时才补充生成）
+            deduplicator: 处理各分块结果时使用的去重器
+            language: 生成内容使用的语言
             
-        except Exception as e:
-            print(f"分块处理失败: {str(e)}，回退到单次处理")
-            return self._generate_knowledge_cards_single(content, num_cards)
+        Returns:
+            补充后的分块结果列表
+        """
+        field, schema_type, _ = GENERATION_KINDS[kind]
+        if not deduplicator.removed:
+            return results
+        print(f"去除了 {deduplicator.removed} 个近似重复的条目")
+        if not self.enable_shortfall_top_up or len(results) != len(tasks):
+            return results
+        
+        for chunk_index, originals in deduplicator.duplicates_of.items():
+            chunk_text, num_items = tasks[chunk_index]
+            kept = results[chunk_index][field]
+            messages = self._build_generation_messages(kind, chunk_text, num_items, language)
+            # 补充请求中列出本分块保留的条目和被重复的条目，避免再次生成相同内容
+            avoid = kept + originals
+            backfill_messages = self._build_top_up_messages(messages, schema_type, avoid, len(originals))
+            extra_items = self._get_cached_result(backfill_messages, BACKFILL_CACHE_TYPE)
+            if extra_items is None:
+                try:
+                    extra = self._top_up(messages, schema_type, {field: list(avoid)}, len(avoid) + len(originals),
+                                         raise_errors=True)
+                except Exception as e:
+                    print(f"分块 {chunk_index + 1} 补充去重条目失败：{str(e)}")
+                    continue
+                # 没有生成新条目时同样缓存（空列表），下次不再重复请求
+                extra_items = extra[field][len(avoid):]
+                self._store_cached_result(backfill_messages, BACKFILL_CACHE_TYPE, extra_items)
+            accepted = [item for item in extra_items if deduplicator.accept(item)]
+            kept.extend(accepted)
+            self._stream_items(field, accepted)
+        return results
     
-    def _generate_language_learning_cards_with_chunking(self, content, num_cards, language="中文"):
+    def _top_up_failed_chunks(self, kind, tasks, failed_indices, language="中文"):
         """
-        使用分块处理生成语言学习知识卡
+        对并发处理中失败的分块单独补充生成
         
         Args:
-            content: 文本内容
-            num_cards: 总卡片数
+            kind: 生成类型
+            tasks: (chunk_text, num_items) 任务列表
+            failed_indices: 失败分块在tasks中的序号
             language: 生成内容使用的语言
             
         Returns:
-            合并后的卡片结果
+            {分块在tasks中的序号: 补充生成的结果}，补充请求仍失败的分块不包含在内
         """
-        try:
-            chunks = self.text_chunker.chunk_text(content)
-            num_chunks = len(chunks)
-            print(f"文本已分为 {num_chunks} 块")
+        if not self.enable_shortfall_top_up:
+            return {}
+        results = {}
+        for index in sorted(failed_indices):
+            chunk_text, num_items = tasks[index]
+            print(f"分块 {index + 1} 生成失败，补充请求{num_items}个条目")
+            try:
+                results[index] = self._generate_single(kind, chunk_text, num_items, language, cache=False)
+            except Exception as e:
+                print(f"分块 {index + 1} 补充请求失败：{str(e)}")
+        return results
+    
+    def _use_async_engine(self):
+        """是否使用异步引擎处理分块请求"""
+        return self.use_async_engine and AsyncEngine.is_available()
+    
+    def _get_async_concurrency_limit(self):
+        """获取异步引擎的并发上限"""
+        return max(1, self.async_concurrency_limit)
+    
+    def _get_limiter(self, endpoint, model_name):
+        """
+        获取当前端点和模型对应的自适应并发限制器
+        
+        Args:
+            endpoint: API地址
+            model_name: 模型名称
             
-            card_distribution = self._distribute_questions_across_chunks(num_chunks, num_cards)
+        Returns:
+            AdaptiveLimiter；未启用自适应并发时返回不做限制的空限制器
+        """
+        if not self.enable_adaptive_concurrency:
+            return NULL_LIMITER
+        key = make_limiter_key(self.provider, endpoint, model_name)
+        return get_concurrency_limiter(key, self.max_concurrent, self.adaptive_concurrency_max,
+                                       self.interactive_reserved_slots)
+    
+    def _get_rate_budget(self, endpoint, model_name):
+        """
+        获取模型对应的RPM/TPM速率预算
+        
+        模型在config['models']中设置了rpm_limit/tpm_limit时使用模型的设置，
+        否则使用advanced_settings中的默认值。
+        
+        Args:
+            endpoint: API地址
+            model_name: 模型名称
+        """
+        rpm = self.default_rpm_limit
+        tpm = self.default_tpm_limit
+        for model in self.config.get('models', []):
+            if model.get('name') == model_name:
+                rpm = model.get('rpm_limit', rpm)
+                tpm = model.get('tpm_limit', tpm)
+                break
+        return get_rate_budget(f"{endpoint}|{model_name}", rpm, tpm, self.interactive_rate_reserve)
+    
+    def _get_worker_count(self):
+        """并发处理器的线程数：启用自适应并发时按上限分配"""
+        if self.enable_adaptive_concurrency:
+            return max(self.max_concurrent, self.adaptive_concurrency_max)
+        return self.max_concurrent
+    
+    def _get_pool_size(self):
+        """HTTP连接池大小，需要覆盖可能的最大并发数"""
+        return max(self._get_worker_count(), self._get_async_concurrency_limit())
+    
+    def _process_chunks_async(self, kind, tasks, language, limit, progress_callback=None, failed_indices=None,
+                              chunk_callback=None, expired_indices=None):
+        """
+        在异步引擎的事件循环上并发处理所有分块
+        
+        Args:
+            kind: 生成类型
+            tasks: (chunk_text, num_items) 任务列表
+            language: 生成内容使用的语言
+            limit: 并发上限
+            progress_callback: 进度回调 (completed, total)
+            failed_indices: 传入列表时，追加失败分块的序号
+            chunk_callback: 每个分块成功完成时立即调用 (分块序号, 结果, 耗时秒数)
+            expired_indices: 传入列表时，追加到达批次硬截止时间时仍未完成的分块序号
+                （这些分块不计入failed_indices）
             
-            tasks = []
-            for i, (chunk_text, start, end) in enumerate(chunks):
-                num_c = card_distribution[i]
-                if num_c > 0:
-                    tasks.append((chunk_text, num_c))
+        Returns:
+            成功分块的结果列表（保持原始顺序）
             
-            if self.enable_concurrent and len(tasks) > 1:
-                print(f"使用并发处理，最大并发数: {self.max_concurrent}")
+        Raises:
+            BatchDeadlineExceeded: 所有分块都在截止时间前没有完成
+            Exception: 如果所有分块都失败
+        """
+        engine = get_async_engine()
+        
+        # 启用多模型路由时，按权重把分块分配到各个健康的模型上作为主模型
+        primaries = [None] * len(tasks)
+        if self._use_model_routing():
+            candidates = {model.get('name'): model for model in self._get_routing_candidates()}
+            assignment = get_model_router().assign(len(tasks), list(candidates.keys()), self.model_weights)
+            primaries = [candidates[name] for name in assignment]
+            print(f"多模型路由分配: {', '.join(assignment)}")
+        
+        factories = [
+            (lambda chunk_text=chunk_text, num_items=num_items, primary=primary:
+                self._agenerate_single(kind, chunk_text, num_items, language, primary))
+            for (chunk_text, num_items), primary in zip(tasks, primaries)
+        ]
+        def outcome_callback(index, success, value, elapsed):
+            if success and chunk_callback:
+                chunk_callback(index, value, elapsed)
+        
+        # 多模型路由时对冲请求已经发往其他模型，不再对同一模型推测执行
+        deadline_policy = self._get_deadline_policy(speculative=not self._use_model_routing())
+        outcomes = engine.run_batch(factories, limit, progress_callback, outcome_callback, deadline_policy)
+        # 被取消时未完成的分块都以OperationCancelled结束，不再当作失败处理
+        check_cancelled()
+        
+        results = []
+        failed = []
+        for index, (success, value) in enumerate(outcomes):
+            if success:
+                results.append(value)
+            else:
+                failed.append((index, value))
+                print(f"Task {index} failed: {str(value)}")
+        
+        expired = [index for index, error in failed if isinstance(error, BatchDeadlineExceeded)]
+        if failed and len(failed) == len(outcomes):
+            if len(expired) == len(failed):
+                raise failed[0][1]
+            raise Exception(f"所有任务都失败了。第一个错误: {failed[0][1]}")
+        if failed_indices is not None:
+            failed_indices.extend(index for index, _ in failed if index not in expired)
+        if expired_indices is not None:
+            expired_indices.extend(expired)
+        
+        return results
+    
+    async def _agenerate_single(self, kind, content, num_items, language="中文", primary=None):
+        """
+        异步生成单个分块（在异步引擎的事件循环中运行）
+        
+        推测执行时同一分块可能被调用多次，这里不读写响应缓存和生成任务，
+        由_generate_with_chunking在派发前和分块完成时处理。
+        
+        Args:
+            kind: 生成类型
+            content: 分块文本
+            num_items: 生成数量
+            language: 生成内容使用的语言
+            primary: 多模型路由时该分块的主模型配置
+        """
+        self._check_job()
+        _, schema_type, _ = GENERATION_KINDS[kind]
+        messages = self._build_generation_messages(kind, content, num_items, language)
+        
+        if self._use_model_routing():
+            result = await self._agenerate_routed(messages, schema_type, primary, num_items)
+        else:
+            result = await self._agenerate_attempt(messages, schema_type, expected_count=num_items)
+        return await self._atop_up(messages, schema_type, result, num_items, primary)
+    
+    async def _agenerate_attempt(self, messages, schema_type, model_info=None, expected_count=None):
+        """
+        向一个模型请求并解析结果
+        
+        请求失败已由重试策略处理，这里只对解析/校验失败重新请求。
+        
+        Args:
+            messages: 消息列表
+            schema_type: 校验类型
+            model_info: 模型配置，默认为当前选择的模型
+            expected_count: 请求生成的数量
+        """
+        max_retries = 3
+        last_error = None
+        model_name = model_info.get('name') if model_info else None
+        for attempt in range(max_retries):
+            response = await self._acall_ai_api(messages, model_info, schema_type)
+            try:
+                return self._parse_generation(response, schema_type, model_name, expected_count)
+            except Exception as e:
+                last_error = e
+                print(f"异步生成第{attempt + 1}次解析失败：{str(e)}")
+        
+        raise Exception(f"分块生成失败：{str(last_error)}")
+    
+    async def _agenerate_routed(self, messages, schema_type, primary=None, expected_count=None):
+        """
+        带对冲和故障转移的多模型生成
+        
+        先向主模型发送请求；主模型超过其延迟百分位仍未返回时，向下一个模型发送
+        一份对冲请求；某个模型失败时立即转移到下一个模型。取第一个通过校验的结果，
+        其余仍在进行的请求会被取消。
+        
+        Args:
+            messages: 消息列表
+            schema_type: 校验类型
+            primary: 主模型配置，默认为当前选择的模型
+            expected_count: 请求生成的数量
+        """
+        router = get_model_router()
+        candidates = self._order_routing_candidates(primary)
+        pending = {}
+        next_index = [0]
+        hedged = False
+        
+        def launch(is_hedge=False):
+            model_info = candidates[next_index[0]]
+            next_index[0] += 1
+            task = asyncio.ensure_future(self._agenerate_attempt(messages, schema_type, model_info, expected_count))
+            pending[task] = (model_info.get('name'), time.monotonic(), is_hedge)
+            if is_hedge:
+                router.record_hedge(model_info.get('name'))
+                print(f"主模型响应较慢，向 {model_info.get('name')} 发送对冲请求")
+        
+        launch()
+        primary_name = candidates[0].get('name')
+        last_error = None
+        try:
+            while pending:
+                timeout = None
+                if not hedged and next_index[0] < len(candidates):
+                    started = min(start for _, start, _ in pending.values())
+                    delay = router.hedge_delay(primary_name, self.hedge_latency_percentile,
+                                               self.hedge_min_delay, self.hedge_default_delay)
+                    timeout = max(0.0, started + delay - time.monotonic())
                 
-                def progress_callback(completed, total):
-                    self._report_progress(completed, total, f"正在处理分块 {completed}/{total}")
+                done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    launch(is_hedge=True)
+                    continue
                 
-                results = self.concurrent_processor.process_batch(
-                    tasks,
-                    lambda chunk_text, num_c: self._generate_language_learning_cards_single(chunk_text, num_c, language),
-                    progress_callback=progress_callback
+                for task in done:
+                    name, start, is_hedge = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        router.record_failure(name)
+                        last_error = e
+                        if next_index[0] < len(candidates):
+                            router.record_failover(name)
+                            print(f"模型 {name} 生成失败，转移到下一个模型：{str(e)[:200]}")
+                            launch()
+                        continue
+                    router.record_success(name, time.monotonic() - start)
+                    if is_hedge:
+                        router.record_hedge(name, won=True)
+                    return result
+        finally:
+            # 取消仍在进行的其他请求
+            for task in pending:
+                task.cancel()
+        
+        raise last_error
+    
+    async def _acall_ai_api(self, messages, model_info=None, schema_type=None):
+        """
+        异步调用AI API（共享异步引擎的aiohttp会话）
+        
+        请求层面的重试由重试策略统一处理，失败时抛出APIRequestError。
+        设置schema_type时按_call_structured的方式使用结构化输出并在端点不支持时降级。
+        
+        Args:
+            messages: 消息列表
+            model_info: 模型配置（仅自定义API），默认为当前选择的模型
+            schema_type: 期望的响应schema类型，为None时不设置response_format
+        """
+        if not schema_type or not self.enable_structured_output:
+            return await self._asend_ai_request(messages, model_info)
+        
+        registry = get_structured_output_registry()
+        try:
+            key, model_name = self._get_structured_target(model_info)
+        except ValueError as e:
+            raise APIRequestError(str(e))
+        mode = registry.get_mode(key, self.structured_output_mode)
+        while True:
+            try:
+                result = await self._asend_ai_request(
+                    messages, model_info, build_response_format(mode, schema_type)
                 )
-            else:
-                print("顺序处理各个分块")
-                results = []
-                for i, (chunk_text, num_c) in enumerate(tasks):
-                    print(f"处理分块 {i+1}/{len(tasks)}")
-                    self._report_progress(i+1, len(tasks), f"正在处理分块 {i+1}/{len(tasks)}")
-                    result = self._generate_language_learning_cards_single(chunk_text, num_c, language)
-                    results.append(result)
-            
-            merged = self.text_chunker.merge_results(results, "cards")
-            print(f"已合并 {len(merged.get('cards', []))} 张语言学习卡片")
+            except APIRequestError as e:
+                if mode == MODE_NONE or e.status not in UNSUPPORTED_STATUS_CODES:
+                    raise
+                mode = next_mode(mode)
+                registry.record_downgrade(model_name, mode)
+                continue
+            registry.confirm_mode(key, mode)
+            return result
+    
+    async def _asend_ai_request(self, messages, model_info=None, response_format=None):
+        """
+        异步发送一次AI请求（含重试）
+        
+        Args:
+            messages: 消息列表
+            model_info: 模型配置（仅自定义API），默认为当前选择的模型
+            response_format: 结构化输出参数，为None时不设置
+        """
+        engine = get_async_engine()
+        
+        if self.provider == 'openai':
+            if not openai.api_key:
+                raise APIRequestError("OpenAI API Key未设置，请在设置中配置API密钥")
+            # 旧版SDK通过aiosession上下文变量复用会话
+            openai.aiosession.set(await engine.get_session())
+            budget = self._get_rate_budget(openai.api_base, self.model)
+            limiter = self._get_limiter(openai.api_base, self.model)
+            estimated_tokens = estimate_request_tokens(messages, self.max_tokens)
+            extra_params = {"response_format": response_format} if response_format else {}
             
-            return merged
+            async def send_once():
+                await budget.acquire_async(estimated_tokens)
+                async with limiter.track_async():
+                    return await openai.ChatCompletion.acreate(
+                        model=self.model,
+                        messages=messages,
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens,
+                        request_timeout=self.request_timeout,
+                        **extra_params
+                    )
             
+            try:
+                response = await self._awith_retry(openai.api_base, send_once)
+            except APIRequestError:
+                raise
+            except Exception as e:
+                raise APIRequestError(f"API调用失败：OpenAI API错误：{str(e)}", get_error_status(e))
+            budget.reconcile(estimated_tokens, extract_usage_tokens(response))
+            return response.choices[0].message.content
+        
+        try:
+            api_url, api_key, model_name = self._resolve_custom_endpoint(model_info)
+        except ValueError as e:
+            raise APIRequestError(str(e))
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        data = self._build_custom_payload(messages, model_name, response_format)
+        budget = self._get_rate_budget(api_url, model_name)
+        limiter = self._get_limiter(api_url, model_name)
+        estimated_tokens = estimate_request_tokens(messages, data["max_tokens"])
+        
+        async def send_once():
+            await budget.acquire_async(estimated_tokens)
+            async with limiter.track_async():
+                return await engine.post_json(api_url, headers, data, self.request_timeout)
+        
+        try:
+            result = await self._awith_retry(api_url, send_once)
+        except APIRequestError:
+            raise
+        except AsyncHTTPError as e:
+            raise APIRequestError(f"API请求失败：{str(e)}\n状态码：{e.status}", e.status)
         except Exception as e:
-            print(f"分块处理失败: {str(e)}，回退到单次处理")
-            return self._generate_language_learning_cards_single(content, num_cards)
-            
\ No newline at end of file
+            raise APIRequestError(f"API请求失败：{type(e).__name__}: {str(e)}")
+        budget.reconcile(estimated_tokens, extract_usage_tokens(result))
+        
+        if not isinstance(result, dict) or 'choices' not in result:
+            raise APIRequestError(f"API返回格式错误：{str(result)[:200]}")
+        
+        return result['choices'][0]['message']['content']
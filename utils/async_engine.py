@@ -0,0 +1,375 @@
+"""
+异步请求引擎模块
+
+在后台线程中运行一个常驻的asyncio事件循环，所有分块请求共享同一个
+aiohttp.ClientSession，并通过信号量限制并发数。相比每个请求占用一个
+阻塞线程，单个事件循环可以同时挂起大量请求，内存占用也更低。
+调用方的操作被取消时，本批次正在运行的协程被取消（aiohttp随之关闭连接），
+尚未开始的协程不再运行。设置截止时间时，落后的协程会推测执行，到达批次的硬截止
+时间时返回已完成的结果。
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from .cancellation import OperationCancelled, current_token
+from .task_deadlines import BatchDeadlineExceeded, DeadlinePolicy, record_deadline_event
+
+try:
+    import aiohttp
+except ImportError:
+    # 如果直接导入失败，尝试从vendor目录导入
+    import sys
+    import os
+    vendor_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vendor")
+    if vendor_dir not in sys.path:
+        sys.path.insert(0, vendor_dir)
+    try:
+        import aiohttp
+    except ImportError:
+        aiohttp = None
+
+
+class AsyncHTTPError(Exception):
+    """异步请求返回错误状态码时抛出的异常"""
+
+    def __init__(self, status: int, text: str, headers: Optional[dict] = None):
+        super().__init__(f"HTTP {status}: {text[:500]}")
+        self.status = status
+        self.text = text
+        self.headers = headers or {}
+
+
+class AsyncEngine:
+    """基于asyncio + aiohttp的并发请求引擎"""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._completed = 0
+        self._failed = 0
+
+    @staticmethod
+    def is_available() -> bool:
+        """检查aiohttp是否可用"""
+        return aiohttp is not None
+
+    def _ensure_started(self):
+        """确保后台事件循环线程已启动"""
+        with self._lock:
+            if self._loop is not None and self._thread is not None and self._thread.is_alive():
+                return
+
+            started = threading.Event()
+            loop = asyncio.new_event_loop()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                started.set()
+                loop.run_forever()
+
+            self._loop = loop
+            self._session = None
+            self._thread = threading.Thread(target=run_loop, name="FeynmanAsyncEngine", daemon=True)
+            self._thread.start()
+            started.wait()
+
+    async def get_session(self):
+        """获取共享的aiohttp会话（必须在引擎事件循环中调用）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def post_json(self, url: str, headers: dict, payload: dict, timeout: float) -> dict:
+        """
+        发送JSON POST请求并返回解析后的JSON
+
+        Args:
+            url: 请求地址
+            headers: 请求头
+            payload: JSON请求体
+            timeout: 超时时间（秒）
+
+        Returns:
+            响应JSON
+
+        Raises:
+            AsyncHTTPError: 响应状态码表示错误时
+        """
+        session = await self.get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with session.post(url, headers=headers, json=payload, timeout=client_timeout) as response:
+            if response.status >= 400:
+                text = await response.text()
+                raise AsyncHTTPError(response.status, text, dict(response.headers))
+            return await response.json(content_type=None)
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """
+        将协程提交到引擎事件循环中运行
+
+        Returns:
+            concurrent.futures.Future，可在任意线程中等待结果
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run_batch(
+        self,
+        task_factories: List[Callable[[], Awaitable[Any]]],
+        limit: int,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        outcome_callback: Optional[Callable[[int, bool, Any, float], None]] = None,
+        deadline_policy: Optional[DeadlinePolicy] = None
+    ) -> List[Tuple[bool, Any]]:
+        """
+        在事件循环中并发运行一批协程，阻塞直到全部完成
+
+        设置deadline_policy时，协程超过软截止时间后用同一个工厂再创建一个协程（推测执行，
+        不占用额外的并发名额），取先成功的结果并取消其余协程；到达批次的硬截止时间时，
+        未完成的协程被取消，结果为 (False, BatchDeadlineExceeded)。
+
+        Args:
+            task_factories: 协程工厂列表，每个工厂调用后返回一个协程（推测执行时可能调用多次，
+                协程中不应有保存结果等副作用，这些放在outcome_callback中）
+            limit: 最大并发数
+            progress_callback: 进度回调 (completed, total)
+            outcome_callback: 每个协程完成时立即调用 (序号, 是否成功, 结果或异常, 耗时秒数)，
+                与progress_callback一样在调用方线程中执行（可以进行磁盘读写等阻塞操作）
+            deadline_policy: 截止时间设置（可选）
+
+        Returns:
+            与任务顺序对应的 (是否成功, 结果或异常) 列表；调用方的操作被取消时，
+            被取消和未开始的协程的结果为 (False, OperationCancelled)
+        """
+        if not task_factories:
+            return []
+
+        total = len(task_factories)
+        # 协程在引擎线程中运行，把调用方的上下文变量（如请求优先级、取消令牌）带过去
+        context = contextvars.copy_context()
+        token = current_token()
+        batch_deadline = deadline_policy.batch_deadline if deadline_policy is not None else 0.0
+        # 完成的协程交回调用方线程执行回调，回调中的阻塞操作不会拖住事件循环上的其他请求
+        finished = queue.Queue()
+
+        async def runner():
+            for var, value in context.items():
+                var.set(value)
+            semaphore = asyncio.Semaphore(max(1, limit))
+            running = set()
+            loop = asyncio.get_running_loop()
+            deadline_at = time.monotonic() + batch_deadline if batch_deadline else None
+            # 本批有任务记录耗时样本时完成，等待样本计算软截止时间的任务随之重新计算
+            sample_recorded = [loop.create_future()]
+
+            def notify_sample():
+                waiter, sample_recorded[0] = sample_recorded[0], loop.create_future()
+                waiter.set_result(None)
+
+            def cancel_running():
+                for task in list(running):
+                    task.cancel()
+
+            unregister = token.on_cancel(lambda: loop.call_soon_threadsafe(cancel_running))
+
+            async def run_attempts(index, factory, start):
+                # 正在运行的协程 {任务: (开始时间, 是否为推测执行)}
+                attempts = {}
+                speculated = 0
+                last_error = None
+
+                def launch(speculative=False):
+                    task = asyncio.ensure_future(factory())
+                    running.add(task)
+                    attempts[task] = (time.monotonic(), speculative)
+
+                launch()
+                try:
+                    while attempts:
+                        now = time.monotonic()
+                        deadlines = [deadline_at] if deadline_at is not None else []
+                        soft_due = None
+                        waiting = list(attempts)
+                        if deadline_policy is not None and speculated < deadline_policy.max_speculative:
+                            soft = deadline_policy.soft_deadline()
+                            if soft is not None:
+                                soft_due = start + soft * (speculated + 1)
+                                deadlines.append(soft_due)
+                            else:
+                                # 耗时样本还不够，同一批中其他任务完成（记录样本）后再计算软截止时间
+                                waiting.append(sample_recorded[0])
+                        timeout = max(0.0, min(deadlines) - now) if deadlines else None
+                        done, _ = await asyncio.wait(waiting, timeout=timeout,
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                        done = [task for task in done if task in attempts]
+                        for task in done:
+                            started, speculative = attempts.pop(task)
+                            running.discard(task)
+                            try:
+                                result = task.result()
+                            except asyncio.CancelledError:
+                                if not token.cancelled:
+                                    raise
+                                return False, OperationCancelled()
+                            except Exception as e:
+                                # 同一任务还有协程在运行时等待其结果
+                                last_error = e
+                                continue
+                            if deadline_policy is not None:
+                                deadline_policy.record(time.monotonic() - started)
+                                notify_sample()
+                                if speculative:
+                                    record_deadline_event("speculative_won")
+                                    print(f"任务 {index} 的推测请求先完成")
+                            return True, result
+                        if done:
+                            continue
+                        now = time.monotonic()
+                        if deadline_at is not None and now >= deadline_at:
+                            record_deadline_event("deadline_expired")
+                            return False, BatchDeadlineExceeded(batch_deadline)
+                        if soft_due is not None and now >= soft_due:
+                            speculated += 1
+                            record_deadline_event("speculative_launched")
+                            print(f"任务 {index} 超过软截止时间（{soft:.1f}秒），再发送一份相同的请求")
+                            launch(speculative=True)
+                    return False, last_error
+                finally:
+                    # 取消落后的协程
+                    for task in attempts:
+                        task.cancel()
+                        running.discard(task)
+
+            async def run_one(index, factory):
+                async with semaphore:
+                    start = time.monotonic()
+                    if token.cancelled:
+                        outcome = (False, OperationCancelled())
+                    elif deadline_at is not None and start >= deadline_at:
+                        record_deadline_event("deadline_expired")
+                        outcome = (False, BatchDeadlineExceeded(batch_deadline))
+                    else:
+                        self._on_start()
+                        try:
+                            outcome = await run_attempts(index, factory, start)
+                        except BaseException:
+                            self._on_finish(False)
+                            raise
+                        self._on_finish(outcome[0])
+                    elapsed = time.monotonic() - start
+
+                finished.put((index, outcome, elapsed))
+                return outcome
+
+            try:
+                return await asyncio.gather(*(run_one(index, factory) for index, factory in enumerate(task_factories)))
+            finally:
+                unregister()
+
+        future = self.submit(runner())
+        # 事件循环中的批次结束（包括出错）后放入结束标记
+        future.add_done_callback(lambda _: finished.put(None))
+        completed = 0
+        while True:
+            item = finished.get()
+            if item is None:
+                break
+            index, outcome, elapsed = item
+            completed += 1
+            if outcome_callback:
+                try:
+                    outcome_callback(index, outcome[0], outcome[1], elapsed)
+                except Exception as e:
+                    print(f"Outcome callback error: {e}")
+            if progress_callback:
+                try:
+                    progress_callback(completed, total)
+                except Exception as e:
+                    print(f"Progress callback error: {e}")
+        return future.result()
+
+    def _on_start(self):
+        with self._stats_lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def _on_finish(self, success: bool):
+        with self._stats_lock:
+            self._in_flight -= 1
+            if success:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def get_stats(self) -> dict:
+        """获取引擎统计信息"""
+        with self._stats_lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        """关闭会话并停止事件循环"""
+        with self._lock:
+            loop = self._loop
+            thread = self._thread
+            self._loop = None
+            self._thread = None
+
+        if loop is None:
+            return
+
+        async def close_session():
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"关闭异步会话失败: {e}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+        loop.close()
+
+
+# 全局异步引擎实例，在配置文件生命周期内复用
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    """获取全局异步引擎实例"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncEngine()
+        return _engine
+
+
+def shutdown_async_engine():
+    """关闭全局异步引擎（在配置文件关闭时调用）"""
+    global _engine
+    with _engine_lock:
+        engine = _engine
+        _engine = None
+    if engine is not None:
+        engine.shutdown()
@@ -0,0 +1,146 @@
+"""
+取消令牌模块
+
+界面上的生成、评估和追问操作各自持有一个取消令牌。令牌通过上下文变量向下传递
+（与请求优先级相同，共享线程池和异步引擎会把提交方的上下文带到任务中），
+各层在需要时读取当前令牌：
+- HTTP传输层：取消时立即关闭正在使用的连接，阻塞中的请求马上返回
+- 异步引擎：取消时取消本批次所有协程，aiohttp随之关闭连接
+- 并发处理器：不再提交排队中的任务
+- 重试、并发名额和速率预算的等待：取消时立即结束等待
+"""
+
+import contextlib
+import contextvars
+import threading
+from typing import Callable, Dict
+
+
+class OperationCancelled(BaseException):
+    """
+    操作被用户取消
+
+    与asyncio.CancelledError一样继承BaseException，各层处理请求失败的
+    except Exception（重试、降级、故障转移、重新请求等）不会把取消当作普通错误处理。
+    """
+
+    def __init__(self, message: str = "操作已取消"):
+        super().__init__(message)
+
+
+class CancellationToken:
+    """取消令牌"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消，并调用所有已注册的取消回调（只生效一次）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancel callback error: {e}")
+
+    def check(self):
+        """
+        检查是否已取消
+
+        Raises:
+            OperationCancelled: 已取消
+        """
+        if self._event.is_set():
+            raise OperationCancelled()
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消回调（已取消时立即调用）
+
+        Args:
+            callback: 取消时调用的函数，可能在任意线程中执行
+
+        Returns:
+            注销回调的函数，操作正常结束时应调用
+        """
+        with self._lock:
+            if not self._event.is_set():
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+
+                def unregister():
+                    with self._lock:
+                        self._callbacks.pop(callback_id, None)
+                return unregister
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: float) -> bool:
+        """等待至多timeout秒，返回是否已取消"""
+        return self._event.wait(timeout)
+
+
+class _NoCancellation(CancellationToken):
+    """没有设置取消令牌时使用的令牌，永远不会取消，也不保存回调"""
+
+    def cancel(self):
+        pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        return lambda: None
+
+
+NO_CANCELLATION = _NoCancellation()
+
+_current_token = contextvars.ContextVar("feynman_cancellation_token", default=NO_CANCELLATION)
+
+
+def current_token() -> CancellationToken:
+    """获取当前上下文中的取消令牌"""
+    return _current_token.get()
+
+
+@contextlib.contextmanager
+def cancellation_scope(token: CancellationToken):
+    """
+    在上下文中设置取消令牌
+
+    用法：
+        with cancellation_scope(self.cancel_token):
+            result = self.ai_handler.evaluate_answer(...)
+    """
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled():
+    """当前操作已取消时抛出OperationCancelled"""
+    current_token().check()
+
+
+def cancellable_sleep(seconds: float):
+    """
+    等待指定秒数，当前操作被取消时立即结束
+
+    Raises:
+        OperationCancelled: 等待期间被取消
+    """
+    if current_token().wait(seconds):
+        raise OperationCancelled()
@@ -0,0 +1,96 @@
+"""
+分块信息密度评分模块
+
+按各分块的信息量分配题目数：目录、参考文献、页眉页脚等内容信息量低，不应与正文章节
+分到同样多的题目。评分完全在本地进行：
+- 词项：中文按相邻两字切分，英文按单词切分（忽略数字和过短的单词）
+- 每个分块的得分为其中不同词项的 TF-IDF 权重之和，在所有分块中都出现的词项（页眉、
+  反复出现的样板文字）权重接近0
+- 再乘以文字字符（汉字和字母）在非空白字符中的比例，目录中的省略号、页码等会拉低得分
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List
+
+_CJK_RUN = re.compile('[\u4e00-\u9fff]+')
+_WORD = re.compile(r'[A-Za-z][A-Za-z\-]{2,}')
+_LETTER = re.compile('[\u4e00-\u9fffA-Za-z]')
+_SPACE = re.compile(r'\s+')
+
+
+def extract_terms(text: str) -> Counter:
+    """
+    提取文本中的词项及其出现次数
+
+    Args:
+        text: 文本
+
+    Returns:
+        词项计数
+    """
+    terms = Counter(word.lower() for word in _WORD.findall(text))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms[run] += 1
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def letter_ratio(text: str) -> float:
+    """汉字和字母在非空白字符中所占的比例"""
+    visible = len(_SPACE.sub("", text))
+    if not visible:
+        return 0.0
+    return len(_LETTER.findall(text)) / visible
+
+
+def score_chunks(texts: List[str]) -> List[float]:
+    """
+    计算各分块的信息密度得分
+
+    Args:
+        texts: 分块文本列表
+
+    Returns:
+        与texts一一对应的得分（非负，空白分块为0）
+    """
+    term_counts = [extract_terms(text) for text in texts]
+    document_frequency = Counter()
+    for counts in term_counts:
+        document_frequency.update(counts.keys())
+    total = len(texts)
+    scores = []
+    for text, counts in zip(texts, term_counts):
+        score = 0.0
+        for term, count in counts.items():
+            idf = math.log((1 + total) / (1 + document_frequency[term]))
+            score += idf * (1 + math.log(count))
+        scores.append(score * letter_ratio(text))
+    return scores
+
+
+def allocate(total: int, weights: List[float]) -> List[int]:
+    """
+    按权重分配数量（最大余数法），总数保持不变
+
+    Args:
+        total: 要分配的总数
+        weights: 各项的权重，权重为0的项不分配
+
+    Returns:
+        与weights一一对应的分配数量；所有权重都为0时返回全0
+    """
+    weight_sum = sum(weight for weight in weights if weight > 0)
+    if total <= 0 or weight_sum <= 0:
+        return [0] * len(weights)
+    quotas = [total * max(weight, 0.0) / weight_sum for weight in weights]
+    counts = [int(quota) for quota in quotas]
+    remaining = total - sum(counts)
+    # 余数大的优先，余数相同时靠前的优先
+    order = sorted(range(len(weights)), key=lambda i: (-(quotas[i] - counts[i]), i))
+    for i in order[:remaining]:
+        counts[i] += 1
+    return counts
@@ -1,14 +1,41 @@
 """
 并发处理器模块
 
-提供并发处理API请求的功能，支持进度回调和错误处理。
+提供并发处理API请求的功能，支持进度回调和错误处理。任务在共享线程池服务的
+分块通道中执行，不再为每次调用创建和销毁线程池。iter_outcomes/process_outcomes
+在每个任务完成时立即给出带任务序号和耗时的结果，调用方不必等最慢的任务完成；
+设置截止时间时，超过软截止时间的任务会推测执行，到达硬截止时间时返回已完成的结果。
+
+每批任务在自己的取消令牌下运行：调用cancel()或调用方的操作被取消时，排队中的
+任务不再执行，正在执行的任务的HTTP连接被立即关闭。
 """
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Callable, Any, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import List, Callable, Any, Iterator, NamedTuple, Optional, Tuple
 import time
 import threading
 
+from .cancellation import CancellationToken, OperationCancelled, cancellation_scope, current_token
+from .executor_service import LANE_CHUNKS, get_executor_service
+from .task_deadlines import BatchDeadlineExceeded, DeadlinePolicy, record_deadline_event
+
+
+# 工作线程数上限（启用自适应并发时，实际并发数由限制器在该范围内动态调整）
+MAX_WORKERS = 32  # 与共享线程池分块通道的线程数一致
+
+
+class TaskOutcome(NamedTuple):
+    """单个任务的执行结果"""
+    index: int                      # 任务在任务列表中的序号
+    result: Any                     # 任务返回值（失败时为None）
+    error: Optional[Exception]      # 任务抛出的异常（成功时为None）
+    elapsed: float                  # 任务执行耗时（秒）
+
+    @property
+    def ok(self) -> bool:
+        """任务是否成功"""
+        return self.error is None
+
 
 class ConcurrentProcessor:
     """并发处理器类"""
@@ -20,15 +47,19 @@ class ConcurrentProcessor:
         Args:
             max_workers: 最大并发工作线程数
         """
-        self.max_workers = max(1, min(max_workers, 10))  # 限制在1-10之间
+        self.max_workers = max(1, min(max_workers, MAX_WORKERS))
         self._cancel_flag = threading.Event()
+        # 正在运行的各批任务的取消令牌
+        self._batch_tokens = set()
+        self._tokens_lock = threading.Lock()
         
     def process_batch(
         self,
         tasks: List[Tuple[Any, ...]],
         task_func: Callable,
         progress_callback: Optional[Callable[[int, int], None]] = None,
-        error_callback: Optional[Callable[[Exception, int], None]] = None
+        error_callback: Optional[Callable[[Exception, int], None]] = None,
+        deadline_policy: Optional[DeadlinePolicy] = None
     ) -> List[Any]:
         """
         批量并发处理任务
@@ -38,6 +69,7 @@ class ConcurrentProcessor:
             task_func: 处理单个任务的函数
             progress_callback: 进度回调函数 (completed, total)
             error_callback: 错误回调函数 (error, task_index)
+            deadline_policy: 截止时间设置（可选，见iter_outcomes）
             
         Returns:
             结果列表，与任务列表顺序对应
@@ -48,66 +80,7 @@ class ConcurrentProcessor:
         if not tasks:
             return []
         
-        # 重置取消标志
-        self._cancel_flag.clear()
-        
-        total = len(tasks)
-        results = [None] * total
-        task_indices = {}
-        failed_tasks = []
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            # 提交所有任务
-            future_to_index = {}
-            for i, task_args in enumerate(tasks):
-                if self._cancel_flag.is_set():
-                    break
-                future = executor.submit(task_func, *task_args)
-                future_to_index[future] = i
-                task_indices[i] = task_args
-            
-            # 收集结果
-            completed = 0
-            for future in as_completed(future_to_index):
-                if self._cancel_flag.is_set():
-                    # 取消所有未完成的任务
-                    for f in future_to_index:
-                        f.cancel()
-                    break
-                
-                task_index = future_to_index[future]
-                
-                try:
-                    result = future.result()
-                    results[task_index] = result
-                    completed += 1
-                    
-                    # 调用进度回调
-                    if progress_callback:
-                        try:
-                            progress_callback(completed, total)
-                        except Exception as e:
-                            print(f"Progress callback error: {e}")
-                            
-                except Exception as e:
-                    failed_tasks.append((task_index, e))
-                    print(f"Task {task_index} failed: {str(e)}")
-                    
-                    # 调用错误回调
-                    if error_callback:
-                        try:
-                            error_callback(e, task_index)
-                        except Exception as callback_error:
-                            print(f"Error callback error: {callback_error}")
-        
-        # 检查是否所有任务都失败了
-        if len(failed_tasks) == total:
-            raise Exception(f"所有任务都失败了。第一个错误: {failed_tasks[0][1]}")
-        
-        # 过滤掉None结果（失败的任务）
-        valid_results = [r for r in results if r is not None]
-        
-        return valid_results
+        return self._run_tasks(tasks, task_func, progress_callback, error_callback, deadline_policy)
     
     def process_with_rate_limit(
         self,
@@ -133,79 +106,289 @@ class ConcurrentProcessor:
         if not tasks:
             return []
         
+        # 使用锁来分配发送时间槽
+        rate_lock = threading.Lock()
+        next_slot_time = [0]  # 使用列表以便在闭包中修改
+
+        def rate_limited_func(*args):
+            """带速率限制的任务函数包装"""
+            with rate_lock:
+                # 只在锁内预约时间槽，等待在锁外进行，避免阻塞其他线程
+                now = time.time()
+                slot = max(now, next_slot_time[0])
+                next_slot_time[0] = slot + rate_limit
+            if slot > now:
+                time.sleep(slot - now)
+
+            # 执行实际任务
+            return task_func(*args)
+        
+        return self._run_tasks(tasks, rate_limited_func, progress_callback, error_callback)
+    
+    def iter_outcomes(
+        self,
+        tasks: List[Tuple[Any, ...]],
+        task_func: Callable,
+        deadline_policy: Optional[DeadlinePolicy] = None
+    ) -> Iterator[TaskOutcome]:
+        """
+        并发执行任务，每完成一个就立即产出其结果
+        
+        任务在共享线程池的分块通道中执行，同时运行的任务不超过max_workers个。任务
+        不一次性全部提交，而是每完成一个再提交下一个，这样多个批次共用通道时各自的
+        并发数仍受max_workers限制，取消时也没有大量排队任务需要清理。
+        
+        设置deadline_policy时，任务超过软截止时间后再提交一份相同的请求（推测请求
+        不占用max_workers名额），取先成功的结果并取消其余请求；到达批次的硬截止时间时，
+        未完成的任务以BatchDeadlineExceeded结束，不再等待。
+        
+        Args:
+            tasks: 任务列表，每个任务是一个参数元组
+            task_func: 处理单个任务的函数（推测执行时同一任务可能被同时调用多次）
+            deadline_policy: 截止时间设置（可选）
+            
+        Yields:
+            TaskOutcome，按完成顺序；cancel()后不再产出，未完成的任务被丢弃
+            
+        Raises:
+            OperationCancelled: 调用方的操作被取消（已完成的结果已经产出）
+        """
         # 重置取消标志
         self._cancel_flag.clear()
         
+        service = get_executor_service()
         total = len(tasks)
-        results = [None] * total
-        failed_tasks = []
+        # 正在执行的请求 {Future: (任务序号, 请求的取消令牌, 是否为推测请求)}
+        attempts = {}
+        # 未完成的任务 {任务序号: [首次提交时间, 已发送的推测请求数]}
+        running = {}
+        next_index = 0
+        batch_start = time.monotonic()
+        batch_deadline = deadline_policy.batch_deadline if deadline_policy is not None else 0.0
         
-        # 使用锁来控制速率
-        rate_lock = threading.Lock()
-        last_submit_time = [0]  # 使用列表以便在闭包中修改
+        # 本批任务的取消令牌：调用方的操作被取消或调用cancel()时触发
+        parent_token = current_token()
+        batch_token = CancellationToken()
+        stopped = Future()
+        unlink = parent_token.on_cancel(batch_token.cancel)
+        batch_token.on_cancel(lambda: stopped.done() or stopped.set_result(None))
+        with self._tokens_lock:
+            self._batch_tokens.add(batch_token)
         
-        def rate_limited_func(*args):
-            """带速率限制的任务函数包装"""
-            with rate_lock:
-                # 计算需要等待的时间
-                elapsed = time.time() - last_submit_time[0]
-                if elapsed < rate_limit:
-                    time.sleep(rate_limit - elapsed)
-                last_submit_time[0] = time.time()
+        def timed(attempt_token, *args):
+            start = time.monotonic()
+            try:
+                with cancellation_scope(attempt_token):
+                    return task_func(*args), None, time.monotonic() - start
+            except OperationCancelled as e:
+                return None, e, time.monotonic() - start
+            except Exception as e:
+                return None, e, time.monotonic() - start
+        
+        def launch(index, speculative=False):
+            # 每个请求有自己的取消令牌，推测执行中落后的请求可以单独中断
+            attempt_token = CancellationToken()
+            unlink_attempt = batch_token.on_cancel(attempt_token.cancel)
+            future = service.submit(LANE_CHUNKS, timed, attempt_token, *tasks[index])
+            future.add_done_callback(lambda _: unlink_attempt())
+            attempts[future] = (index, attempt_token, speculative)
+        
+        def submit_next():
+            nonlocal next_index
+            running[next_index] = [time.monotonic(), 0]
+            launch(next_index)
+            next_index += 1
+        
+        def drop_attempts(index):
+            # 取消任务其余仍在进行的请求
+            for future, (task_index, attempt_token, _) in list(attempts.items()):
+                if task_index == index:
+                    del attempts[future]
+                    future.cancel()
+                    attempt_token.cancel()
+        
+        def soft_due(state, soft):
+            # 第n个推测请求在首次提交后 n * 软截止时间 发送
+            return state[0] + soft * (state[1] + 1)
+        
+        def next_timeout():
+            deadlines = []
+            if batch_deadline:
+                deadlines.append(batch_start + batch_deadline)
+            soft = deadline_policy.soft_deadline() if deadline_policy is not None else None
+            if soft is not None:
+                deadlines.extend(soft_due(state, soft) for state in running.values()
+                                 if state[1] < deadline_policy.max_speculative)
+            return max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+        
+        try:
+            while next_index < total and len(running) < self.max_workers:
+                submit_next()
             
-            # 执行实际任务
-            return task_func(*args)
+            while running:
+                wait(list(attempts) + [stopped], timeout=next_timeout(), return_when=FIRST_COMPLETED)
+                
+                for future in [f for f in attempts if f.done()]:
+                    if future not in attempts:
+                        # 同一任务的其他请求先完成，已被取消
+                        continue
+                    task_index, _, speculative = attempts.pop(future)
+                    try:
+                        result, error, elapsed = future.result()
+                    except Exception as e:
+                        # 线程池关闭等原因导致任务没有执行
+                        result, error, elapsed = None, e, 0.0
+                    if stopped.done():
+                        # 已取消：只产出取消前已经完成的结果
+                        if error is None:
+                            started = running.pop(task_index)[0]
+                            drop_attempts(task_index)
+                            yield TaskOutcome(task_index, result, error, time.monotonic() - started)
+                        continue
+                    if error is not None and any(index == task_index for index, _, _ in attempts.values()):
+                        # 同一任务还有请求在进行，等待其结果
+                        continue
+                    started = running.pop(task_index)[0]
+                    drop_attempts(task_index)
+                    if error is None and deadline_policy is not None:
+                        deadline_policy.record(elapsed)
+                        if speculative:
+                            record_deadline_event("speculative_won")
+                            print(f"任务 {task_index} 的推测请求先完成")
+                    if next_index < total:
+                        submit_next()
+                    yield TaskOutcome(task_index, result, error, time.monotonic() - started)
+                
+                if stopped.done():
+                    if parent_token.cancelled:
+                        raise OperationCancelled()
+                    return
+                
+                now = time.monotonic()
+                if batch_deadline and now >= batch_start + batch_deadline and running:
+                    # 到达硬截止时间：未完成的任务不再等待，尚未提交的任务不再提交
+                    expired = sorted(list(running) + list(range(next_index, total)))
+                    running.clear()
+                    next_index = total
+                    record_deadline_event("deadline_expired", len(expired))
+                    print(f"批次超过截止时间（{batch_deadline:.0f}秒），{len(expired)} 个任务未完成")
+                    for task_index in expired:
+                        yield TaskOutcome(task_index, None, BatchDeadlineExceeded(batch_deadline), now - batch_start)
+                    return
+                
+                soft = deadline_policy.soft_deadline() if deadline_policy is not None else None
+                if soft is not None:
+                    for task_index, state in running.items():
+                        if state[1] < deadline_policy.max_speculative and now >= soft_due(state, soft):
+                            state[1] += 1
+                            record_deadline_event("speculative_launched")
+                            print(f"任务 {task_index} 超过软截止时间（{soft:.1f}秒），再发送一份相同的请求")
+                            launch(task_index, speculative=True)
+        finally:
+            # 取消或调用方提前结束迭代时，取消排队中的任务，并中断正在执行的任务
+            for future in attempts:
+                future.cancel()
+            if attempts:
+                batch_token.cancel()
+            unlink()
+            with self._tokens_lock:
+                self._batch_tokens.discard(batch_token)
+    
+    def process_outcomes(
+        self,
+        tasks: List[Tuple[Any, ...]],
+        task_func: Callable,
+        outcome_callback: Optional[Callable[[TaskOutcome], None]] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        deadline_policy: Optional[DeadlinePolicy] = None
+    ) -> List[TaskOutcome]:
+        """
+        并发执行任务，每完成一个回调一次，最后按任务顺序返回所有结果
+        
+        与process_batch不同，失败的任务不会被过滤掉，每个结果都带有任务序号。
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_index = {}
+        Args:
+            tasks: 任务列表，每个任务是一个参数元组
+            task_func: 处理单个任务的函数
+            outcome_callback: 每个任务完成（成功或失败）时立即调用，参数为TaskOutcome
+            progress_callback: 进度回调函数 (completed, total)，completed包含失败的任务
+            deadline_policy: 截止时间设置（可选，见iter_outcomes）
             
-            # 提交所有任务（速率限制会在执行时生效）
-            for i, task_args in enumerate(tasks):
-                if self._cancel_flag.is_set():
-                    break
-                future = executor.submit(rate_limited_func, *task_args)
-                future_to_index[future] = i
+        Returns:
+            按任务顺序排列的TaskOutcome列表；取消时只包含已完成的任务，到达硬截止时间时
+            未完成的任务以BatchDeadlineExceeded结束
+        """
+        outcomes = []
+        total = len(tasks)
+        for outcome in self.iter_outcomes(tasks, task_func, deadline_policy):
+            outcomes.append(outcome)
+            if not outcome.ok:
+                print(f"Task {outcome.index} failed: {str(outcome.error)}")
+            for callback, args in ((outcome_callback, (outcome,)), (progress_callback, (len(outcomes), total))):
+                if callback:
+                    try:
+                        callback(*args)
+                    except Exception as e:
+                        print(f"Callback error: {e}")
+        outcomes.sort(key=lambda outcome: outcome.index)
+        return outcomes
+    
+    def _run_tasks(
+        self,
+        tasks: List[Tuple[Any, ...]],
+        task_func: Callable,
+        progress_callback: Optional[Callable[[int, int], None]],
+        error_callback: Optional[Callable[[Exception, int], None]],
+        deadline_policy: Optional[DeadlinePolicy] = None
+    ) -> List[Any]:
+        """执行任务并按process_batch的约定返回成功任务的结果"""
+        total = len(tasks)
+        results = [None] * total
+        failed_tasks = []
+        
+        # 收集结果
+        completed = 0
+        for outcome in self.iter_outcomes(tasks, task_func, deadline_policy):
+            task_index = outcome.index
             
-            # 收集结果
-            completed = 0
-            for future in as_completed(future_to_index):
-                if self._cancel_flag.is_set():
-                    for f in future_to_index:
-                        f.cancel()
-                    break
+            if outcome.ok:
+                results[task_index] = outcome.result
+                completed += 1
                 
-                task_index = future_to_index[future]
+                # 调用进度回调
+                if progress_callback:
+                    try:
+                        progress_callback(completed, total)
+                    except Exception as e:
+                        print(f"Progress callback error: {e}")
+            else:
+                e = outcome.error
+                failed_tasks.append((task_index, e))
+                print(f"Task {task_index} failed: {str(e)}")
                 
-                try:
-                    result = future.result()
-                    results[task_index] = result
-                    completed += 1
-                    
-                    if progress_callback:
-                        try:
-                            progress_callback(completed, total)
-                        except Exception as e:
-                            print(f"Progress callback error: {e}")
-                            
-                except Exception as e:
-                    failed_tasks.append((task_index, e))
-                    print(f"Task {task_index} failed: {str(e)}")
-                    
-                    if error_callback:
-                        try:
-                            error_callback(e, task_index)
-                        except Exception as callback_error:
-                            print(f"Error callback error: {callback_error}")
+                # 调用错误回调
+                if error_callback:
+                    try:
+                        error_callback(e, task_index)
+                    except Exception as callback_error:
+                        print(f"Error callback error: {callback_error}")
         
+        # 检查是否所有任务都失败了
         if len(failed_tasks) == total:
             raise Exception(f"所有任务都失败了。第一个错误: {failed_tasks[0][1]}")
         
+        # 过滤掉None结果（失败的任务）
         valid_results = [r for r in results if r is not None]
+        
         return valid_results
     
     def cancel(self):
-        """取消所有正在进行的任务"""
+        """取消所有正在进行的任务：排队中的任务不再执行，正在执行的请求立即中断"""
         self._cancel_flag.set()
+        with self._tokens_lock:
+            tokens = list(self._batch_tokens)
+        for token in tokens:
+            token.cancel()
     
     def is_cancelled(self) -> bool:
         """检查是否已取消"""
@@ -218,5 +401,5 @@ class ConcurrentProcessor:
         Args:
             max_workers: 新的最大工作线程数
         """
-        self.max_workers = max(1, min(max_workers, 10))
+        self.max_workers = max(1, min(max_workers, MAX_WORKERS))
 
@@ -0,0 +1,219 @@
+"""
+共享线程池服务模块
+
+插件内所有后台任务共用一个常驻的线程池服务，按用途划分为若干通道（lane），
+每个通道是一个固定大小的线程池：
+- generation: 题目/卡片/语言练习生成任务（界面发起的整次生成）
+- evaluation: 答案评估
+- followup: 追加提问
+- pdf_io: PDF文本提取等文件读写
+- chunks: 分块请求（并发处理器提交的单个API请求）
+
+各通道互不占用线程：批量生成占满分块通道时，评估和追问仍有自己的线程可用。
+分块请求单独使用一个通道，避免生成任务在同一通道内等待自己提交的子任务而死锁。
+线程池在配置文件生命周期内复用，配置文件关闭时统一关闭。
+"""
+
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# 通道名称
+LANE_GENERATION = "generation"
+LANE_EVALUATION = "evaluation"
+LANE_FOLLOWUP = "followup"
+LANE_PDF_IO = "pdf_io"
+LANE_CHUNKS = "chunks"
+
+# 各通道的线程数。分块通道只提供线程，实际并发数由并发处理器按配置（或自适应并发）控制
+LANE_WORKERS = {
+    LANE_GENERATION: 4,
+    LANE_EVALUATION: 4,
+    LANE_FOLLOWUP: 4,
+    LANE_PDF_IO: 2,
+    LANE_CHUNKS: 32,
+}
+
+
+class Lane:
+    """线程池通道，记录排队和运行中的任务数"""
+
+    def __init__(self, name: str, max_workers: int):
+        """
+        初始化通道
+
+        Args:
+            name: 通道名称
+            max_workers: 线程数
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"Feynman-{name}")
+        self._lock = threading.Lock()
+        self._created = time.monotonic()
+        self._queued = 0
+        self._active = 0
+        self._peak_active = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._busy_seconds = 0.0
+        self._wait_seconds = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交任务，返回Future（任务在提交方上下文变量的副本中运行，如请求优先级）"""
+        submitted = time.monotonic()
+        context = contextvars.copy_context()
+
+        def run():
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._peak_active = max(self._peak_active, self._active)
+                self._wait_seconds += started - submitted
+            success = False
+            try:
+                result = context.run(fn, *args, **kwargs)
+                success = True
+                return result
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._busy_seconds += time.monotonic() - started
+                    if success:
+                        self._completed += 1
+                    else:
+                        self._failed += 1
+
+        with self._lock:
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future):
+        # 排队中被取消的任务不会执行run，在这里扣除排队数
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._cancelled += 1
+
+    def get_stats(self) -> dict:
+        """获取通道统计信息"""
+        with self._lock:
+            elapsed = max(time.monotonic() - self._created, 1e-9)
+            started = self._completed + self._failed + self._active
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "peak_active": self._peak_active,
+                "peak_queued": self._peak_queued,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                # 当前占用的线程比例，以及自通道创建以来的平均线程利用率
+                "utilization": self._active / self.max_workers,
+                "average_utilization": min(1.0, self._busy_seconds / (elapsed * self.max_workers)),
+                "average_wait": self._wait_seconds / started if started else 0.0,
+            }
+
+    def shutdown(self):
+        """关闭通道：取消排队中的任务，不等待运行中的任务结束"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecutorService:
+    """按通道划分的共享线程池服务"""
+
+    def __init__(self, lane_workers: Dict[str, int] = None):
+        """
+        初始化线程池服务
+
+        Args:
+            lane_workers: 各通道的线程数，默认为LANE_WORKERS
+        """
+        self._lane_workers = dict(lane_workers or LANE_WORKERS)
+        self._lanes: Dict[str, Lane] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _get_lane(self, name: str) -> Lane:
+        """获取通道，首次使用时创建"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("线程池服务已关闭")
+            lane = self._lanes.get(name)
+            if lane is None:
+                if name not in self._lane_workers:
+                    raise ValueError(f"未知的线程池通道: {name}")
+                lane = Lane(name, self._lane_workers[name])
+                self._lanes[name] = lane
+            return lane
+
+    def submit(self, lane: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        在指定通道中执行任务
+
+        Args:
+            lane: 通道名称
+            fn: 任务函数
+            *args, **kwargs: 任务参数
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return self._get_lane(lane).submit(fn, *args, **kwargs)
+
+    def lane_size(self, lane: str) -> int:
+        """获取通道的线程数"""
+        return self._lane_workers.get(lane, 0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各通道的统计信息（尚未使用的通道不创建，也不出现在结果中）"""
+        with self._lock:
+            lanes = dict(self._lanes)
+        return {name: lane.get_stats() for name, lane in lanes.items()}
+
+    def shutdown(self):
+        """关闭所有通道"""
+        with self._lock:
+            self._closed = True
+            lanes = list(self._lanes.values())
+            self._lanes.clear()
+        for lane in lanes:
+            lane.shutdown()
+
+
+# 全局线程池服务实例，在配置文件生命周期内复用
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_executor_service() -> ExecutorService:
+    """获取全局线程池服务实例"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ExecutorService()
+        return _service
+
+
+def shutdown_executor_service():
+    """关闭全局线程池服务（在配置文件关闭时调用）"""
+    global _service
+    with _service_lock:
+        service = _service
+        _service = None
+    if service is not None:
+        service.shutdown()
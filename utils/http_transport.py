@@ -0,0 +1,330 @@
+"""
+HTTP传输层模块
+
+为AI API请求提供长连接复用的HTTP会话池。每个（端点, API Key）组合
+共享一个长期存在的requests.Session，避免每次请求都重新进行TCP+TLS握手。
+会话在整个配置文件（profile）生命周期内复用，关闭配置文件时统一释放。
+
+当前操作被取消时（见cancellation模块），正在使用的连接被立即关闭，
+阻塞在读取响应上的请求马上返回，不必等到请求超时。
+"""
+
+import contextlib
+import socket
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .cancellation import OperationCancelled, current_token
+
+# 当前线程中正在发出的请求使用的连接（由abort_on_cancel设置）
+_tracking = threading.local()
+
+
+class _TrackedPoolMixin:
+    """记录请求所用连接的连接池，取消时据此关闭连接"""
+
+    def _make_request(self, conn, *args, **kwargs):
+        connections = getattr(_tracking, "connections", None)
+        if connections is not None:
+            connections.append(conn)
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class _TrackedHTTPConnectionPool(_TrackedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+def _abort_connections(connections: List):
+    """关闭连接的套接字，阻塞在该连接上的读写立即出错返回"""
+    for conn in list(connections):
+        sock = getattr(conn, "sock", None)
+        if sock is None:
+            continue
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _track_connections() -> Tuple[Callable[[], None], Callable[[], None]]:
+    """
+    开始记录当前线程发出的请求所用的连接，当前操作被取消时关闭这些连接
+
+    Returns:
+        (停止记录的函数, 停止监听取消的函数)
+
+    Raises:
+        OperationCancelled: 当前操作已取消
+    """
+    token = current_token()
+    token.check()
+    connections = []
+    previous = getattr(_tracking, "connections", None)
+    _tracking.connections = connections
+    unregister = token.on_cancel(lambda: _abort_connections(connections))
+
+    def restore():
+        _tracking.connections = previous
+    return restore, unregister
+
+
+@contextlib.contextmanager
+def abort_on_cancel():
+    """
+    上下文中通过传输层会话发出的请求（包括SDK直接使用会话发出的请求），
+    在当前操作被取消时立即关闭连接，并以OperationCancelled结束
+    """
+    token = current_token()
+    restore, unregister = _track_connections()
+    try:
+        yield
+    except Exception as e:
+        if token.cancelled:
+            raise OperationCancelled("请求已取消") from e
+        raise
+    finally:
+        restore()
+        unregister()
+
+
+class _PooledSession(requests.Session):
+    """
+    由传输层管理生命周期的Session
+
+    openai 0.28 会定期对线程会话调用close()，这里忽略外部的close，
+    只有传输层关闭时（配置文件关闭时的close_all_transports）才真正释放连接池。
+    """
+
+    _released = False
+
+    def close(self):
+        """
+        有意不做任何事：会话被所有请求共享，外部（openai）关闭它会断开其他请求正在复用的连接。
+        连接由release()释放；释放之后再调用close()按普通Session关闭。
+        """
+        if self._released:
+            super().close()
+
+    def release(self):
+        """真正关闭会话并释放所有连接"""
+        self._released = True
+        super().close()
+
+
+class HTTPTransport:
+    """基于连接池的HTTP传输类"""
+
+    def __init__(self, pool_size: int = 3):
+        """
+        初始化传输层
+
+        Args:
+            pool_size: 连接池大小，通常与最大并发请求数一致
+        """
+        self.pool_size = max(1, pool_size)
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._error_count = 0
+        # 已被替换的连接池中累计的连接数与请求数
+        self._retired_connections = 0
+        self._retired_pool_requests = 0
+        self.session = _PooledSession()
+        self._adapter = None
+        self._mount_adapter()
+
+    def _mount_adapter(self):
+        """挂载新的连接池适配器"""
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0
+        )
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackedHTTPConnectionPool,
+            "https": _TrackedHTTPSConnectionPool,
+        }
+        old_adapter = self._adapter
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+        if old_adapter is not None:
+            connections, pool_requests = self._collect_pool_counters(old_adapter)
+            self._retired_connections += connections
+            self._retired_pool_requests += pool_requests
+            old_adapter.close()
+
+    @staticmethod
+    def _collect_pool_counters(adapter: HTTPAdapter) -> Tuple[int, int]:
+        """统计适配器下所有连接池的新建连接数和请求数"""
+        connections = 0
+        pool_requests = 0
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections += getattr(pool, "num_connections", 0)
+            pool_requests += getattr(pool, "num_requests", 0)
+        return connections, pool_requests
+
+    def ensure_pool_size(self, pool_size: int):
+        """
+        确保连接池足够容纳指定的并发数（只扩不缩）
+
+        Args:
+            pool_size: 需要支持的并发请求数
+        """
+        with self._lock:
+            if pool_size > self.pool_size:
+                self.pool_size = pool_size
+                self._mount_adapter()
+
+    def post(self, url: str, headers: Optional[dict] = None, json: Optional[dict] = None,
+             timeout: Optional[float] = None, stream: bool = False) -> requests.Response:
+        """
+        发送POST请求（复用连接池中的连接）
+
+        Args:
+            url: 请求地址
+            headers: 请求头
+            json: JSON请求体
+            timeout: 超时时间（秒）
+            stream: 是否以流方式读取响应
+
+        Returns:
+            requests.Response对象；流式响应在读取过程中被取消时连接同样会被关闭
+
+        Raises:
+            OperationCancelled: 当前操作已取消，或在请求过程中被取消
+        """
+        token = current_token()
+        restore, unregister = _track_connections()
+        with self._lock:
+            self._request_count += 1
+        try:
+            response = self.session.post(url, headers=headers, json=json, timeout=timeout, stream=stream)
+        except Exception as e:
+            unregister()
+            with self._lock:
+                self._error_count += 1
+            if token.cancelled:
+                raise OperationCancelled("请求已取消") from e
+            raise
+        finally:
+            restore()
+        if not stream:
+            unregister()
+            return response
+
+        # 流式响应的连接在读取完成前一直占用，关闭响应时才停止监听取消
+        close = response.close
+
+        def close_response():
+            unregister()
+            close()
+        response.close = close_response
+        return response
+
+    def get_stats(self) -> dict:
+        """
+        获取连接复用统计
+
+        Returns:
+            包含请求数、新建连接数（握手次数）和复用次数的字典
+        """
+        with self._lock:
+            connections, pool_requests = self._collect_pool_counters(self._adapter)
+            connections += self._retired_connections
+            pool_requests += self._retired_pool_requests
+            return {
+                "pool_size": self.pool_size,
+                "requests": self._request_count,
+                "errors": self._error_count,
+                "connections_opened": connections,
+                "connections_reused": max(0, pool_requests - connections),
+            }
+
+    def close(self):
+        """关闭传输层，释放所有连接"""
+        with self._lock:
+            self.session.release()
+
+
+# 全局传输层注册表：(端点, API Key) -> HTTPTransport
+_transports: Dict[Tuple[str, str], HTTPTransport] = {}
+_registry_lock = threading.Lock()
+
+
+def _endpoint_of(api_url: str) -> str:
+    """提取端点（协议+主机+端口）作为连接池的键"""
+    parts = urlsplit(api_url or "")
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else (api_url or "")
+
+
+def get_transport(api_url: str, api_key: str = "", pool_size: int = 3) -> HTTPTransport:
+    """
+    获取（或创建）指定端点和API Key对应的传输层
+
+    Args:
+        api_url: API地址
+        api_key: API密钥
+        pool_size: 需要的连接池大小
+
+    Returns:
+        HTTPTransport实例
+    """
+    key = (_endpoint_of(api_url), api_key or "")
+    with _registry_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = HTTPTransport(pool_size=pool_size)
+            _transports[key] = transport
+            return transport
+    transport.ensure_pool_size(pool_size)
+    return transport
+
+
+def get_all_transport_stats() -> Dict[str, dict]:
+    """
+    获取所有传输层的统计信息
+
+    Returns:
+        以端点为键的统计字典（不包含API Key）
+    """
+    with _registry_lock:
+        items = list(_transports.items())
+
+    stats = {}
+    for (endpoint, _api_key), transport in items:
+        transport_stats = transport.get_stats()
+        if endpoint in stats:
+            # 同一端点使用了多个API Key，合并计数
+            for field, value in transport_stats.items():
+                stats[endpoint][field] = stats[endpoint].get(field, 0) + value
+        else:
+            stats[endpoint] = transport_stats
+    return stats
+
+
+def close_all_transports():
+    """关闭所有传输层（在配置文件关闭时调用）"""
+    with _registry_lock:
+        transports = list(_transports.values())
+        _transports.clear()
+
+    for transport in transports:
+        try:
+            transport.close()
+        except Exception as e:
+            print(f"关闭HTTP连接池失败: {e}")
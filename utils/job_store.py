@@ -0,0 +1,401 @@
+"""
+生成任务存储模块
+
+分块生成一整本教材可能需要几十个请求，生成过程原来只保存在工作线程的内存中，
+Anki关闭、切换配置文件或进程崩溃时，已经完成（已经付费）的分块全部丢失。
+这里用 data/generation_jobs.db（SQLite）持久保存每个生成任务：任务参数、原文、
+状态，以及每个分块的完成状态和解析结果。分块一完成就写入数据库，任务恢复时
+已完成的分块直接使用保存的结果，不再重新请求。
+
+任务状态：
+- running: 正在运行；进程退出时仍为running的任务在下次打开配置文件时自动恢复
+- paused: 已暂停，可以手动继续
+- cancelled: 已取消
+- failed: 出错结束，可以手动重试（已完成的分块保留）
+- completed: 已完成，保存最终结果
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+# 任务状态
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+JOB_COMPLETED = "completed"
+
+JOB_STATUS_NAMES = {
+    JOB_RUNNING: "运行中",
+    JOB_PAUSED: "已暂停",
+    JOB_CANCELLED: "已取消",
+    JOB_FAILED: "失败",
+    JOB_COMPLETED: "已完成",
+}
+
+# 可以继续运行的状态
+RESUMABLE_STATUSES = (JOB_RUNNING, JOB_PAUSED, JOB_FAILED)
+
+# 分块阶段：分块生成，以及分层生成的分块摘要
+STAGE_GENERATE = "generate"
+STAGE_SUMMARY = "summary"
+
+# 已结束（完成或取消）的任务保留天数
+JOB_RETENTION_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    question_type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    content TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (job_id, stage, chunk_index)
+);
+"""
+
+
+def job_store_path() -> str:
+    """获取任务数据库路径（data目录不存在时自动创建）"""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    return os.path.join(data_dir, "generation_jobs.db")
+
+
+def task_fingerprint(task: Sequence[Any]) -> str:
+    """分块任务参数的指纹；原文或分块设置变化后分块不同，保存的结果不再复用"""
+    payload = json.dumps(list(task), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class JobInterrupted(Exception):
+    """任务被暂停、取消，或因配置文件关闭而中断"""
+
+    MESSAGES = {
+        JOB_PAUSED: "生成任务已暂停，可以在“生成任务”窗口中继续",
+        JOB_CANCELLED: "生成任务已取消",
+        JOB_RUNNING: "配置文件已关闭，生成任务将在下次打开时继续",
+    }
+
+    def __init__(self, status: str):
+        self.status = status
+        super().__init__(self.MESSAGES.get(status, "生成任务已中断"))
+
+
+class ActiveJob:
+    """当前进程中正在运行的任务，供生成过程记录分块结果和检查暂停/取消请求"""
+
+    def __init__(self, store: "JobStore", job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._stop_status = None
+        self._stop_callbacks = []
+
+    def request_stop(self, status: str):
+        """请求停止任务：尚未发送的分块不再发送，并调用停止回调（中止正在进行的请求）"""
+        first = self._stop_status is None
+        self._stop_status = status
+        if not first:
+            return
+        for callback in self._stop_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Job stop callback error: {e}")
+
+    def on_stop(self, callback):
+        """注册停止回调，运行方用它取消正在进行的请求（如取消令牌的cancel）"""
+        self._stop_callbacks.append(callback)
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_status is not None
+
+    @property
+    def stop_status(self):
+        """请求停止后的状态，未请求停止时为None"""
+        return self._stop_status
+
+    def check(self):
+        """
+        检查是否有停止请求
+
+        Raises:
+            JobInterrupted: 任务已被请求暂停、取消或中断
+        """
+        if self._stop_status is not None:
+            raise JobInterrupted(self._stop_status)
+
+    def begin_stage(self, stage: str, tasks: List[Sequence[Any]]) -> Dict[int, Any]:
+        """
+        登记一个阶段的分块，返回之前已完成的分块结果
+
+        Args:
+            stage: 阶段名称（STAGE_GENERATE、STAGE_SUMMARY）
+            tasks: 分块任务参数列表
+
+        Returns:
+            {分块序号: 保存的结果}，只包含参数与本次相同的已完成分块
+        """
+        return self.store.begin_stage(self.job_id, stage, tasks)
+
+    def record_chunk(self, stage: str, index: int, result: Any):
+        """保存一个完成的分块结果"""
+        self.store.record_chunk(self.job_id, stage, index, result)
+
+    def finish(self, result: Any):
+        """任务完成，保存最终结果"""
+        self.store.set_status(self.job_id, JOB_COMPLETED, result=result)
+        self.store.detach(self)
+
+    def fail(self, error: str):
+        """任务出错结束"""
+        self.store.set_status(self.job_id, JOB_FAILED, error=error)
+        self.store.detach(self)
+
+    def interrupted(self, status: str):
+        """任务被停止（status为停止后的状态）"""
+        self.store.set_status(self.job_id, status)
+        self.store.detach(self)
+
+
+class JobStore:
+    """基于SQLite的生成任务存储"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化任务存储
+
+        Args:
+            db_path: 数据库路径，默认为 data/generation_jobs.db
+        """
+        self.db_path = db_path or job_store_path()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # 当前进程中正在运行的任务 {任务ID: ActiveJob}
+        self._active: Dict[str, ActiveJob] = {}
+
+    def _execute(self, sql: str, params: Sequence[Any] = ()) -> List[sqlite3.Row]:
+        """执行SQL并返回结果；存储已关闭时不执行"""
+        with self._lock:
+            if self._conn is None:
+                return []
+            try:
+                return self._conn.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                print(f"生成任务数据库操作失败: {e}")
+                return []
+
+    def create_job(self, question_type: str, content: str, params: Dict[str, Any]) -> str:
+        """
+        创建任务
+
+        Args:
+            question_type: 问题类型（与generate_questions的参数相同）
+            content: 原文
+            params: 其他生成参数（数量、模型、语言、模板等）
+
+        Returns:
+            任务ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        title = " ".join(content.split())[:40]
+        self._execute(
+            "INSERT INTO jobs (id, title, question_type, params, content, status, created, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, title, question_type, json.dumps(params, ensure_ascii=False), content, JOB_PAUSED, now, now)
+        )
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务的全部信息（包括原文和最终结果）"""
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def list_jobs(self, statuses: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        列出任务（按更新时间倒序，不包括原文和结果）
+
+        Args:
+            statuses: 只列出这些状态的任务，默认列出全部
+
+        Returns:
+            任务列表，每项包含 id、title、question_type、status、error、created、updated、
+            done（已完成的分块数）、total（已登记的分块数）
+        """
+        sql = ("SELECT j.id, j.title, j.question_type, j.status, j.error, j.created, j.updated, "
+               "COUNT(c.chunk_index) AS total, COALESCE(SUM(c.done), 0) AS done "
+               "FROM jobs j LEFT JOIN job_chunks c ON c.job_id = j.id")
+        params: List[Any] = []
+        if statuses:
+            sql += f" WHERE j.status IN ({', '.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += " GROUP BY j.id ORDER BY j.updated DESC"
+        return [dict(row) for row in self._execute(sql, params)]
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None, result: Any = None):
+        """更新任务状态（完成时同时保存最终结果）"""
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, result = COALESCE(?, result), updated = ? WHERE id = ?",
+            (status, error, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             time.time(), job_id)
+        )
+
+    def begin_stage(self, job_id: str, stage: str, tasks: List[Sequence[Any]]) -> Dict[int, Any]:
+        """登记分块并返回已完成的分块结果（见ActiveJob.begin_stage）"""
+        stored = {
+            row["chunk_index"]: row
+            for row in self._execute("SELECT chunk_index, fingerprint, done, result FROM job_chunks "
+                                     "WHERE job_id = ? AND stage = ?", (job_id, stage))
+        }
+        now = time.time()
+        completed = {}
+        for index, task in enumerate(tasks):
+            fingerprint = task_fingerprint(task)
+            row = stored.pop(index, None)
+            if row is not None and row["fingerprint"] == fingerprint:
+                if row["done"]:
+                    completed[index] = json.loads(row["result"])
+                continue
+            # 新分块，或分块内容已变化（原文或分块设置不同），需要重新生成
+            self._execute(
+                "INSERT OR REPLACE INTO job_chunks (job_id, stage, chunk_index, fingerprint, done, result, updated) "
+                "VALUES (?, ?, ?, ?, 0, NULL, ?)",
+                (job_id, stage, index, fingerprint, now)
+            )
+        for index in stored:
+            self._execute("DELETE FROM job_chunks WHERE job_id = ? AND stage = ? AND chunk_index = ?",
+                          (job_id, stage, index))
+        return completed
+
+    def record_chunk(self, job_id: str, stage: str, index: int, result: Any):
+        """保存一个完成的分块结果"""
+        now = time.time()
+        self._execute(
+            "UPDATE job_chunks SET done = 1, result = ?, updated = ? WHERE job_id = ? AND stage = ? AND chunk_index = ?",
+            (json.dumps(result, ensure_ascii=False), now, job_id, stage, index)
+        )
+        self._execute("UPDATE jobs SET updated = ? WHERE id = ?", (now, job_id))
+
+    def delete_job(self, job_id: str):
+        """删除任务及其分块结果"""
+        self._execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def prune(self, retention_days: float = JOB_RETENTION_DAYS):
+        """删除超过保留天数的已完成、已取消和失败任务"""
+        cutoff = time.time() - retention_days * 86400
+        for row in self._execute("SELECT id FROM jobs WHERE status IN (?, ?, ?) AND updated < ?",
+                                 (JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED, cutoff)):
+            self.delete_job(row["id"])
+
+    def attach(self, job_id: str) -> ActiveJob:
+        """
+        在当前进程中开始运行任务
+
+        Raises:
+            RuntimeError: 任务已在运行
+        """
+        with self._lock:
+            if job_id in self._active:
+                raise RuntimeError("该生成任务正在运行")
+            job = ActiveJob(self, job_id)
+            self._active[job_id] = job
+        self.set_status(job_id, JOB_RUNNING)
+        return job
+
+    def detach(self, job: ActiveJob):
+        """任务在当前进程中结束运行"""
+        with self._lock:
+            if self._active.get(job.job_id) is job:
+                del self._active[job.job_id]
+
+    def is_active(self, job_id: str) -> bool:
+        """任务是否正在当前进程中运行"""
+        with self._lock:
+            return job_id in self._active
+
+    def request_stop(self, job_id: str, status: str):
+        """
+        暂停或取消任务
+
+        正在运行的任务立即中止进行中的请求并停止，由运行方更新状态（已完成的分块
+        已经保存，继续时不会重新请求）；未运行的任务直接更新状态。
+
+        Args:
+            job_id: 任务ID
+            status: JOB_PAUSED 或 JOB_CANCELLED
+        """
+        with self._lock:
+            job = self._active.get(job_id)
+        if job is not None:
+            job.request_stop(status)
+        else:
+            job_info = self.get_job(job_id)
+            if job_info and job_info["status"] != JOB_COMPLETED:
+                self.set_status(job_id, status)
+
+    def close(self):
+        """关闭存储：正在运行的任务保持running状态，下次打开配置文件时继续"""
+        with self._lock:
+            active = list(self._active.values())
+            self._active.clear()
+            conn, self._conn = self._conn, None
+        for job in active:
+            job.request_stop(JOB_RUNNING)
+        if conn is not None:
+            conn.close()
+
+
+# 全局任务存储实例
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """获取全局任务存储实例（首次使用时清理过期任务）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+            _store.prune()
+        return _store
+
+
+def close_job_store():
+    """关闭全局任务存储（在配置文件关闭时调用）"""
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
@@ -0,0 +1,375 @@
+"""
+宽松JSON解析模块
+
+AI返回的"JSON"经常带有各种小错误。这里用一次线性扫描的递归下降解析器直接把文本
+解析为Python对象，并在解析过程中就地修复以下问题：
+
+- 代码块标记（```json）、JSON前后的说明文字
+- 缺少的逗号、多余的逗号（包括尾随逗号）、缺少的冒号
+- 单引号字符串、未加引号的键、字符串中未转义的双引号和换行
+- Python风格的 True / False / None
+- 被截断的响应中未闭合的字符串和括号
+
+每个字符只会被扫描常数次，不使用会回溯的正则，解析结果附带实际应用的修复列表。
+salvage_array() 用于从被截断或损坏的响应中只取出完整的数组元素。
+"""
+
+import json
+import re
+from typing import Any, List, Tuple
+
+
+# 修复类型
+REPAIR_CODE_FENCE = "code_fence"
+REPAIR_LEADING_TEXT = "leading_text"
+REPAIR_TRAILING_TEXT = "trailing_text"
+REPAIR_MISSING_COMMA = "missing_comma"
+REPAIR_EXTRA_COMMA = "extra_comma"
+REPAIR_MISSING_COLON = "missing_colon"
+REPAIR_SINGLE_QUOTE = "single_quote"
+REPAIR_UNQUOTED_KEY = "unquoted_key"
+REPAIR_UNESCAPED_QUOTE = "unescaped_quote"
+REPAIR_CONTROL_CHARACTER = "control_character"
+REPAIR_INVALID_ESCAPE = "invalid_escape"
+REPAIR_PYTHON_LITERAL = "python_literal"
+REPAIR_BARE_WORD = "bare_word"
+REPAIR_UNCLOSED_STRING = "unclosed_string"
+REPAIR_UNCLOSED_BRACKET = "unclosed_bracket"
+# 文本在某个对象/数组内部结束（响应被截断）
+REPAIR_TRUNCATED = "truncated"
+
+# 所有模式都只匹配固定字符集，不会回溯
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+_STRING_CHUNKS = {
+    '"': re.compile(r'[^"\\\x00-\x1f]*'),
+    "'": re.compile(r"[^'\\\x00-\x1f]*"),
+}
+_NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?")
+_WORD = re.compile(r"[^\W\d][\w$-]*")
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "'": "'"}
+_LITERALS = {"true": True, "false": False, "null": None}
+_PYTHON_LITERALS = {"True": True, "False": False, "None": None}
+
+_DECODER = json.JSONDecoder()
+
+# 对象/数组的最大嵌套深度，超过时视为无法修复的错误（避免递归溢出）
+MAX_DEPTH = 200
+
+# 字符串结束引号之后可能出现的字符
+_AFTER_STRING = {",", ":", "}", "]", ""}
+
+
+class LenientJSONError(ValueError):
+    """无法修复的JSON错误"""
+
+    def __init__(self, message: str, pos: int):
+        super().__init__(f"{message}（位置{pos}）")
+        self.pos = pos
+
+
+class _Parser:
+    """宽松JSON解析器（单次使用）"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.repairs: List[str] = []
+        # 文本结束时仍未闭合的对象/数组（按id记录），即被截断的值
+        self.incomplete = set()
+        self.depth = 0
+
+    def repair(self, kind: str):
+        if kind not in self.repairs:
+            self.repairs.append(kind)
+
+    def truncated(self, value: Any):
+        """记录在文本结尾处被截断的对象/数组"""
+        self.repair(REPAIR_UNCLOSED_BRACKET)
+        self.repair(REPAIR_TRUNCATED)
+        self.incomplete.add(id(value))
+
+    def skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE.match(self.text, pos).end()
+
+    def parse(self) -> Any:
+        text = self.text
+        start = text.find("{")
+        if start < 0:
+            start = text.find("[")
+        if start < 0:
+            raise LenientJSONError("响应中没有JSON对象", 0)
+        self._check_surrounding(text[:start], REPAIR_LEADING_TEXT)
+
+        try:
+            # JSON本身合法、只是前后有多余文字时，直接用标准库解析
+            value, pos = _DECODER.raw_decode(text, start)
+        except (json.JSONDecodeError, RecursionError):
+            value, pos = self.parse_value(start)
+        self._check_surrounding(text[pos:], REPAIR_TRAILING_TEXT)
+        return value
+
+    def _check_surrounding(self, extra: str, kind: str):
+        """记录JSON前后的代码块标记和说明文字"""
+        if "```" in extra:
+            self.repair(REPAIR_CODE_FENCE)
+            extra = extra.replace("```json", "").replace("```JSON", "").replace("```", "")
+        if extra.strip():
+            self.repair(kind)
+
+    def parse_value(self, pos: int) -> Tuple[Any, int]:
+        text = self.text
+        ch = text[pos]
+        if ch == "{" or ch == "[":
+            if self.depth >= MAX_DEPTH:
+                raise LenientJSONError(f"嵌套层数超过{MAX_DEPTH}", pos)
+            self.depth += 1
+            try:
+                return self.parse_object(pos + 1) if ch == "{" else self.parse_array(pos + 1)
+            finally:
+                self.depth -= 1
+        if ch == '"' or ch == "'":
+            return self.parse_string(pos)
+        match = _NUMBER.match(text, pos)
+        if match:
+            number = match.group()
+            value = float(number) if match.group(1) or match.group(2) else int(number)
+            return value, match.end()
+        match = _WORD.match(text, pos)
+        if match:
+            word = match.group()
+            if word in _LITERALS:
+                return _LITERALS[word], match.end()
+            if word in _PYTHON_LITERALS:
+                self.repair(REPAIR_PYTHON_LITERAL)
+                return _PYTHON_LITERALS[word], match.end()
+            self.repair(REPAIR_BARE_WORD)
+            return word, match.end()
+        raise LenientJSONError(f"意外的字符 {ch!r}", pos)
+
+    def _is_value_start(self, pos: int) -> bool:
+        """该位置是否可能是一个值（或键）的开始，用于判断是否缺少逗号"""
+        ch = self.text[pos]
+        return ch in "{[\"'-" or ch.isdigit() or _WORD.match(self.text, pos) is not None
+
+    def parse_object(self, pos: int) -> Tuple[dict, int]:
+        text = self.text
+        result = {}
+        expect_member = True
+        while True:
+            pos = self.skip_whitespace(pos)
+            if pos >= self.length:
+                self.truncated(result)
+                return result, pos
+            ch = text[pos]
+            if ch == "}":
+                if result and expect_member:
+                    self.repair(REPAIR_EXTRA_COMMA)
+                return result, pos + 1
+            if ch == "]":
+                # 括号不匹配：对象未闭合，交给外层数组处理
+                self.repair(REPAIR_UNCLOSED_BRACKET)
+                return result, pos
+            if ch == ",":
+                if expect_member:
+                    self.repair(REPAIR_EXTRA_COMMA)
+                expect_member = True
+                pos += 1
+                continue
+            if not expect_member:
+                if not self._is_value_start(pos):
+                    raise LenientJSONError(f"对象中意外的字符 {ch!r}", pos)
+                self.repair(REPAIR_MISSING_COMMA)
+
+            # 键
+            if ch == '"' or ch == "'":
+                key, pos = self.parse_string(pos)
+            else:
+                match = _WORD.match(text, pos)
+                if not match:
+                    raise LenientJSONError(f"对象中意外的字符 {ch!r}", pos)
+                self.repair(REPAIR_UNQUOTED_KEY)
+                key, pos = match.group(), match.end()
+
+            pos = self.skip_whitespace(pos)
+            if pos >= self.length:
+                # 截断在键之后，丢弃这个键
+                self.truncated(result)
+                return result, pos
+            if text[pos] == ":":
+                pos = self.skip_whitespace(pos + 1)
+            elif self._is_value_start(pos):
+                self.repair(REPAIR_MISSING_COLON)
+            else:
+                raise LenientJSONError(f"键后面缺少冒号，遇到 {text[pos]!r}", pos)
+            if pos >= self.length:
+                self.truncated(result)
+                return result, pos
+
+            result[key], pos = self.parse_value(pos)
+            expect_member = False
+
+    def parse_array(self, pos: int) -> Tuple[list, int]:
+        text = self.text
+        result = []
+        expect_item = True
+        while True:
+            pos = self.skip_whitespace(pos)
+            if pos >= self.length:
+                self.truncated(result)
+                return result, pos
+            ch = text[pos]
+            if ch == "]":
+                if result and expect_item:
+                    self.repair(REPAIR_EXTRA_COMMA)
+                return result, pos + 1
+            if ch == "}":
+                # 括号不匹配：数组未闭合，交给外层对象处理
+                self.repair(REPAIR_UNCLOSED_BRACKET)
+                return result, pos
+            if ch == ",":
+                if expect_item:
+                    self.repair(REPAIR_EXTRA_COMMA)
+                expect_item = True
+                pos += 1
+                continue
+            if not expect_item:
+                if not self._is_value_start(pos):
+                    raise LenientJSONError(f"数组中意外的字符 {ch!r}", pos)
+                self.repair(REPAIR_MISSING_COMMA)
+            value, pos = self.parse_value(pos)
+            result.append(value)
+            expect_item = False
+
+    def _closes_string(self, pos: int) -> bool:
+        """
+        判断pos处的引号是否为字符串结束
+
+        引号后（跳过空白）是分隔符或文本结尾时视为结束；引号后有空白且紧接着新的字符串、
+        对象或数组，或者隔着换行时，视为缺少逗号的结束引号；否则视为内容中未转义的引号。
+        """
+        after = self.skip_whitespace(pos + 1)
+        next_char = self.text[after] if after < self.length else ""
+        if next_char in _AFTER_STRING:
+            return True
+        if after > pos + 1 and next_char in "\"'{[":
+            return True
+        return "\n" in self.text[pos + 1:after]
+
+    def parse_string(self, pos: int) -> Tuple[str, int]:
+        text = self.text
+        quote = text[pos]
+        if quote == "'":
+            self.repair(REPAIR_SINGLE_QUOTE)
+        chunk_pattern = _STRING_CHUNKS[quote]
+        parts = []
+        pos += 1
+        while True:
+            match = chunk_pattern.match(text, pos)
+            parts.append(match.group())
+            pos = match.end()
+            if pos >= self.length:
+                self.repair(REPAIR_UNCLOSED_STRING)
+                return "".join(parts), pos
+            ch = text[pos]
+            if ch == quote:
+                if self._closes_string(pos):
+                    return "".join(parts), pos + 1
+                # 字符串内容中未转义的引号
+                self.repair(REPAIR_UNESCAPED_QUOTE)
+                parts.append(ch)
+                pos += 1
+            elif ch == "\\":
+                pos = self._parse_escape(pos, parts)
+            else:
+                # 字符串中的原始换行、制表符等控制字符
+                self.repair(REPAIR_CONTROL_CHARACTER)
+                parts.append(ch)
+                pos += 1
+
+    def _parse_escape(self, pos: int, parts: List[str]) -> int:
+        """解析pos处的转义序列，返回其后的位置"""
+        text = self.text
+        if pos + 1 >= self.length:
+            self.repair(REPAIR_UNCLOSED_STRING)
+            return pos + 1
+        escape = text[pos + 1]
+        if escape in _ESCAPES:
+            parts.append(_ESCAPES[escape])
+            return pos + 2
+        if escape == "u":
+            code = text[pos + 2:pos + 6]
+            try:
+                value = int(code, 16) if len(code) == 4 else None
+            except ValueError:
+                value = None
+            if value is not None:
+                # 代理对
+                if 0xD800 <= value <= 0xDBFF and text[pos + 6:pos + 8] == "\\u":
+                    try:
+                        low = int(text[pos + 8:pos + 12], 16)
+                    except ValueError:
+                        low = 0
+                    if 0xDC00 <= low <= 0xDFFF:
+                        parts.append(chr(0x10000 + ((value - 0xD800) << 10) + (low - 0xDC00)))
+                        return pos + 12
+                parts.append(chr(value))
+                return pos + 6
+        # 无效的转义，保留原样
+        self.repair(REPAIR_INVALID_ESCAPE)
+        parts.append(escape)
+        return pos + 2
+
+
+def lenient_loads(text: str) -> Tuple[Any, List[str]]:
+    """
+    宽松地解析JSON文本
+
+    Args:
+        text: AI返回的原始文本
+
+    Returns:
+        (解析结果, 应用的修复列表) 元组；文本本身是合法JSON时修复列表为空
+
+    Raises:
+        LenientJSONError: 遇到无法修复的错误
+    """
+    try:
+        return json.loads(text), []
+    except (json.JSONDecodeError, TypeError, RecursionError):
+        pass
+    parser = _Parser(text)
+    return parser.parse(), parser.repairs
+
+
+def salvage_array(text: str, field: str) -> Tuple[List[Any], bool]:
+    """
+    从被截断或损坏的响应中取出field数组里完整的元素
+
+    被截断在中间的元素会被丢弃；遇到无法修复的错误时，视为响应在出错位置被截断，
+    保留出错位置之前的完整元素。
+
+    Args:
+        text: AI返回的原始文本
+        field: 顶层对象中数组字段的名称
+
+    Returns:
+        (完整元素列表, 响应是否不完整) 元组
+    """
+    damaged = False
+    parser = _Parser(text)
+    try:
+        data = parser.parse()
+    except LenientJSONError as e:
+        damaged = True
+        parser = _Parser(text[:e.pos])
+        try:
+            data = parser.parse()
+        except LenientJSONError:
+            return [], True
+
+    items = data.get(field) if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return [], True
+    complete = [item for item in items if id(item) not in parser.incomplete]
+    return complete, damaged or bool(parser.incomplete)
@@ -0,0 +1,193 @@
+"""
+多模型路由模块
+
+记录每个模型的响应延迟和健康状况，为请求路由提供依据：
+- 对冲请求：主模型在延迟百分位内仍未返回时，向备用模型发送一份相同请求
+- 故障转移：主模型请求失败时切换到下一个健康的模型
+- 按权重把分块任务分配到各个健康的模型上
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class _ModelStats:
+    """单个模型的路由统计"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=50)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.hedges_launched = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+
+class ModelRouter:
+    """多模型路由器"""
+
+    def __init__(self, unhealthy_after: int = 3, recovery_seconds: float = 60.0):
+        """
+        初始化路由器
+
+        Args:
+            unhealthy_after: 连续失败多少次后视为不健康
+            recovery_seconds: 不健康的模型多少秒后重新参与路由
+        """
+        self.unhealthy_after = unhealthy_after
+        self.recovery_seconds = recovery_seconds
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _ModelStats] = {}
+        # 平滑加权轮询的当前权重
+        self._current_weights: Dict[str, float] = {}
+
+    def _get(self, name: str) -> _ModelStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = _ModelStats()
+            self._stats[name] = stats
+        return stats
+
+    def record_success(self, name: str, latency: float):
+        """记录一次成功请求及其延迟"""
+        with self._lock:
+            stats = self._get(name)
+            stats.latencies.append(latency)
+            stats.successes += 1
+            stats.consecutive_failures = 0
+
+    def record_failure(self, name: str):
+        """记录一次失败请求"""
+        with self._lock:
+            stats = self._get(name)
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.last_failure = time.time()
+
+    def record_hedge(self, name: str, won: bool = False):
+        """记录一次对冲请求（won为True表示对冲请求先返回了有效结果）"""
+        with self._lock:
+            stats = self._get(name)
+            if won:
+                stats.hedges_won += 1
+            else:
+                stats.hedges_launched += 1
+
+    def record_failover(self, name: str):
+        """记录一次从指定模型转移出去的故障转移"""
+        with self._lock:
+            self._get(name).failovers += 1
+
+    def is_healthy(self, name: str) -> bool:
+        """模型是否健康（连续失败过多时在恢复时间内视为不健康）"""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None or stats.consecutive_failures < self.unhealthy_after:
+                return True
+            return time.time() - stats.last_failure > self.recovery_seconds
+
+    def hedge_delay(self, name: str, percentile: float = 90, min_delay: float = 5.0,
+                    default_delay: float = 30.0) -> float:
+        """
+        计算发送对冲请求前的等待时间
+
+        Args:
+            name: 主模型名称
+            percentile: 使用主模型最近延迟的百分位
+            min_delay: 等待时间下限（秒）
+            default_delay: 样本不足时使用的等待时间（秒）
+
+        Returns:
+            等待秒数
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            samples = sorted(stats.latencies) if stats else []
+        if len(samples) < 5:
+            return max(min_delay, default_delay)
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return max(min_delay, samples[index])
+
+    def order_candidates(self, names: List[str], weights: Optional[Dict[str, float]] = None) -> List[str]:
+        """
+        排列候选模型：第一个（主模型）保持在最前，其余健康模型按权重从高到低，
+        不健康的模型排在最后
+
+        Args:
+            names: 候选模型名称列表，第一个为主模型
+            weights: 模型权重
+        """
+        if not names:
+            return []
+        weights = weights or {}
+        primary, others = names[0], names[1:]
+        healthy = [n for n in others if self.is_healthy(n)]
+        unhealthy = [n for n in others if not self.is_healthy(n)]
+        healthy.sort(key=lambda n: weights.get(n, 1), reverse=True)
+        if self.is_healthy(primary):
+            return [primary] + healthy + unhealthy
+        return healthy + [primary] + unhealthy
+
+    def assign(self, count: int, names: List[str], weights: Optional[Dict[str, float]] = None) -> List[str]:
+        """
+        按权重把count个任务分配到健康的模型上（平滑加权轮询）
+
+        Args:
+            count: 任务数量
+            names: 候选模型名称列表
+            weights: 模型权重，未设置的模型权重为1
+
+        Returns:
+            长度为count的模型名称列表
+        """
+        weights = weights or {}
+        healthy = [n for n in names if self.is_healthy(n) and weights.get(n, 1) > 0]
+        if not healthy:
+            healthy = names[:1]
+        total = sum(weights.get(n, 1) for n in healthy)
+
+        assignment = []
+        with self._lock:
+            for _ in range(count):
+                for name in healthy:
+                    self._current_weights[name] = self._current_weights.get(name, 0) + weights.get(name, 1)
+                chosen = max(healthy, key=lambda n: self._current_weights[n])
+                self._current_weights[chosen] -= total
+                assignment.append(chosen)
+        return assignment
+
+    def get_stats(self) -> Dict[str, dict]:
+        """获取各模型的路由统计"""
+        with self._lock:
+            items = list(self._stats.items())
+        result = {}
+        for name, stats in items:
+            samples = sorted(stats.latencies)
+            result[name] = {
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "p50_latency": round(samples[len(samples) // 2], 2) if samples else None,
+                "p90_latency": round(samples[min(len(samples) - 1, int(len(samples) * 0.9))], 2) if samples else None,
+                "hedges_launched": stats.hedges_launched,
+                "hedges_won": stats.hedges_won,
+                "failovers": stats.failovers,
+            }
+        return result
+
+
+# 全局路由器实例，在配置文件生命周期内积累延迟样本
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """获取全局模型路由器"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
@@ -0,0 +1,224 @@
+"""
+近似重复条目检测模块
+
+相邻分块之间的重叠内容和反复讲同一知识点的教材，常常让不同分块生成几乎相同的题目。
+这里对题目/卡片的题干和选项（或答案）取字符n-gram（shingle）集合，用MinHash签名和
+LSH分桶找出可能相似的条目，再用精确的Jaccard相似度确认。每个条目只与落入同一分桶的
+条目比较，几百道题目也能在接近线性的时间内完成去重。中文不需要分词，按字符切分即可。
+"""
+
+import random
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 字符n-gram的长度
+SHINGLE_SIZE = 3
+
+# MinHash签名长度 = 分桶数 × 每桶的行数。相似度为s的两个条目至少落入同一个桶的概率为
+# 1 - (1 - s^4)^16：s=0.8时约为1，s=0.6时约为0.9，s=0.3时约为0.12
+LSH_BANDS = 16
+LSH_ROWS = 4
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(LSH_BANDS * LSH_ROWS)]
+
+# 比较时忽略空白和标点
+_IGNORED = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def item_text(item: Any) -> str:
+    """取出用于比较的文本：题干加选项（选择题）或答案（问答题、知识卡片）"""
+    if not isinstance(item, dict):
+        return str(item)
+    parts = [str(item.get("question", ""))]
+    options = item.get("options")
+    if isinstance(options, list):
+        parts.extend(str(option) for option in options)
+    else:
+        parts.append(str(item.get("answer", "")))
+    return " ".join(parts)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """
+    计算文本的字符n-gram哈希集合
+
+    Args:
+        text: 文本
+        size: n-gram长度
+
+    Returns:
+        n-gram的CRC32哈希集合；文本比size短时整段作为一个n-gram
+    """
+    normalized = _IGNORED.sub("", text.lower())
+    if not normalized:
+        return set()
+    if len(normalized) <= size:
+        return {zlib.crc32(normalized.encode('utf-8'))}
+    return {zlib.crc32(normalized[i:i + size].encode('utf-8')) for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    """两个集合的Jaccard相似度"""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+class NearDuplicateIndex:
+    """按Jaccard相似度检测近似重复文本的增量索引"""
+
+    def __init__(self, threshold: float = 0.8):
+        """
+        初始化索引
+
+        Args:
+            threshold: 相似度达到该值即视为重复（0~1）
+        """
+        self.threshold = threshold
+        self._shingles: List[Set[int]] = []
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        # 每个n-gram在各个哈希函数下的取值；同一批题目中常见的n-gram只计算一次
+        self._permuted: Dict[int, List[int]] = {}
+
+    def _band_keys(self, hashes: Set[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+        """计算MinHash签名并按分桶切分"""
+        vectors = []
+        for h in hashes:
+            vector = self._permuted.get(h)
+            if vector is None:
+                vector = [(a * h + b) % _PRIME for a, b in _PERMUTATIONS]
+                self._permuted[h] = vector
+            vectors.append(vector)
+        signature = list(map(min, zip(*vectors)))
+        return [(band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])) for band in range(LSH_BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def add(self, text: str) -> Optional[int]:
+        """
+        添加文本；与已有文本近似重复时不添加
+
+        Args:
+            text: 要添加的文本
+
+        Returns:
+            与之重复的已有文本的序号（按添加顺序，从0开始）；不重复时返回None
+        """
+        hashes = shingles(text)
+        keys = self._band_keys(hashes) if hashes else []
+        best, best_similarity = None, self.threshold
+        checked = set()
+        for key in keys:
+            for index in self._buckets.get(key, ()):
+                if index in checked:
+                    continue
+                checked.add(index)
+                similarity = jaccard(hashes, self._shingles[index])
+                if similarity >= best_similarity:
+                    best, best_similarity = index, similarity
+        if best is not None:
+            _record_removed()
+            return best
+        index = len(self._shingles)
+        self._shingles.append(hashes)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(index)
+        return None
+
+
+class ChunkDeduplicator:
+    """
+    跨分块去重：按分块结果到达的顺序逐个过滤，已保留（可能已显示给用户）的条目不会
+    再被后到达的条目替换
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        """
+        初始化去重器
+
+        Args:
+            threshold: 相似度阈值
+        """
+        self._index = NearDuplicateIndex(threshold)
+        # 按加入索引的顺序记录保留的条目，用于查找被去除条目与哪个条目重复
+        self._indexed: List[Any] = []
+        # {分块序号: 与该分块被去除条目重复的已保留条目}
+        self.duplicates_of: Dict[int, List[Any]] = {}
+
+    @property
+    def removed(self) -> int:
+        """被去除的条目数"""
+        return sum(len(items) for items in self.duplicates_of.values())
+
+    def filter(self, chunk_index: int, items: List[Any]) -> List[Any]:
+        """
+        过滤一个分块的条目
+
+        Args:
+            chunk_index: 分块序号
+            items: 该分块生成的条目
+
+        Returns:
+            与已保留条目不重复的条目
+        """
+        kept = []
+        for item in items:
+            duplicate_of = self._index.add(item_text(item))
+            if duplicate_of is None:
+                self._indexed.append(item)
+                kept.append(item)
+            else:
+                self.duplicates_of.setdefault(chunk_index, []).append(self._indexed[duplicate_of])
+        return kept
+
+    def accept(self, item: Any) -> bool:
+        """补充生成的条目与已保留条目都不重复时加入并返回True"""
+        if self._index.add(item_text(item)) is not None:
+            return False
+        self._indexed.append(item)
+        return True
+
+
+def deduplicate(items: List[Any], threshold: float = 0.8) -> Tuple[List[Any], List[Tuple[int, int]]]:
+    """
+    去除近似重复的条目，保留先出现的一个
+
+    Args:
+        items: 题目/卡片列表
+        threshold: 相似度阈值
+
+    Returns:
+        (保留的条目, [(被去除条目的序号, 与之重复的条目的序号)])
+    """
+    index = NearDuplicateIndex(threshold)
+    kept_positions = []
+    removed = []
+    for position, item in enumerate(items):
+        duplicate_of = index.add(item_text(item))
+        if duplicate_of is None:
+            kept_positions.append(position)
+        else:
+            removed.append((position, kept_positions[duplicate_of]))
+    return [items[position] for position in kept_positions], removed
+
+
+# 全局统计
+_stats = {"removed": 0}
+_stats_lock = threading.Lock()
+
+
+def _record_removed():
+    with _stats_lock:
+        _stats["removed"] += 1
+
+
+def get_dedup_stats() -> dict:
+    """获取检测到的近似重复条目数"""
+    with _stats_lock:
+        return dict(_stats)
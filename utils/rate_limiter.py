@@ -0,0 +1,324 @@
+"""
+请求速率预算模块
+
+为每个模型维护每分钟请求数（RPM）和每分钟token数（TPM）两个令牌桶。
+发送请求前按提示词和max_tokens估算token消耗，只有预算充足时才放行；
+收到响应后再根据响应中的usage字段修正估算值，多扣的token退回桶中。
+等待预算的请求按优先级类别排队（见request_priority），并为交互请求保留一部分预算。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .cancellation import cancellable_sleep
+from .request_priority import PRIORITY_INTERACTIVE, PRIORITY_NAMES, current_priority, record_priority_wait
+from .token_estimator import estimate_tokens
+
+# 有更高优先级的请求在等待时，低优先级请求再次检查预算前的等待时间（秒）
+PRIORITY_YIELD_INTERVAL = 0.05
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """
+    估算一次请求会计入TPM的token数（提示词 + 最大补全长度）
+
+    Args:
+        messages: 请求消息列表
+        max_tokens: 请求的max_tokens
+
+    Returns:
+        估算的token数
+    """
+    prompt_tokens = 0
+    for message in messages:
+        # 每条消息约有4个token的格式开销
+        prompt_tokens += 4 + estimate_tokens(str(message.get("content", "")))
+    return prompt_tokens + (max_tokens or 0)
+
+
+def extract_usage_tokens(response: Any) -> Optional[int]:
+    """
+    从响应中提取实际消耗的token数
+
+    Args:
+        response: 响应JSON字典或openai SDK的响应对象
+
+    Returns:
+        total_tokens，响应中没有usage字段时返回None
+    """
+    usage = None
+    if isinstance(response, dict):
+        usage = response.get("usage")
+    else:
+        usage = getattr(response, "usage", None)
+    if not usage:
+        return None
+    try:
+        total = usage.get("total_tokens") if hasattr(usage, "get") else getattr(usage, "total_tokens", None)
+        if total is None:
+            prompt = usage.get("prompt_tokens", 0) if hasattr(usage, "get") else getattr(usage, "prompt_tokens", 0)
+            completion = usage.get("completion_tokens", 0) if hasattr(usage, "get") else getattr(usage, "completion_tokens", 0)
+            total = (prompt or 0) + (completion or 0)
+        return int(total) if total else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶"""
+
+    def __init__(self, per_minute: float):
+        """
+        初始化令牌桶
+
+        Args:
+            per_minute: 每分钟补充的令牌数（同时也是桶容量）
+        """
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        """按流逝时间补充令牌"""
+        elapsed = now - self._updated
+        self._updated = now
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0)
+
+    def wait_time(self, amount: float) -> float:
+        """获取攒够指定数量令牌还需等待的秒数（调用前需先refill）"""
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def set_capacity(self, per_minute: float):
+        """修改每分钟令牌数（配置变化时调用）"""
+        self.capacity = float(per_minute)
+        self.tokens = min(self.tokens, self.capacity)
+
+
+class RateBudget:
+    """单个模型的RPM/TPM预算"""
+
+    def __init__(self, key: str, rpm: int = 0, tpm: int = 0, reserve: float = 0.0):
+        """
+        初始化速率预算
+
+        Args:
+            key: 预算标识（通常为模型名称）
+            rpm: 每分钟请求数上限，0表示不限制
+            tpm: 每分钟token数上限，0表示不限制
+            reserve: 为交互请求保留的预算比例（0~1），其他请求不能用掉这一部分
+        """
+        self.key = key
+        self.reserve = reserve
+        self._lock = threading.Lock()
+        # 各优先级类别正在等待预算的请求数
+        self._waiting = [0] * len(PRIORITY_NAMES)
+        self._rpm_bucket = TokenBucket(rpm) if rpm else None
+        self._tpm_bucket = TokenBucket(tpm) if tpm else None
+        self._admitted = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._estimated_tokens = 0
+        self._actual_tokens = 0
+
+    def set_limits(self, rpm: int, tpm: int):
+        """更新RPM/TPM上限"""
+        with self._lock:
+            self._rpm_bucket = self._update_bucket(self._rpm_bucket, rpm)
+            self._tpm_bucket = self._update_bucket(self._tpm_bucket, tpm)
+
+    @staticmethod
+    def _update_bucket(bucket: Optional[TokenBucket], per_minute: int) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        if bucket.capacity != per_minute:
+            bucket.set_capacity(per_minute)
+        return bucket
+
+    def try_reserve(self, tokens: int, priority: Optional[int] = None) -> float:
+        """
+        尝试为一次请求预留预算，不阻塞
+
+        Args:
+            tokens: 估算的token数
+            priority: 优先级类别，默认取当前上下文中的类别
+
+        Returns:
+            0表示已预留成功；否则为预计还需等待的秒数（未预留）
+        """
+        if priority is None:
+            priority = current_priority()
+        with self._lock:
+            if any(self._waiting[:priority]):
+                return PRIORITY_YIELD_INTERVAL
+            # 非交互请求需要在桶中留下保留的部分
+            reserve = 0.0 if priority == PRIORITY_INTERACTIVE else self.reserve
+            now = time.monotonic()
+            wait = 0.0
+            if self._rpm_bucket is not None:
+                self._rpm_bucket.refill(now)
+                capacity = self._rpm_bucket.capacity
+                wait = max(wait, self._rpm_bucket.wait_time(min(1 + reserve * capacity, capacity)))
+            if self._tpm_bucket is not None:
+                self._tpm_bucket.refill(now)
+                # 单个请求超过桶容量时按容量计，否则永远无法放行
+                capacity = self._tpm_bucket.capacity
+                wait = max(wait, self._tpm_bucket.wait_time(min(tokens + reserve * capacity, capacity)))
+            if wait > 0:
+                return wait
+
+            if self._rpm_bucket is not None:
+                self._rpm_bucket.tokens -= 1
+            if self._tpm_bucket is not None:
+                self._tpm_bucket.tokens -= tokens
+            self._admitted += 1
+            self._estimated_tokens += tokens
+            return 0.0
+
+    def _record_wait(self, seconds: float):
+        with self._lock:
+            self._waits += 1
+            self._wait_seconds += seconds
+
+    def _set_waiting(self, priority: int, delta: int):
+        with self._lock:
+            self._waiting[priority] += delta
+
+    def acquire(self, tokens: int, priority: Optional[int] = None):
+        """
+        预留预算，预算不足时按优先级排队等待
+
+        Raises:
+            OperationCancelled: 等待期间当前操作被取消
+        """
+        if priority is None:
+            priority = current_priority()
+        waited = 0.0
+        wait = self.try_reserve(tokens, priority)
+        if wait > 0:
+            self._set_waiting(priority, 1)
+            try:
+                while wait > 0:
+                    # 分段等待，期间其他请求退回的token也能被利用
+                    wait = min(wait, 1.0)
+                    cancellable_sleep(wait)
+                    waited += wait
+                    wait = self.try_reserve(tokens, priority)
+            finally:
+                self._set_waiting(priority, -1)
+            self._record_wait(waited)
+        record_priority_wait(priority, "budget", waited)
+
+    async def acquire_async(self, tokens: int, priority: Optional[int] = None):
+        """在事件循环中预留预算，预算不足时按优先级异步排队等待"""
+        if priority is None:
+            priority = current_priority()
+        waited = 0.0
+        wait = self.try_reserve(tokens, priority)
+        if wait > 0:
+            self._set_waiting(priority, 1)
+            try:
+                while wait > 0:
+                    wait = min(wait, 1.0)
+                    await asyncio.sleep(wait)
+                    waited += wait
+                    wait = self.try_reserve(tokens, priority)
+            finally:
+                self._set_waiting(priority, -1)
+            self._record_wait(waited)
+        record_priority_wait(priority, "budget", waited)
+
+    def reconcile(self, estimated: int, actual: Optional[int]):
+        """
+        根据响应中的实际用量修正TPM桶
+
+        Args:
+            estimated: 发送前预留的token数
+            actual: 响应usage中的total_tokens，为None时不修正
+        """
+        if actual is None:
+            return
+        with self._lock:
+            self._actual_tokens += actual
+            if self._tpm_bucket is not None:
+                self._tpm_bucket.refill(time.monotonic())
+                # 退回多扣的部分（少扣时扣成负数，后续请求会等待补足）
+                self._tpm_bucket.tokens = min(
+                    self._tpm_bucket.capacity,
+                    self._tpm_bucket.tokens + (estimated - actual)
+                )
+
+    def get_stats(self) -> dict:
+        """获取预算统计信息"""
+        with self._lock:
+            return {
+                "rpm_limit": int(self._rpm_bucket.capacity) if self._rpm_bucket else 0,
+                "tpm_limit": int(self._tpm_bucket.capacity) if self._tpm_bucket else 0,
+                "interactive_reserve": self.reserve,
+                "waiting": {PRIORITY_NAMES[priority]: count for priority, count in enumerate(self._waiting)},
+                "admitted": self._admitted,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 2),
+                "estimated_tokens": self._estimated_tokens,
+                "actual_tokens": self._actual_tokens,
+            }
+
+
+class _UnlimitedBudget:
+    """未设置RPM/TPM上限时使用的空预算"""
+
+    def acquire(self, tokens: int, priority: Optional[int] = None):
+        pass
+
+    async def acquire_async(self, tokens: int, priority: Optional[int] = None):
+        pass
+
+    def reconcile(self, estimated: int, actual: Optional[int]):
+        pass
+
+
+UNLIMITED_BUDGET = _UnlimitedBudget()
+
+
+# 全局预算注册表：key -> RateBudget
+_budgets: Dict[str, RateBudget] = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_budget(key: str, rpm: int = 0, tpm: int = 0, reserve: float = 0.0):
+    """
+    获取（或创建）指定模型的速率预算
+
+    Args:
+        key: 预算标识（通常为模型名称）
+        rpm: 每分钟请求数上限，0表示不限制
+        tpm: 每分钟token数上限，0表示不限制
+        reserve: 为交互请求保留的预算比例
+
+    Returns:
+        RateBudget；RPM和TPM都不限制时返回空预算
+    """
+    if not rpm and not tpm:
+        return UNLIMITED_BUDGET
+    with _registry_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = RateBudget(key, rpm, tpm, reserve)
+            _budgets[key] = budget
+            return budget
+    budget.set_limits(rpm, tpm)
+    budget.reserve = reserve
+    return budget
+
+
+def get_all_budget_stats() -> Dict[str, dict]:
+    """获取所有速率预算的统计信息"""
+    with _registry_lock:
+        items = list(_budgets.items())
+    return {key: budget.get_stats() for key, budget in items}
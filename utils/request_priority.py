@@ -0,0 +1,118 @@
+"""
+请求优先级模块
+
+批量生成几十个分块时，所有并发名额和速率预算都被分块请求占用，用户提交答案评估或
+追问时只能排在后面。这里为每个AI请求标记优先级类别：
+- interactive: 追问、语言练习等用户正在等待的交互请求（最高）
+- evaluation: 答案评估
+- prefetch: 单次请求的题目/卡片生成
+- bulk: 分块生成、分层生成中的批量请求（最低）
+
+优先级通过上下文变量传递：入口方法用 request_priority() 设置类别，同一线程（或协程）
+中之后发出的请求都使用该类别；共享线程池和异步引擎会把提交方的上下文带到任务中。
+自适应并发限制器和速率预算按类别排队：有更高优先级的请求在等待时，低优先级请求不会
+抢先占用名额；交互请求还有额外保留的并发名额和速率预算。各类别的排队时间记录在
+get_priority_stats() 中。
+"""
+
+import contextlib
+import contextvars
+import threading
+from typing import Dict
+
+# 优先级类别（数值越小优先级越高）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_EVALUATION = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_BULK = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_EVALUATION: "evaluation",
+    PRIORITY_PREFETCH: "prefetch",
+    PRIORITY_BULK: "bulk",
+}
+
+# 未设置时按单次生成处理
+_current_priority = contextvars.ContextVar("feynman_request_priority", default=PRIORITY_PREFETCH)
+
+
+def current_priority() -> int:
+    """获取当前上下文中请求的优先级类别"""
+    return _current_priority.get()
+
+
+@contextlib.contextmanager
+def request_priority(priority: int):
+    """
+    在上下文中设置请求的优先级类别
+
+    用法：
+        with request_priority(PRIORITY_EVALUATION):
+            response = self._call_ai_api(messages)
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class PriorityWaitStats:
+    """按优先级类别统计请求等待并发名额和速率预算的时间"""
+
+    STAGES = ("slot", "budget")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {stage: {"count": 0, "waited": 0, "total_wait": 0.0, "max_wait": 0.0} for stage in self.STAGES}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def record(self, priority: int, stage: str, seconds: float):
+        """
+        记录一次排队
+
+        Args:
+            priority: 优先级类别
+            stage: 排队阶段（slot: 并发名额，budget: 速率预算）
+            seconds: 等待时间（秒），无需等待时为0
+        """
+        name = PRIORITY_NAMES.get(priority, PRIORITY_NAMES[PRIORITY_PREFETCH])
+        with self._lock:
+            entry = self._stats[name][stage]
+            entry["count"] += 1
+            if seconds > 0:
+                entry["waited"] += 1
+                entry["total_wait"] += seconds
+                entry["max_wait"] = max(entry["max_wait"], seconds)
+
+    def get_stats(self) -> Dict[str, dict]:
+        """获取各类别的排队统计：次数、需要等待的次数、平均和最长等待时间（秒）"""
+        with self._lock:
+            return {
+                name: {
+                    stage: {
+                        "count": entry["count"],
+                        "waited": entry["waited"],
+                        "avg_wait": round(entry["total_wait"] / entry["count"], 3) if entry["count"] else 0.0,
+                        "max_wait": round(entry["max_wait"], 3),
+                    }
+                    for stage, entry in stages.items()
+                }
+                for name, stages in self._stats.items()
+            }
+
+
+_wait_stats = PriorityWaitStats()
+
+
+def record_priority_wait(priority: int, stage: str, seconds: float):
+    """记录一次排队（见PriorityWaitStats.record）"""
+    _wait_stats.record(priority, stage, seconds)
+
+
+def get_priority_stats() -> Dict[str, dict]:
+    """获取各优先级类别的排队统计"""
+    return _wait_stats.get_stats()
@@ -0,0 +1,238 @@
+"""
+AI响应缓存模块
+
+按内容寻址的磁盘缓存：以 (服务商, 模型, temperature, max_tokens, 消息, 校验类型)
+的哈希作为键，保存已经通过 ResponseHandler.parse_and_validate 校验的解析结果。
+缓存命中时既不需要请求API，也不需要重新解析JSON。
+
+缓存文件保存在 data/response_cache 目录下，每个条目一个JSON文件，
+支持总大小上限（按最近使用时间淘汰）和可选的过期时间。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def cache_dir_path() -> str:
+    """获取缓存目录路径（不存在时自动创建）"""
+    cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "response_cache")
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+def make_cache_key(provider: str, model: str, temperature: Any, max_tokens: Any,
+                   messages: List[Dict[str, Any]], schema_type: str = "") -> str:
+    """
+    计算缓存键
+
+    Args:
+        provider: 服务商
+        model: 模型名称
+        temperature: 温度参数
+        max_tokens: 最大token数
+        messages: 请求消息列表
+        schema_type: 校验类型（同一请求按不同schema解析的结果分开缓存）
+
+    Returns:
+        SHA-256十六进制字符串
+    """
+    payload = json.dumps(
+        [provider, model, temperature, max_tokens, messages, schema_type],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """带LRU淘汰和TTL的磁盘响应缓存"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size_mb: float = 50, ttl_hours: float = 0):
+        """
+        初始化响应缓存
+
+        Args:
+            cache_dir: 缓存目录，默认为 data/response_cache
+            max_size_mb: 缓存总大小上限（MB）
+            ttl_hours: 条目过期时间（小时），0表示永不过期
+        """
+        self.cache_dir = cache_dir or cache_dir_path()
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_hours * 3600 if ttl_hours else 0
+        self._lock = threading.Lock()
+        # 内存索引：key -> [文件大小, 最近访问时间]
+        self._index = None
+        self._total_size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """首次访问时扫描缓存目录建立索引"""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_size = 0
+        try:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                self._index[name[:-5]] = [stat.st_size, stat.st_mtime]
+                self._total_size += stat.st_size
+        except OSError as e:
+            print(f"读取响应缓存目录失败: {e}")
+
+    def _remove(self, key: str):
+        entry = self._index.pop(key, None)
+        if entry:
+            self._total_size -= entry[0]
+        try:
+            os.remove(self._path_for(key))
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的解析结果，未命中或已过期时返回None
+        """
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self._misses += 1
+                return None
+
+            path = self._path_for(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                self._misses += 1
+                return None
+
+            if self.ttl_seconds and time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                self._remove(key)
+                self._misses += 1
+                return None
+
+            # 更新最近访问时间（用于LRU淘汰）
+            now = time.time()
+            self._index[key][1] = now
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+
+            self._hits += 1
+            return entry.get("data")
+
+    def put(self, key: str, data: Any):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            data: 已校验的解析结果（必须可JSON序列化）
+        """
+        try:
+            content = json.dumps({"created_at": time.time(), "data": data}, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            print(f"响应缓存序列化失败: {e}")
+            return
+
+        size = len(content.encode("utf-8"))
+        if size > self.max_size_bytes:
+            return
+
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._total_size -= self._index[key][0]
+
+            path = self._path_for(key)
+            tmp_path = path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"写入响应缓存失败: {e}")
+                self._index.pop(key, None)
+                return
+
+            self._index[key] = [size, time.time()]
+            self._total_size += size
+            self._evict_if_needed()
+
+    def _evict_if_needed(self):
+        """超过大小上限时按最近访问时间淘汰旧条目"""
+        if self._total_size <= self.max_size_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self._total_size <= self.max_size_bytes:
+                break
+            self._remove(key)
+            self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index.keys()):
+                self._remove(key)
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            self._load_index()
+            return {
+                "entries": len(self._index),
+                "size_bytes": self._total_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+# 全局缓存实例
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(max_size_mb: float = 50, ttl_hours: float = 0) -> ResponseCache:
+    """
+    获取全局响应缓存实例
+
+    Args:
+        max_size_mb: 缓存总大小上限（MB）
+        ttl_hours: 条目过期时间（小时），0表示永不过期
+
+    Returns:
+        ResponseCache实例（配置变化时更新上限和过期时间）
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(max_size_mb=max_size_mb, ttl_hours=ttl_hours)
+        else:
+            _cache.max_size_bytes = int(max_size_mb * 1024 * 1024)
+            _cache.ttl_seconds = ttl_hours * 3600 if ttl_hours else 0
+        return _cache
@@ -1,11 +1,139 @@
 """AI响应处理工具"""
 import json
-import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+
+from .lenient_json import REPAIR_TRUNCATED, lenient_loads, salvage_array
+
+def _object_schema(properties: Dict[str, Any], required: List[str]) -> Dict[str, Any]:
+    """构建JSON对象schema"""
+    return {"type": "object", "properties": properties, "required": required}
+
+
+_STRING = {"type": "string"}
+_STRING_ARRAY = {"type": "array", "items": {"type": "string"}}
+
+# 各类型响应的JSON Schema：既用于服务商的结构化输出模式，也用于校验解析后的响应（_check_schema）
+_CARD_SCHEMA = _object_schema(
+    {
+        "cards": {
+            "type": "array",
+            "items": _object_schema(
+                {"question": _STRING, "answer": _STRING, "context": _STRING},
+                ["question", "answer", "context"]
+            )
+        }
+    },
+    ["cards"]
+)
+
+# 各schema类型中存放题目/卡片列表的字段
+ITEM_FIELDS = {
+    "choice_question": "questions",
+    "essay_question": "questions",
+    "knowledge_card": "cards",
+    "cloze_card": "cards",
+}
+
+JSON_SCHEMAS = {
+    "choice_question": _object_schema(
+        {
+            "questions": {
+                "type": "array",
+                "items": _object_schema(
+                    {
+                        "question": _STRING,
+                        "options": {"type": "array", "items": _STRING, "minItems": 4, "maxItems": 4},
+                        "correct_answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+                        "explanation": _STRING,
+                        "source_content": _STRING
+                    },
+                    ["question", "options", "correct_answer", "explanation", "source_content"]
+                )
+            }
+        },
+        ["questions"]
+    ),
+    "knowledge_card": _CARD_SCHEMA,
+    "cloze_card": _CARD_SCHEMA,
+    "essay_question": _object_schema(
+        {
+            "questions": {
+                "type": "array",
+                "items": _object_schema(
+                    {
+                        "question": _STRING,
+                        "reference_answer": _STRING,
+                        "key_points": {"type": "array", "items": _STRING, "minItems": 3},
+                        "source_content": _STRING
+                    },
+                    ["question", "reference_answer", "key_points", "source_content"]
+                )
+            }
+        },
+        ["questions"]
+    ),
+    "essay_evaluation": _object_schema(
+        {
+            "score": {"type": "number"},
+            "feedback": _STRING,
+            "covered_points": _STRING_ARRAY,
+            "missing_points": _STRING_ARRAY,
+            "suggestions": _STRING_ARRAY
+        },
+        ["score", "feedback", "covered_points", "missing_points", "suggestions"]
+    ),
+}
+
+# _check_schema支持的类型，bool虽然是int的子类，但不算数字
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "number": (int, float)}
+_TYPE_NAMES = {"object": "对象", "array": "数组", "string": "字符串", "number": "数字"}
+
+
+def _check_schema(value: Any, schema: Dict[str, Any], path: str) -> None:
+    """
+    按JSON_SCHEMAS中用到的JSON Schema子集（type、properties、required、items、
+    minItems、maxItems、enum）校验数据
+    
+    Args:
+        value: 要校验的数据
+        schema: JSON Schema
+        path: 数据在响应中的位置，用于错误信息
+        
+    Raises:
+        ValueError: 数据不符合schema
+    """
+    schema_type = schema["type"]
+    if not isinstance(value, _JSON_TYPES[schema_type]) or isinstance(value, bool):
+        raise ValueError(f"返回的JSON格式不正确：{path}必须是{_TYPE_NAMES[schema_type]}")
+    if "enum" in schema and value not in schema["enum"]:
+        raise ValueError(f"返回的JSON格式不正确：{path}必须是{'、'.join(schema['enum'])}之一")
+    if schema_type == "object":
+        missing = [key for key in schema.get("required", []) if key not in value]
+        if missing:
+            raise ValueError(f"返回的JSON格式不正确：{path}缺少{', '.join(missing)}字段")
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in value:
+                _check_schema(value[key], property_schema, f"{path}.{key}")
+    elif schema_type == "array":
+        if len(value) < schema.get("minItems", 0):
+            raise ValueError(f"返回的JSON格式不正确：{path}至少需要{schema['minItems']}项")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            raise ValueError(f"返回的JSON格式不正确：{path}最多只能有{schema['maxItems']}项")
+        for index, item in enumerate(value):
+            _check_schema(item, schema["items"], f"{path}[{index}]")
+
 
 class ResponseHandler:
     """处理AI响应的工具类"""
     
+    @staticmethod
+    def get_json_schema(schema_type: str) -> Dict[str, Any]:
+        """获取指定类型对应的JSON Schema（与validate的校验规则一致）"""
+        schema = JSON_SCHEMAS.get(schema_type)
+        if schema is None:
+            raise ValueError(f"未知的schema类型：{schema_type}")
+        return schema
+    
     @staticmethod
     def clean_response(response: str) -> str:
         """清理AI响应文本，移除代码块标记等"""
@@ -22,297 +150,87 @@ class ResponseHandler:
         
         return cleaned
     
-    @staticmethod
-    def fix_incomplete_json(json_str: str) -> str:
-        """修复不完整的JSON字符串"""
-        # 处理末尾不完整的情况
-        if not json_str.endswith("}"):
-            # 尝试找到最后一个完整的对象
-            last_complete = json_str.rfind('        }')
-            if last_complete != -1:
-                json_str = json_str[:last_complete + 9] + "\n    ]\n}"
-        return json_str
-    
-    @staticmethod
-    def advanced_json_fix(json_str: str) -> str:
-        """高级JSON修复，处理各种常见的JSON格式错误"""
-        # 1. 尝试修复缺少逗号的问题
-        # 查找可能缺少逗号的位置 - 通常是在对象或数组项之后
-        pattern = r'(["}\]])\s*\n\s*(["{\[])'
-        json_str = re.sub(pattern, r'\1,\n\2', json_str)
-        
-        # 特别处理题目列表中可能缺少的逗号
-        # 例如："question": "问题内容"\n    "options": 之间缺少逗号
-        pattern_question = r'("question":\s*"[^"]*")\s*\n\s*(")'
-        json_str = re.sub(pattern_question, r'\1,\n    \2', json_str)
-        
-        # 处理选项之间缺少的逗号
-        pattern_options = r'("options":\s*\[\s*(?:"[^"]*",\s*)*"[^"]*")\s*\n\s*(")'
-        json_str = re.sub(pattern_options, r'\1,\n    \2', json_str)
-        
-        # 处理correct_answer后缺少的逗号
-        pattern_correct = r'("correct_answer":\s*"[^"]*")\s*\n\s*(")'
-        json_str = re.sub(pattern_correct, r'\1,\n    \2', json_str)
-        
-        # 处理explanation后缺少的逗号
-        pattern_explanation = r'("explanation":\s*"[^"]*")\s*\n\s*(")'
-        json_str = re.sub(pattern_explanation, r'\1,\n    \2', json_str)
-        
-        # 处理key_points后缺少的逗号
-        pattern_key_points = r'("key_points":\s*\[[^\]]*\])\s*\n\s*(")'
-        json_str = re.sub(pattern_key_points, r'\1,\n    \2', json_str)
-        
-        # 处理reference_answer后缺少的逗号
-        pattern_reference = r'("reference_answer":\s*"[^"]*")\s*\n\s*(")'
-        json_str = re.sub(pattern_reference, r'\1,\n    \2', json_str)
-        
-        # 2. 修复多余的逗号
-        # 数组末尾多余的逗号
-        json_str = re.sub(r',\s*\]', r']', json_str)
-        # 对象末尾多余的逗号
-        json_str = re.sub(r',\s*\}', r'}', json_str)
-        
-        # 3. 修复未闭合的引号
-        # 这是一个简化的处理，实际上引号不匹配的问题很复杂
-        # 计算引号数量，如果是奇数，尝试找到可能缺少引号的位置
-        if json_str.count('"') % 2 != 0:
-            lines = json_str.split('\n')
-            for i, line in enumerate(lines):
-                # 如果一行中有奇数个引号，可能是这行缺少引号
-                if line.count('"') % 2 != 0:
-                    # 检查是否是值的结尾缺少引号
-                    if ':' in line and line.rstrip()[-1] not in ['"', '}', ']', ',']:
-                        lines[i] = line + '"'
-            json_str = '\n'.join(lines)
-        
-        # 4. 确保JSON对象和数组的完整性
-        # 检查大括号是否匹配
-        if json_str.count('{') > json_str.count('}'):
-            json_str += '}'
-        # 检查方括号是否匹配
-        if json_str.count('[') > json_str.count(']'):
-            json_str += ']'
-        
-        # 5. 处理特定位置的格式问题
-        # 检查第13行附近是否缺少逗号（根据错误信息）
-        lines = json_str.split('\n')
-        if len(lines) >= 13:
-            line12 = lines[12] if len(lines) > 12 else ""
-            line13 = lines[13] if len(lines) > 13 else ""
-            
-            # 如果第12行结束没有逗号，且第13行开始是一个新的键
-            if line12 and line13 and not line12.rstrip().endswith(',') and re.match(r'\s*"[^"]+"\s*:', line13):
-                lines[12] = line12.rstrip() + ','
-                json_str = '\n'.join(lines)
-        
-        return json_str
-    
-    @staticmethod
-    def deep_json_fix(json_str: str) -> str:
-        """深度JSON修复，处理更复杂的格式问题
-        
-        这个方法尝试通过更激进的方式修复JSON，适用于常规修复方法失败的情况
+    def validate(self, data: Any, schema_type: str) -> None:
         """
-        # 首先尝试识别JSON的基本结构
-        # 大多数情况下，我们期望的是一个包含questions数组的对象
-        
-        # 1. 确保最外层是一个对象
-        json_str = json_str.strip()
-        if not json_str.startswith('{'):
-            json_str = '{' + json_str
-        if not json_str.endswith('}'):
-            json_str = json_str + '}'
-            
-        # 2. 尝试识别和修复questions数组
-        questions_match = re.search(r'"questions"\s*:\s*\[', json_str)
-        if questions_match:
-            # 找到questions数组的开始位置
-            start_pos = questions_match.end()
-            # 尝试找到数组的结束位置
-            bracket_count = 1  # 已经遇到了一个[
-            end_pos = len(json_str)
-            
-            for i in range(start_pos, len(json_str)):
-                if json_str[i] == '[':
-                    bracket_count += 1
-                elif json_str[i] == ']':
-                    bracket_count -= 1
-                    if bracket_count == 0:
-                        end_pos = i + 1
-                        break
-            
-            # 提取questions数组内容
-            questions_content = json_str[start_pos:end_pos-1]  # 不包括最后的]
-            
-            # 分割成单独的问题对象
-            question_objects = []
-            object_start = 0
-            bracket_count = 0
-            in_string = False
-            escape_next = False
-            
-            for i, char in enumerate(questions_content):
-                if escape_next:
-                    escape_next = False
-                    continue
-                    
-                if char == '\\':
-                    escape_next = True
-                elif char == '"' and not escape_next:
-                    in_string = not in_string
-                elif not in_string:
-                    if char == '{':
-                        if bracket_count == 0:
-                            object_start = i
-                        bracket_count += 1
-                    elif char == '}':
-                        bracket_count -= 1
-                        if bracket_count == 0:
-                            # 找到一个完整的问题对象
-                            question_obj = questions_content[object_start:i+1]
-                            # 尝试修复这个对象
-                            fixed_obj = ResponseHandler.fix_question_object(question_obj)
-                            question_objects.append(fixed_obj)
-            
-            # 重建questions数组
-            fixed_questions = ',\n'.join(question_objects)
-            fixed_json = json_str[:start_pos] + fixed_questions + json_str[end_pos-1:]
-            
-            return fixed_json
+        按schema类型对应的JSON Schema校验解析后的响应
         
-        return json_str
-    
-    @staticmethod
-    def fix_question_object(question_obj: str) -> str:
-        """修复单个问题对象的JSON格式"""
-        # 确保对象的开始和结束
-        question_obj = question_obj.strip()
-        if not question_obj.startswith('{'):
-            question_obj = '{' + question_obj
-        if not question_obj.endswith('}'):
-            question_obj = question_obj + '}'
+        Args:
+            data: 解析后的响应
+            schema_type: 模式类型，见JSON_SCHEMAS
             
-        # 使用正则表达式找出所有键值对
-        pairs = re.findall(r'"([^"]+)"\s*:\s*("(?:\\.|[^"\\])*"|[\[\{].*?[\]\}]|\d+|true|false|null)', question_obj, re.DOTALL)
+        Raises:
+            ValueError: 未知的schema类型，或数据不符合schema
+        """
+        _check_schema(data, self.get_json_schema(schema_type), "响应")
+
+    def validate_item(self, item: Dict[str, Any], schema_type: str) -> bool:
+        """
+        按schema校验单个题目/卡片
         
-        # 重建对象，确保键值对之间有逗号
-        if pairs:
-            fixed_obj = '{\n'
-            for i, (key, value) in enumerate(pairs):
-                fixed_obj += f'    "{key}": {value}'
-                if i < len(pairs) - 1:
-                    fixed_obj += ',\n'
-                else:
-                    fixed_obj += '\n'
-            fixed_obj += '}'
-            return fixed_obj
+        Args:
+            item: 单个题目或卡片
+            schema_type: 模式类型，需为ITEM_FIELDS中的类型
             
-        return question_obj
-        
-    @staticmethod
-    def try_multiple_fixes(response: str) -> str:
-        """尝试多种方法修复JSON"""
-        # 首先进行基本清理
-        cleaned = ResponseHandler.clean_response(response)
-        
-        # 尝试直接解析
-        try:
-            json.loads(cleaned)
-            return cleaned
-        except json.JSONDecodeError:
-            pass
-        
-        # 尝试基本的不完整JSON修复
-        fixed = ResponseHandler.fix_incomplete_json(cleaned)
+        Returns:
+            是否通过校验
+        """
+        field = ITEM_FIELDS.get(schema_type)
+        if field is None:
+            raise ValueError(f"schema类型不包含条目列表：{schema_type}")
         try:
-            json.loads(fixed)
-            return fixed
-        except json.JSONDecodeError:
-            pass
+            self.validate({field: [item]}, schema_type)
+            return True
+        except ValueError:
+            return False
+
+    def parse_structured(self, response: str, schema_type: str):
+        """解析结构化输出模式下的响应，直接解析失败时才进入修复流程
         
-        # 尝试高级修复
-        advanced_fixed = ResponseHandler.advanced_json_fix(cleaned)
-        try:
-            json.loads(advanced_fixed)
-            return advanced_fixed
-        except json.JSONDecodeError:
-            pass
+        Args:
+            response: AI的原始响应文本
+            schema_type: 模式类型，同parse_and_validate
+            
+        Returns:
+            (解析后的JSON对象, 是否经过了修复流程) 元组
             
-        # 尝试深度修复
-        deep_fixed = ResponseHandler.deep_json_fix(cleaned)
+        Raises:
+            ValueError: 当JSON解析失败或验证失败时
+        """
         try:
-            json.loads(deep_fixed)
-            return deep_fixed
-        except json.JSONDecodeError:
+            data = json.loads(self.clean_response(response))
+            self.validate(data, schema_type)
+            return data, False
+        except (json.JSONDecodeError, ValueError, TypeError, KeyError):
             pass
-        
-        # 如果所有修复都失败，返回原始清理后的文本
-        # 让json.loads抛出具体的错误信息
-        return cleaned
+        return self.parse_and_validate(response, schema_type), True
 
-    def validate_choice_question(self, data: Dict[str, Any]) -> None:
-        """验证选择题格式"""
-        if not isinstance(data, dict) or "questions" not in data:
-            raise ValueError("返回的JSON格式不正确：缺少questions字段")
+    def salvage(self, response: str, schema_type: str, expected_count: Optional[int] = None) -> Tuple[dict, int]:
+        """从被截断或损坏的响应中保留每个完整且通过校验的题目/卡片
         
-        for q in data["questions"]:
-            if not all(key in q for key in ["question", "options", "correct_answer", "explanation", "source_content"]):
-                raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-            if not isinstance(q["options"], list) or len(q["options"]) != 4:
-                raise ValueError("返回的JSON格式不正确：选项数量不正确")
-            if q["correct_answer"] not in ["A", "B", "C", "D"]:
-                raise ValueError("返回的JSON格式不正确：正确答案必须是A、B、C、D之一")
-
-    def validate_knowledge_card(self, data: Dict[str, Any]) -> None:
-        """验证知识卡片格式"""
-        if not isinstance(data, dict) or "cards" not in data:
-            raise ValueError("返回的JSON格式不正确：缺少cards字段")
-        
-        for card in data["cards"]:
-            if not all(key in card for key in ["question", "answer", "context"]):
-                raise ValueError("返回的JSON格式不正确：卡片数据结构不完整")
-            if not all(isinstance(card[key], str) for key in ["question", "answer", "context"]):
-                raise ValueError("返回的JSON格式不正确：字段值必须是字符串")
-
-    def validate_essay_evaluation(self, data: Dict[str, Any]) -> None:
-        """验证问答评估格式"""
-        required_fields = ["score", "feedback", "covered_points", "missing_points", "suggestions"]
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            raise ValueError(f"AI返回的JSON缺少必要字段：{', '.join(missing_fields)}")
-        
-        if not isinstance(data["score"], (int, float)):
-            raise ValueError("score必须是数字")
-        if not isinstance(data["feedback"], str):
-            raise ValueError("feedback必须是字符串")
-        if not isinstance(data["covered_points"], list):
-            raise ValueError("covered_points必须是数组")
-        if not isinstance(data["missing_points"], list):
-            raise ValueError("missing_points必须是数组")
-        if not isinstance(data["suggestions"], list):
-            raise ValueError("suggestions必须是数组")
-
-    def validate_cloze_card(self, data: Dict[str, Any]) -> None:
-        """验证填空卡片格式"""
-        if not isinstance(data, dict) or "cards" not in data:
-            raise ValueError("返回的JSON格式不正确：缺少cards字段")
-        
-        for card in data["cards"]:
-            if not all(key in card for key in ["question", "answer", "context"]):
-                raise ValueError("返回的JSON格式不正确：卡片数据结构不完整")
-            if not all(isinstance(card[key], str) for key in ["question", "answer", "context"]):
-                raise ValueError("返回的JSON格式不正确：字段值必须是字符串")
-    
-    def validate_essay_question(self, data: Dict[str, Any]) -> None:
-        """验证问答题格式"""
-        if not isinstance(data, dict) or "questions" not in data:
-            raise ValueError("返回的JSON格式不正确：缺少questions字段")
-        
-        for q in data["questions"]:
-            if not all(key in q for key in ["question", "reference_answer", "key_points", "source_content"]):
-                raise ValueError("返回的JSON格式不正确：问题数据结构不完整")
-            if not isinstance(q["key_points"], list) or len(q["key_points"]) < 3:
-                raise ValueError("返回的JSON格式不正确：关键点数量不足")
+        Args:
+            response: AI的原始响应文本
+            schema_type: 模式类型，需为ITEM_FIELDS中的类型
+            expected_count: 请求生成的数量，用于计算缺少的数量
+            
+        Returns:
+            (只包含保留条目的结果, 缺少的条目数) 元组；未提供expected_count时，
+            缺少数为被丢弃的条目数（被截断的条目计为1个）
+            
+        Raises:
+            ValueError: 没有任何可以保留的条目
+        """
+        field = ITEM_FIELDS.get(schema_type)
+        if field is None:
+            raise ValueError(f"schema类型不包含条目列表：{schema_type}")
+        items, incomplete = salvage_array(response, field)
+        valid = [item for item in items if self.validate_item(item, schema_type)]
+        if not valid:
+            raise ValueError("响应中没有可以保留的完整条目")
+        if expected_count:
+            missing_count = max(0, expected_count - len(valid))
+        else:
+            missing_count = len(items) - len(valid) + (1 if incomplete else 0)
+        return {field: valid}, missing_count
 
     def parse_and_validate(self, response: str, schema_type: str) -> dict:
         """解析并验证JSON响应
@@ -331,80 +249,19 @@ class ResponseHandler:
         debug_info = f"尝试解析{schema_type}类型的JSON..."
         
         try:
-            # 尝试从文本中提取JSON部分（删除前导和尾随文本）
-            json_text = response
-            
-            # 查找JSON的开始位置
-            json_start = response.find('{')
-            if json_start > 0:
-                # 如果JSON不是从开头开始，则可能有前导文本
-                debug_info += f"\n发现前导文本，JSON从位置{json_start}开始。"
-                json_text = response[json_start:]
-            
-            # 查找JSON的结束位置（找到最后一个闭合的大括号）
-            json_end = len(json_text)
-            stack = []
-            for i, char in enumerate(json_text):
-                if char == '{':
-                    stack.append(i)
-                elif char == '}':
-                    if stack:
-                        stack.pop()
-                        if not stack:  # 如果栈为空，意味着我们找到了最后匹配的闭合括号
-                            json_end = i + 1
-                            break
-            
-            if json_end < len(json_text):
-                # 如果找到了闭合括号且不在文本末尾，可能有尾随文本
-                debug_info += f"\n发现尾随文本，JSON在位置{json_end}结束。"
-                json_text = json_text[:json_end]
-            
-            # 尝试多种方法修复JSON
-            fixed = self.try_multiple_fixes(json_text)
-            debug_info += "\n尝试修复JSON格式..."
-            
-            # 解析JSON
+            # 一次扫描完成提取和修复（前后说明文字、代码块、逗号、引号、未闭合的括号等）
             try:
-                data = json.loads(fixed)
-                debug_info += "\nJSON解析成功!"
-            except json.JSONDecodeError as e:
-                debug_info += f"\nJSON解析失败: {str(e)}，尝试额外的修复方法..."
-                
-                # 尝试修复引号问题
-                fixed = fixed.replace("'", '"')  # 将单引号替换为双引号
-                
-                # 尝试修复常见的问题，如尾部逗号
-                fixed = re.sub(r',\s*}', '}', fixed)  # 删除对象结尾的逗号
-                fixed = re.sub(r',\s*]', ']', fixed)  # 删除数组结尾的逗号
-                
-                # 如果是选择题，尝试修复options数组格式
-                if schema_type == "choice_question":
-                    # 查找并修复options数组中可能的格式问题
-                    options_pattern = r'"options"\s*:\s*\[(.*?)\]'
-                    for match in re.finditer(options_pattern, fixed, re.DOTALL):
-                        options_content = match.group(1)
-                        if ',' not in options_content:
-                            # 可能缺少逗号，尝试添加
-                            fixed_options = re.sub(r'("[^"]*")\s*("[^"]*")', r'\1, \2', options_content)
-                            fixed = fixed.replace(options_content, fixed_options)
-                
-                data = json.loads(fixed)
-                debug_info += "\n额外修复后JSON解析成功!"
+                data, repairs = lenient_loads(response)
+            except ValueError as e:
+                raise json.JSONDecodeError(str(e), response, getattr(e, "pos", 0))
+            if repairs:
+                debug_info += f"\n已修复：{', '.join(repairs)}"
+            if REPAIR_TRUNCATED in repairs and schema_type in ITEM_FIELDS:
+                # 最后一个条目可能只有一半，交给salvage只保留完整的条目
+                raise ValueError("响应被截断，最后一个条目可能不完整")
             
             # 根据类型验证
-            validator_map = {
-                "choice_question": self.validate_choice_question,
-                "knowledge_card": self.validate_knowledge_card,
-                "essay_evaluation": self.validate_essay_evaluation,
-                "cloze_card": self.validate_cloze_card,
-                "essay_question": self.validate_essay_question
-            }
-            
-            validator = validator_map.get(schema_type)
-            if not validator:
-                raise ValueError(f"未知的schema类型：{schema_type}")
-            
-            validator(data)
+            self.validate(data, schema_type)
             return data
             
         except json.JSONDecodeError as e:
@@ -0,0 +1,393 @@
+"""
+请求重试策略模块
+
+统一处理AI API请求的重试：
+- 429 限流：优先遵循响应中的 Retry-After，否则按退避时间等待
+- 408 / 5xx / 连接错误 / 超时：按带去相关抖动（decorrelated jitter）的指数退避重试
+- 其他 4xx（参数错误、鉴权失败等）：不重试，直接失败
+- 每个端点维护一个熔断器，连续失败达到阈值后在冷却时间内直接快速失败
+- 当前操作被取消时不再重试，重试前的等待也立即结束
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .adaptive_concurrency import get_error_status
+from .cancellation import OperationCancelled, cancellable_sleep, check_cancelled
+
+
+class APIRequestError(Exception):
+    """API请求失败（已按重试策略处理）时抛出的异常"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpenError(APIRequestError):
+    """端点熔断期间快速失败时抛出的异常"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"端点 {endpoint} 暂时不可用（连续请求失败），请在{retry_in:.0f}秒后重试")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+# 错误分类
+RATE_LIMITED = "rate_limited"   # 429，服务端可用但限流
+SERVER_ERROR = "server"         # 408 / 5xx
+TRANSIENT = "transient"         # 连接错误、超时
+FATAL = "fatal"                 # 其他错误，不重试
+
+
+def _has_class_name(error: BaseException, *fragments: str) -> bool:
+    """检查异常类型（包括父类）名称是否包含指定片段"""
+    for cls in type(error).__mro__:
+        if any(fragment in cls.__name__ for fragment in fragments):
+            return True
+    return False
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    对请求异常进行分类
+
+    Args:
+        error: 请求过程中抛出的异常
+
+    Returns:
+        RATE_LIMITED、SERVER_ERROR、TRANSIENT 或 FATAL
+    """
+    if isinstance(error, APIRequestError):
+        return FATAL
+    status = get_error_status(error)
+    if status == 429:
+        # 额度用尽同样返回429，但重试没有意义
+        if getattr(error, "code", None) == "insufficient_quota":
+            return FATAL
+        return RATE_LIMITED
+    if status is not None:
+        if status == 408 or status >= 500:
+            return SERVER_ERROR
+        return FATAL
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return TRANSIENT
+    # requests.ConnectionError / Timeout、aiohttp.ClientConnectionError、openai.error.APIConnectionError 等
+    if _has_class_name(error, "Timeout", "Connection", "TryAgain"):
+        return TRANSIENT
+    return FATAL
+
+
+def _get_header(headers: Any, name: str) -> Optional[str]:
+    """不区分大小写地读取响应头"""
+    if not headers:
+        return None
+    try:
+        value = headers.get(name)
+        if value is not None:
+            return value
+        lower = name.lower()
+        for key, value in headers.items():
+            if str(key).lower() == lower:
+                return value
+    except AttributeError:
+        pass
+    return None
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """
+    从异常携带的响应头中解析 Retry-After（秒）
+
+    支持秒数、HTTP日期以及部分服务商使用的 retry-after-ms。
+    """
+    headers = getattr(error, "headers", None)
+    if not headers:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = _get_header(headers, "retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+
+    value = _get_header(headers, "Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_time.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """重试策略"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 最大尝试次数（包括第一次请求）
+            base_delay: 退避的基础等待时间（秒）
+            max_delay: 单次等待时间上限（秒），Retry-After 不受此限制
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind: str, attempt: int) -> bool:
+        """判断第attempt次尝试失败后是否继续重试"""
+        return kind != FATAL and attempt < self.max_attempts
+
+    def compute_delay(self, error: BaseException, previous_delay: float) -> float:
+        """
+        计算下一次重试前的等待时间
+
+        Args:
+            error: 本次失败的异常
+            previous_delay: 上一次的等待时间（首次为0）
+
+        Returns:
+            等待秒数
+        """
+        retry_after = parse_retry_after(error)
+        if retry_after is not None:
+            # 遵循服务端要求，加少量抖动避免所有请求同时恢复
+            return retry_after + random.uniform(0, self.base_delay)
+        # 去相关抖动：sleep = min(cap, random(base, previous * 3))
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+
+class CircuitBreaker:
+    """单个端点的熔断器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            endpoint: 端点地址
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断后多少秒允许一次探测请求
+        """
+        self.endpoint = endpoint
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._trips = 0
+        self._fast_failures = 0
+
+    def before_call(self):
+        """
+        请求前检查熔断状态
+
+        Raises:
+            CircuitOpenError: 熔断中，直接失败
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.cooldown - time.time()
+            if self.state == self.OPEN and remaining <= 0:
+                # 冷却结束，放行一次探测请求
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._fast_failures += 1
+            raise CircuitOpenError(self.endpoint, max(remaining, 0.0))
+
+    def record_success(self):
+        """请求成功：关闭熔断器"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"端点 {self.endpoint} 已恢复，关闭熔断")
+            self.state = self.CLOSED
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """请求失败（5xx、超时、连接错误）：累计失败次数，达到阈值后熔断"""
+        with self._lock:
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._trips += 1
+                    print(f"端点 {self.endpoint} 连续失败{self._consecutive_failures}次，熔断{self.cooldown:.0f}秒")
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+    def record_neutral(self):
+        """请求结果不反映端点可用性（如限流、参数错误）：只释放探测名额"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def get_stats(self) -> dict:
+        """获取熔断器统计信息"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._consecutive_failures,
+                "trips": self._trips,
+                "fast_failures": self._fast_failures,
+            }
+
+
+# 全局熔断器注册表与重试统计
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+_metrics = {"attempts": 0, "retries": 0, "retry_wait_seconds": 0.0, "gave_up": 0}
+_metrics_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str, failure_threshold: int = 5, cooldown: float = 30.0) -> CircuitBreaker:
+    """
+    获取（或创建）端点对应的熔断器
+
+    Args:
+        endpoint: 端点地址
+        failure_threshold: 连续失败多少次后熔断
+        cooldown: 熔断冷却时间（秒）
+    """
+    with _registry_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, failure_threshold, cooldown)
+            _breakers[endpoint] = breaker
+        else:
+            breaker.failure_threshold = max(1, failure_threshold)
+            breaker.cooldown = cooldown
+        return breaker
+
+
+def _record_metric(name: str, value: float = 1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def _on_attempt_failed(breaker: CircuitBreaker, error: BaseException) -> str:
+    """记录失败结果到熔断器，返回错误分类"""
+    kind = classify_error(error)
+    if kind in (SERVER_ERROR, TRANSIENT):
+        breaker.record_failure()
+    else:
+        breaker.record_neutral()
+    return kind
+
+
+def call_with_retry(endpoint: str, func: Callable[[], Any], policy: Optional[RetryPolicy] = None,
+                    breaker: Optional[CircuitBreaker] = None) -> Any:
+    """
+    按重试策略执行同步请求
+
+    Args:
+        endpoint: 端点地址（用于熔断器和日志）
+        func: 执行一次请求的函数
+        policy: 重试策略，默认为RetryPolicy()
+        breaker: 熔断器，默认使用该端点的全局熔断器
+
+    Returns:
+        func的返回值
+
+    Raises:
+        CircuitOpenError: 端点熔断中
+        OperationCancelled: 当前操作被取消
+        Exception: 不可重试的错误，或重试次数用完后的最后一个错误
+    """
+    policy = policy or RetryPolicy()
+    breaker = breaker or get_circuit_breaker(endpoint)
+    delay = 0.0
+    attempt = 0
+    while True:
+        attempt += 1
+        check_cancelled()
+        breaker.before_call()
+        _record_metric("attempts")
+        try:
+            result = func()
+        except OperationCancelled:
+            # 请求被取消，不影响熔断判断
+            breaker.record_neutral()
+            raise
+        except Exception as e:
+            kind = _on_attempt_failed(breaker, e)
+            if not policy.should_retry(kind, attempt):
+                if kind != FATAL:
+                    _record_metric("gave_up")
+                raise
+            delay = policy.compute_delay(e, delay)
+            _record_metric("retries")
+            _record_metric("retry_wait_seconds", delay)
+            print(f"请求失败（{kind}），{delay:.1f}秒后进行第{attempt}次重试：{str(e)[:200]}")
+            cancellable_sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+async def acall_with_retry(endpoint: str, func: Callable[[], Awaitable[Any]], policy: Optional[RetryPolicy] = None,
+                           breaker: Optional[CircuitBreaker] = None) -> Any:
+    """按重试策略执行异步请求，参数同call_with_retry，func返回协程"""
+    policy = policy or RetryPolicy()
+    breaker = breaker or get_circuit_breaker(endpoint)
+    delay = 0.0
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        _record_metric("attempts")
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # 请求被取消（如对冲请求中落后的一方），不影响熔断判断
+            breaker.record_neutral()
+            raise
+        except Exception as e:
+            kind = _on_attempt_failed(breaker, e)
+            if not policy.should_retry(kind, attempt):
+                if kind != FATAL:
+                    _record_metric("gave_up")
+                raise
+            delay = policy.compute_delay(e, delay)
+            _record_metric("retries")
+            _record_metric("retry_wait_seconds", delay)
+            print(f"请求失败（{kind}），{delay:.1f}秒后进行第{attempt}次重试：{str(e)[:200]}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def get_retry_stats() -> dict:
+    """获取重试次数、等待时间和各端点熔断器状态"""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats["retry_wait_seconds"] = round(stats["retry_wait_seconds"], 2)
+    with _registry_lock:
+        items = list(_breakers.items())
+    stats["breakers"] = {endpoint: breaker.get_stats() for endpoint, breaker in items}
+    return stats
@@ -0,0 +1,96 @@
+"""
+原文定位模块
+
+分层生成时题目是根据提纲生成的，题目中的 source_content 只是提纲里的一句话。
+这里根据题目内容（以及提纲中保留的[片段编号]）找回原文所在的分块，并从中摘出
+与题目最相关的几句话，作为复习和追问时使用的原文依据。
+"""
+
+import re
+from typing import List, Optional, Set, Tuple
+
+from .near_duplicates import shingles
+
+# 提纲中的来源片段标记，如 [3]、[片段3]
+_CHUNK_MARKER = re.compile(r'\[(?:片段)?\s*(\d+)\s*\]')
+# 句子：以句末标点或换行结尾
+_SENTENCE = re.compile(r'[^。！？!?\n]+[。！？!?]?')
+_CJK = re.compile('[\u4e00-\u9fff]')
+
+# 摘录的最少字符数，不足时向相邻句子扩展
+EXCERPT_MIN_CHARS = 120
+EXCERPT_MAX_SENTENCES = 4
+
+
+def _overlap(query: Set[int], text_shingles: Set[int]) -> float:
+    """查询与文本共有的n-gram数，按文本大小做平方根归一化（避免偏向长文本）"""
+    if not query or not text_shingles:
+        return 0.0
+    return len(query & text_shingles) / (len(text_shingles) ** 0.5)
+
+
+def chunk_markers(text: str) -> List[int]:
+    """提取文本中的[片段编号]标记（从1开始）"""
+    return [int(number) for number in _CHUNK_MARKER.findall(text or "")]
+
+
+class SourceLocator:
+    """在原文分块中查找题目对应的段落"""
+
+    def __init__(self, chunks: List[str]):
+        """
+        初始化定位器
+
+        Args:
+            chunks: 原文分块文本（编号按列表顺序从1开始）
+        """
+        self.chunks = chunks
+        self._chunk_shingles = [shingles(chunk) for chunk in chunks]
+
+    def locate(self, text: str, hint: Optional[List[int]] = None) -> Optional[Tuple[int, str]]:
+        """
+        查找与文本最相关的分块和原文摘录
+
+        Args:
+            text: 题目内容（题干、答案、提纲引文等拼接的文本）
+            hint: 提纲标记的候选片段编号，有效时只在这些分块中查找
+
+        Returns:
+            (片段编号, 原文摘录)；找不到相关内容时返回None
+        """
+        query = shingles(text)
+        candidates = [number - 1 for number in (hint or []) if 1 <= number <= len(self.chunks)]
+        if not candidates:
+            candidates = range(len(self.chunks))
+        best_score, best_index = 0.0, None
+        for index in candidates:
+            score = len(query & self._chunk_shingles[index])
+            if score > best_score:
+                best_score, best_index = score, index
+        if best_index is None:
+            return None
+        return best_index + 1, self._excerpt(self.chunks[best_index], query)
+
+    @staticmethod
+    def _excerpt(chunk: str, query: Set[int]) -> str:
+        """从分块中摘出与查询最相关的句子，并向相关度较高的相邻句子扩展"""
+        sentences = [m.group().strip() for m in _SENTENCE.finditer(chunk)]
+        sentences = [sentence for sentence in sentences if sentence]
+        if not sentences:
+            return chunk.strip()[:EXCERPT_MIN_CHARS]
+        scores = [_overlap(query, shingles(sentence)) for sentence in sentences]
+        first = last = max(range(len(sentences)), key=lambda i: scores[i])
+        length = len(sentences[first])
+        while length < EXCERPT_MIN_CHARS and last - first + 1 < EXCERPT_MAX_SENTENCES:
+            before = scores[first - 1] if first > 0 else None
+            after = scores[last + 1] if last + 1 < len(sentences) else None
+            if before is None and after is None:
+                break
+            if after is None or (before is not None and before > after):
+                first -= 1
+                length += len(sentences[first])
+            else:
+                last += 1
+                length += len(sentences[last])
+        separator = "" if _CJK.search(chunk) else " "
+        return separator.join(sentences[first:last + 1])
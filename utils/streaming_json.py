@@ -0,0 +1,132 @@
+"""
+流式JSON解析模块
+
+在流式响应逐段到达时增量扫描文本，每当顶层对象中 questions / cards 数组的
+一个元素的右花括号到达，就立即把该元素解析出来，无需等待整个响应结束。
+每个字符只扫描一次，前导说明文字和代码块标记会被忽略。
+"""
+
+import json
+from typing import Any, Dict, Iterable, List
+
+
+class StreamingArrayParser:
+    """增量解析顶层对象中指定数组字段的元素"""
+
+    def __init__(self, fields: Iterable[str] = ("questions", "cards")):
+        """
+        初始化解析器
+
+        Args:
+            fields: 需要逐个输出元素的数组字段名
+        """
+        self.fields = set(fields)
+        # 只保留可能还需要切片的文本（当前元素或字段名），_buffer_start为其绝对位置
+        self._buffer = ""
+        self._buffer_start = 0
+        self._length = 0
+        # 括号栈，元素为 "{" 或 "["
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # 顶层对象中最近一个字符串（可能是字段名）
+        self._last_key = None
+        # 目标数组在括号栈中的深度，未进入时为None
+        self._array_depth = None
+        self._item_start = None
+        self._finished = False
+        self.parsed = 0
+        self.malformed = 0
+
+    def _text(self, start: int, end: int) -> str:
+        """取出绝对位置[start, end)范围的文本"""
+        return self._buffer[start - self._buffer_start:end - self._buffer_start]
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """
+        输入一段增量文本
+
+        Args:
+            delta: 新到达的文本片段
+
+        Returns:
+            本次新完成的数组元素列表（可能为空）
+        """
+        items = []
+        if self._finished:
+            return items
+        offset = self._length
+        self._buffer += delta
+        self._length += len(delta)
+
+        stack = self._stack
+        for i, ch in enumerate(delta):
+            pos = offset + i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(stack) == 1 and stack[0] == "{":
+                        self._last_key = self._text(self._string_start + 1, pos)
+                continue
+
+            if not stack:
+                # 根对象开始前的文字（说明、```json 等）全部跳过
+                if ch == "{":
+                    stack.append("{")
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                if (ch == "[" and self._array_depth is None and len(stack) == 1
+                        and self._last_key in self.fields):
+                    self._array_depth = len(stack) + 1
+                elif ch == "{" and self._array_depth is not None and len(stack) == self._array_depth:
+                    self._item_start = pos
+                stack.append(ch)
+            elif ch in "}]":
+                stack.pop()
+                if self._array_depth is not None:
+                    if ch == "}" and self._item_start is not None and len(stack) == self._array_depth:
+                        item = self._parse_item(self._text(self._item_start, pos + 1))
+                        self._item_start = None
+                        if item is not None:
+                            items.append(item)
+                    elif ch == "]" and len(stack) < self._array_depth:
+                        self._array_depth = None
+                if not stack:
+                    # 根对象结束，之后的文字忽略
+                    self._finished = True
+                    break
+            elif ch == "," and len(stack) == 1:
+                self._last_key = None
+
+        # 丢弃已扫描完且不再需要的文本，缓冲区只保留未完成的元素或字段名
+        keep_from = self._length
+        if self._item_start is not None:
+            keep_from = self._item_start
+        elif self._in_string:
+            keep_from = self._string_start
+        if keep_from > self._buffer_start:
+            self._buffer = self._buffer[keep_from - self._buffer_start:]
+            self._buffer_start = keep_from
+        return items
+
+    def _parse_item(self, text: str):
+        """解析单个元素，格式错误时返回None"""
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return None
+        if not isinstance(item, dict):
+            self.malformed += 1
+            return None
+        self.parsed += 1
+        return item
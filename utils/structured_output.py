@@ -0,0 +1,220 @@
+"""
+结构化输出模块
+
+为OpenAI兼容端点选择结构化输出方式，尽量让模型直接返回符合schema的JSON：
+- json_schema：response_format 携带与校验规则一致的JSON Schema
+- json_object：response_format 只要求返回JSON对象
+- none：不设置 response_format，完全依赖提示词和修复流程
+
+端点不支持某种方式时（返回400/422），自动降级到下一种并立即重发，
+探测到的可用方式保存在 data/structured_output.json 中，下次直接使用。
+同时按模型统计直接解析成功、经修复成功、部分保留和解析失败的次数。
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .response_handler import ResponseHandler
+
+
+MODE_JSON_SCHEMA = "json_schema"
+MODE_JSON_OBJECT = "json_object"
+MODE_NONE = "none"
+
+# 降级顺序
+MODES = [MODE_JSON_SCHEMA, MODE_JSON_OBJECT, MODE_NONE]
+
+# 视为"不支持该response_format"的HTTP状态码
+UNSUPPORTED_STATUS_CODES = {400, 422}
+
+
+def capabilities_file_path() -> str:
+    """获取结构化输出能力持久化文件路径"""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    return os.path.join(data_dir, "structured_output.json")
+
+
+def build_response_format(mode: str, schema_type: str) -> Optional[Dict[str, Any]]:
+    """
+    构建请求中的 response_format 参数
+
+    Args:
+        mode: 结构化输出方式
+        schema_type: 响应的schema类型（如 choice_question）
+
+    Returns:
+        response_format 字典；mode为none时返回None
+    """
+    if mode == MODE_JSON_SCHEMA:
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": schema_type,
+                # 不使用strict：严格模式要求所有对象设置additionalProperties=false，
+                # 部分兼容端点不支持，且本地仍会按同一schema校验
+                "strict": False,
+                "schema": ResponseHandler.get_json_schema(schema_type)
+            }
+        }
+    if mode == MODE_JSON_OBJECT:
+        return {"type": "json_object"}
+    return None
+
+
+def next_mode(mode: str) -> str:
+    """获取降级后的结构化输出方式"""
+    index = MODES.index(mode) if mode in MODES else len(MODES) - 1
+    return MODES[min(index + 1, len(MODES) - 1)]
+
+
+def make_capability_key(endpoint: str, model: str) -> str:
+    """构建能力注册表的键"""
+    return f"{endpoint}|{model}"
+
+
+class _ModelStats:
+    """单个模型的结构化输出统计"""
+
+    def __init__(self):
+        self.responses = 0
+        self.direct = 0       # 直接解析并通过校验
+        self.repaired = 0     # 经过修复流程才通过校验
+        self.salvaged = 0     # 响应被截断或损坏，只保留了其中完整的条目
+        self.missing_items = 0  # 部分保留时缺少的条目总数
+        self.failed = 0       # 修复后仍无法通过校验（会触发重新请求）
+        self.downgrades = 0   # 因端点不支持而降级的次数
+
+    def to_dict(self, mode: Optional[str]) -> dict:
+        valid = self.direct + self.repaired + self.salvaged
+        return {
+            "mode": mode,
+            "responses": self.responses,
+            "direct": self.direct,
+            "repaired": self.repaired,
+            "salvaged": self.salvaged,
+            "missing_items": self.missing_items,
+            "failed": self.failed,
+            "downgrades": self.downgrades,
+            "success_rate": round(valid / self.responses, 3) if self.responses else None,
+            "direct_rate": round(self.direct / self.responses, 3) if self.responses else None,
+        }
+
+
+class StructuredOutputRegistry:
+    """记录各端点/模型可用的结构化输出方式及解析统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes: Optional[Dict[str, str]] = None
+        self._stats: Dict[str, _ModelStats] = {}
+
+    def _load(self) -> Dict[str, str]:
+        """读取已保存的能力（需持有锁）"""
+        if self._modes is None:
+            self._modes = {}
+            try:
+                path = capabilities_file_path()
+                if os.path.exists(path):
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    for key, value in data.items():
+                        mode = value.get("mode") if isinstance(value, dict) else None
+                        if mode in MODES:
+                            self._modes[key] = mode
+            except Exception as e:
+                print(f"加载结构化输出能力失败: {e}")
+        return self._modes
+
+    def get_mode(self, key: str, preferred: str) -> str:
+        """
+        获取端点/模型应使用的结构化输出方式
+
+        Args:
+            key: make_capability_key生成的键
+            preferred: 配置中的首选方式
+
+        Returns:
+            已探测到的可用方式与首选方式中降级程度更高的一个
+        """
+        if preferred not in MODES:
+            preferred = MODE_JSON_SCHEMA
+        with self._lock:
+            saved = self._load().get(key)
+        if saved is None:
+            return preferred
+        return MODES[max(MODES.index(saved), MODES.index(preferred))]
+
+    def record_downgrade(self, model: str, mode: str):
+        """记录一次降级（mode为降级后的方式），在确认可用后再保存"""
+        with self._lock:
+            self._get_stats(model).downgrades += 1
+        print(f"{model} 不支持当前结构化输出方式，降级为 {mode}")
+
+    def confirm_mode(self, key: str, mode: str):
+        """请求成功后确认端点/模型支持该方式，变化时写入文件"""
+        with self._lock:
+            modes = self._load()
+            if modes.get(key) == mode:
+                return
+            modes[key] = mode
+            data = {k: {"mode": v, "updated_at": time.time()} for k, v in modes.items()}
+        try:
+            path = capabilities_file_path()
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"保存结构化输出能力失败: {e}")
+
+    def _get_stats(self, model: str) -> _ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = _ModelStats()
+            self._stats[model] = stats
+        return stats
+
+    def record_parse(self, model: str, outcome: str, missing: int = 0):
+        """
+        记录一次响应的解析结果
+
+        Args:
+            model: 模型名称
+            outcome: direct、repaired、salvaged 或 failed
+            missing: 部分保留时缺少的条目数
+        """
+        with self._lock:
+            stats = self._get_stats(model)
+            stats.responses += 1
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            stats.missing_items += missing
+
+    def get_stats(self) -> dict:
+        """获取各模型的结构化输出方式和解析统计"""
+        with self._lock:
+            modes = dict(self._load())
+            items = list(self._stats.items())
+        result = {}
+        for model, stats in items:
+            mode = next((v for k, v in modes.items() if k.endswith("|" + model)), None)
+            result[model] = stats.to_dict(mode)
+        return result
+
+
+# 全局注册表，在配置文件生命周期内积累统计
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_structured_output_registry() -> StructuredOutputRegistry:
+    """获取全局结构化输出注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = StructuredOutputRegistry()
+        return _registry
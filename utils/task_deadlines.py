@@ -0,0 +1,159 @@
+"""
+任务截止时间模块
+
+分块生成时一个响应很慢的分块会拖住整批结果（单个请求最长可达请求超时时间）。
+这里按模型记录最近分块请求的耗时，为批次中的每个任务设置截止时间：
+- 软截止时间：任务耗时超过该模型最近耗时的百分位（乘以倍数）后，向同一模型再发送
+  一份相同的请求（推测执行），取先返回的有效结果，其余请求立即取消
+- 硬截止时间：整批任务的最长用时，到时仍未完成的任务不再等待，返回已完成的结果
+
+这样整批的用时接近单个分块的中位耗时，而不是最慢分块的耗时。
+"""
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+# 计算软截止时间前至少需要的耗时样本数
+MIN_LATENCY_SAMPLES = 5
+
+
+class BatchDeadlineExceeded(Exception):
+    """任务在批次的硬截止时间前没有完成"""
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        super().__init__(f"批次已超过截止时间（{deadline:.0f}秒），任务未完成")
+
+
+class LatencyTracker:
+    """按模型记录最近成功任务的耗时"""
+
+    def __init__(self, max_samples: int = 100):
+        """
+        初始化耗时记录
+
+        Args:
+            max_samples: 每个模型保留的最近样本数
+        """
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, key: str, seconds: float):
+        """记录一次成功任务的耗时"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = deque(maxlen=self.max_samples)
+                self._samples[key] = samples
+            samples.append(seconds)
+
+    def percentile(self, key: str, percentile: float) -> Optional[float]:
+        """
+        获取模型最近耗时的百分位
+
+        Returns:
+            耗时秒数；样本不足MIN_LATENCY_SAMPLES个时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(key) or [])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return samples[index]
+
+    def get_stats(self) -> Dict[str, dict]:
+        """获取各模型的样本数和p50/p90耗时"""
+        with self._lock:
+            items = [(key, sorted(samples)) for key, samples in self._samples.items()]
+        return {
+            key: {
+                "samples": len(samples),
+                "p50_latency": round(samples[len(samples) // 2], 2) if samples else None,
+                "p90_latency": round(samples[min(len(samples) - 1, int(len(samples) * 0.9))], 2) if samples else None,
+            }
+            for key, samples in items
+        }
+
+
+class DeadlinePolicy:
+    """一批任务的截止时间设置"""
+
+    def __init__(self, key: str, percentile: float = 90, multiplier: float = 1.5, min_soft_deadline: float = 10.0,
+                 max_speculative: int = 1, batch_deadline: float = 0.0, tracker: Optional[LatencyTracker] = None):
+        """
+        初始化截止时间设置
+
+        Args:
+            key: 耗时样本的分组键（模型）
+            percentile: 软截止时间使用的耗时百分位
+            multiplier: 软截止时间 = 百分位耗时 * multiplier
+            min_soft_deadline: 软截止时间下限（秒）
+            max_speculative: 每个任务最多额外发送的推测请求数，0表示不推测执行
+            batch_deadline: 整批任务的硬截止时间（秒），0表示不限制
+            tracker: 耗时记录，默认为全局记录
+        """
+        self.key = key
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_soft_deadline = min_soft_deadline
+        self.max_speculative = max(0, int(max_speculative))
+        self.batch_deadline = max(0.0, float(batch_deadline or 0))
+        self.tracker = tracker or get_latency_tracker()
+
+    def soft_deadline(self) -> Optional[float]:
+        """
+        当前的软截止时间（秒）
+
+        Returns:
+            秒数；不推测执行或耗时样本不足时返回None
+        """
+        if self.max_speculative <= 0:
+            return None
+        latency = self.tracker.percentile(self.key, self.percentile)
+        if latency is None:
+            return None
+        return max(self.min_soft_deadline, latency * self.multiplier)
+
+    def record(self, seconds: float):
+        """记录一次成功任务的耗时（同一批中先完成的任务也会影响后面任务的软截止时间）"""
+        self.tracker.record(self.key, seconds)
+
+
+class DeadlineStats:
+    """推测执行和硬截止时间的统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"speculative_launched": 0, "speculative_won": 0, "deadline_expired": 0}
+
+    def record(self, name: str, count: int = 1):
+        """增加计数（speculative_launched、speculative_won、deadline_expired）"""
+        with self._lock:
+            self._counters[name] += count
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+_tracker = LatencyTracker()
+_stats = DeadlineStats()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    """获取全局耗时记录，在配置文件生命周期内积累样本"""
+    return _tracker
+
+
+def record_deadline_event(name: str, count: int = 1):
+    """记录一次推测执行或硬截止事件（见DeadlineStats.record）"""
+    _stats.record(name, count)
+
+
+def get_deadline_stats() -> dict:
+    """获取推测执行、硬截止时间的统计和各模型的耗时百分位"""
+    stats = _stats.get_stats()
+    stats["latency"] = _tracker.get_stats()
+    return stats
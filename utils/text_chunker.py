@@ -2,16 +2,125 @@
 文本分块工具模块
 
 提供智能和简单两种文本分块策略，用于处理长文本。
+分块大小可以按字符数，也可以按token预算（使用可插拔的本地token估算器）。
+启用内容锚定后，分块边界由断点附近的文本内容决定，修改某一段内容只会影响所在的分块，
+后面的分块边界保持不变，已缓存的分块结果可以继续复用。
 """
 
+import bisect
 import re
-from typing import List, Tuple
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+
+# token估算器估算结果中每个token最多对应的字符数，用于限定二分查找的范围
+MAX_CHARS_PER_TOKEN = 8
+
+# 内容锚定时参与计算边界指纹的字符数（断点前后各一半）
+ANCHOR_CONTEXT = 64
+
+# 各类自然边界的匹配规则，按优先级排列（换行符用 str.find/rfind 查找）
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_PARAGRAPH_START = re.compile(r'\n\s*\n\s*')
+_SENTENCE = re.compile(r'[。！？.!?]\s+')
+_CJK_SENTENCE = re.compile(r'[。！？]')
+_PUNCTUATION = re.compile(r'[，,;；]\s*')
+_SPACE = re.compile(r'\s+')
+
+
+def _closest_match_end(pattern, text: str, start: int, end: int, target: int) -> Optional[int]:
+    """
+    在text[start:end]范围内查找结束位置最接近target的匹配
+
+    用 pos/endpos 直接在原文上匹配（与在切片上匹配的结果相同，但不复制切片），
+    匹配的结束位置单调递增，越过target后即可停止扫描。
+
+    Returns:
+        最接近的结束位置，距离相同时取较前的一个；没有匹配时返回None
+    """
+    previous = None
+    for match in pattern.finditer(text, start, end):
+        match_end = match.end()
+        if match_end >= target:
+            if previous is not None and target - previous <= match_end - target:
+                return previous
+            return match_end
+        previous = match_end
+    return previous
+
+
+def _longest_within(shortest: int, longest: int, budget: int, tokens_of: Callable[[int], int]) -> int:
+    """
+    在[shortest, longest]范围内查找token数不超过budget的最大长度
+
+    tokens_of(n)为长度n的文本的token数，随n单调不减。token数与长度大致成正比，
+    因此按比例插值猜测位置，通常几次估算即可收敛；插值没能把范围缩小一半时改用二分，
+    保证最坏情况下也是对数次估算。shortest本身超出预算时返回shortest。
+    """
+    if longest <= shortest:
+        return max(shortest, longest)
+    high_tokens = tokens_of(longest)
+    if high_tokens <= budget:
+        return longest
+    low, high = shortest, longest
+    low_tokens = tokens_of(low) if low > 0 else 0
+    interpolate = True
+    # 不变式：长度low在预算内（或为shortest），长度high超出预算
+    while high - low > 1:
+        width = high - low
+        if interpolate and high_tokens > low_tokens:
+            mid = low + (budget - low_tokens) * width // (high_tokens - low_tokens)
+            mid = min(max(mid, low + 1), high - 1)
+        else:
+            mid = (low + high) // 2
+        mid_tokens = tokens_of(mid)
+        if mid_tokens <= budget:
+            low, low_tokens = mid, mid_tokens
+        else:
+            high, high_tokens = mid, mid_tokens
+        interpolate = (high - low) * 2 <= width
+    return low
+
+
+def _anchor_fingerprint(text: str, position: int) -> int:
+    """计算断点前后一小段文本的指纹（与进程无关，每次运行结果相同）"""
+    half = ANCHOR_CONTEXT // 2
+    return zlib.crc32(text[max(0, position - half):position + half].encode('utf-8'))
+
+
+def _paragraph_ends(text: str, start: int, end: int) -> List[int]:
+    """text[start:end]范围内所有段落边界的结束位置"""
+    return [m.end() for m in _PARAGRAPH_BREAK.finditer(text, start, end)]
+
+
+def _line_ends(text: str, start: int, end: int) -> List[int]:
+    """text[start:end]范围内所有换行符之后的位置"""
+    positions = []
+    position = text.find('\n', start, end)
+    while position >= 0:
+        positions.append(position + 1)
+        position = text.find('\n', position + 1, end)
+    return positions
+
+
+def _sentence_ends(text: str, start: int, end: int) -> List[int]:
+    """text[start:end]范围内所有句子结束的位置（按位置排序）"""
+    return sorted({m.end() for pattern in (_SENTENCE, _CJK_SENTENCE) for m in pattern.finditer(text, start, end)})
+
+
+def _last_match_end(pattern, text: str, start: int, end: int) -> Optional[int]:
+    """text[start:end]范围内最后一个匹配的结束位置，没有匹配时返回None"""
+    last = None
+    for match in pattern.finditer(text, start, end):
+        last = match
+    return last.end() if last else None
 
 
 class TextChunker:
     """文本分块工具类"""
     
-    def __init__(self, chunk_size: int = 2000, overlap: int = 200, strategy: str = "smart"):
+    def __init__(self, chunk_size: int = 2000, overlap: int = 200, strategy: str = "smart",
+                 token_estimator: Optional[Callable[[str], int]] = None, anchored: bool = False):
         """
         初始化文本分块器
         
@@ -19,10 +128,40 @@ class TextChunker:
             chunk_size: 每块的字符数
             overlap: 分块之间的重叠字符数
             strategy: 分块策略 ("simple" 或 "smart")
+            token_estimator: token估算函数，用于按token分块和统计token数
+            anchored: 是否按内容锚定分块边界（仅智能分块）
         """
         self.chunk_size = chunk_size
         self.overlap = overlap
         self.strategy = strategy
+        self.token_estimator = token_estimator
+        # 每块的token预算，为None时按字符数分块
+        self.token_budget: Optional[int] = None
+        self.overlap_tokens = 0
+        self.anchored = anchored
+    
+    def set_token_budget(self, token_budget: Optional[int], overlap_tokens: int = 0,
+                         token_estimator: Optional[Callable[[str], int]] = None):
+        """
+        设置按token分块
+        
+        Args:
+            token_budget: 每块最多的token数，为None时恢复按字符数分块
+            overlap_tokens: 分块之间重叠的token数
+            token_estimator: token估算函数，默认沿用当前的估算函数
+        """
+        if token_estimator is not None:
+            self.token_estimator = token_estimator
+        if token_budget is not None and self.token_estimator is None:
+            raise ValueError("按token分块需要提供token估算函数")
+        self.token_budget = max(1, token_budget) if token_budget is not None else None
+        self.overlap_tokens = max(0, overlap_tokens)
+    
+    def count_tokens(self, text: str) -> Optional[int]:
+        """估算文本的token数，未设置估算函数时返回None"""
+        if self.token_estimator is None:
+            return None
+        return self.token_estimator(text)
         
     def chunk_text(self, text: str) -> List[Tuple[str, int, int]]:
         """
@@ -34,6 +173,11 @@ class TextChunker:
         Returns:
             分块列表，每个元素为 (chunk_text, start_pos, end_pos)
         """
+        if self.token_budget is not None:
+            if not text or self.count_tokens(text) <= self.token_budget:
+                return [(text, 0, len(text))]
+            return self._token_chunk(text)
+        
         if not text or len(text) <= self.chunk_size:
             # 文本太短，不需要分块
             return [(text, 0, len(text))]
@@ -92,7 +236,11 @@ class TextChunker:
                 break
             
             # 寻找自然断点
-            actual_end = self._find_natural_break(text, start, ideal_end, text_len)
+            actual_end = None
+            if self.anchored:
+                actual_end = self._find_anchor(text, chunks, start, ideal_end)
+            if actual_end is None:
+                actual_end = self._find_natural_break(text, start, ideal_end, text_len)
             chunk = text[start:actual_end]
             chunks.append((chunk, start, actual_end))
             
@@ -108,7 +256,64 @@ class TextChunker:
                 
         return chunks
     
-    def _find_natural_break(self, text: str, start: int, ideal_end: int, text_len: int) -> int:
+    def _token_chunk(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        按token预算分块：每块不超过token_budget，智能策略下在预算范围内最靠近末尾的
+        自然边界处分割，相邻分块重叠约overlap_tokens个token
+        
+        Args:
+            text: 要分块的文本
+            
+        Returns:
+            分块列表
+        """
+        chunks = []
+        start = 0
+        text_len = len(text)
+
+        while start < text_len:
+            # 在预算内能容纳的最远位置
+            ideal_end = self._token_end(text, start, self.token_budget)
+            if ideal_end >= text_len:
+                chunks.append((text[start:text_len], start, text_len))
+                break
+            
+            actual_end = ideal_end
+            if self.strategy == "smart":
+                # 只在理想位置之前查找断点，保证不超出预算
+                anchor = None
+                if self.anchored:
+                    anchor = self._find_anchor(text, chunks, start, ideal_end)
+                if anchor is not None:
+                    actual_end = anchor
+                else:
+                    actual_end = self._find_natural_break(text, start, ideal_end, text_len, max_end=ideal_end)
+            chunks.append((text[start:actual_end], start, actual_end))
+            
+            next_start = self._token_start(text, start, actual_end, self.overlap_tokens)
+            if self.strategy == "smart" and next_start < actual_end:
+                next_start = self._find_overlap_start(text, next_start, actual_end)
+            # 保证每块都向前推进
+            start = next_start if next_start > start else actual_end
+        
+        return chunks
+    
+    def _token_end(self, text: str, start: int, budget: int) -> int:
+        """查找从start开始、token数不超过budget的最远结束位置（至少包含一个字符）"""
+        longest = min(len(text) - start, budget * MAX_CHARS_PER_TOKEN)
+        length = _longest_within(1, longest, budget, lambda n: self.token_estimator(text[start:start + n]))
+        return start + length
+    
+    def _token_start(self, text: str, floor: int, end: int, tokens: int) -> int:
+        """查找不早于floor、到end为止token数不超过tokens的最早起始位置"""
+        if tokens <= 0:
+            return end
+        longest = min(end - floor, tokens * MAX_CHARS_PER_TOKEN)
+        length = _longest_within(0, longest, tokens, lambda n: self.token_estimator(text[end - n:end]))
+        return end - length
+    
+    def _find_natural_break(self, text: str, start: int, ideal_end: int, text_len: int,
+                            max_end: Optional[int] = None) -> int:
         """
         寻找自然断点
         
@@ -117,6 +322,7 @@ class TextChunker:
             start: 起始位置
             ideal_end: 理想结束位置
             text_len: 文本总长度
+            max_end: 断点不能超过的位置（按token分块时为预算上限）
             
         Returns:
             实际结束位置
@@ -129,54 +335,76 @@ class TextChunker:
         search_window = min(200, self.chunk_size // 4)
         search_start = max(start, ideal_end - search_window)
         search_end = min(text_len, ideal_end + search_window)
-        search_text = text[search_start:search_end]
-        
-        # 1. 优先查找段落边界（双换行符）
-        paragraph_breaks = [m.end() for m in re.finditer(r'\n\s*\n', search_text)]
-        if paragraph_breaks:
-            # 找到最接近理想位置的段落边界
-            closest = min(paragraph_breaks, 
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
-        
-        # 2. 查找单换行符
-        newline_breaks = [m.end() for m in re.finditer(r'\n', search_text)]
-        if newline_breaks:
-            closest = min(newline_breaks,
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
+        if max_end is not None:
+            search_end = min(search_end, max_end)
         
-        # 3. 查找句子边界（句号、问号、感叹号后跟空格或换行）
-        sentence_breaks = [m.end() for m in re.finditer(r'[。！？.!?]\s+', search_text)]
-        if sentence_breaks:
-            closest = min(sentence_breaks,
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
+        # 1. 优先查找段落边界（双换行符），找到最接近理想位置的段落边界
+        closest = _closest_match_end(_PARAGRAPH_BREAK, text, search_start, search_end, ideal_end)
+        if closest is not None:
+            return closest
         
-        # 4. 查找中文句号
-        chinese_sentence_breaks = [m.end() for m in re.finditer(r'[。！？]', search_text)]
-        if chinese_sentence_breaks:
-            closest = min(chinese_sentence_breaks,
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
+        # 2. 查找单换行符：理想位置前后最近的换行符
+        pivot = max(search_start, ideal_end - 1)
+        before = text.rfind('\n', search_start, pivot)
+        after = text.find('\n', pivot, search_end)
+        if after >= 0 and (before < 0 or after + 1 - ideal_end < ideal_end - (before + 1)):
+            return after + 1
+        if before >= 0:
+            return before + 1
         
+        # 3. 查找句子边界（句号、问号、感叹号后跟空格或换行）
+        # 4. 查找中文句号
         # 5. 查找逗号、分号等标点
-        punctuation_breaks = [m.end() for m in re.finditer(r'[，,;；]\s*', search_text)]
-        if punctuation_breaks:
-            closest = min(punctuation_breaks,
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
-        
         # 6. 查找空格
-        space_breaks = [m.end() for m in re.finditer(r'\s+', search_text)]
-        if space_breaks:
-            closest = min(space_breaks,
-                         key=lambda x: abs((search_start + x) - ideal_end))
-            return search_start + closest
+        for pattern in (_SENTENCE, _CJK_SENTENCE, _PUNCTUATION, _SPACE):
+            closest = _closest_match_end(pattern, text, search_start, search_end, ideal_end)
+            if closest is not None:
+                return closest
         
         # 7. 如果都找不到，直接在理想位置分割
         return ideal_end
     
+    def _find_anchor(self, text: str, chunks: List[Tuple[str, int, int]], start: int, limit: int) -> Optional[int]:
+        """
+        按内容锚定选择断点
+
+        按段落、换行、句子的优先级收集候选断点。一个候选附近文本的指纹如果是前后radius范围内
+        所有候选中最小的，它就是锚点——是否为锚点只取决于附近的文本，与分块从哪里开始无关，
+        且相邻锚点至少相距radius。每块在上一块结束之后的第一个锚点处结束，所以每个锚点都是
+        分块边界：修改某处内容后，从下一个锚点开始的分块与修改前完全相同。
+        
+        Args:
+            text: 文本
+            chunks: 已经生成的分块
+            start: 当前块的起始位置
+            limit: 断点的最晚位置
+            
+        Returns:
+            断点位置；范围内没有锚点时返回None（由调用方按理想位置查找自然断点）
+        """
+        radius = max(1, (limit - start) // 3)
+        # 上一块结束的位置（有重叠时在当前块起点之后），断点至少离起点radius远
+        after = max(chunks[-1][2] if chunks else 0, start + radius)
+        if limit <= after:
+            return None
+        scan_start = max(0, after - radius)
+        scan_end = min(len(text), limit + radius)
+        for collect in (_paragraph_ends, _line_ends, _sentence_ends):
+            candidates = collect(text, scan_start, scan_end)
+            first = bisect.bisect_right(candidates, after)
+            last = bisect.bisect_right(candidates, limit)
+            if first == last:
+                continue
+            keys = [(_anchor_fingerprint(text, position), position) for position in candidates]
+            for index in range(first, last):
+                position = candidates[index]
+                left = bisect.bisect_left(candidates, position - radius)
+                right = bisect.bisect_right(candidates, position + radius)
+                if keys[index] == min(keys[left:right]):
+                    return position
+            return None
+        return None
+    
     def _find_overlap_start(self, text: str, overlap_start: int, chunk_end: int) -> int:
         """
         寻找重叠区域的起始点，尽量在自然边界处
@@ -189,23 +417,20 @@ class TextChunker:
         Returns:
             重叠区域的实际起始位置
         """
-        search_text = text[overlap_start:chunk_end]
-        
-        # 1. 查找段落开始
-        paragraph_starts = [m.start() for m in re.finditer(r'\n\s*\n\s*', search_text)]
-        if paragraph_starts:
-            # 使用最后一个段落开始
-            return overlap_start + paragraph_starts[-1] + len(re.search(r'\n\s*\n\s*', search_text[paragraph_starts[-1]:]).group())
+        # 1. 查找段落开始（使用最后一个段落开始）
+        paragraph_start = _last_match_end(_PARAGRAPH_START, text, overlap_start, chunk_end)
+        if paragraph_start is not None:
+            return paragraph_start
         
         # 2. 查找换行符
-        newline_starts = [m.start() for m in re.finditer(r'\n', search_text)]
-        if newline_starts:
-            return overlap_start + newline_starts[-1] + 1
+        newline = text.rfind('\n', overlap_start, chunk_end)
+        if newline >= 0:
+            return newline + 1
         
         # 3. 查找句子开始（标点后的位置）
-        sentence_starts = [m.end() for m in re.finditer(r'[。！？.!?]\s+', search_text)]
-        if sentence_starts:
-            return overlap_start + sentence_starts[-1]
+        sentence_start = _last_match_end(_SENTENCE, text, overlap_start, chunk_end)
+        if sentence_start is not None:
+            return sentence_start
         
         # 4. 如果都找不到，使用理想起始位置
         return overlap_start
@@ -246,26 +471,42 @@ class TextChunker:
         
         Args:
             text: 要判断的文本
-            threshold_multiplier: 阈值倍数，文本长度超过 chunk_size * threshold_multiplier 时才分块
+            threshold_multiplier: 阈值倍数，文本长度超过 chunk_size * threshold_multiplier 时才分块；
+                按token分块时只要超出token预算就分块（否则请求会超出上下文窗口）
             
         Returns:
             是否需要分块
         """
+        if self.token_budget is not None:
+            return self.count_tokens(text) > self.token_budget
         return len(text) > self.chunk_size * threshold_multiplier
     
-    def get_chunk_count(self, text: str) -> int:
+    def get_chunk_count(self, text: str, with_tokens: bool = False):
         """
         计算文本会被分成多少块
         
         Args:
             text: 文本
+            with_tokens: 是否同时返回文本的估算token数
             
         Returns:
-            分块数量
+            分块数量；with_tokens为True时返回 (分块数量, token数) 元组，
+            未设置token估算函数时token数为None
         """
+        if with_tokens:
+            return self.get_chunk_count(text), self.count_tokens(text)
+        
         if not self.should_chunk(text):
             return 1
         
+        if self.token_budget is not None:
+            # 按token预算估算
+            effective_tokens = self.token_budget - self.overlap_tokens
+            if effective_tokens <= 0:
+                return 1
+            total_tokens = self.count_tokens(text)
+            return max(1, 1 + (total_tokens - self.token_budget + effective_tokens - 1) // effective_tokens)
+        
         # 粗略估算
         text_len = len(text)
         if text_len <= self.chunk_size:
@@ -0,0 +1,76 @@
+"""
+本地token估算模块
+
+在不联网、不加载分词模型的情况下估算文本的token数，用于速率预算和按token分块。
+估算器可插拔：通过 register_token_estimator 注册新的估算函数（接收文本、返回token数，
+且文本变长时结果不减少），在配置中用 token_estimator 按名称选择。
+"""
+
+import re
+from typing import Callable, Dict
+
+# 中日韩字符（含全角符号），每个字大约对应一个或多个token
+_CJK_RUN = re.compile('[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]+')
+
+DEFAULT_ESTIMATOR = "heuristic"
+
+
+def _count_cjk(text: str) -> int:
+    """统计文本中的中日韩字符数"""
+    return sum(map(len, _CJK_RUN.findall(text)))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的token数
+
+    中日韩字符大约每字1个token，其余字符大约每4个字符1个token。
+    """
+    if not text:
+        return 0
+    cjk = _count_cjk(text)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_tokens_conservative(text: str) -> int:
+    """
+    偏保守地估算文本的token数
+
+    适用于对中文编码效率较低的分词器：中日韩字符按每字2个token、其余字符按每3个字符
+    1个token计算，宁可多估也不让请求超出上下文窗口。
+    """
+    if not text:
+        return 0
+    cjk = _count_cjk(text)
+    return cjk * 2 + (len(text) - cjk + 2) // 3
+
+
+_estimators: Dict[str, Callable[[str], int]] = {
+    "heuristic": estimate_tokens,
+    "conservative": estimate_tokens_conservative,
+}
+
+
+def register_token_estimator(name: str, estimator: Callable[[str], int]):
+    """
+    注册token估算器
+
+    Args:
+        name: 估算器名称（配置中的 token_estimator）
+        estimator: 估算函数，接收文本返回token数
+    """
+    _estimators[name] = estimator
+
+
+def get_token_estimator(name: str = DEFAULT_ESTIMATOR) -> Callable[[str], int]:
+    """
+    按名称获取token估算器，名称未注册时使用默认估算器
+
+    Args:
+        name: 估算器名称
+    """
+    estimator = _estimators.get(name)
+    if estimator is None:
+        print(f"未知的token估算器 {name}，使用 {DEFAULT_ESTIMATOR}")
+        estimator = _estimators[DEFAULT_ESTIMATOR]
+    return estimator